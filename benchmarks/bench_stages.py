@@ -0,0 +1,114 @@
+"""
+Benchmarks of the public stage functions of the trip and stop pipelines.
+
+Usage:
+    pytest benchmarks
+    pytest benchmarks --bench-sizes 10k,1m --benchmark-autosave
+    pytest benchmarks --bench-engine fast --benchmark-autosave
+    pytest-benchmark compare --group-by group,param:size
+"""
+
+from typing import Callable
+
+import pytest
+
+from conftest import (
+    STOPS_BUFFER_RADIUS,
+    STOPS_EXTENDED_BUFFER_RADIUS,
+    TERMINALS_BUFFER_RADIUS,
+    StageInputs,
+)
+from gps2gtfs.data_field.input_field import TerminalField
+from gps2gtfs.preprocessing.data_cleaner import clean
+from gps2gtfs.stop.data_preparator import create_stop_buffers, prepare_trajectory_df
+from gps2gtfs.stop.feature_extractor import extract_stop_features
+from gps2gtfs.stop.stop_extractor import extract_stops
+from gps2gtfs.trip.feature_extractor import extract_trip_features
+from gps2gtfs.trip.trip_extractor import extract_trips
+
+
+@pytest.mark.benchmark(group="clean")
+def bench_clean(run_stage: Callable, stage_inputs: StageInputs) -> None:
+    raw_gps_df = stage_inputs.get("raw_gps")
+    run_stage(clean, lambda: (raw_gps_df.copy(),), len(raw_gps_df))
+
+
+@pytest.mark.benchmark(group="extract_trips")
+def bench_extract_trips(run_stage: Callable, stage_inputs: StageInputs) -> None:
+    cleaned_gps_df = stage_inputs.get("cleaned_gps")
+    run_stage(
+        extract_trips,
+        lambda: (
+            cleaned_gps_df.copy(),
+            stage_inputs.terminals_df.copy(),
+            TERMINALS_BUFFER_RADIUS,
+            stage_inputs.num_workers,
+            stage_inputs.backend,
+            stage_inputs.engine,
+        ),
+        len(cleaned_gps_df),
+    )
+
+
+@pytest.mark.benchmark(group="extract_trip_features")
+def bench_extract_trip_features(run_stage: Callable, stage_inputs: StageInputs) -> None:
+    trips_df = stage_inputs.get("trips")
+    run_stage(extract_trip_features, lambda: (trips_df.copy(),), len(trips_df))
+
+
+@pytest.mark.benchmark(group="create_stop_buffers")
+def bench_create_stop_buffers(run_stage: Callable, stage_inputs: StageInputs) -> None:
+    cleaned_gps_df = stage_inputs.get("cleaned_gps")
+    run_stage(
+        create_stop_buffers,
+        lambda: (
+            cleaned_gps_df.copy(),
+            stage_inputs.stops_df.copy(),
+            STOPS_BUFFER_RADIUS,
+            STOPS_EXTENDED_BUFFER_RADIUS,
+        ),
+        len(cleaned_gps_df),
+    )
+
+
+@pytest.mark.benchmark(group="prepare_trajectory_df")
+def bench_prepare_trajectory_df(run_stage: Callable, stage_inputs: StageInputs) -> None:
+    raw_gps_geo_df = stage_inputs.get("stop_buffers")[0]
+    trips_df = stage_inputs.get("trips")
+    trip_features_df = stage_inputs.get("trip_features")
+    run_stage(
+        prepare_trajectory_df,
+        lambda: (raw_gps_geo_df.copy(), trips_df.copy(), trip_features_df.copy()),
+        len(raw_gps_geo_df),
+    )
+
+
+@pytest.mark.benchmark(group="extract_stops")
+def bench_extract_stops(run_stage: Callable, stage_inputs: StageInputs) -> None:
+    trajectory_df = stage_inputs.get("trajectory")
+    stop_buffers = stage_inputs.get("stop_buffers")[1:]
+    run_stage(
+        extract_stops,
+        lambda: (
+            trajectory_df.copy(),
+            *stop_buffers,
+            stage_inputs.num_workers,
+            stage_inputs.backend,
+            stage_inputs.engine,
+        ),
+        len(trajectory_df),
+    )
+
+
+@pytest.mark.benchmark(group="extract_stop_features")
+def bench_extract_stop_features(run_stage: Callable, stage_inputs: StageInputs) -> None:
+    stop_gps_df = stage_inputs.get("stop_gps")
+    run_stage(
+        extract_stop_features,
+        lambda: (
+            stop_gps_df.copy(),
+            stage_inputs.terminals_df[TerminalField.TERMINAL_ID.value].tolist(),
+            stage_inputs.engine,
+        ),
+        len(stop_gps_df),
+    )
@@ -0,0 +1,237 @@
+"""
+Fixtures of the stage benchmarks.
+
+Every benchmark runs once per selected data size. The raw GPS data of a size is generated by
+the synthetic AVL generator with a fixed seed along the example route, and the input of every
+stage is the output of the previous stages, computed once per size and shared by the
+benchmarks.
+
+Sizes are selected with --bench-sizes or the GPS2GTFS_BENCH_SIZES environment variable, e.g.
+"10k,1m,10m". Only 10k runs by default, since the loop based stages take hours on 10M pings.
+"""
+
+import os
+import tempfile
+from typing import Any, Callable, Dict
+
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TERMINALS_PATH = os.path.join(REPO_DIR, "examples", "raw_data", "bus_terminals_654.csv")
+STOPS_PATH = os.path.join(REPO_DIR, "examples", "raw_data", "bus_stops_654.csv")
+
+DEFAULT_SIZES = "10k"
+SEED = 20220701
+TERMINALS_BUFFER_RADIUS = 100
+STOPS_BUFFER_RADIUS = 50
+STOPS_EXTENDED_BUFFER_RADIUS = 100
+
+DAYS = 7
+# Lower bound of the raw GPS rows of one bus and day with the default generator parameters
+ROWS_PER_BUS_DAY = 1_400
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("gps2gtfs benchmarks")
+    group.addoption(
+        "--bench-sizes",
+        default=os.environ.get("GPS2GTFS_BENCH_SIZES", DEFAULT_SIZES),
+        help="Comma separated numbers of raw GPS pings, e.g. 10k,1m,10m (default: 10k).",
+    )
+    group.addoption(
+        "--bench-workers",
+        type=int,
+        default=1,
+        help="Number of workers of the parallel stages (default: 1).",
+    )
+    group.addoption(
+        "--bench-backend",
+        default="serial",
+        help="Execution backend of the parallel stages (default: serial).",
+    )
+    group.addoption(
+        "--bench-engine",
+        default="reference",
+        help="Engine of the matching and aggregation stages (default: reference).",
+    )
+
+
+def pytest_generate_tests(metafunc: pytest.Metafunc) -> None:
+    if "size" in metafunc.fixturenames:
+        labels = [
+            label.strip().lower()
+            for label in metafunc.config.getoption("--bench-sizes").split(",")
+            if label.strip()
+        ]
+        metafunc.parametrize(
+            "size", [parse_size(label) for label in labels], ids=labels
+        )
+
+
+def parse_size(label: str) -> int:
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    label = label.strip().lower()
+    if label[-1:] in multipliers:
+        return int(float(label[:-1]) * multipliers[label[-1]])
+    return int(label)
+
+
+def generate_raw_gps(num_pings: int, seed: int = SEED) -> pd.DataFrame:
+    """
+    Generate raw GPS data of buses running trips between the example terminals.
+
+    The data is simulated by the synthetic AVL generator over DAYS days, with as many buses as
+    needed to reach `num_pings` rows, and cut to `num_pings` rows.
+
+    Parameters:
+        num_pings (int): Number of rows to generate.
+        seed (int): Seed of the random generator. The same seed gives the same data.
+
+    Returns:
+        DataFrame: Raw GPS data with the columns of RawGPSField and the device time as string.
+    """
+    from gps2gtfs.synthetic.avl_generator import generate_avl_data
+
+    num_buses = -(-num_pings // (ROWS_PER_BUS_DAY * DAYS))
+    with tempfile.TemporaryDirectory() as output_dir:
+        paths = generate_avl_data(
+            TERMINALS_PATH,
+            STOPS_PATH,
+            output_dir,
+            num_buses=num_buses,
+            num_days=DAYS,
+            seed=seed,
+        )
+        raw_gps_df = pd.read_csv(paths["raw_gps"])
+    return raw_gps_df.head(num_pings)
+
+
+class StageInputs:
+    """
+    Lazily computed outputs of the pipeline stages for one data size.
+    """
+
+    def __init__(self, size: int, num_workers: int, backend: str, engine: str) -> None:
+        from gps2gtfs.load_data.load_from_csv import load
+
+        self.size = size
+        self.num_workers = num_workers
+        self.backend = backend
+        self.engine = engine
+        self.terminals_df, self.stops_df = load(
+            {"terminals": TERMINALS_PATH, "stops": STOPS_PATH}
+        )
+        self._cache: Dict[str, Any] = {}
+
+    def get(self, name: str) -> Any:
+        if name not in self._cache:
+            self._cache[name] = getattr(self, f"_make_{name}")()
+        return self._cache[name]
+
+    def _make_raw_gps(self) -> pd.DataFrame:
+        return generate_raw_gps(self.size, SEED + self.size)
+
+    def _make_cleaned_gps(self) -> pd.DataFrame:
+        from gps2gtfs.preprocessing.data_cleaner import clean
+
+        return clean(self.get("raw_gps"))
+
+    def _make_trips(self) -> pd.DataFrame:
+        from gps2gtfs.trip.trip_extractor import extract_trips
+
+        return extract_trips(
+            self.get("cleaned_gps"),
+            self.terminals_df,
+            TERMINALS_BUFFER_RADIUS,
+            self.num_workers,
+            self.backend,
+            self.engine,
+        )
+
+    def _make_trip_features(self) -> pd.DataFrame:
+        from gps2gtfs.trip.feature_extractor import extract_trip_features
+
+        return extract_trip_features(self.get("trips"))
+
+    def _make_stop_buffers(self) -> tuple:
+        from gps2gtfs.stop.data_preparator import create_stop_buffers
+
+        return create_stop_buffers(
+            self.get("cleaned_gps"),
+            self.stops_df,
+            STOPS_BUFFER_RADIUS,
+            STOPS_EXTENDED_BUFFER_RADIUS,
+        )
+
+    def _make_trajectory(self) -> pd.DataFrame:
+        from gps2gtfs.stop.data_preparator import prepare_trajectory_df
+
+        return prepare_trajectory_df(
+            self.get("stop_buffers")[0].copy(),
+            self.get("trips").copy(),
+            self.get("trip_features"),
+        )
+
+    def _make_stop_gps(self) -> pd.DataFrame:
+        from gps2gtfs.stop.stop_extractor import extract_stops
+
+        return extract_stops(
+            self.get("trajectory"),
+            *self.get("stop_buffers")[1:],
+            self.num_workers,
+            self.backend,
+            self.engine,
+        )
+
+
+@pytest.fixture(scope="session")
+def stage_inputs_cache() -> Dict[int, StageInputs]:
+    return {}
+
+
+@pytest.fixture
+def stage_inputs(
+    request: pytest.FixtureRequest,
+    stage_inputs_cache: Dict[int, StageInputs],
+    size: int,
+) -> StageInputs:
+    if size not in stage_inputs_cache:
+        stage_inputs_cache[size] = StageInputs(
+            size,
+            request.config.getoption("--bench-workers"),
+            request.config.getoption("--bench-backend"),
+            request.config.getoption("--bench-engine"),
+        )
+    return stage_inputs_cache[size]
+
+
+@pytest.fixture
+def run_stage(benchmark: Any, stage_inputs: StageInputs) -> Callable:
+    """
+    Benchmark a stage function on fresh copies of its inputs.
+
+    The stages modify their inputs in place, so the inputs are copied before every round,
+    outside of the measured time.
+    """
+
+    def run(func: Callable, make_args: Callable[[], tuple], input_rows: int) -> Any:
+        benchmark.extra_info.update(
+            {
+                "size": stage_inputs.size,
+                "input_rows": input_rows,
+                "num_workers": stage_inputs.num_workers,
+                "backend": stage_inputs.backend,
+                "engine": stage_inputs.engine,
+            }
+        )
+        rounds = 5 if stage_inputs.size <= 100_000 else 1
+        result = benchmark.pedantic(
+            func, setup=lambda: (make_args(), {}), rounds=rounds, iterations=1
+        )
+        benchmark.extra_info["output_rows"] = (
+            len(result) if hasattr(result, "__len__") else None
+        )
+        return result
+
+    return run
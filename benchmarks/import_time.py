@@ -0,0 +1,103 @@
+"""
+Measure how long importing gps2gtfs takes in a fresh interpreter.
+
+Every target is imported in a new Python process, several times, and the median import time is
+reported together with the heavy third-party modules the import pulled in. Passing a git
+reference compares the working tree against that revision of the package.
+
+Usage:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --baseline-ref 6fd6704 --repeats 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+from typing import Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TARGETS = ["gps2gtfs", "gps2gtfs.cli", "gps2gtfs.pipeline"]
+HEAVY_MODULES = ["pandas", "geopandas", "shapely", "pyproj", "multiprocessing.pool"]
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {target}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "heavy_modules": [m for m in {heavy_modules!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_import(target: str, package_dir: str, repeats: int) -> Optional[Dict]:
+    env = dict(os.environ, PYTHONPATH=package_dir)
+    code = IMPORT_SNIPPET.format(target=target, heavy_modules=HEAVY_MODULES)
+    runs: List[Dict] = []
+    for _ in range(repeats):
+        process = subprocess.run(
+            [sys.executable, "-c", code],
+            env=env,
+            cwd=package_dir,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            # The target does not exist in this revision
+            return None
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    return {
+        "median_seconds": statistics.median(run["seconds"] for run in runs),
+        "heavy_modules": runs[-1]["heavy_modules"],
+    }
+
+
+def export_revision(ref: str, destination: str) -> None:
+    archive = subprocess.run(
+        ["git", "archive", "--format=tar", ref, "gps2gtfs"],
+        cwd=REPO_DIR,
+        check=True,
+        capture_output=True,
+    ).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(destination)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--targets", nargs="+", default=DEFAULT_TARGETS)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--baseline-ref", default=None, help="git revision to compare with"
+    )
+    args = parser.parse_args()
+
+    trees = {"working tree": REPO_DIR}
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        if args.baseline_ref:
+            export_revision(args.baseline_ref, baseline_dir)
+            trees = {args.baseline_ref: baseline_dir, **trees}
+
+        print(f"{'target':<30} {'tree':<14} {'median (ms)':>12}  heavy modules loaded")
+        for target in args.targets:
+            for tree_name, package_dir in trees.items():
+                result = measure_import(target, package_dir, args.repeats)
+                if result is None:
+                    print(f"{target:<30} {tree_name:<14} {'n/a':>12}")
+                    continue
+                print(
+                    f"{target:<30} {tree_name:<14} "
+                    f"{result['median_seconds'] * 1000:>12.1f}  "
+                    f"{', '.join(result['heavy_modules']) or '-'}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
-from . import (  # noqa F401
-    data_field,
-    load_data,
-    pipeline,
-    preprocessing,
-    reporting,
-    stop,
-    trip,
-    utility,
+from gps2gtfs._lazy import attach
+
+# Submodules are imported on first access, so importing the package stays cheap
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "aggregation",
+        "cli",
+        "data_field",
+        "discovery",
+        "load_data",
+        "pipeline",
+        "preprocessing",
+        "reporting",
+        "stop",
+        "store",
+        "synthetic",
+        "trip",
+        "utility",
+    ],
 )
@@ -0,0 +1,32 @@
+from importlib import import_module
+from typing import Callable, List, Sequence, Tuple
+
+
+def attach(
+    package_name: str, submodules: Sequence[str]
+) -> Tuple[Callable, Callable, List[str]]:
+    """
+    Make the submodules of a package importable as attributes on first access (PEP 562).
+
+    Parameters:
+        package_name (str): The name of the package, i.e. `__name__` of its `__init__`.
+        submodules (Sequence[str]): The names of the submodules to expose.
+
+    Returns:
+        Tuple[Callable, Callable, List[str]]: The `__getattr__`, `__dir__` and `__all__` of
+                                              the package.
+
+    Example:
+        >>> __getattr__, __dir__, __all__ = attach(__name__, ["trip", "trip_stop"])
+    """
+    submodules = list(submodules)
+
+    def __getattr__(name: str):  # noqa ANN202
+        if name in submodules:
+            return import_module(f"{package_name}.{name}")
+        raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+
+    def __dir__() -> List[str]:
+        return list(submodules)
+
+    return __getattr__, __dir__, submodules
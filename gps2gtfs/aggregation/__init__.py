@@ -0,0 +1,9 @@
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "quantile_sketch",
+        "schedule_sketches",
+    ],
+)
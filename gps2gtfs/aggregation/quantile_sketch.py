@@ -0,0 +1,161 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from gps2gtfs.utility.defaults import DEFAULT_K
+
+# Fewest items kept at any level
+MIN_LEVEL_CAPACITY = 8
+# Ratio of the capacity of a level to the capacity of the level above it
+CAPACITY_DECAY = 2 / 3
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch of a stream of numbers, after Karnin, Lang and Liberty (KLL).
+
+    The sketch keeps the numbers in levels, an item of level h standing for 2^h numbers. New
+    numbers go to level 0, and a level over its capacity is compacted: its items are sorted, and
+    every other one, starting at a random offset, is moved up a level while the others are
+    dropped. The capacities decrease geometrically from `k` at the top level, so the sketch
+    holds at most about 3k items whatever the number of values, and its rank error is about
+    1.7 / k (under 1% with the default k of 200). The sketch is exact while it holds fewer
+    numbers than its level 0 capacity.
+
+    Two sketches are merged by concatenating their levels and compacting, so the sketches of
+    days or partitions can be combined into the sketch of a year.
+
+    Parameters:
+        k (int): Capacity of the top level. Default is 200.
+        seed (int, optional): Seed of the random offsets of the compactions. Default is None.
+
+    Example:
+        >>> monday, tuesday = KLLSketch(), KLLSketch()
+        >>> monday.update(monday_durations)
+        >>> tuesday.update(tuesday_durations)
+        >>> monday.merge(tuesday).quantiles([0.5, 0.85])
+        array([42.5, 51. ])
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: Optional[int] = None) -> None:
+        self.k = k
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values: Iterable[float]) -> "KLLSketch":
+        """
+        Add numbers to the sketch. NaN values are skipped.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """
+        Add the numbers summarized by another sketch to this one. `other` is not changed.
+        """
+        if other.count == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantiles(self, fractions: Iterable[float]) -> np.ndarray:
+        """
+        Estimate the quantiles of the numbers added to the sketch.
+
+        Parameters:
+            fractions (Iterable[float]): Fractions between 0 and 1, e.g. 0.85 for P85.
+
+        Returns:
+            ndarray: The number of nearest rank for every fraction, the minimum for 0 and the
+                     maximum for 1. NaN for an empty sketch.
+        """
+        fractions = np.asarray(list(fractions), dtype=np.float64)
+        if self.count == 0:
+            return np.full(len(fractions), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [
+                np.full(len(level_items), 2**level)
+                for level, level_items in enumerate(self.levels)
+            ]
+        )
+        order = np.argsort(items, kind="stable")
+        cumulative_weights = np.cumsum(weights[order])
+        positions = np.searchsorted(
+            cumulative_weights, np.ceil(fractions * self.count), side="left"
+        )
+        estimates = items[order][np.minimum(positions, len(items) - 1)]
+        estimates[fractions <= 0] = self.min
+        estimates[fractions >= 1] = self.max
+        return estimates
+
+    @property
+    def size(self) -> int:
+        """
+        Number of items held by the sketch.
+        """
+        return sum(len(items) for items in self.levels)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "count": self.count,
+            "min": None if self.count == 0 else self.min,
+            "max": None if self.count == 0 else self.max,
+            "levels": [items.tolist() for items in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], seed: Optional[int] = None) -> "KLLSketch":
+        sketch = cls(data["k"], seed)
+        sketch.count = data["count"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        sketch.levels = [
+            np.asarray(items, dtype=np.float64) for items in data["levels"]
+        ]
+        return sketch
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(MIN_LEVEL_CAPACITY, int(np.ceil(self.k * CAPACITY_DECAY**depth)))
+
+    def _compress(self) -> None:
+        # Compact the lowest level over its capacity until the sketch fits its capacity
+        while self.size > sum(map(self._capacity, range(len(self.levels)))):
+            for level in range(len(self.levels)):
+                if len(self.levels[level]) > self._capacity(level):
+                    self._compact(level)
+                    break
+
+    def _compact(self, level: int) -> None:
+        if level + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+        items = np.sort(self.levels[level])
+        # With an odd number of items, the largest stays at its level
+        kept = items[len(items) - len(items) % 2 :]
+        paired = items[: len(items) - len(items) % 2]
+        promoted = paired[self._rng.integers(2) :: 2]
+        self.levels[level] = kept
+        self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def __repr__(self) -> str:
+        return f"KLLSketch(k={self.k}, count={self.count}, size={self.size})"
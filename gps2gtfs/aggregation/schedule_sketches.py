@@ -0,0 +1,269 @@
+import json
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pandas import DataFrame
+
+from gps2gtfs.aggregation.quantile_sketch import DEFAULT_K, KLLSketch
+from gps2gtfs.data_field.output_field import StopTimeField, TripField
+from gps2gtfs.utility.defaults import DEFAULT_QUANTILES
+from gps2gtfs.utility.logger import logger
+
+SCHEDULE_SKETCHES_FILE_NAME = "schedule_sketches.json"
+# Key of the percentile tables derived from the day of week
+IS_WEEKDAY = StopTimeField.IS_WEEKDAY.value
+# Key columns holding integers, the others are kept as text
+_INTEGER_KEY_COLUMNS = {TripField.DAY_OF_WEEK.value, TripField.HOUR_OF_DAY.value}
+
+
+class SketchMetric(Enum):
+    TRIP_DURATION_IN_MINS = "trip_duration_in_mins"
+    DWELL_TIME_IN_SECONDS = "dwell_time_in_seconds"
+    RUNNING_TIME_IN_SECONDS = "running_time_in_seconds"
+    HEADWAY_IN_SECONDS = "headway_in_seconds"
+
+
+_TRIP_KEY_COLUMNS = [
+    TripField.DIRECTION.value,
+    TripField.DAY_OF_WEEK.value,
+    TripField.HOUR_OF_DAY.value,
+]
+_STOP_KEY_COLUMNS = [
+    StopTimeField.DIRECTION.value,
+    StopTimeField.BUS_STOP.value,
+    StopTimeField.DAY_OF_WEEK.value,
+    StopTimeField.HOUR_OF_DAY.value,
+]
+# Column of the values and key columns of every metric
+METRIC_COLUMNS: Dict[SketchMetric, Tuple[str, List[str]]] = {
+    SketchMetric.TRIP_DURATION_IN_MINS: (
+        TripField.DURATION_IN_MINS.value,
+        _TRIP_KEY_COLUMNS,
+    ),
+    SketchMetric.DWELL_TIME_IN_SECONDS: (
+        StopTimeField.DWELL_TIME_IN_SECONDS.value,
+        _STOP_KEY_COLUMNS,
+    ),
+    SketchMetric.RUNNING_TIME_IN_SECONDS: (
+        StopTimeField.RUNNING_TIME_IN_SECONDS.value,
+        _STOP_KEY_COLUMNS,
+    ),
+    SketchMetric.HEADWAY_IN_SECONDS: (
+        StopTimeField.HEADWAY_IN_SECONDS.value,
+        _STOP_KEY_COLUMNS,
+    ),
+}
+_TRIP_METRICS = [SketchMetric.TRIP_DURATION_IN_MINS]
+_STOP_METRICS = [
+    SketchMetric.DWELL_TIME_IN_SECONDS,
+    SketchMetric.RUNNING_TIME_IN_SECONDS,
+    SketchMetric.HEADWAY_IN_SECONDS,
+]
+
+
+class ScheduleSketches:
+    """
+    Quantile sketches of trip durations and stop times, by direction, day of week and hour.
+
+    Every metric has one `KLLSketch` per key: the trip durations by direction, day of week and
+    hour of day, and the dwell times, running times and headways by direction, bus stop, day
+    of week and hour of day. The sketches are updated with every batch of trips and stop times
+    as they are produced, and hold a bounded number of items whatever the number of days, so
+    the percentiles of a year are computed without keeping its trips and stop times.
+
+    The sketches of separate runs, e.g. one per day, are combined with `merge`, and
+    `percentile_table` merges the sketches of coarser keys, e.g. weekdays against weekends.
+
+    Parameters:
+        k (int): Accuracy of the sketches, see `KLLSketch`. Default is 200.
+        seed (int, optional): Seed of the sketches. Default is None.
+
+    Example:
+        >>> sketches = ScheduleSketches()
+        >>> for day in days:
+        ...     result = trip_stop.process(*day, 100, 50, 100)
+        ...     sketches.update_trips(result.trips)
+        ...     sketches.update_stop_times(result.stop_times)
+        >>> sketches.percentile_table(
+        ...     "trip_duration_in_mins", by=["direction", "is_weekday", "hour_of_day"]
+        ... )
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: Optional[int] = None) -> None:
+        self.k = k
+        self.seed = seed
+        self.sketches: Dict[SketchMetric, Dict[Tuple, KLLSketch]] = {
+            metric: {} for metric in SketchMetric
+        }
+
+    def update_trips(self, trips_df: DataFrame) -> int:
+        """
+        Add the durations of trips, with the columns of `TripField`.
+
+        Returns:
+            int: The number of values added.
+        """
+        return sum(self._update(metric, trips_df) for metric in _TRIP_METRICS)
+
+    def update_stop_times(self, stop_times_df: DataFrame) -> int:
+        """
+        Add the dwell times of stop times, with the columns of `StopTimeField`, and their
+        running times and headways when they have them.
+
+        Returns:
+            int: The number of values added.
+        """
+        return sum(self._update(metric, stop_times_df) for metric in _STOP_METRICS)
+
+    def merge(self, other: "ScheduleSketches") -> "ScheduleSketches":
+        """
+        Add the values summarized by other sketches to these. `other` is not changed.
+        """
+        for metric, other_sketches in other.sketches.items():
+            sketches = self.sketches[metric]
+            for key, other_sketch in other_sketches.items():
+                if key not in sketches:
+                    sketches[key] = KLLSketch(self.k, self.seed)
+                sketches[key].merge(other_sketch)
+        return self
+
+    def percentile_table(
+        self,
+        metric: Union[str, SketchMetric],
+        quantiles: Sequence[float] = DEFAULT_QUANTILES,
+        by: Optional[Iterable[str]] = None,
+    ) -> DataFrame:
+        """
+        Estimate the percentiles of a metric for every key.
+
+        Parameters:
+            metric (Union[str, SketchMetric]): One of 'trip_duration_in_mins',
+                                               'dwell_time_in_seconds',
+                                               'running_time_in_seconds' or
+                                               'headway_in_seconds'.
+            quantiles (Sequence[float]): Fractions of the percentiles. Default is (0.5, 0.85).
+            by (Iterable[str], optional): Key columns of the table, among the key columns of
+                                          the metric and 'is_weekday'. The sketches of the
+                                          keys with the same values are merged, and the
+                                          columns the metric has no key for are ignored.
+                                          Default is None, which keeps all its key columns.
+
+        Returns:
+            DataFrame: The key columns, the number of values, their minimum and maximum, and
+                       one column per quantile named after its percentile, e.g. 'p85'.
+        """
+        metric = SketchMetric(metric)
+        key_columns = METRIC_COLUMNS[metric][1]
+        derived_columns = {IS_WEEKDAY: TripField.DAY_OF_WEEK.value}
+        if by is None:
+            by = key_columns
+        by = [
+            column
+            for column in by
+            if column in key_columns or derived_columns.get(column) in key_columns
+        ]
+        percentile_columns = [f"p{round(q * 100, 3):g}" for q in quantiles]
+
+        groups: Dict[Tuple, KLLSketch] = {}
+        for key, sketch in self.sketches[metric].items():
+            values = dict(zip(key_columns, key))
+            values[IS_WEEKDAY] = int(values.get(TripField.DAY_OF_WEEK.value, 0) < 5)
+            group_key = tuple(values[column] for column in by)
+            if group_key not in groups:
+                groups[group_key] = KLLSketch(self.k, self.seed)
+            groups[group_key].merge(sketch)
+
+        rows = [
+            [*group_key, sketch.count, sketch.min, sketch.max]
+            + sketch.quantiles(quantiles).tolist()
+            for group_key, sketch in sorted(groups.items())
+        ]
+        return DataFrame(
+            rows, columns=[*by, "count", "min", "max", *percentile_columns]
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "metrics": {
+                metric.value: {
+                    "key_columns": METRIC_COLUMNS[metric][1],
+                    "sketches": [
+                        {"key": list(key), "sketch": sketch.to_dict()}
+                        for key, sketch in sorted(sketches.items())
+                    ],
+                }
+                for metric, sketches in self.sketches.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(
+        cls, data: Dict[str, Any], seed: Optional[int] = None
+    ) -> "ScheduleSketches":
+        schedule_sketches = cls(data["k"], seed)
+        for name, metric_data in data["metrics"].items():
+            schedule_sketches.sketches[SketchMetric(name)] = {
+                tuple(entry["key"]): KLLSketch.from_dict(entry["sketch"], seed)
+                for entry in metric_data["sketches"]
+            }
+        return schedule_sketches
+
+    def write_json(self, path: str) -> None:
+        """
+        Write the sketches as a JSON file, from which `read_json` makes them again.
+
+        Parameters:
+            path (str): The file path where the JSON sketches will be saved.
+
+        Returns:
+            None
+        """
+        with open(path, "w", encoding="utf-8") as sketches_file:
+            json.dump(self.to_dict(), sketches_file)
+        logger.info(f"Successfully wrote the schedule sketches into JSON in {path}")
+
+    @classmethod
+    def read_json(cls, path: str, seed: Optional[int] = None) -> "ScheduleSketches":
+        with open(path, encoding="utf-8") as sketches_file:
+            return cls.from_dict(json.load(sketches_file), seed)
+
+    def _update(self, metric: SketchMetric, df: DataFrame) -> int:
+        value_column, key_columns = METRIC_COLUMNS[metric]
+        if value_column not in df.columns or len(df) == 0:
+            return 0
+        missing_columns = [column for column in key_columns if column not in df.columns]
+        if missing_columns:
+            logger.warning(
+                f"Skipping the '{metric.value}' sketches, the data has no "
+                f"{missing_columns} columns"
+            )
+            return 0
+
+        values_df = df[[*key_columns, value_column]].dropna()
+        keys_df = DataFrame(
+            {
+                column: (
+                    values_df[column].astype(np.int64)
+                    if column in _INTEGER_KEY_COLUMNS
+                    else values_df[column].astype(str)
+                )
+                for column in key_columns
+            }
+        )
+        values = values_df[value_column].to_numpy(dtype=np.float64)
+        sketches = self.sketches[metric]
+        for key, positions in keys_df.groupby(key_columns, sort=False).indices.items():
+            key = tuple(part.item() if hasattr(part, "item") else part for part in key)
+            if key not in sketches:
+                sketches[key] = KLLSketch(self.k, self.seed)
+            sketches[key].update(values[positions])
+        return len(values)
+
+    def __repr__(self) -> str:
+        counts = ", ".join(
+            f"{metric.value}={len(sketches)} keys"
+            for metric, sketches in self.sketches.items()
+        )
+        return f"ScheduleSketches({counts})"
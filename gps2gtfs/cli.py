@@ -0,0 +1,1043 @@
+import argparse
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+from gps2gtfs.utility.data_io_converter import FileFormat
+from gps2gtfs.utility.defaults import (
+    DEFAULT_CLUSTER_RADIUS_M,
+    DEFAULT_K,
+    DEFAULT_MAX_FROZEN_RATIO,
+    DEFAULT_MAX_GAP_S,
+    DEFAULT_MIN_LAYOVER_S,
+    DEFAULT_MIN_TERMINAL_DISTANCE_M,
+    DEFAULT_MIN_VISITS,
+    DEFAULT_QUANTILES,
+    DEFAULT_SPARSE_INTERVAL_S,
+    DEFAULT_STATIONARY_DISTANCE_M,
+    DEFAULT_TOLERANCE_M,
+    SimplifyMethod,
+)
+from gps2gtfs.utility.executor import Engine, ExecutionBackend, MemoryProfile
+from gps2gtfs.utility.logger import logger
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+    from gps2gtfs.pipeline.result import PipelineResult
+    from gps2gtfs.reporting.run_report import RunReport
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="gps2gtfs",
+        description="Process raw GPS data of public transit into trips and stop times.",
+    )
+    subparsers = parser.add_subparsers(dest="pipeline", required=True)
+
+    trip_parser = subparsers.add_parser("trip", help="Extract trips from raw GPS data.")
+    _add_route_arguments(trip_parser, with_stops=False)
+    _add_engine_arguments(trip_parser)
+
+    trip_stop_parser = subparsers.add_parser(
+        "trip-stop", help="Extract trips and stop times from raw GPS data."
+    )
+    _add_route_arguments(trip_stop_parser, with_stops=True)
+    _add_engine_arguments(trip_stop_parser)
+    trip_stop_parser.add_argument(
+        "--trajectory-store",
+        default=None,
+        metavar="DIR",
+        help="Also write the trip-annotated trajectories in a store partitioned by date and "
+        "grid cell in DIR, which can be queried by area and time window.",
+    )
+    trip_stop_parser.add_argument(
+        "--export-trajectories",
+        action="store_true",
+        help="Also write the trajectory of every trip as one simplified linestring with "
+        "delta-encoded times to 'trajectories' (GeoParquet with --output-format parquet).",
+    )
+    trip_stop_parser.add_argument(
+        "--trajectory-tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE_M,
+        metavar="M",
+        help="Largest distance in meters of the GPS records dropped from the exported "
+        f"trajectories (default: {DEFAULT_TOLERANCE_M:g}).",
+    )
+    trip_stop_parser.add_argument(
+        "--trajectory-simplification",
+        choices=[method.value for method in SimplifyMethod],
+        default=SimplifyMethod.DOUGLAS_PEUCKER.value,
+        help="Distance used to simplify the exported trajectories: to the path "
+        "('douglas-peucker'), or to the position interpolated at the time of each record "
+        "('time-aware') (default: douglas-peucker).",
+    )
+    trip_stop_parser.add_argument(
+        "--running-times-and-headways",
+        action="store_true",
+        help="Add the running time from the previous stop and the headway behind the "
+        "previous bus at the same stop to the stop times.",
+    )
+    trip_stop_parser.add_argument(
+        "--schedule-sketches",
+        action="store_true",
+        help="Also write mergeable quantile sketches of the trip durations and stop times "
+        "to schedule_sketches.json, for schedule-stats.",
+    )
+
+    stop_parser = subparsers.add_parser(
+        "stop",
+        help="Extract stop times from the trips and processed GPS data of an earlier run.",
+    )
+    _add_stop_arguments(stop_parser)
+    _add_engine_arguments(stop_parser, with_trips=False)
+
+    sweep_parser = subparsers.add_parser(
+        "sweep",
+        help="Compare the trips and stop times of a grid of terminal and stop buffer radii.",
+    )
+    _add_sweep_arguments(sweep_parser)
+    _add_engine_arguments(sweep_parser, with_partitions=False)
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Keep routes and workers loaded, and run extraction jobs sent over HTTP.",
+    )
+    _add_serve_arguments(serve_parser)
+
+    discover_parser = subparsers.add_parser(
+        "discover",
+        help="Find candidate terminals and stops where buses repeatedly stop.",
+    )
+    _add_discover_arguments(discover_parser)
+
+    quality_parser = subparsers.add_parser(
+        "quality",
+        help="Profile the raw GPS data per device and date: intervals, gaps, duplicates.",
+    )
+    _add_quality_arguments(quality_parser)
+
+    schedule_stats_parser = subparsers.add_parser(
+        "schedule-stats",
+        help="Percentiles of trip durations and stop times over many runs, from merged "
+        "sketches.",
+    )
+    _add_schedule_stats_arguments(schedule_stats_parser)
+
+    synthesize_parser = subparsers.add_parser(
+        "synthesize",
+        help="Generate synthetic raw GPS data with ground truth trips and stop times.",
+    )
+    _add_synthesize_arguments(synthesize_parser)
+
+    compare_parser = subparsers.add_parser(
+        "compare-engines",
+        help="Check that the fast engine gives the outputs of the reference engine.",
+    )
+    _add_route_arguments(compare_parser, with_stops=True)
+    _add_compare_arguments(compare_parser)
+
+    return parser
+
+
+def _add_route_arguments(parser: argparse.ArgumentParser, with_stops: bool) -> None:
+    inputs = parser.add_argument_group("inputs")
+    inputs.add_argument("--raw-gps", required=True, help="Path to the raw GPS data.")
+    inputs.add_argument(
+        "--terminals", required=True, help="Path to the trip terminals CSV."
+    )
+    inputs.add_argument(
+        "--terminals-buffer-radius",
+        type=int,
+        default=100,
+        help="Buffer radius around the trip terminals (default: 100).",
+    )
+    if with_stops:
+        inputs.add_argument("--stops", required=True, help="Path to the stops CSV.")
+        inputs.add_argument(
+            "--stops-buffer-radius",
+            type=int,
+            default=50,
+            help="Buffer radius around the bus stops (default: 50).",
+        )
+        inputs.add_argument(
+            "--stops-extended-buffer-radius",
+            type=int,
+            default=100,
+            help="Extended buffer radius around the bus stops (default: 100).",
+        )
+
+
+def _add_stop_arguments(parser: argparse.ArgumentParser) -> None:
+    inputs = parser.add_argument_group("inputs")
+    inputs.add_argument("--raw-gps", required=True, help="Path to the raw GPS data.")
+    inputs.add_argument(
+        "--processed-gps",
+        required=True,
+        help="Path to the processed GPS data written by trip or trip-stop with "
+        "--write-processed-gps.",
+    )
+    inputs.add_argument(
+        "--trips", required=True, help="Path to the trips written by trip or trip-stop."
+    )
+    inputs.add_argument("--stops", required=True, help="Path to the stops CSV.")
+    inputs.add_argument(
+        "--stops-buffer-radius",
+        type=int,
+        default=50,
+        help="Buffer radius around the bus stops (default: 50).",
+    )
+    inputs.add_argument(
+        "--stops-extended-buffer-radius",
+        type=int,
+        default=100,
+        help="Extended buffer radius around the bus stops (default: 100).",
+    )
+    parser.add_argument(
+        "--running-times-and-headways",
+        action="store_true",
+        help="Add the running time from the previous stop and the headway behind the "
+        "previous bus at the same stop to the stop times.",
+    )
+
+
+def _add_sweep_arguments(parser: argparse.ArgumentParser) -> None:
+    inputs = parser.add_argument_group("inputs")
+    inputs.add_argument("--raw-gps", required=True, help="Path to the raw GPS data.")
+    inputs.add_argument(
+        "--terminals", required=True, help="Path to the trip terminals CSV."
+    )
+    inputs.add_argument("--stops", required=True, help="Path to the stops CSV.")
+
+    sweep = parser.add_argument_group("sweep")
+    sweep.add_argument(
+        "--terminals-buffer-radius",
+        type=int,
+        nargs="+",
+        default=[100],
+        help="Buffer radii around the trip terminals (default: 100).",
+    )
+    sweep.add_argument(
+        "--stops-buffer-radius",
+        type=int,
+        nargs="+",
+        default=[50],
+        help="Buffer radii around the bus stops (default: 50).",
+    )
+    sweep.add_argument(
+        "--stops-extended-buffer-radius",
+        type=int,
+        nargs="+",
+        default=[100],
+        help="Extended buffer radii around the bus stops (default: 100).",
+    )
+    sweep.add_argument(
+        "--write-outputs",
+        action="store_true",
+        help="Also write the trips and stop times of every setting, in one directory "
+        "per setting.",
+    )
+
+
+def _add_engine_arguments(
+    parser: argparse.ArgumentParser,
+    with_trips: bool = True,
+    with_partitions: bool = True,
+) -> None:
+    engine = parser.add_argument_group("engine and resources")
+    if with_partitions:
+        engine.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of parallel workers (default: number of CPU cores).",
+        )
+        engine.add_argument(
+            "--backend",
+            choices=[b.value for b in ExecutionBackend],
+            default=ExecutionBackend.PROCESSES.value,
+            help="Parallel execution backend (default: processes).",
+        )
+    engine.add_argument(
+        "--engine",
+        choices=[e.value for e in Engine],
+        default=Engine.REFERENCE.value,
+        help="Implementation of the matching and aggregation stages, the original loops or "
+        "their vectorized equivalents (default: reference).",
+    )
+    if with_trips:
+        engine.add_argument(
+            "--compress-stationary",
+            action="store_true",
+            help="Collapse the runs of GPS records of a device at the same position to "
+            "their first and last records before matching.",
+        )
+    engine.add_argument(
+        "--memory-profile",
+        choices=[m.value for m in MemoryProfile],
+        default=MemoryProfile.DEFAULT.value,
+        help="Dtypes of the cleaned GPS data, the default ones or compact ones that take "
+        "less memory (default: default).",
+    )
+    if with_trips and with_partitions:
+        engine.add_argument(
+            "--lean",
+            action="store_true",
+            help="Make the points of the cleaned GPS data once, without copying it, for "
+            "both the terminal and the stop matching.",
+        )
+    engine.add_argument(
+        "--presorted",
+        action="store_true",
+        help="Trust that the raw GPS data is sorted by device and time, e.g. Parquet files "
+        "written in that order, and skip sorting it.",
+    )
+    if with_trips and with_partitions:
+        engine.add_argument(
+            "--memory-limit",
+            type=int,
+            default=None,
+            metavar="MB",
+            help="Memory ceiling in megabytes. When set, the input is processed one date "
+            "at a time with intermediates spilled to disk.",
+        )
+        engine.add_argument(
+            "--work-dir",
+            default=None,
+            help="Directory for spilled partitions when --memory-limit is set "
+            "(default: a temporary directory).",
+        )
+
+    io = parser.add_argument_group("input and output")
+    io.add_argument(
+        "--input-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help=(
+            "Format of the raw GPS data (default: csv)."
+            if with_trips
+            else "Format of the raw GPS, processed GPS and trips data (default: csv)."
+        ),
+    )
+    io.add_argument(
+        "--output-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help="Format of the outputs (default: csv).",
+    )
+    io.add_argument(
+        "--output-dir",
+        default=".",
+        help="Directory where outputs are written (default: current directory).",
+    )
+    if with_trips and with_partitions:
+        io.add_argument(
+            "--write-processed-gps",
+            action="store_true",
+            help="Also write the GPS records matched with the trip terminals, from which "
+            "the stop pipeline computes stop times without extracting the trips again.",
+        )
+    io.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log the time, peak memory and row counts of every pipeline stage.",
+    )
+    io.add_argument(
+        "--profile-dir",
+        default=None,
+        help="Profile every stage and worker task, and write a .pstats and a collapsed-stack "
+        "(flame graph) file per stage in this directory.",
+    )
+    io.add_argument(
+        "--report",
+        action="store_true",
+        help="Write the run report as run_report.json in the output directory.",
+    )
+    io.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Logging level (default: INFO).",
+    )
+
+    monitoring = parser.add_argument_group("progress monitoring")
+    monitoring.add_argument(
+        "--progress-interval",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Log the rows processed, throughput and ETA of the running stage every "
+        "SECONDS seconds (default: 30 when metrics are exported, otherwise off).",
+    )
+    monitoring.add_argument(
+        "--metrics-file",
+        default=None,
+        help="Keep the progress metrics up to date in this Prometheus textfile.",
+    )
+    monitoring.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve the progress metrics on http://127.0.0.1:PORT/metrics.",
+    )
+
+
+def _add_serve_arguments(parser: argparse.ArgumentParser) -> None:
+    service = parser.add_argument_group("service")
+    service.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Serve the jobs on http://127.0.0.1:PORT (default: 8765).",
+    )
+    service.add_argument(
+        "--route",
+        nargs="+",
+        action="append",
+        default=[],
+        metavar=("ID TERMINALS", "STOPS"),
+        help="Register a route at start-up from its trip terminals CSV and, optionally, its "
+        "stops CSV. Can be repeated, and more routes can be registered over HTTP.",
+    )
+    service.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of parallel workers (default: number of CPU cores).",
+    )
+    service.add_argument(
+        "--backend",
+        choices=[b.value for b in ExecutionBackend],
+        default=ExecutionBackend.PROCESSES.value,
+        help="Parallel execution backend (default: processes).",
+    )
+    service.add_argument(
+        "--engine",
+        choices=[e.value for e in Engine],
+        default=Engine.REFERENCE.value,
+        help="Implementation of the matching and aggregation stages (default: reference).",
+    )
+    service.add_argument(
+        "--memory-profile",
+        choices=[m.value for m in MemoryProfile],
+        default=MemoryProfile.DEFAULT.value,
+        help="Dtypes of the cleaned GPS data (default: default).",
+    )
+    service.add_argument(
+        "--lean",
+        action="store_true",
+        help="Make the points of the cleaned GPS data once for both the terminal and the "
+        "stop matching.",
+    )
+    service.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Logging level (default: INFO).",
+    )
+
+
+def _add_discover_arguments(parser: argparse.ArgumentParser) -> None:
+    data = parser.add_argument_group("data")
+    data.add_argument("--raw-gps", required=True, help="Path to the raw GPS data file.")
+    data.add_argument(
+        "--input-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help="Format of the raw GPS data file (default: csv).",
+    )
+
+    clustering = parser.add_argument_group("clustering")
+    clustering.add_argument(
+        "--cluster-radius",
+        type=float,
+        default=DEFAULT_CLUSTER_RADIUS_M,
+        help="Size in meters of the grid cells of the clustering "
+        f"(default: {DEFAULT_CLUSTER_RADIUS_M:g}).",
+    )
+    clustering.add_argument(
+        "--min-visits",
+        type=int,
+        default=DEFAULT_MIN_VISITS,
+        help="Number of dwells around a place that makes it a candidate "
+        f"(default: {DEFAULT_MIN_VISITS}).",
+    )
+    clustering.add_argument(
+        "--min-layover",
+        type=float,
+        default=DEFAULT_MIN_LAYOVER_S,
+        help="Shortest dwell in seconds that counts as a layover at a terminal "
+        f"(default: {DEFAULT_MIN_LAYOVER_S:g}).",
+    )
+    clustering.add_argument(
+        "--min-terminal-distance",
+        type=float,
+        default=DEFAULT_MIN_TERMINAL_DISTANCE_M,
+        help="Shortest distance in meters between the two terminals "
+        f"(default: {DEFAULT_MIN_TERMINAL_DISTANCE_M:g}).",
+    )
+
+    io = parser.add_argument_group("output")
+    io.add_argument(
+        "--output-dir",
+        default=".",
+        help="Directory where discovered_terminals.csv and discovered_stops.csv are "
+        "written (default: current directory).",
+    )
+    io.add_argument(
+        "--write-dwells",
+        action="store_true",
+        help="Also write the dwells found in the GPS data to dwells.csv.",
+    )
+    io.add_argument(
+        "--memory-limit",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="Memory ceiling used to size the chunks read from the raw GPS data.",
+    )
+    io.add_argument(
+        "--work-dir",
+        default=None,
+        help="Directory to spill the partitions into (default: a temporary directory).",
+    )
+    io.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log the time, peak memory and row counts of every pipeline stage.",
+    )
+    io.add_argument(
+        "--report",
+        action="store_true",
+        help="Write the run report as run_report.json in the output directory.",
+    )
+    io.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Logging level (default: INFO).",
+    )
+
+
+def _add_quality_arguments(parser: argparse.ArgumentParser) -> None:
+    data = parser.add_argument_group("data")
+    data.add_argument("--raw-gps", required=True, help="Path to the raw GPS data file.")
+    data.add_argument(
+        "--input-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help="Format of the raw GPS data file (default: csv).",
+    )
+
+    thresholds = parser.add_argument_group("thresholds")
+    thresholds.add_argument(
+        "--max-gap",
+        type=float,
+        default=DEFAULT_MAX_GAP_S,
+        help="Interval in seconds between two records above which the signal is lost "
+        f"(default: {DEFAULT_MAX_GAP_S:g}).",
+    )
+    thresholds.add_argument(
+        "--stationary-distance",
+        type=float,
+        default=DEFAULT_STATIONARY_DISTANCE_M,
+        help="Distance in meters from the previous record below which a record has not "
+        f"moved (default: {DEFAULT_STATIONARY_DISTANCE_M:g}).",
+    )
+    thresholds.add_argument(
+        "--sparse-interval",
+        type=float,
+        default=DEFAULT_SPARSE_INTERVAL_S,
+        help="Median interval in seconds above which a device-day is flagged as sparse "
+        f"(default: {DEFAULT_SPARSE_INTERVAL_S:g}).",
+    )
+    thresholds.add_argument(
+        "--max-frozen-ratio",
+        type=float,
+        default=DEFAULT_MAX_FROZEN_RATIO,
+        help="Share of frozen records above which a device-day is flagged as frozen "
+        f"(default: {DEFAULT_MAX_FROZEN_RATIO:g}).",
+    )
+
+    io = parser.add_argument_group("output")
+    io.add_argument(
+        "--output-dir",
+        default=".",
+        help="Directory where gps_quality and gps_quality_summary.json are written "
+        "(default: current directory).",
+    )
+    io.add_argument(
+        "--output-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help="Format of the gps_quality table (default: csv).",
+    )
+    io.add_argument(
+        "--memory-limit",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="Memory ceiling used to size the chunks read from the raw GPS data.",
+    )
+    io.add_argument(
+        "--work-dir",
+        default=None,
+        help="Directory to spill the partitions into (default: a temporary directory).",
+    )
+    io.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log the time, peak memory and row counts of every pipeline stage.",
+    )
+    io.add_argument(
+        "--report",
+        action="store_true",
+        help="Write the run report as run_report.json in the output directory.",
+    )
+    io.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Logging level (default: INFO).",
+    )
+
+
+def _add_schedule_stats_arguments(parser: argparse.ArgumentParser) -> None:
+    inputs = parser.add_argument_group("inputs")
+    inputs.add_argument(
+        "--trips",
+        nargs="+",
+        default=[],
+        help="Paths of trips outputs, read in chunks.",
+    )
+    inputs.add_argument(
+        "--stops",
+        nargs="+",
+        default=[],
+        help="Paths of stops outputs, read in chunks.",
+    )
+    inputs.add_argument(
+        "--sketches",
+        nargs="+",
+        default=[],
+        help="Paths of schedule_sketches.json files written by trip-stop "
+        "--schedule-sketches or schedule-stats, merged together.",
+    )
+    inputs.add_argument(
+        "--input-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help="Format of the trips and stops files (default: csv).",
+    )
+
+    tables = parser.add_argument_group("tables")
+    tables.add_argument(
+        "--quantiles",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_QUANTILES),
+        help="Fractions of the percentiles of the tables (default: "
+        f"{' '.join(f'{q:g}' for q in DEFAULT_QUANTILES)}).",
+    )
+    tables.add_argument(
+        "--by",
+        nargs="+",
+        default=None,
+        help="Key columns of the tables, among direction, bus_stop, day_of_week, "
+        "is_weekday and hour_of_day (default: all the keys of every metric).",
+    )
+    tables.add_argument(
+        "--k",
+        type=int,
+        default=DEFAULT_K,
+        help=f"Accuracy of the sketches made from files (default: {DEFAULT_K}).",
+    )
+
+    io = parser.add_argument_group("output")
+    io.add_argument(
+        "--output-dir",
+        default=".",
+        help="Directory where the percentile tables and the merged "
+        "schedule_sketches.json are written (default: current directory).",
+    )
+    io.add_argument(
+        "--output-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help="Format of the percentile tables (default: csv).",
+    )
+    io.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log the time, peak memory and row counts of every pipeline stage.",
+    )
+    io.add_argument(
+        "--report",
+        action="store_true",
+        help="Write the run report as run_report.json in the output directory.",
+    )
+    io.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Logging level (default: INFO).",
+    )
+
+
+def _add_compare_arguments(parser: argparse.ArgumentParser) -> None:
+    comparison = parser.add_argument_group("comparison")
+    comparison.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of parallel workers (default: number of CPU cores).",
+    )
+    comparison.add_argument(
+        "--backend",
+        choices=[b.value for b in ExecutionBackend],
+        default=ExecutionBackend.PROCESSES.value,
+        help="Parallel execution backend (default: processes).",
+    )
+    comparison.add_argument(
+        "--input-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help="Format of the raw GPS data (default: csv).",
+    )
+    comparison.add_argument(
+        "--rtol",
+        type=float,
+        default=1e-9,
+        help="Relative tolerance of numbers (default: 1e-9).",
+    )
+    comparison.add_argument(
+        "--atol",
+        type=float,
+        default=1e-6,
+        help="Absolute tolerance of numbers and seconds (default: 1e-6).",
+    )
+    comparison.add_argument(
+        "--report",
+        default=None,
+        help="Write the comparison of every stage to this JSON file.",
+    )
+    comparison.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Logging level (default: INFO).",
+    )
+
+
+def _add_synthesize_arguments(parser: argparse.ArgumentParser) -> None:
+    route = parser.add_argument_group("route")
+    route.add_argument(
+        "--terminals", required=True, help="Path to the trip terminals CSV."
+    )
+    route.add_argument(
+        "--stops",
+        required=True,
+        help="Path to the stops CSV, with the stops of each direction in travel order.",
+    )
+
+    simulation = parser.add_argument_group("simulation")
+    simulation.add_argument(
+        "--buses", type=int, default=10, help="Number of buses (default: 10)."
+    )
+    simulation.add_argument(
+        "--days", type=int, default=7, help="Number of service days (default: 7)."
+    )
+    simulation.add_argument(
+        "--start-date",
+        default="2022-07-01",
+        help="First service date as YYYY-MM-DD (default: 2022-07-01).",
+    )
+    simulation.add_argument(
+        "--trips-per-day",
+        type=int,
+        default=8,
+        help="Number of trips each bus runs a day (default: 8).",
+    )
+    simulation.add_argument(
+        "--ping-interval",
+        type=float,
+        default=15,
+        help="Seconds between two GPS pings (default: 15).",
+    )
+    simulation.add_argument(
+        "--gps-noise",
+        type=float,
+        default=5.0,
+        help="Standard deviation of the GPS noise in meters (default: 5).",
+    )
+    simulation.add_argument(
+        "--signal-gaps-per-day",
+        type=float,
+        default=2.0,
+        help="Average number of signal gaps per bus and day (default: 2).",
+    )
+    simulation.add_argument(
+        "--seed", type=int, default=0, help="Seed of the random generator (default: 0)."
+    )
+
+    io = parser.add_argument_group("output")
+    io.add_argument(
+        "--output-dir", required=True, help="Directory where the data is written."
+    )
+    io.add_argument(
+        "--output-format",
+        choices=[f.value for f in FileFormat],
+        default=FileFormat.CSV.value,
+        help="Format of the outputs (default: csv).",
+    )
+    io.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=1_000_000,
+        help="Maximum number of rows written at once (default: 1000000).",
+    )
+    io.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Logging level (default: INFO).",
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logger.setLevel(args.log_level)
+
+    if args.pipeline == "synthesize":
+        from gps2gtfs.synthetic.avl_generator import generate_avl_data
+
+        paths = generate_avl_data(
+            args.terminals,
+            args.stops,
+            args.output_dir,
+            num_buses=args.buses,
+            num_days=args.days,
+            start_date=args.start_date,
+            trips_per_day=args.trips_per_day,
+            ping_interval_s=args.ping_interval,
+            gps_noise_m=args.gps_noise,
+            signal_gaps_per_day=args.signal_gaps_per_day,
+            output_format=args.output_format,
+            chunk_rows=args.chunk_rows,
+            seed=args.seed,
+        )
+        return 0 if paths is not None else 1
+    if args.pipeline == "compare-engines":
+        return _compare_engines(args)
+    if args.pipeline == "serve":
+        return _serve(args)
+    if args.pipeline == "discover":
+        from gps2gtfs.pipeline import discover
+
+        results = discover.run(
+            args.raw_gps,
+            cluster_radius_m=args.cluster_radius,
+            min_visits=args.min_visits,
+            min_layover_s=args.min_layover,
+            min_terminal_distance_m=args.min_terminal_distance,
+            memory_limit_mb=args.memory_limit,
+            work_dir=args.work_dir,
+            input_format=args.input_format,
+            output_dir=args.output_dir,
+            write_dwells=args.write_dwells,
+            profile=args.profile,
+            write_report=args.report,
+        )
+        return 0 if results is not None else 1
+    if args.pipeline == "schedule-stats":
+        from gps2gtfs.pipeline import schedule_stats
+
+        sketches = schedule_stats.run(
+            args.trips,
+            args.stops,
+            args.sketches,
+            quantiles=args.quantiles,
+            by=args.by,
+            k=args.k,
+            input_format=args.input_format,
+            output_format=args.output_format,
+            output_dir=args.output_dir,
+            profile=args.profile,
+            write_report=args.report,
+        )
+        return 0 if sketches is not None else 1
+    if args.pipeline == "quality":
+        from gps2gtfs.pipeline import quality
+
+        results = quality.run(
+            args.raw_gps,
+            max_gap_s=args.max_gap,
+            stationary_distance_m=args.stationary_distance,
+            sparse_interval_s=args.sparse_interval,
+            max_frozen_ratio=args.max_frozen_ratio,
+            memory_limit_mb=args.memory_limit,
+            work_dir=args.work_dir,
+            input_format=args.input_format,
+            output_format=args.output_format,
+            output_dir=args.output_dir,
+            profile=args.profile,
+            write_report=args.report,
+        )
+        return 0 if results is not None else 1
+
+    engine_kwargs = {
+        "engine": args.engine,
+        "memory_profile": args.memory_profile,
+        "presorted": args.presorted,
+        "input_format": args.input_format,
+        "output_format": args.output_format,
+        "output_dir": args.output_dir,
+        "profile": args.profile,
+        "write_report": args.report,
+        "profile_dir": args.profile_dir,
+    }
+    if args.pipeline != "sweep":
+        engine_kwargs["num_workers"] = args.workers
+        engine_kwargs["backend"] = args.backend
+    if args.pipeline != "stop":
+        engine_kwargs["compress_stationary_records"] = args.compress_stationary
+    if args.pipeline == "trip-stop":
+        engine_kwargs["trajectory_store_dir"] = args.trajectory_store
+        engine_kwargs["export_trajectories"] = args.export_trajectories
+        engine_kwargs["trajectory_tolerance_m"] = args.trajectory_tolerance
+        engine_kwargs["trajectory_simplification"] = args.trajectory_simplification
+        engine_kwargs["schedule_sketches"] = args.schedule_sketches
+    if args.pipeline in ("trip-stop", "stop"):
+        engine_kwargs["running_times_and_headways"] = args.running_times_and_headways
+    if args.pipeline not in ("stop", "sweep"):
+        engine_kwargs["lean"] = args.lean
+        engine_kwargs["write_processed_gps"] = args.write_processed_gps
+        if args.memory_limit is not None:
+            engine_kwargs["memory_limit_mb"] = args.memory_limit
+            engine_kwargs["work_dir"] = args.work_dir
+
+    progress = None
+    if any(
+        option is not None
+        for option in (args.progress_interval, args.metrics_file, args.metrics_port)
+    ):
+        from gps2gtfs.reporting.progress import ProgressMonitor
+
+        progress = ProgressMonitor(
+            log_interval_s=args.progress_interval or 30.0,
+            textfile_path=args.metrics_file,
+            http_port=args.metrics_port,
+        ).start()
+        engine_kwargs["progress"] = progress
+
+    try:
+        result = _run_pipeline(args, engine_kwargs)
+    finally:
+        if progress is not None:
+            progress.close()
+    return 0 if result is not None else 1
+
+
+def _run_pipeline(
+    args: argparse.Namespace, engine_kwargs: Dict[str, Any]
+) -> Optional[Union["PipelineResult", "RunReport", "DataFrame"]]:
+    if args.pipeline == "trip":
+        from gps2gtfs.pipeline import trip
+
+        run = trip.run if args.memory_limit is None else trip.run_partitioned
+        return run(
+            args.raw_gps, args.terminals, args.terminals_buffer_radius, **engine_kwargs
+        )
+
+    if args.pipeline == "stop":
+        from gps2gtfs.pipeline import stop
+
+        return stop.run(
+            args.raw_gps,
+            args.processed_gps,
+            args.trips,
+            args.stops,
+            args.stops_buffer_radius,
+            args.stops_extended_buffer_radius,
+            **engine_kwargs,
+        )
+
+    if args.pipeline == "sweep":
+        from gps2gtfs.pipeline import sweep
+
+        return sweep.run(
+            args.raw_gps,
+            args.terminals,
+            args.stops,
+            args.terminals_buffer_radius,
+            args.stops_buffer_radius,
+            args.stops_extended_buffer_radius,
+            write_outputs=args.write_outputs,
+            **engine_kwargs,
+        )
+
+    from gps2gtfs.pipeline import trip_stop
+
+    run = trip_stop.run if args.memory_limit is None else trip_stop.run_partitioned
+    return run(
+        args.raw_gps,
+        args.terminals,
+        args.stops,
+        args.terminals_buffer_radius,
+        args.stops_buffer_radius,
+        args.stops_extended_buffer_radius,
+        **engine_kwargs,
+    )
+
+
+def _serve(args: argparse.Namespace) -> int:
+    from gps2gtfs.pipeline.service import ExtractionService
+
+    service = ExtractionService(
+        num_workers=args.workers,
+        backend=args.backend,
+        engine=args.engine,
+        memory_profile=args.memory_profile,
+        lean=args.lean,
+    ).start()
+    for route in args.route:
+        if len(route) not in (2, 3):
+            logger.error(
+                f"--route takes an ID, a terminals CSV and a stops CSV: {route}"
+            )
+            service.close()
+            return 1
+        if service.register_route_files(*route) is None:
+            service.close()
+            return 1
+    service.serve(args.port)
+    return 0
+
+
+def _compare_engines(args: argparse.Namespace) -> int:
+    import json
+
+    from gps2gtfs.load_data.load_from_csv import load_data_for_trip_stop_pipeline
+    from gps2gtfs.reporting.equivalence import compare_stage_engines
+
+    loaded_data = load_data_for_trip_stop_pipeline(
+        args.raw_gps, args.terminals, args.stops, args.input_format
+    )
+    if not loaded_data:
+        return 1
+    raw_gps_df, trip_terminals_df, stops_df = loaded_data
+
+    comparisons = compare_stage_engines(
+        raw_gps_df,
+        trip_terminals_df,
+        stops_df,
+        args.terminals_buffer_radius,
+        args.stops_buffer_radius,
+        args.stops_extended_buffer_radius,
+        args.workers,
+        args.backend,
+        args.rtol,
+        args.atol,
+    )
+    if args.report is not None:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump([c.to_dict() for c in comparisons], report_file, indent=2)
+    return 0 if all(comparison.equivalent for comparison in comparisons) else 1
@@ -1,5 +1,10 @@
-from . import (  # noqa F401
-    im_field,
-    input_field,
-    output_field,
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "im_field",
+        "input_field",
+        "output_field",
+    ],
 )
@@ -83,3 +83,17 @@ class ExtractedStopField(Enum):
     DIRECTION = "direction"
 
     GROUPED_ENDS = "grouped_ends"
+
+
+class DwellField(Enum):
+    DEVICE_ID = "deviceid"
+    DATE = "date"
+    ARRIVAL_TIME = "arrival_time"
+    DEPARTURE_TIME = "departure_time"
+    DWELL_TIME_IN_SECONDS = "dwell_time_in_seconds"
+    RECORDS = "records"
+    LATITUDE = "latitude"
+    LONGITUDE = "longitude"
+
+    CLUSTER = "cluster"
+    DIRECTION = "direction"
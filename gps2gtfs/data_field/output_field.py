@@ -30,3 +30,66 @@ class StopTimeField(Enum):
     DAY_OF_WEEK = "day_of_week"
     HOUR_OF_DAY = "hour_of_day"
     IS_WEEKDAY = "is_weekday"
+    RUNNING_TIME_IN_SECONDS = "running_time_in_seconds"
+    HEADWAY_IN_SECONDS = "headway_in_seconds"
+
+
+class SweepField(Enum):
+    TERMINALS_BUFFER_RADIUS = "terminals_buffer_radius"
+    STOPS_BUFFER_RADIUS = "stops_buffer_radius"
+    STOPS_EXTENDED_BUFFER_RADIUS = "stops_extended_buffer_radius"
+    TRIPS = "trips"
+    STOP_TIMES = "stop_times"
+    STOP_COVERAGE = "stop_coverage"
+    MEDIAN_DWELL_TIME_IN_SECONDS = "median_dwell_time_in_seconds"
+
+
+class CompactTrajectoryField(Enum):
+    TRIP_ID = "trip_id"
+    DEVICE_ID = "deviceid"
+    DIRECTION = "direction"
+    START_TIME = "start_time"
+    RAW_POINTS = "raw_points"
+    POINTS = "points"
+    TIME_DELTAS_S = "time_deltas_s"
+    GEOMETRY = "geometry"
+
+
+class DiscoveredTerminalField(Enum):
+    TERMINAL_ID = "terminal_id"
+    LATITUDE = "latitude"
+    LONGITUDE = "longitude"
+    VISITS = "visits"
+    LAYOVERS = "layovers"
+    DEVICES = "devices"
+    MEDIAN_DWELL_TIME_IN_SECONDS = "median_dwell_time_in_seconds"
+
+
+class DiscoveredStopField(Enum):
+    STOP_ID = "stop_id"
+    DIRECTION = "direction"
+    LATITUDE = "latitude"
+    LONGITUDE = "longitude"
+    VISITS = "visits"
+    DEVICES = "devices"
+    MEDIAN_DWELL_TIME_IN_SECONDS = "median_dwell_time_in_seconds"
+
+
+class GPSQualityField(Enum):
+    DEVICE_ID = "deviceid"
+    DATE = "date"
+    RECORDS = "records"
+    FIRST_TIME = "first_time"
+    LAST_TIME = "last_time"
+    SPAN_HOURS = "span_hours"
+    COVERAGE_RATIO = "coverage_ratio"
+    INTERVAL_P50_S = "interval_p50_s"
+    INTERVAL_P90_S = "interval_p90_s"
+    INTERVAL_P99_S = "interval_p99_s"
+    GAPS = "gaps"
+    LONGEST_GAP_S = "longest_gap_s"
+    DUPLICATE_RATIO = "duplicate_ratio"
+    OUT_OF_ORDER = "out_of_order"
+    ZERO_COORDINATES = "zero_coordinates"
+    STATIONARY_RATIO = "stationary_ratio"
+    FROZEN_RATIO = "frozen_ratio"
@@ -0,0 +1,8 @@
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "dwell_clusters",
+    ],
+)
@@ -0,0 +1,356 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+from pandas import DataFrame, Series, concat
+from gps2gtfs.data_field.im_field import CleanedRawGPSField, DwellField
+from gps2gtfs.data_field.output_field import (
+    DiscoveredStopField,
+    DiscoveredTerminalField,
+)
+from gps2gtfs.utility.data_io_converter import GEO_CRS, haversine_m
+from gps2gtfs.utility.defaults import (
+    DEFAULT_CLUSTER_RADIUS_M,
+    DEFAULT_MIN_LAYOVER_S,
+    DEFAULT_MIN_TERMINAL_DISTANCE_M,
+    DEFAULT_MIN_VISITS,
+)
+from gps2gtfs.utility.logger import logger
+
+# Offsets of a grid cell and of its eight neighbours
+_NEIGHBOUR_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+def find_dwells(cleaned_gps_df: DataFrame) -> DataFrame:
+    """
+    Collapse the runs of zero speed records of every device into dwell events.
+
+    A run is a sequence of consecutive records of one device and one date that all have a zero
+    speed. Runs are found with shifted arrays, without a loop over the records, so the dwells
+    of long periods can be found one partition of the GPS data at a time and concatenated.
+
+    Parameters:
+        cleaned_gps_df (DataFrame): The GPS data returned by `clean`, sorted by device and time.
+
+    Returns:
+        DataFrame: One row per run with the columns of `DwellField`: the device, date, first
+                   and last times of the run, its duration in seconds, its number of records
+                   and its mean position.
+    """
+    device_ids = cleaned_gps_df[CleanedRawGPSField.DEVICE_ID.value].to_numpy()
+    device_times = cleaned_gps_df[CleanedRawGPSField.DEVICE_TIME.value]
+    dates = device_times.dt.normalize().to_numpy()
+    is_stopped = (cleaned_gps_df[CleanedRawGPSField.SPEED.value] == 0).to_numpy()
+
+    continues_run = np.zeros(len(cleaned_gps_df), dtype=bool)
+    continues_run[1:] = (
+        is_stopped[1:]
+        & is_stopped[:-1]
+        & (device_ids[1:] == device_ids[:-1])
+        & (dates[1:] == dates[:-1])
+    )
+    run_ids = np.cumsum(is_stopped & ~continues_run)[is_stopped]
+
+    stopped_df = cleaned_gps_df[is_stopped]
+    groups = stopped_df.groupby(run_ids, sort=False)
+    dwells_df = DataFrame(
+        {
+            DwellField.DEVICE_ID.value: groups[
+                CleanedRawGPSField.DEVICE_ID.value
+            ].first(),
+            DwellField.DATE.value: groups[CleanedRawGPSField.DATE.value].first(),
+            DwellField.ARRIVAL_TIME.value: groups[
+                CleanedRawGPSField.DEVICE_TIME.value
+            ].min(),
+            DwellField.DEPARTURE_TIME.value: groups[
+                CleanedRawGPSField.DEVICE_TIME.value
+            ].max(),
+            DwellField.RECORDS.value: groups.size(),
+            DwellField.LATITUDE.value: groups[CleanedRawGPSField.LATITUDE.value].mean(),
+            DwellField.LONGITUDE.value: groups[
+                CleanedRawGPSField.LONGITUDE.value
+            ].mean(),
+        }
+    ).reset_index(drop=True)
+    dwells_df.insert(
+        4,
+        DwellField.DWELL_TIME_IN_SECONDS.value,
+        (
+            dwells_df[DwellField.DEPARTURE_TIME.value]
+            - dwells_df[DwellField.ARRIVAL_TIME.value]
+        ).dt.total_seconds(),
+    )
+    logger.info(
+        f"Found {len(dwells_df)} dwells in {int(is_stopped.sum())} zero speed records"
+    )
+    return dwells_df
+
+
+def cluster_dwells(
+    dwells_df: DataFrame,
+    cluster_radius_m: float = DEFAULT_CLUSTER_RADIUS_M,
+    min_visits: int = DEFAULT_MIN_VISITS,
+) -> np.ndarray:
+    """
+    Cluster the positions of dwells by density, on a grid.
+
+    The dwells are put in square cells of `cluster_radius_m`. A cell is dense when it and its
+    eight neighbours hold at least `min_visits` dwells, adjacent dense cells form a cluster,
+    and the cells next to a cluster join it. This is DBSCAN with the distances between dwells
+    replaced by cell adjacency: the work grows with the number of occupied cells rather than
+    with the pairs of dwells, so that months of dwells cluster in seconds.
+
+    Parameters:
+        dwells_df (DataFrame): Dwells with their latitude and longitude, e.g. from
+                               `find_dwells`.
+        cluster_radius_m (float): Size in meters of the grid cells. Default is 30.
+        min_visits (int): Number of dwells around a cell that makes it dense. Default is 5.
+
+    Returns:
+        ndarray: The cluster of every dwell, numbered from 0, or -1 for dwells in no cluster.
+    """
+    from geopandas import points_from_xy
+
+    if len(dwells_df) == 0:
+        return np.zeros(0, dtype=np.int64)
+    points = points_from_xy(
+        dwells_df[DwellField.LONGITUDE.value],
+        dwells_df[DwellField.LATITUDE.value],
+        crs="EPSG:4326",
+    ).to_crs(GEO_CRS)
+
+    # Cell coordinates start at 1, so that the neighbours of every cell have a valid key
+    cell_x = np.floor(points.x / cluster_radius_m).astype(np.int64)
+    cell_y = np.floor(points.y / cluster_radius_m).astype(np.int64)
+    cell_x -= cell_x.min() - 1
+    cell_y -= cell_y.min() - 1
+    width = int(cell_y.max()) + 2
+    cells, cell_of_dwell, cell_visits = np.unique(
+        cell_x * width + cell_y, return_inverse=True, return_counts=True
+    )
+
+    # Position of the neighbours of every cell in `cells`, -1 for empty neighbours
+    neighbours = []
+    for dx, dy in _NEIGHBOUR_OFFSETS:
+        keys = cells + dx * width + dy
+        positions = np.minimum(np.searchsorted(cells, keys), len(cells) - 1)
+        neighbours.append(np.where(cells[positions] == keys, positions, -1))
+
+    neighbourhood_visits = sum(
+        np.where(neighbour >= 0, cell_visits[neighbour], 0) for neighbour in neighbours
+    )
+    is_dense = neighbourhood_visits >= min_visits
+
+    # Every dense cell takes the smallest label of the dense cells it is connected to
+    no_label = len(cells)
+    labels = np.where(is_dense, np.arange(len(cells)), no_label)
+    while True:
+        new_labels = labels.copy()
+        for neighbour in neighbours:
+            linked = is_dense & (neighbour >= 0) & is_dense[neighbour]
+            new_labels[linked] = np.minimum(
+                new_labels[linked], labels[neighbour[linked]]
+            )
+        new_labels[is_dense] = new_labels[new_labels[is_dense]]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    # Cells next to a cluster join it
+    for neighbour in neighbours:
+        linked = ~is_dense & (neighbour >= 0) & is_dense[neighbour]
+        labels[linked] = np.minimum(labels[linked], labels[neighbour[linked]])
+
+    is_clustered = labels < no_label
+    cell_clusters = np.full(len(cells), -1, dtype=np.int64)
+    _, cluster_numbers = np.unique(labels[is_clustered], return_inverse=True)
+    cell_clusters[is_clustered] = cluster_numbers
+    return cell_clusters[cell_of_dwell]
+
+
+def discover_terminals_and_stops(
+    dwells_df: DataFrame,
+    cluster_radius_m: float = DEFAULT_CLUSTER_RADIUS_M,
+    min_visits: int = DEFAULT_MIN_VISITS,
+    min_layover_s: float = DEFAULT_MIN_LAYOVER_S,
+    min_terminal_distance_m: float = DEFAULT_MIN_TERMINAL_DISTANCE_M,
+) -> Optional[Tuple[DataFrame, DataFrame]]:
+    """
+    Find the terminals and stops of a route from the places where its buses repeatedly stop.
+
+    The dwells are clustered with `cluster_dwells`. The terminals are the two clusters with the
+    most layovers, i.e. dwells of at least `min_layover_s`, that are at least
+    `min_terminal_distance_m` apart. Every other dwell between a departure from one terminal and
+    the next arrival at the other is given the direction between them, and the dwells of each
+    direction are clustered again into its stops. The stops of a direction are ordered by their
+    median time since the departure from the terminal.
+
+    Parameters:
+        dwells_df (DataFrame): Dwells of the buses of the route, from `find_dwells`.
+        cluster_radius_m (float): Size in meters of the grid cells of the clustering. Default
+                                  is 30.
+        min_visits (int): Number of dwells around a place that makes it a candidate. Default
+                          is 5.
+        min_layover_s (float): Shortest dwell in seconds that counts as a layover at a
+                               terminal. Default is 180.
+        min_terminal_distance_m (float): Shortest distance in meters between the two terminals.
+                                         Default is 1000.
+
+    Returns:
+        Optional[Tuple[DataFrame, DataFrame]]: The terminals, with the columns of
+                                               `DiscoveredTerminalField`, and the stops, with
+                                               the columns of `DiscoveredStopField`. Both can be
+                                               read by the loaders as terminals and stops data.
+                                               None is returned if two terminals cannot be
+                                               found.
+
+    Notes:
+        - Buses also stop at traffic lights and junctions, which show up as stops with short
+          dwells. The visit counts and median dwell times help to review the candidates.
+
+    Example:
+        >>> dwells_df = find_dwells(clean(raw_gps_df))
+        >>> terminals_df, stops_df = discover_terminals_and_stops(dwells_df)
+        >>> stops_df.to_csv("stops.csv", index=False)
+    """
+    dwells_df = dwells_df.sort_values(
+        [DwellField.DEVICE_ID.value, DwellField.ARRIVAL_TIME.value], kind="stable"
+    ).reset_index(drop=True)
+    dwells_df[DwellField.CLUSTER.value] = cluster_dwells(
+        dwells_df, cluster_radius_m, min_visits
+    )
+    clusters_df = _summarize_clusters(
+        dwells_df[dwells_df[DwellField.CLUSTER.value] >= 0], min_layover_s
+    )
+    terminal_clusters = _pick_terminals(clusters_df, min_terminal_distance_m)
+    if terminal_clusters is None:
+        logger.error(
+            "Could not find two terminals with layovers "
+            f"{min_terminal_distance_m} m apart in the dwells"
+        )
+        return None
+
+    terminal_ids = [f"BT{number:02d}" for number in (1, 2)]
+    terminals_df = clusters_df.loc[terminal_clusters].reset_index(drop=True)
+    terminals_df.insert(0, DiscoveredTerminalField.TERMINAL_ID.value, terminal_ids)
+    terminals_df = terminals_df[[f.value for f in DiscoveredTerminalField]]
+
+    # Terminal of every terminal dwell, and the terminals before and after the other dwells
+    terminal = Series(
+        np.select(
+            [
+                dwells_df[DwellField.CLUSTER.value] == terminal_clusters[0],
+                dwells_df[DwellField.CLUSTER.value] == terminal_clusters[1],
+            ],
+            [1.0, 2.0],
+            np.nan,
+        )
+    )
+    device_days = [
+        dwells_df[DwellField.DEVICE_ID.value],
+        dwells_df[DwellField.DATE.value],
+    ]
+    previous_terminal = terminal.groupby(device_days).ffill()
+    next_terminal = terminal.groupby(device_days).bfill()
+    terminal_departure = (
+        dwells_df[DwellField.DEPARTURE_TIME.value]
+        .where(terminal.notna())
+        .groupby(device_days)
+        .ffill()
+    )
+    dwells_df[DwellField.DIRECTION.value] = np.select(
+        [
+            terminal.isna() & (previous_terminal == 1) & (next_terminal == 2),
+            terminal.isna() & (previous_terminal == 2) & (next_terminal == 1),
+        ],
+        [1, 2],
+        0,
+    )
+    seconds_since_departure = (
+        dwells_df[DwellField.ARRIVAL_TIME.value] - terminal_departure
+    ).dt.total_seconds()
+
+    stops_dfs = []
+    for direction, name in [
+        (1, f"{terminal_ids[0]}-{terminal_ids[1]}"),
+        (2, f"{terminal_ids[1]}-{terminal_ids[0]}"),
+    ]:
+        is_direction = dwells_df[DwellField.DIRECTION.value] == direction
+        direction_dwells_df = dwells_df[is_direction].copy()
+        direction_dwells_df[DwellField.CLUSTER.value] = cluster_dwells(
+            direction_dwells_df, cluster_radius_m, min_visits
+        )
+        is_clustered = direction_dwells_df[DwellField.CLUSTER.value] >= 0
+        direction_stops_df = _summarize_clusters(
+            direction_dwells_df[is_clustered], min_layover_s
+        )
+        order = (
+            seconds_since_departure[is_direction][is_clustered]
+            .groupby(direction_dwells_df[DwellField.CLUSTER.value][is_clustered])
+            .median()
+        )
+        direction_stops_df = direction_stops_df.loc[order.sort_values().index]
+        direction_stops_df[DiscoveredStopField.DIRECTION.value] = name
+        stops_dfs.append(direction_stops_df)
+
+    stops_df = concat(stops_dfs, ignore_index=True)
+    stops_df.insert(
+        0, DiscoveredStopField.STOP_ID.value, np.arange(1, len(stops_df) + 1)
+    )
+    stops_df = stops_df[[f.value for f in DiscoveredStopField]]
+    logger.info(
+        f"Discovered {len(terminals_df)} terminals and {len(stops_df)} stops in "
+        f"{len(dwells_df)} dwells"
+    )
+    return terminals_df, stops_df
+
+
+def _summarize_clusters(dwells_df: DataFrame, min_layover_s: float) -> DataFrame:
+    groups = dwells_df.groupby(DwellField.CLUSTER.value)
+    dwell_times = dwells_df[DwellField.DWELL_TIME_IN_SECONDS.value]
+    return DataFrame(
+        {
+            DiscoveredTerminalField.LATITUDE.value: groups[
+                DwellField.LATITUDE.value
+            ].mean(),
+            DiscoveredTerminalField.LONGITUDE.value: groups[
+                DwellField.LONGITUDE.value
+            ].mean(),
+            DiscoveredTerminalField.VISITS.value: groups.size(),
+            DiscoveredTerminalField.LAYOVERS.value: (dwell_times >= min_layover_s)
+            .groupby(dwells_df[DwellField.CLUSTER.value])
+            .sum(),
+            DiscoveredTerminalField.DEVICES.value: groups[
+                DwellField.DEVICE_ID.value
+            ].nunique(),
+            DiscoveredTerminalField.MEDIAN_DWELL_TIME_IN_SECONDS.value: groups[
+                DwellField.DWELL_TIME_IN_SECONDS.value
+            ].median(),
+        }
+    )
+
+
+def _pick_terminals(
+    clusters_df: DataFrame, min_terminal_distance_m: float
+) -> Optional[List[int]]:
+    candidates = clusters_df[clusters_df[DiscoveredTerminalField.LAYOVERS.value] > 0]
+    candidates = candidates.sort_values(
+        [
+            DiscoveredTerminalField.LAYOVERS.value,
+            DiscoveredTerminalField.VISITS.value,
+        ],
+        ascending=False,
+        kind="stable",
+    )
+    if len(candidates) < 2:
+        return None
+    first = candidates.iloc[0]
+    distances = haversine_m(
+        first[DiscoveredTerminalField.LATITUDE.value],
+        first[DiscoveredTerminalField.LONGITUDE.value],
+        candidates[DiscoveredTerminalField.LATITUDE.value].to_numpy(),
+        candidates[DiscoveredTerminalField.LONGITUDE.value].to_numpy(),
+    )
+    far_candidates = candidates.index[distances >= min_terminal_distance_m]
+    if len(far_candidates) == 0:
+        return None
+    return [candidates.index[0], far_candidates[0]]
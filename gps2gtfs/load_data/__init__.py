@@ -1,3 +1,9 @@
-from . import (  # noqa F401
-    load_from_csv,
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "load_from_csv",
+        "partitioner",
+    ],
 )
@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 
 from pandas import DataFrame
 from gps2gtfs.data_field.im_field import (
@@ -6,7 +6,7 @@ from gps2gtfs.data_field.im_field import (
 )
 from gps2gtfs.data_field.output_field import TripField
 from gps2gtfs.data_field.input_field import RawGPSField, StopField, TerminalField
-from gps2gtfs.utility.data_io_converter import read_csv_file
+from gps2gtfs.utility.data_io_converter import FileFormat, read_csv_file, read_file
 from gps2gtfs.utility.logger import logger
 
 
@@ -52,6 +52,7 @@ def load(file_paths: Dict[str, str]) -> List[Optional[DataFrame]]:
 def load_data_for_trip_pipeline(
     raw_gps_data_path: str,
     trip_terminals_data_path: str,
+    raw_gps_data_format: Union[str, FileFormat] = FileFormat.CSV,
 ) -> Optional[List[DataFrame]]:
     """
     Load and validate data for a processing pipeline.
@@ -63,6 +64,8 @@ def load_data_for_trip_pipeline(
     Parameters:
         raw_gps_data_path (str): File path to the CSV containing raw GPS data.
         trip_terminals_data_path (str): File path to the CSV containing trip terminals data.
+        raw_gps_data_format (Union[str, FileFormat]): Format of the raw GPS data file, either
+                                                      'csv' or 'parquet'. Default is 'csv'.
 
     Returns:
         Optional[List[DataFrame]]: A list of pandas DataFrames containing the loaded data. If any
@@ -71,6 +74,7 @@ def load_data_for_trip_pipeline(
 
     Notes:
         - The function uses the 'load' function to load data from the specified file paths.
+        - The raw GPS data may be a CSV or a Parquet file, the other inputs are CSV files.
         - It validates that the loaded DataFrames contain the required columns for raw GPS data,
           trip terminals data, and stops data.
         - If the data passes validation, a list containing the loaded DataFrames is returned.
@@ -87,11 +91,11 @@ def load_data_for_trip_pipeline(
         ...     print("Data loading and validation failed.")
     """
     file_paths = {
-        "Raw GPS data": raw_gps_data_path,
         "Trip terminals data": trip_terminals_data_path,
     }
 
-    raw_gps_df, trip_terminals_df = load(file_paths)
+    raw_gps_df = read_file(raw_gps_data_path, "Raw GPS data", raw_gps_data_format)
+    (trip_terminals_df,) = load(file_paths)
     if not any([df is None for df in [raw_gps_df, trip_terminals_df]]):
         raw_gps_fields = {f.value for f in RawGPSField}
         trip_terminals_fields = {f.value for f in TerminalField}
@@ -111,6 +115,7 @@ def load_data_for_trip_stop_pipeline(
     raw_gps_data_path: str,
     trip_terminals_data_path: str,
     stops_data_path: str,
+    raw_gps_data_format: Union[str, FileFormat] = FileFormat.CSV,
 ) -> Optional[List[DataFrame]]:
     """
     Load and validate data for a processing pipeline.
@@ -123,6 +128,8 @@ def load_data_for_trip_stop_pipeline(
         raw_gps_data_path (str): File path to the CSV containing raw GPS data.
         trip_terminals_data_path (str): File path to the CSV containing trip terminals data.
         stops_data_path (str): File path to the CSV containing stops data.
+        raw_gps_data_format (Union[str, FileFormat]): Format of the raw GPS data file, either
+                                                      'csv' or 'parquet'. Default is 'csv'.
 
     Returns:
         Optional[List[DataFrame]]: A list of pandas DataFrames containing the loaded data. If any
@@ -131,6 +138,7 @@ def load_data_for_trip_stop_pipeline(
 
     Notes:
         - The function uses the 'load' function to load data from the specified file paths.
+        - The raw GPS data may be a CSV or a Parquet file, the other inputs are CSV files.
         - It validates that the loaded DataFrames contain the required columns for raw GPS data,
           trip terminals data, and stops data.
         - If the data passes validation, a list containing the loaded DataFrames is returned.
@@ -148,12 +156,12 @@ def load_data_for_trip_stop_pipeline(
         ...     print("Data loading and validation failed.")
     """
     file_paths = {
-        "Raw GPS data": raw_gps_data_path,
         "Trip terminals data": trip_terminals_data_path,
         "Stops data": stops_data_path,
     }
 
-    raw_gps_df, trip_terminals_df, stops_df = load(file_paths)
+    raw_gps_df = read_file(raw_gps_data_path, "Raw GPS data", raw_gps_data_format)
+    trip_terminals_df, stops_df = load(file_paths)
     if not any([df is None for df in [raw_gps_df, trip_terminals_df, stops_df]]):
         raw_gps_fields = {f.value for f in RawGPSField}
         trip_terminals_fields = {f.value for f in TerminalField}
@@ -173,6 +181,74 @@ def load_data_for_trip_stop_pipeline(
             logger.error(f"In Stops data: {stops_fields}")
 
 
+def load_data_for_partitioned_pipeline(
+    trip_terminals_data_path: str,
+    stops_data_path: Optional[str] = None,
+) -> Optional[List[DataFrame]]:
+    """
+    Load and validate the route data for a partitioned processing pipeline.
+
+    The raw GPS data is not loaded by this function, since the partitioned pipeline streams it
+    from disk. Only the trip terminals data and, for the trip & stop pipeline, the stops data are
+    loaded and validated.
+
+    Parameters:
+        trip_terminals_data_path (str): File path to the CSV containing trip terminals data.
+        stops_data_path (str, optional): File path to the CSV containing stops data. Default is
+                                         None, for the trip pipeline.
+
+    Returns:
+        Optional[List[DataFrame]]: A list of pandas DataFrames containing the loaded data. If any
+                                   data file is not found or does not contain the required columns,
+                                   None is returned.
+    """
+    file_paths = {"Trip terminals data": trip_terminals_data_path}
+    required_fields = [{f.value for f in TerminalField}]
+    if stops_data_path is not None:
+        file_paths["Stops data"] = stops_data_path
+        required_fields.append({f.value for f in StopField})
+
+    loaded_dfs = load(file_paths)
+    if not any([df is None for df in loaded_dfs]):
+        if all(
+            not fields - set(df.columns.values)
+            for fields, df in zip(required_fields, loaded_dfs)
+        ):
+            logger.info("Data Loaded successfully for pipeline")
+            return loaded_dfs
+        else:
+            logger.error("Failed to load data for pipeline")
+            logger.error("Following columns should be included in your CSV files,")
+            for file_name, fields in zip(file_paths.keys(), required_fields):
+                logger.error(f"In {file_name}: {fields}")
+
+
+def load_raw_gps_data(
+    raw_gps_data_path: str,
+    raw_gps_data_format: Union[str, FileFormat] = FileFormat.CSV,
+) -> Optional[DataFrame]:
+    """
+    Load and validate the raw GPS data alone, for routes whose other data is already loaded.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the CSV or Parquet file containing raw GPS data.
+        raw_gps_data_format (Union[str, FileFormat]): Format of the raw GPS data file, either
+                                                      'csv' or 'parquet'. Default is 'csv'.
+
+    Returns:
+        Optional[DataFrame]: The raw GPS data. None is returned if the file is not found or
+                             does not contain the required columns.
+    """
+    raw_gps_df = read_file(raw_gps_data_path, "Raw GPS data", raw_gps_data_format)
+    if raw_gps_df is not None:
+        raw_gps_fields = {f.value for f in RawGPSField}
+        if not raw_gps_fields - set(raw_gps_df.columns.values):
+            return raw_gps_df
+        logger.error("Failed to load Raw GPS data")
+        logger.error("Following columns should be included in your CSV files,")
+        logger.error(f"In Raw GPS data: {raw_gps_fields}")
+
+
 def load_data_for_trip_calculation(
     raw_gps_data_path: str,
     trip_terminals_data_path: str,
@@ -203,20 +279,43 @@ def load_data_for_stop_calculation(
     processed_gps_data_path: str,
     trips_data_path: str,
     stops_data_path: str,
+    data_format: Union[str, FileFormat] = FileFormat.CSV,
 ) -> Optional[List[DataFrame]]:
-    file_paths = {
-        "Raw GPS data": raw_gps_data_path,
-        "Processed GPS data": processed_gps_data_path,
-        "Trips data": trips_data_path,
-        "Stops data": stops_data_path,
-    }
+    """
+    Load and validate the data for calculating stop times from stored trip results.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the raw GPS data.
+        processed_gps_data_path (str): File path to the GPS records matched with the trip
+                                       terminals, as written by the trip pipelines.
+        trips_data_path (str): File path to the trips, as written by the trip pipelines.
+        stops_data_path (str): File path to the CSV containing stops data.
+        data_format (Union[str, FileFormat]): Format of the raw GPS, processed GPS and trips
+                                              data files, either 'csv' or 'parquet'. Default is
+                                              'csv'.
 
-    raw_gps_df, processed_gps_df, trips_df, stops_df = load(file_paths)
+    Returns:
+        Optional[List[DataFrame]]: The raw GPS, processed GPS, trips and stops data. If any data
+                                   file is not found or does not contain the required columns,
+                                   None is returned.
+
+    Notes:
+        - The processed GPS data does not need the 'geometry' column, which is not written to
+          files and is rebuilt from the coordinates.
+    """
+    raw_gps_df = read_file(raw_gps_data_path, "Raw GPS data", data_format)
+    processed_gps_df = read_file(
+        processed_gps_data_path, "Processed GPS data", data_format
+    )
+    trips_df = read_file(trips_data_path, "Trips data", data_format)
+    (stops_df,) = load({"Stops data": stops_data_path})
     if not any(
         [df is None for df in [raw_gps_df, processed_gps_df, trips_df, stops_df]]
     ):
         raw_gps_fields = {f.value for f in RawGPSField}
-        processed_gps_fields = {f.value for f in ProcessedGPSField}
+        processed_gps_fields = {
+            f.value for f in ProcessedGPSField if f != ProcessedGPSField.GEOMETRY
+        }
         trips_fields = {f.value for f in TripField}
         stops_fields = {f.value for f in StopField}
         if (
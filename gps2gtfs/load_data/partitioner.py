@@ -0,0 +1,154 @@
+import os
+from typing import Dict, List, Optional, Union
+
+from pandas import DataFrame, to_datetime
+from gps2gtfs.data_field.input_field import RawGPSField
+from gps2gtfs.utility.data_io_converter import FileFormat, iter_file_chunks
+from gps2gtfs.utility.logger import logger
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+# Rough ratio between the size of a raw GPS partition and the peak memory the trip & stop
+# pipeline needs to process it (cleaned copy, GeoDataFrames, trajectory and its reprojection)
+PIPELINE_MEMORY_EXPANSION = 8
+PARTITION_FILE_PREFIX = "date="
+
+
+def estimate_row_bytes(df: DataFrame) -> int:
+    """
+    Estimate the in-memory size of a single row of a DataFrame in bytes.
+
+    Parameters:
+        df (DataFrame): A non-empty pandas DataFrame sampled from the input.
+
+    Returns:
+        int: The average deep memory usage per row, at least 1 byte.
+    """
+    if len(df) == 0:
+        return 1
+    return max(1, int(df.memory_usage(deep=True).sum() / len(df)))
+
+
+def partition_raw_gps_by_date(
+    raw_gps_data_path: str,
+    work_dir: str,
+    memory_limit_mb: Optional[int] = None,
+    file_format: Union[str, FileFormat] = FileFormat.CSV,
+) -> Optional[Dict[str, str]]:
+    """
+    Stream a raw GPS file and spill its rows into one CSV file per service date.
+
+    The raw GPS file is read in chunks so that the whole file is never held in memory. The date
+    of every row is derived from its 'devicetime' value, which is the same date the trip
+    extraction uses to pair terminal records, so no trip can start in one partition and end in
+    another. Rows that appear out of date order in the input are still routed to the partition
+    of their own date.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the CSV or Parquet file containing raw GPS data.
+        work_dir (str): Directory where the partition files are written.
+        memory_limit_mb (int, optional): Memory ceiling in megabytes. It is used to size the
+                                         chunks read from the input. Default is None, which
+                                         reads chunks of a fixed number of rows.
+        file_format (Union[str, FileFormat]): Format of the raw GPS file, either 'csv' or
+                                              'parquet'. Default is 'csv'.
+
+    Returns:
+        Optional[Dict[str, str]]: A dictionary mapping each date (YYYY-MM-DD) to the path of its
+                                  partition file, sorted by date. None is returned if the file
+                                  cannot be read or does not contain the required columns.
+    """
+    raw_gps_fields = {f.value for f in RawGPSField}
+    chunk_rows = DEFAULT_CHUNK_ROWS
+    if memory_limit_mb is not None:
+        try:
+            sample_df = next(iter_file_chunks(raw_gps_data_path, 10_000, file_format))
+        except Exception as e:
+            logger.error(f"Failed to read the Raw GPS data in {raw_gps_data_path}. {e}")
+            return None
+        row_bytes = estimate_row_bytes(sample_df)
+        # Keep the chunk well below the ceiling, the parsed chunk and its groups coexist
+        chunk_rows = max(1_000, int(memory_limit_mb * 1024**2 / (row_bytes * 4)))
+
+    os.makedirs(work_dir, exist_ok=True)
+    partition_paths: Dict[str, str] = {}
+    logger.info(f"Partitioning Raw GPS data by date in chunks of {chunk_rows} rows")
+    try:
+        for chunk in iter_file_chunks(raw_gps_data_path, chunk_rows, file_format):
+            missing_fields = raw_gps_fields - set(chunk.columns.values)
+            if missing_fields:
+                logger.error("Failed to partition data for pipeline")
+                logger.error("Following columns should be included in your CSV files,")
+                logger.error(f"In Raw GPS data: {raw_gps_fields}")
+                return None
+
+            dates = to_datetime(chunk[RawGPSField.DEVICE_TIME.value]).dt.strftime(
+                "%Y-%m-%d"
+            )
+            for date, date_chunk in chunk.groupby(dates, sort=False):
+                path = partition_paths.get(date)
+                if path is None:
+                    path = os.path.join(work_dir, f"{PARTITION_FILE_PREFIX}{date}.csv")
+                    partition_paths[date] = path
+                    date_chunk.to_csv(path, index=False)
+                else:
+                    date_chunk.to_csv(path, mode="a", header=False, index=False)
+    except FileNotFoundError:
+        logger.error(
+            f"File is not found. Please check the file path. Provided path is {raw_gps_data_path}."
+        )
+        return None
+    except ImportError:
+        logger.error("Reading Parquet files requires pyarrow. Please install pyarrow.")
+        return None
+
+    logger.info(
+        f"Successfully partitioned Raw GPS data into {len(partition_paths)} dates"
+    )
+    return dict(sorted(partition_paths.items()))
+
+
+def split_partition_by_device(
+    partition_df: DataFrame,
+    memory_limit_mb: Optional[int] = None,
+) -> List[DataFrame]:
+    """
+    Split a date partition into groups of whole devices that fit under a memory ceiling.
+
+    Parameters:
+        partition_df (DataFrame): Raw GPS data of a single date.
+        memory_limit_mb (int, optional): Memory ceiling in megabytes. Default is None, which
+                                         keeps the partition whole.
+
+    Returns:
+        List[DataFrame]: Parts of the partition. Every device appears in exactly one part.
+    """
+    if memory_limit_mb is None or len(partition_df) == 0:
+        return [partition_df]
+
+    limit_bytes = memory_limit_mb * 1024**2
+    row_bytes = estimate_row_bytes(partition_df) * PIPELINE_MEMORY_EXPANSION
+    max_rows = max(1, limit_bytes // row_bytes)
+    if len(partition_df) <= max_rows:
+        return [partition_df]
+
+    device_sizes = partition_df.groupby(RawGPSField.DEVICE_ID.value, sort=True).size()
+    if device_sizes.max() > max_rows:
+        logger.warning(
+            "A single device exceeds the memory limit for one date, "
+            "such a device is processed in a part of its own"
+        )
+
+    buckets: List[List] = [[]]
+    bucket_rows = 0
+    for device_id, size in device_sizes.items():
+        if buckets[-1] and bucket_rows + size > max_rows:
+            buckets.append([])
+            bucket_rows = 0
+        buckets[-1].append(device_id)
+        bucket_rows += size
+
+    logger.info(f"Splitting the partition into {len(buckets)} device groups")
+    return [
+        partition_df[partition_df[RawGPSField.DEVICE_ID.value].isin(devices)]
+        for devices in buckets
+    ]
@@ -1,4 +1,17 @@
-from . import (  # noqa F401
-    trip,
-    trip_stop,
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "discover",
+        "graph",
+        "quality",
+        "result",
+        "schedule_stats",
+        "service",
+        "stop",
+        "sweep",
+        "trip",
+        "trip_stop",
+    ],
 )
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+from typing import List, Optional, Tuple, Union
+
+from pandas import DataFrame, concat
+from gps2gtfs.discovery.dwell_clusters import (
+    DEFAULT_CLUSTER_RADIUS_M,
+    DEFAULT_MIN_LAYOVER_S,
+    DEFAULT_MIN_TERMINAL_DISTANCE_M,
+    DEFAULT_MIN_VISITS,
+    discover_terminals_and_stops,
+    find_dwells,
+)
+from gps2gtfs.load_data.partitioner import partition_raw_gps_by_date
+from gps2gtfs.preprocessing.data_cleaner import REMOVED_ROWS_ATTR, clean
+from gps2gtfs.reporting.run_report import RUN_REPORT_FILE_NAME, RunReport
+from gps2gtfs.utility.data_io_converter import (
+    FileFormat,
+    output_file_path,
+    read_csv_file,
+    write_file,
+)
+from gps2gtfs.utility.logger import logger
+
+TERMINALS_FILE_NAME = "discovered_terminals"
+STOPS_FILE_NAME = "discovered_stops"
+DWELLS_FILE_NAME = "dwells"
+
+
+def run(
+    raw_gps_data_path: str,
+    cluster_radius_m: float = DEFAULT_CLUSTER_RADIUS_M,
+    min_visits: int = DEFAULT_MIN_VISITS,
+    min_layover_s: float = DEFAULT_MIN_LAYOVER_S,
+    min_terminal_distance_m: float = DEFAULT_MIN_TERMINAL_DISTANCE_M,
+    memory_limit_mb: Optional[int] = None,
+    work_dir: Optional[str] = None,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: Optional[str] = ".",
+    write_dwells: bool = False,
+    profile: bool = False,
+    write_report: bool = False,
+) -> Optional[Tuple[DataFrame, DataFrame]]:
+    """
+    Discover the terminals and stops of a route from its raw GPS data.
+
+    The raw GPS data is streamed into one file per date, and every date is cleaned and reduced to
+    its dwells on its own, so only the dwells of the whole period are held in memory. The dwells
+    are then clustered into terminals and stops by `discover_terminals_and_stops`.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the CSV or Parquet file containing raw GPS data.
+        cluster_radius_m, min_visits, min_layover_s, min_terminal_distance_m: See
+        `discover_terminals_and_stops`.
+        memory_limit_mb (int, optional): Memory ceiling in megabytes used to size the input
+                                         chunks. Default is None.
+        work_dir (str, optional): Directory to spill the partitions into. Default is None,
+                                  which uses a temporary directory removed after the run.
+        input_format (Union[str, FileFormat]): Format of the raw GPS data file, either 'csv'
+                                               or 'parquet'. Default is 'csv'.
+        output_dir (str, optional): Directory where 'discovered_terminals.csv' and
+                                    'discovered_stops.csv' are written. Default is the current
+                                    directory. None writes nothing.
+        write_dwells (bool): Whether to also write the dwells found in the GPS data to
+                             'dwells.csv'. Default is False.
+        profile (bool): Whether to log the metrics of every stage. Default is False.
+        write_report (bool): Whether to write the run report as JSON in the output directory.
+                             Default is False.
+
+    Returns:
+        Optional[Tuple[DataFrame, DataFrame]]: The discovered terminals and stops. None is
+                                               returned if the raw GPS data cannot be loaded or
+                                               two terminals cannot be found.
+
+    Example:
+        >>> from gps2gtfs.pipeline import discover
+        >>> terminals_df, stops_df = discover.run("raw_gps.csv", output_dir="route_654")
+        >>> trip_stop.run("raw_gps.csv", "route_654/discovered_terminals.csv",
+        ...               "route_654/discovered_stops.csv", 100, 50, 100)
+    """
+    report = RunReport(
+        "discover",
+        {
+            "cluster_radius_m": cluster_radius_m,
+            "min_visits": min_visits,
+            "min_layover_s": min_layover_s,
+            "min_terminal_distance_m": min_terminal_distance_m,
+            "memory_limit_mb": memory_limit_mb,
+        },
+        log_stages=profile,
+    )
+    logger.info("Starting Pipeline for discovering terminals and stops")
+    spill_dir = (
+        work_dir if work_dir is not None else tempfile.mkdtemp(prefix="gps2gtfs_")
+    )
+    dwells_dfs: List[DataFrame] = []
+    try:
+        with report.stage("partition"):
+            partition_paths = partition_raw_gps_by_date(
+                raw_gps_data_path, spill_dir, memory_limit_mb, input_format
+            )
+        if partition_paths is None:
+            return None
+
+        for date, partition_path in partition_paths.items():
+            logger.info(f"Finding dwells of {date}")
+            with report.stage("load") as stage:
+                partition_df = read_csv_file(partition_path, f"partition of {date}")
+                stage.output_rows = None if partition_df is None else len(partition_df)
+            if partition_df is None:
+                continue
+            with report.stage("clean", len(partition_df)) as stage:
+                cleaned_raw_gps_df = clean(partition_df)
+                stage.output_rows = len(cleaned_raw_gps_df)
+                stage.counters.update(cleaned_raw_gps_df.attrs[REMOVED_ROWS_ATTR])
+            del partition_df
+            with report.stage("dwells", len(cleaned_raw_gps_df)) as stage:
+                dwells_dfs.append(find_dwells(cleaned_raw_gps_df))
+                stage.output_rows = len(dwells_dfs[-1])
+            del cleaned_raw_gps_df
+    finally:
+        if work_dir is None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    dwells_df = concat(dwells_dfs, ignore_index=True) if dwells_dfs else DataFrame()
+    del dwells_dfs
+    if len(dwells_df) == 0:
+        logger.error("No zero speed records were found in the Raw GPS data")
+        report.finish()
+        return None
+
+    with report.stage("clustering", len(dwells_df)) as stage:
+        results = discover_terminals_and_stops(
+            dwells_df,
+            cluster_radius_m,
+            min_visits,
+            min_layover_s,
+            min_terminal_distance_m,
+        )
+        stage.output_rows = None if results is None else len(results[1])
+    report.finish()
+    if results is None:
+        return None
+
+    terminals_df, stops_df = results
+    if output_dir is not None:
+        outputs = [(TERMINALS_FILE_NAME, terminals_df), (STOPS_FILE_NAME, stops_df)]
+        if write_dwells:
+            outputs.append((DWELLS_FILE_NAME, dwells_df))
+        for name, output_df in outputs:
+            write_file(output_df, output_file_path(output_dir, name, FileFormat.CSV))
+        if write_report:
+            report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return terminals_df, stops_df
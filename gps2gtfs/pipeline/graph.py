@@ -0,0 +1,411 @@
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from pandas import DataFrame
+from gps2gtfs.data_field.input_field import TerminalField
+from gps2gtfs.data_field.output_field import TripField
+from gps2gtfs.load_data.load_from_csv import load_raw_gps_data
+from gps2gtfs.preprocessing.data_cleaner import (
+    MEMORY_BYTES_ATTR,
+    REMOVED_ROWS_ATTR,
+    clean,
+)
+from gps2gtfs.preprocessing.stationary_compressor import (
+    STATIONARY_ROWS_ATTR,
+    compress_stationary,
+)
+from gps2gtfs.reporting.profiler import StageProfiler
+from gps2gtfs.reporting.progress import ProgressMonitor
+from gps2gtfs.reporting.run_report import RunReport
+from gps2gtfs.stop.data_preparator import prepare_trajectory_df
+from gps2gtfs.stop.feature_extractor import extract_stop_features, stop_time_columns
+from gps2gtfs.stop.stop_extractor import extract_stops
+from gps2gtfs.trip.feature_extractor import extract_trip_features
+from gps2gtfs.trip.trip_extractor import assemble_trips, match_terminals
+from gps2gtfs.utility.data_io_converter import FileFormat, pandas_to_geo_data_frame
+from gps2gtfs.utility.executor import Engine, ExecutionBackend, MemoryProfile
+from gps2gtfs.utility.logger import logger
+from gps2gtfs.utility.route_index import RouteIndex
+
+
+class PipelineOutput(Enum):
+    RAW_GPS = "raw_gps"
+    CLEANED_GPS = "cleaned_gps"
+    TERMINAL_MATCHES = "terminal_matches"
+    PROCESSED_GPS = "processed_gps"
+    TRIPS = "trips"
+    TRAJECTORY = "trajectory"
+    STOP_MATCHES = "stop_matches"
+    STOP_TIMES = "stop_times"
+
+
+# Stage that makes every output, and the outputs it reads, in the order the stages run
+STAGES: Dict[PipelineOutput, Tuple[str, Tuple[PipelineOutput, ...]]] = {
+    PipelineOutput.RAW_GPS: ("load", ()),
+    PipelineOutput.CLEANED_GPS: ("clean", (PipelineOutput.RAW_GPS,)),
+    PipelineOutput.TERMINAL_MATCHES: ("terminal match", (PipelineOutput.CLEANED_GPS,)),
+    PipelineOutput.PROCESSED_GPS: ("trip assembly", (PipelineOutput.TERMINAL_MATCHES,)),
+    PipelineOutput.TRIPS: ("trip features", (PipelineOutput.PROCESSED_GPS,)),
+    PipelineOutput.TRAJECTORY: (
+        "trajectory prep",
+        (
+            PipelineOutput.CLEANED_GPS,
+            PipelineOutput.PROCESSED_GPS,
+            PipelineOutput.TRIPS,
+        ),
+    ),
+    PipelineOutput.STOP_MATCHES: ("stop match", (PipelineOutput.TRAJECTORY,)),
+    PipelineOutput.STOP_TIMES: ("stop features", (PipelineOutput.STOP_MATCHES,)),
+}
+
+# Trip columns read by the trajectory stage
+_TRAJECTORY_TRIP_COLUMNS = [TripField.TRIP_ID.value, TripField.DIRECTION.value]
+
+
+class StageGraph:
+    """
+    The stages of the trip & stop pipeline as a lazy dependency graph, run for named outputs.
+
+    Nothing runs when the graph is made. `compute` runs only the stages its outputs depend on,
+    e.g. the trip durations need neither the trajectory nor the stop stages, and only the
+    columns asked for: the trip durations, day of week and hour of day, and the date features
+    of the stop times, are computed when they are asked for or read by a later stage. The stop
+    times only read the trip ID and direction of the trips.
+
+    Intermediate outputs are released as soon as the stages that read them have run, and
+    nothing is kept between calls, so the same graph can be computed several times, also at
+    the same time in threads.
+
+    The outputs and the stages that make them are:
+
+    - 'raw_gps' (load): The raw GPS data, loaded from `raw_gps` when it is a file path.
+    - 'cleaned_gps' (clean): The cleaned GPS data.
+    - 'terminal_matches' (terminal match): The GPS records within the trip terminal buffers.
+    - 'processed_gps' (trip assembly): The start and end terminal records of every trip.
+    - 'trips' (trip features): The trips, with the columns of `TripField`.
+    - 'trajectory' (trajectory prep): The GPS records of every trip, with its direction.
+    - 'stop_matches' (stop match): The trajectory records within the stop buffers.
+    - 'stop_times' (stop features): The stop times, with the columns of `StopTimeField`. The
+      running times and headways are only added when they are named in the columns.
+
+    Parameters:
+        raw_gps (Union[str, DataFrame]): Raw GPS data, or the path of its CSV or Parquet file.
+        trip_terminals_df (DataFrame): Trip terminals data, with the columns of
+                                       `TerminalField`.
+        stops_df (DataFrame, optional): Stops data, with the columns of `StopField`. Default is
+                                        None, in which case only the outputs up to 'trips' can
+                                        be computed.
+        terminals_buffer_radius (int): Buffer radius around the trip terminals. Default is 100.
+        stops_buffer_radius (int): Buffer radius around the bus stops. Default is 50.
+        stops_extended_buffer_radius (int): Extended buffer radius around the bus stops.
+                                            Default is 100.
+        input_format (Union[str, FileFormat]): Format of the raw GPS data file, either 'csv'
+                                               or 'parquet'. Default is 'csv'.
+        route_index (RouteIndex, optional): Prebuilt buffers and spatial indexes of the
+                                            terminals and stops. Default is None, which makes
+                                            one for the graph.
+        num_workers, backend, engine, compress_stationary_records, memory_profile, presorted,
+        lean, profile, progress, profile_dir: See `gps2gtfs.pipeline.trip_stop.process`.
+
+    Example:
+        >>> from gps2gtfs.pipeline.graph import StageGraph
+        >>> graph = StageGraph("raw_gps.csv", terminals_df, stops_df, engine="fast")
+        >>> graph.plan(["trips"])
+        ['load', 'clean', 'terminal match', 'trip assembly', 'trip features']
+        >>> outputs = graph.compute(["trips"], columns={"trips": ["trip_id", "duration"]})
+        >>> outputs["trips"].head()
+    """
+
+    def __init__(
+        self,
+        raw_gps: Union[str, DataFrame],
+        trip_terminals_df: DataFrame,
+        stops_df: Optional[DataFrame] = None,
+        terminals_buffer_radius: int = 100,
+        stops_buffer_radius: int = 50,
+        stops_extended_buffer_radius: int = 100,
+        num_workers: Optional[int] = None,
+        backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+        engine: Union[str, Engine] = Engine.REFERENCE,
+        compress_stationary_records: bool = False,
+        memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+        presorted: bool = False,
+        lean: bool = False,
+        input_format: Union[str, FileFormat] = FileFormat.CSV,
+        route_index: Optional[RouteIndex] = None,
+        profile: bool = False,
+        progress: Optional[ProgressMonitor] = None,
+        profile_dir: Optional[str] = None,
+    ) -> None:
+        self.raw_gps = raw_gps
+        self.stops_df = stops_df
+        self.terminals_buffer_radius = terminals_buffer_radius
+        self.stops_buffer_radius = stops_buffer_radius
+        self.stops_extended_buffer_radius = stops_extended_buffer_radius
+        self.num_workers = num_workers
+        self.backend = ExecutionBackend(backend)
+        self.engine = Engine(engine)
+        self.compress_stationary_records = compress_stationary_records
+        self.memory_profile = MemoryProfile(memory_profile)
+        self.presorted = presorted
+        self.lean = lean
+        self.input_format = FileFormat(input_format)
+        self.route_index = (
+            route_index
+            if route_index is not None
+            else RouteIndex(trip_terminals_df, stops_df)
+        )
+        self.profile = profile
+        self.progress = progress
+        self.profile_dir = profile_dir
+
+        self._stage_functions: Dict[PipelineOutput, Callable] = {
+            PipelineOutput.RAW_GPS: self._load,
+            PipelineOutput.CLEANED_GPS: self._clean,
+            PipelineOutput.TERMINAL_MATCHES: self._match_terminals,
+            PipelineOutput.PROCESSED_GPS: self._assemble_trips,
+            PipelineOutput.TRIPS: self._extract_trip_features,
+            PipelineOutput.TRAJECTORY: self._prepare_trajectory,
+            PipelineOutput.STOP_MATCHES: self._match_stops,
+            PipelineOutput.STOP_TIMES: self._extract_stop_features,
+        }
+
+    def plan(self, outputs: Iterable[Union[str, PipelineOutput]]) -> List[str]:
+        """
+        Names of the stages that `compute` runs for `outputs`, in the order they run.
+        """
+        return [STAGES[output][0] for output in self._needed_outputs(outputs)]
+
+    def compute(
+        self,
+        outputs: Iterable[Union[str, PipelineOutput]],
+        columns: Optional[Dict[str, List[str]]] = None,
+        report: Optional[RunReport] = None,
+    ) -> Optional[Dict[str, Optional[DataFrame]]]:
+        """
+        Run the stages needed for `outputs` and return them.
+
+        Parameters:
+            outputs (Iterable[Union[str, PipelineOutput]]): Names of the outputs to compute.
+            columns (Dict[str, List[str]], optional): Columns to keep of some outputs, by
+                                                      output name. The trip and stop time
+                                                      features that are not kept are not
+                                                      computed. Default is None, which keeps
+                                                      all the columns.
+            report (RunReport, optional): Report in which the metrics of the stages are
+                                          added. Default is None, which makes a new report.
+
+        Returns:
+            Optional[Dict[str, Optional[DataFrame]]]: The outputs by name. The outputs from
+                                                      'processed_gps' on are None when no
+                                                      trip can be extracted. None is returned
+                                                      if the raw GPS data cannot be loaded.
+
+        Raises:
+            ValueError: If an output name is unknown, or a stop output is asked for without
+                        stops data.
+        """
+        requested = {PipelineOutput(output) for output in outputs}
+        needed = self._needed_outputs(requested)
+        columns = {
+            PipelineOutput(output): output_columns
+            for output, output_columns in (columns or {}).items()
+        }
+        columns = self._needed_columns(needed, requested, columns)
+        if report is None:
+            report = self._new_report()
+
+        # Number of stages still to run that read every output, to release it after the last
+        readers = {output: 0 for output in needed}
+        for output in needed:
+            for input_output in STAGES[output][1]:
+                readers[input_output] += 1
+
+        results: Dict[PipelineOutput, Optional[DataFrame]] = {}
+        for output in needed:
+            stage_name, input_outputs = STAGES[output]
+            inputs = [results[input_output] for input_output in input_outputs]
+            if any(input_df is None for input_df in inputs):
+                results[output] = None
+            else:
+                # An output that is both returned and read by the stop features stage, which
+                # changes its input, is copied first
+                if (
+                    output == PipelineOutput.STOP_TIMES
+                    and PipelineOutput.STOP_MATCHES in requested
+                ):
+                    inputs = [inputs[0].copy()]
+                input_rows = len(inputs[0]) if inputs else None
+                with report.stage(stage_name, input_rows) as stage:
+                    result = self._stage_functions[output](
+                        *inputs, columns=columns.get(output)
+                    )
+                    stage.output_rows = None if result is None else len(result)
+                    if output == PipelineOutput.CLEANED_GPS and result is not None:
+                        stage.counters.update(result.attrs.get(REMOVED_ROWS_ATTR, {}))
+                        stage.counters.update(result.attrs.get(MEMORY_BYTES_ATTR, {}))
+                        if STATIONARY_ROWS_ATTR in result.attrs:
+                            stage.counters[STATIONARY_ROWS_ATTR] = result.attrs[
+                                STATIONARY_ROWS_ATTR
+                            ]
+                results[output] = result
+                if output == PipelineOutput.RAW_GPS and result is None:
+                    report.finish()
+                    return None
+
+            for input_output in input_outputs:
+                readers[input_output] -= 1
+                if readers[input_output] == 0 and input_output not in requested:
+                    del results[input_output]
+            del inputs
+
+        report.finish()
+        return {
+            output.value: self._select_columns(results[output], columns.get(output))
+            for output in needed
+            if output in requested
+        }
+
+    def _needed_outputs(
+        self, outputs: Iterable[Union[str, PipelineOutput]]
+    ) -> List[PipelineOutput]:
+        needed: Set[PipelineOutput] = set()
+        pending = [PipelineOutput(output) for output in outputs]
+        while pending:
+            output = pending.pop()
+            if output not in needed:
+                needed.add(output)
+                pending.extend(STAGES[output][1])
+        if self.stops_df is None and PipelineOutput.STOP_MATCHES in needed:
+            raise ValueError("The stop outputs need the stops data")
+        return [output for output in STAGES if output in needed]
+
+    def _needed_columns(
+        self,
+        needed: List[PipelineOutput],
+        requested: Set[PipelineOutput],
+        columns: Dict[PipelineOutput, List[str]],
+    ) -> Dict[PipelineOutput, Optional[List[str]]]:
+        # The outputs asked for without columns are computed in full, the others with the
+        # columns asked for and those read by the later stages
+        needed_columns: Dict[PipelineOutput, Optional[List[str]]] = {
+            output: columns.get(output) if output in requested else []
+            for output in needed
+        }
+        trip_columns = needed_columns.get(PipelineOutput.TRIPS)
+        if trip_columns is not None and PipelineOutput.TRAJECTORY in needed:
+            needed_columns[PipelineOutput.TRIPS] = list(
+                dict.fromkeys(_TRAJECTORY_TRIP_COLUMNS + trip_columns)
+            )
+        return needed_columns
+
+    def _select_columns(
+        self, output_df: Optional[DataFrame], columns: Optional[List[str]]
+    ) -> Optional[DataFrame]:
+        if output_df is None or columns is None:
+            return output_df
+        return output_df[[column for column in output_df.columns if column in columns]]
+
+    def _new_report(self) -> RunReport:
+        return RunReport(
+            "graph",
+            {
+                "terminals_buffer_radius": self.terminals_buffer_radius,
+                "stops_buffer_radius": self.stops_buffer_radius,
+                "stops_extended_buffer_radius": self.stops_extended_buffer_radius,
+                "backend": self.backend.value,
+                "engine": self.engine.value,
+                "compress_stationary_records": self.compress_stationary_records,
+                "memory_profile": self.memory_profile.value,
+                "presorted": self.presorted,
+                "lean": self.lean,
+            },
+            log_stages=self.profile,
+            progress=self.progress,
+            profiler=StageProfiler(self.profile_dir) if self.profile_dir else None,
+        )
+
+    def _load(self, columns: Optional[List[str]] = None) -> Optional[DataFrame]:
+        if isinstance(self.raw_gps, DataFrame):
+            return self.raw_gps
+        return load_raw_gps_data(self.raw_gps, self.input_format)
+
+    def _clean(
+        self, raw_gps_df: DataFrame, columns: Optional[List[str]] = None
+    ) -> DataFrame:
+        cleaned_raw_gps_df = clean(
+            raw_gps_df, memory_profile=self.memory_profile, presorted=self.presorted
+        )
+        if self.compress_stationary_records and len(cleaned_raw_gps_df) > 0:
+            cleaned_raw_gps_df = compress_stationary(cleaned_raw_gps_df)
+        if self.lean:
+            # The points are made once, without copying the columns, for the terminal and
+            # the stop matching
+            cleaned_raw_gps_df = pandas_to_geo_data_frame(
+                cleaned_raw_gps_df, copy=False
+            )
+        return cleaned_raw_gps_df
+
+    def _match_terminals(
+        self, cleaned_raw_gps_df: DataFrame, columns: Optional[List[str]] = None
+    ) -> DataFrame:
+        return match_terminals(
+            cleaned_raw_gps_df,
+            self.route_index.trip_terminals_df,
+            self.terminals_buffer_radius,
+            self.num_workers,
+            self.backend,
+            self.engine,
+            copy=not self.lean,
+            route_index=self.route_index,
+        )
+
+    def _assemble_trips(
+        self, terminal_matches_df: DataFrame, columns: Optional[List[str]] = None
+    ) -> Optional[DataFrame]:
+        trips_df = assemble_trips(terminal_matches_df, self.engine)
+        if len(trips_df) == 0:
+            logger.info("No trips found in the data")
+            return None
+        return trips_df
+
+    def _extract_trip_features(
+        self, processed_gps_df: DataFrame, columns: Optional[List[str]] = None
+    ) -> DataFrame:
+        return extract_trip_features(processed_gps_df, columns=columns)
+
+    def _prepare_trajectory(
+        self,
+        cleaned_raw_gps_df: DataFrame,
+        processed_gps_df: DataFrame,
+        trips_df: DataFrame,
+        columns: Optional[List[str]] = None,
+    ) -> DataFrame:
+        raw_gps_geo_df = pandas_to_geo_data_frame(cleaned_raw_gps_df, not self.lean)
+        return prepare_trajectory_df(raw_gps_geo_df, processed_gps_df, trips_df)
+
+    def _match_stops(
+        self, trajectory_df: DataFrame, columns: Optional[List[str]] = None
+    ) -> DataFrame:
+        return extract_stops(
+            trajectory_df,
+            *self.route_index.stop_buffers(
+                self.stops_buffer_radius, self.stops_extended_buffer_radius
+            ),
+            self.num_workers,
+            self.backend,
+            self.engine,
+        )
+
+    def _extract_stop_features(
+        self, stop_gps_df: DataFrame, columns: Optional[List[str]] = None
+    ) -> DataFrame:
+        if len(stop_gps_df) == 0:
+            return DataFrame(columns=columns or stop_time_columns())
+        terminals_df = self.route_index.trip_terminals_df
+        return extract_stop_features(
+            stop_gps_df,
+            terminals_df[TerminalField.TERMINAL_ID.value].tolist(),
+            self.engine,
+            columns,
+        )
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pandas import DataFrame, concat
+from gps2gtfs.load_data.partitioner import partition_raw_gps_by_date
+from gps2gtfs.reporting.gps_quality import (
+    DEFAULT_MAX_FROZEN_RATIO,
+    DEFAULT_MAX_GAP_S,
+    DEFAULT_SPARSE_INTERVAL_S,
+    DEFAULT_STATIONARY_DISTANCE_M,
+    GPS_QUALITY_FILE_NAME,
+    GPS_QUALITY_SUMMARY_FILE_NAME,
+    profile_gps_quality,
+    summarize_gps_quality,
+    write_gps_quality_summary,
+)
+from gps2gtfs.reporting.run_report import RUN_REPORT_FILE_NAME, RunReport
+from gps2gtfs.utility.data_io_converter import (
+    FileFormat,
+    output_file_path,
+    read_csv_file,
+    write_file,
+)
+from gps2gtfs.utility.logger import logger
+
+
+def run(
+    raw_gps_data_path: str,
+    max_gap_s: float = DEFAULT_MAX_GAP_S,
+    stationary_distance_m: float = DEFAULT_STATIONARY_DISTANCE_M,
+    sparse_interval_s: float = DEFAULT_SPARSE_INTERVAL_S,
+    max_frozen_ratio: float = DEFAULT_MAX_FROZEN_RATIO,
+    memory_limit_mb: Optional[int] = None,
+    work_dir: Optional[str] = None,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: Optional[str] = ".",
+    profile: bool = False,
+    write_report: bool = False,
+) -> Optional[Tuple[DataFrame, Dict[str, Any]]]:
+    """
+    Profile the quality of a raw GPS file per device and date.
+
+    The raw GPS data is streamed into one file per date, and every date is profiled on its own
+    by `profile_gps_quality`, so only the small profile of the whole period is held in memory.
+    The raw records are profiled before cleaning, in the order they were received, so that
+    duplicates, zero coordinates and out of order records are seen.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the CSV or Parquet file containing raw GPS data.
+        max_gap_s, stationary_distance_m: See `profile_gps_quality`.
+        sparse_interval_s, max_frozen_ratio: See `summarize_gps_quality`.
+        memory_limit_mb (int, optional): Memory ceiling in megabytes used to size the input
+                                         chunks. Default is None.
+        work_dir (str, optional): Directory to spill the partitions into. Default is None,
+                                  which uses a temporary directory removed after the run.
+        input_format (Union[str, FileFormat]): Format of the raw GPS data file, either 'csv'
+                                               or 'parquet'. Default is 'csv'.
+        output_format (Union[str, FileFormat]): Format of the profile table, either 'csv' or
+                                                'parquet'. Default is 'csv'.
+        output_dir (str, optional): Directory where the 'gps_quality' table and
+                                    'gps_quality_summary.json' are written. Default is the
+                                    current directory. None writes nothing.
+        profile (bool): Whether to log the metrics of every stage. Default is False.
+        write_report (bool): Whether to write the run report as JSON in the output directory.
+                             Default is False.
+
+    Returns:
+        Optional[Tuple[DataFrame, Dict[str, Any]]]: The profile per device and date, and its
+                                                    summary. None is returned if the raw GPS
+                                                    data cannot be loaded.
+
+    Example:
+        >>> from gps2gtfs.pipeline import quality
+        >>> quality_df, summary = quality.run("raw_gps.csv", output_dir="route_654")
+        >>> summary["flagged_device_days"]["clock_skew"]["count"]
+        0
+    """
+    report = RunReport(
+        "quality",
+        {
+            "max_gap_s": max_gap_s,
+            "stationary_distance_m": stationary_distance_m,
+            "sparse_interval_s": sparse_interval_s,
+            "max_frozen_ratio": max_frozen_ratio,
+            "memory_limit_mb": memory_limit_mb,
+        },
+        log_stages=profile,
+    )
+    logger.info("Starting Pipeline for profiling the GPS data quality")
+    spill_dir = (
+        work_dir if work_dir is not None else tempfile.mkdtemp(prefix="gps2gtfs_")
+    )
+    quality_dfs: List[DataFrame] = []
+    try:
+        with report.stage("partition"):
+            partition_paths = partition_raw_gps_by_date(
+                raw_gps_data_path, spill_dir, memory_limit_mb, input_format
+            )
+        if partition_paths is None:
+            return None
+
+        for date, partition_path in partition_paths.items():
+            with report.stage("load") as stage:
+                partition_df = read_csv_file(partition_path, f"partition of {date}")
+                stage.output_rows = None if partition_df is None else len(partition_df)
+            if partition_df is None:
+                continue
+            with report.stage("quality", len(partition_df)) as stage:
+                quality_dfs.append(
+                    profile_gps_quality(partition_df, max_gap_s, stationary_distance_m)
+                )
+                stage.output_rows = len(quality_dfs[-1])
+            del partition_df
+    finally:
+        if work_dir is None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    quality_df = (
+        concat(quality_dfs, ignore_index=True)
+        if quality_dfs
+        else profile_gps_quality(DataFrame())
+    )
+    summary = summarize_gps_quality(quality_df, sparse_interval_s, max_frozen_ratio)
+    report.finish()
+
+    if output_dir is not None:
+        write_file(
+            quality_df,
+            output_file_path(output_dir, GPS_QUALITY_FILE_NAME, output_format),
+        )
+        write_gps_quality_summary(
+            summary, os.path.join(output_dir, GPS_QUALITY_SUMMARY_FILE_NAME)
+        )
+        if write_report:
+            report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return quality_df, summary
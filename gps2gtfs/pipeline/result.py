@@ -0,0 +1,131 @@
+import os
+from typing import TYPE_CHECKING, List, Optional, Union
+
+from gps2gtfs.reporting.run_report import RUN_REPORT_FILE_NAME
+from gps2gtfs.utility.data_io_converter import (
+    PROCESSED_GPS_FILE_NAME,
+    FileFormat,
+    geo_to_pandas_data_frame,
+    output_file_path,
+    write_file,
+)
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+    from gps2gtfs.aggregation.schedule_sketches import ScheduleSketches
+    from gps2gtfs.reporting.run_report import RunReport
+
+
+class PipelineResult:
+    """
+    Outputs of a pipeline run, kept in memory, with the report of the run.
+
+    The outputs a pipeline does not produce are None, e.g. the stop times of the trip pipeline.
+    When no trip can be extracted from the GPS data, all the outputs are None.
+
+    Attributes:
+        trips (DataFrame, optional): The trips, as written in 'trips'.
+        stop_times (DataFrame, optional): The stop times, as written in 'stops'.
+        processed_gps (DataFrame, optional): The GPS records matched with the trip terminals,
+                                             from which `gps2gtfs.pipeline.stop.run` computes
+                                             stop times again.
+        trajectories (GeoDataFrame, optional): The simplified trajectory of every trip, as
+                                               written in 'trajectories', when the run
+                                               exports them.
+        schedule_sketches (ScheduleSketches, optional): The quantile sketches of the trip
+                                                        durations and stop times, as written
+                                                        in 'schedule_sketches.json', when the
+                                                        run makes them.
+        report (RunReport): The parameters of the run and the metrics of every stage.
+
+    Example:
+        >>> from gps2gtfs.pipeline import trip_stop
+        >>> result = trip_stop.process(raw_gps_df, terminals_df, stops_df, 100, 50, 100)
+        >>> result.stop_times.groupby("bus_stop")["dwell_time_in_seconds"].median()
+        >>> result.write("out/route_654")
+    """
+
+    def __init__(
+        self,
+        report: "RunReport",
+        trips: Optional["DataFrame"] = None,
+        stop_times: Optional["DataFrame"] = None,
+        processed_gps: Optional["DataFrame"] = None,
+        trajectories: Optional["DataFrame"] = None,
+        schedule_sketches: Optional["ScheduleSketches"] = None,
+    ) -> None:
+        self.report = report
+        self.trips = trips
+        self.stop_times = stop_times
+        self.processed_gps = processed_gps
+        self.trajectories = trajectories
+        self.schedule_sketches = schedule_sketches
+
+    def write(
+        self,
+        output_dir: str,
+        output_format: Union[str, FileFormat] = FileFormat.CSV,
+        write_processed_gps: bool = False,
+        write_report: bool = False,
+    ) -> List[str]:
+        """
+        Write the outputs of the run in a directory.
+
+        Parameters:
+            output_dir (str): Directory where the outputs are written. It is created if needed.
+            output_format (Union[str, FileFormat]): Format of the outputs, either 'csv' or
+                                                    'parquet'. Default is 'csv'.
+            write_processed_gps (bool): Whether to also write the processed GPS records.
+                                        Default is False.
+            write_report (bool): Whether to also write the run report as JSON. Default is
+                                 False.
+
+        Returns:
+            List[str]: The paths of the files written.
+        """
+        outputs = [
+            ("trips", self.trips),
+            ("stops", self.stop_times),
+            ("trajectories", self.trajectories),
+        ]
+        if write_processed_gps and self.processed_gps is not None:
+            outputs.append(
+                (PROCESSED_GPS_FILE_NAME, geo_to_pandas_data_frame(self.processed_gps))
+            )
+
+        paths = []
+        for name, output_df in outputs:
+            if output_df is None:
+                continue
+            path = output_file_path(output_dir, name, output_format)
+            write_file(output_df, path, output_format)
+            paths.append(path)
+        if self.schedule_sketches is not None:
+            from gps2gtfs.aggregation.schedule_sketches import (
+                SCHEDULE_SKETCHES_FILE_NAME,
+            )
+
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, SCHEDULE_SKETCHES_FILE_NAME)
+            self.schedule_sketches.write_json(path)
+            paths.append(path)
+        if write_report:
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, RUN_REPORT_FILE_NAME)
+            self.report.write_json(path)
+            paths.append(path)
+        return paths
+
+    def __repr__(self) -> str:
+        outputs = ", ".join(
+            f"{name}={len(output_df)} rows"
+            for name, output_df in [
+                ("trips", self.trips),
+                ("stop_times", self.stop_times),
+                ("processed_gps", self.processed_gps),
+                ("trajectories", self.trajectories),
+            ]
+            if output_df is not None
+        )
+        return f"PipelineResult({outputs}, report={self.report!r})"
@@ -0,0 +1,126 @@
+import os
+from typing import Iterable, Optional, Sequence, Union
+
+from gps2gtfs.aggregation.quantile_sketch import DEFAULT_K
+from gps2gtfs.aggregation.schedule_sketches import (
+    DEFAULT_QUANTILES,
+    SCHEDULE_SKETCHES_FILE_NAME,
+    ScheduleSketches,
+)
+from gps2gtfs.reporting.run_report import RUN_REPORT_FILE_NAME, RunReport
+from gps2gtfs.utility.data_io_converter import (
+    FileFormat,
+    iter_file_chunks,
+    output_file_path,
+    write_file,
+)
+from gps2gtfs.utility.logger import logger
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+
+def run(
+    trips_paths: Iterable[str] = (),
+    stop_times_paths: Iterable[str] = (),
+    sketches_paths: Iterable[str] = (),
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+    by: Optional[Iterable[str]] = None,
+    k: int = DEFAULT_K,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: Optional[str] = ".",
+    profile: bool = False,
+    write_report: bool = False,
+) -> Optional[ScheduleSketches]:
+    """
+    Make the percentile tables of trip durations and stop times over any number of runs.
+
+    The sketches written by earlier runs, e.g. one per day with `schedule_sketches`, are
+    merged, and the trips and stop times files are read in chunks into the same sketches, so
+    that a year of outputs is summarized in bounded memory. The merged sketches are written
+    again, so that later runs can add to them.
+
+    Parameters:
+        trips_paths (Iterable[str]): Paths of 'trips' outputs. Default is none.
+        stop_times_paths (Iterable[str]): Paths of 'stops' outputs. Default is none.
+        sketches_paths (Iterable[str]): Paths of 'schedule_sketches.json' files. Default is
+                                        none.
+        quantiles (Sequence[float]): Fractions of the percentiles. Default is (0.5, 0.85).
+        by (Iterable[str], optional): Key columns of the tables, see
+                                      `ScheduleSketches.percentile_table`. Default is None,
+                                      which keeps all the key columns of every metric.
+        k (int): Accuracy of the sketches made from the files, see `KLLSketch`. Default is
+                 200.
+        chunk_rows (int): Number of rows read at a time from the files. Default is 1,000,000.
+        input_format (Union[str, FileFormat]): Format of the trips and stops files, either
+                                               'csv' or 'parquet'. Default is 'csv'.
+        output_format (Union[str, FileFormat]): Format of the percentile tables. Default is
+                                                'csv'.
+        output_dir (str, optional): Directory where 'schedule_sketches.json' and one
+                                    '<metric>_percentiles' table per metric with values are
+                                    written. Default is the current directory. None writes
+                                    nothing.
+        profile (bool): Whether to log the metrics of every stage. Default is False.
+        write_report (bool): Whether to write the run report as JSON in the output directory.
+                             Default is False.
+
+    Returns:
+        Optional[ScheduleSketches]: The merged sketches. None is returned if a file cannot be
+                                    read.
+
+    Example:
+        >>> from gps2gtfs.pipeline import schedule_stats
+        >>> sketches = schedule_stats.run(
+        ...     sketches_paths=glob("runs/*/schedule_sketches.json"), output_dir="year"
+        ... )
+        >>> sketches.percentile_table("trip_duration_in_mins", (0.5, 0.85), by=["direction"])
+    """
+    report = RunReport(
+        "schedule_stats",
+        {"quantiles": list(quantiles), "k": k, "chunk_rows": chunk_rows},
+        log_stages=profile,
+    )
+    logger.info("Starting Pipeline for schedule statistics")
+    sketches = ScheduleSketches(k)
+    for path in sketches_paths:
+        with report.stage("merge"):
+            try:
+                sketches.merge(ScheduleSketches.read_json(path))
+            except Exception as e:
+                logger.error(f"Failed to read the schedule sketches in {path}. {e}")
+                return None
+
+    for paths, update in [
+        (trips_paths, sketches.update_trips),
+        (stop_times_paths, sketches.update_stop_times),
+    ]:
+        for path in paths:
+            with report.stage("sketch") as stage:
+                stage.input_rows = 0
+                stage.counters["sketched_values"] = 0
+                try:
+                    for chunk_df in iter_file_chunks(path, chunk_rows, input_format):
+                        stage.input_rows += len(chunk_df)
+                        stage.counters["sketched_values"] += update(chunk_df)
+                except Exception as e:
+                    logger.error(f"Failed to read the outputs in {path}. {e}")
+                    return None
+    report.finish()
+
+    if output_dir is not None:
+        for metric, metric_sketches in sketches.sketches.items():
+            if metric_sketches:
+                write_file(
+                    sketches.percentile_table(metric, quantiles, by),
+                    output_file_path(
+                        output_dir, f"{metric.value}_percentiles", output_format
+                    ),
+                    output_format,
+                )
+        sketches.write_json(os.path.join(output_dir, SCHEDULE_SKETCHES_FILE_NAME))
+        if write_report:
+            report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return sketches
@@ -0,0 +1,381 @@
+import json
+import threading
+from contextlib import nullcontext
+from typing import Any, Dict, Optional, Union
+
+from pandas import DataFrame
+from gps2gtfs.load_data.load_from_csv import (
+    load_data_for_partitioned_pipeline,
+    load_raw_gps_data,
+)
+from gps2gtfs.pipeline import trip, trip_stop
+from gps2gtfs.pipeline.result import PipelineResult
+from gps2gtfs.utility.data_io_converter import FileFormat
+from gps2gtfs.utility.executor import (
+    Engine,
+    ExecutionBackend,
+    MemoryProfile,
+    WorkerPool,
+)
+from gps2gtfs.utility.logger import logger
+from gps2gtfs.utility.route_index import RouteIndex
+
+DEFAULT_SERVICE_PORT = 8765
+# Host names the requests must be addressed to, which web pages of other sites cannot send
+_LOCAL_HOSTS = ("127.0.0.1", "localhost")
+
+
+class ExtractionService:
+    """
+    Long-running extraction of trips and stop times for registered routes.
+
+    A job run by the CLI starts Python, imports geopandas, starts the workers and buffers the
+    terminals and stops of its route before any matching, which costs more than the work of
+    small jobs, e.g. one route for one day. The service does all of this once: the routes are
+    registered with their terminals and stops, whose buffers and spatial indexes are kept in a
+    `RouteIndex`, and the workers are kept running in a `WorkerPool`. Jobs then only load and
+    process their raw GPS data.
+
+    Jobs are submitted with `extract`, or over HTTP on localhost with `serve`:
+
+    - `GET /routes` lists the registered routes.
+    - `POST /routes` registers a route from `{"route_id", "terminals", "stops"}`, the paths of
+      its CSV files. `stops` is optional, for routes that only need trips.
+    - `POST /jobs` runs a job from `{"route_id", "raw_gps", "terminals_buffer_radius",
+      "stops_buffer_radius", "stops_extended_buffer_radius"}`, and optionally
+      `"input_format"`, `"compress_stationary_records"`, `"presorted"`, `"output_dir"`,
+      `"output_format"` and `"write_processed_gps"`. Without stop radii, only the trips are
+      extracted. The response holds the `trips` and `stop_times` records and the run
+      `report`, or the paths of the `files` written when `output_dir` is given.
+
+    Parameters:
+        num_workers (int, optional): Number of parallel workers. Default is None, which uses
+                                     the number of available CPU cores.
+        backend (Union[str, ExecutionBackend]): One of 'serial', 'threads' or 'processes'.
+                                                Default is 'processes'.
+        engine (Union[str, Engine]): Implementation of the matching and aggregation stages,
+                                     either 'reference' or 'fast'. Default is 'reference'.
+        memory_profile (Union[str, MemoryProfile]): Either 'default' or 'compact'. Default is
+                                                    'default'.
+        lean (bool): Whether to make the points of the cleaned GPS data once for both the
+                     terminal and the stop matching. Default is False.
+
+    Notes:
+        - Jobs sent at the same time run concurrently, in a thread each, on the same workers.
+        - The HTTP server only listens on 127.0.0.1 and reads the files of the local machine,
+          so it must not be exposed to other hosts. It only accepts requests addressed to
+          127.0.0.1 or localhost, with JSON bodies sent as 'application/json', so that web
+          pages open in a browser cannot send it jobs.
+
+    Example:
+        >>> with ExtractionService(num_workers=4, engine="fast") as service:
+        ...     service.register_route_files("654", terminals_path, stops_path)
+        ...     result = service.extract("654", raw_gps_df, 100, 50, 100)
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+        engine: Union[str, Engine] = Engine.REFERENCE,
+        memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+        lean: bool = False,
+    ) -> None:
+        self.backend = ExecutionBackend(backend)
+        self.engine = Engine(engine)
+        self.memory_profile = MemoryProfile(memory_profile)
+        self.lean = lean
+        self.pool: Optional[WorkerPool] = None
+        if self.backend != ExecutionBackend.SERIAL:
+            self.pool = WorkerPool(num_workers, self.backend)
+        self.routes: Dict[str, RouteIndex] = {}
+        self._lock = threading.Lock()
+        self._server: Any = None
+
+    def __enter__(self) -> "ExtractionService":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def num_workers(self) -> int:
+        return 1 if self.pool is None else self.pool.num_workers
+
+    def start(self) -> "ExtractionService":
+        # The workers are started before the HTTP server threads, so that processes fork a
+        # single-threaded interpreter
+        if self.pool is not None:
+            self.pool.start()
+        return self
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self.pool is not None:
+            self.pool.close()
+
+    def register_route(
+        self,
+        route_id: str,
+        trip_terminals_df: DataFrame,
+        stops_df: Optional[DataFrame] = None,
+    ) -> RouteIndex:
+        """
+        Register a route, or replace it, building the index of its terminals and stops.
+        """
+        route_index = RouteIndex(trip_terminals_df, stops_df)
+        with self._lock:
+            self.routes[route_id] = route_index
+        logger.info(f"Registered route {route_id}: {route_index}")
+        return route_index
+
+    def register_route_files(
+        self,
+        route_id: str,
+        trip_terminals_data_path: str,
+        stops_data_path: Optional[str] = None,
+    ) -> Optional[RouteIndex]:
+        """
+        Register a route from its trip terminals CSV and, optionally, its stops CSV.
+
+        Returns:
+            Optional[RouteIndex]: The index of the route. None is returned if the data cannot
+                                  be loaded.
+        """
+        loaded_data = load_data_for_partitioned_pipeline(
+            trip_terminals_data_path, stops_data_path
+        )
+        if not loaded_data:
+            return None
+        return self.register_route(route_id, *loaded_data)
+
+    def extract(
+        self,
+        route_id: str,
+        raw_gps_df: DataFrame,
+        terminals_buffer_radius: int,
+        stops_buffer_radius: Optional[int] = None,
+        stops_extended_buffer_radius: Optional[int] = None,
+        compress_stationary_records: bool = False,
+        presorted: bool = False,
+    ) -> PipelineResult:
+        """
+        Extract the trips, and the stop times when stop radii are given, of a registered route.
+
+        Parameters:
+            route_id (str): ID of a registered route.
+            raw_gps_df (DataFrame): Raw GPS data of the route, with the columns of
+                                    `RawGPSField`.
+            terminals_buffer_radius (int): Buffer radius around the trip terminals.
+            stops_buffer_radius (int, optional): Buffer radius around the bus stops. Default
+                                                 is None, which extracts the trips only.
+            stops_extended_buffer_radius (int, optional): Extended buffer radius around the
+                                                          bus stops. Default is None.
+            compress_stationary_records (bool): Whether to collapse the runs of GPS records at
+                                                the same position. Default is False.
+            presorted (bool): Whether the raw GPS data is sorted by device and time. Default
+                              is False.
+
+        Returns:
+            PipelineResult: The outputs of the run with its report.
+
+        Raises:
+            ValueError: If the route is not registered, or has no stops and stop radii are
+                        given.
+        """
+        route_index = self.routes.get(route_id)
+        if route_index is None:
+            raise ValueError(f"Route {route_id!r} is not registered")
+        with_stops = (
+            stops_buffer_radius is not None or stops_extended_buffer_radius is not None
+        )
+        if with_stops and route_index.stops_df is None:
+            raise ValueError(f"Route {route_id!r} was registered without stops")
+
+        options = {
+            "num_workers": self.num_workers,
+            "backend": self.backend,
+            "engine": self.engine,
+            "compress_stationary_records": compress_stationary_records,
+            "memory_profile": self.memory_profile,
+            "presorted": presorted,
+            "lean": self.lean,
+            "route_index": route_index,
+        }
+        with self.pool.activate() if self.pool is not None else nullcontext():
+            if not with_stops:
+                return trip.process(
+                    raw_gps_df,
+                    route_index.trip_terminals_df,
+                    terminals_buffer_radius,
+                    **options,
+                )
+            return trip_stop.process(
+                raw_gps_df,
+                route_index.trip_terminals_df,
+                route_index.stops_df,
+                terminals_buffer_radius,
+                stops_buffer_radius,
+                stops_extended_buffer_radius,
+                **options,
+            )
+
+    def run_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a job described as in the body of `POST /jobs`, and build its response.
+
+        Raises:
+            ValueError: If the job is incomplete, its route is unknown or its raw GPS data
+                        cannot be loaded.
+        """
+        try:
+            route_id = str(job["route_id"])
+            raw_gps_data_path = job["raw_gps"]
+            terminals_buffer_radius = job["terminals_buffer_radius"]
+        except KeyError as e:
+            raise ValueError(f"The job has no {e.args[0]!r}")
+        raw_gps_df = load_raw_gps_data(
+            raw_gps_data_path, job.get("input_format", FileFormat.CSV)
+        )
+        if raw_gps_df is None:
+            raise ValueError(f"Failed to load the Raw GPS data of {raw_gps_data_path}")
+
+        result = self.extract(
+            route_id,
+            raw_gps_df,
+            terminals_buffer_radius,
+            job.get("stops_buffer_radius"),
+            job.get("stops_extended_buffer_radius"),
+            bool(job.get("compress_stationary_records", False)),
+            bool(job.get("presorted", False)),
+        )
+        del raw_gps_df
+
+        response: Dict[str, Any] = {
+            "route_id": route_id,
+            "report": result.report.to_dict(),
+        }
+        output_dir = job.get("output_dir")
+        if output_dir is not None:
+            response["files"] = result.write(
+                output_dir,
+                job.get("output_format", FileFormat.CSV),
+                bool(job.get("write_processed_gps", False)),
+            )
+            return response
+        for name, output_df in [
+            ("trips", result.trips),
+            ("stop_times", result.stop_times),
+        ]:
+            response[name] = (
+                None
+                if output_df is None
+                else json.loads(output_df.to_json(orient="records", date_format="iso"))
+            )
+        return response
+
+    def serve(self, port: int = DEFAULT_SERVICE_PORT, block: bool = True) -> None:
+        """
+        Serve the routes and jobs over HTTP on http://127.0.0.1:<port>.
+
+        Parameters:
+            port (int): Port to listen on. Default is 8765.
+            block (bool): Whether to serve in the calling thread until interrupted, or in a
+                          background thread until `close`. Default is True.
+        """
+        self.start()
+        self._server = _make_http_server(self, port)
+        logger.info(f"Serving extraction jobs on http://127.0.0.1:{port}")
+        if not block:
+            threading.Thread(
+                target=self._server.serve_forever, name="gps2gtfs-service", daemon=True
+            ).start()
+            return
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopping the extraction service")
+        finally:
+            self.close()
+
+    def __repr__(self) -> str:
+        return (
+            f"ExtractionService(routes={sorted(self.routes)}, engine={self.engine.value!r}, "
+            f"backend={self.backend.value!r}, num_workers={self.num_workers})"
+        )
+
+
+def _make_http_server(service: ExtractionService, port: int) -> Any:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ServiceHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa N802
+            if not self._is_local():
+                return
+            if self.path.rstrip("/") != "/routes":
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return
+            self._send(
+                200,
+                {
+                    route_id: repr(route_index)
+                    for route_id, route_index in service.routes.items()
+                },
+            )
+
+        def do_POST(self) -> None:  # noqa N802
+            if not self._is_local():
+                return
+            path = self.path.rstrip("/")
+            if path not in ("/routes", "/jobs"):
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return
+            # Browsers send other sites' forms as plain text without asking the server first
+            if self.headers.get_content_type() != "application/json":
+                self._send(415, {"error": "The body must be sent as application/json"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if path == "/jobs":
+                    self._send(200, service.run_job(body))
+                    return
+                route_index = service.register_route_files(
+                    str(body["route_id"]), body["terminals"], body.get("stops")
+                )
+                if route_index is None:
+                    raise ValueError("Failed to load the terminals or stops data")
+                self._send(200, {str(body["route_id"]): repr(route_index)})
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Rejected the request on {path}. {e}")
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                logger.exception(f"Failed to process the request on {path}")
+                self._send(500, {"error": str(e)})
+
+        def _is_local(self) -> bool:
+            # A Host header of another name is a page of another site reaching the service,
+            # e.g. through DNS rebinding
+            host = self.headers.get("Host", "")
+            if host.split(":")[0] in _LOCAL_HOSTS:
+                return True
+            logger.error(f"Rejected a request addressed to host {host!r}")
+            self._send(403, {"error": "The service only accepts requests to localhost"})
+            return False
+
+        def _send(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa A002
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), ServiceHandler)
+    server.daemon_threads = True
+    return server
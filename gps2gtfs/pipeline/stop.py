@@ -0,0 +1,262 @@
+import os
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from pandas import DataFrame, Series, unique
+from gps2gtfs.data_field.im_field import CleanedRawGPSField, ProcessedGPSField
+from gps2gtfs.data_field.output_field import StopTimeField, TripField
+from gps2gtfs.load_data.load_from_csv import load_data_for_stop_calculation
+from gps2gtfs.pipeline.result import PipelineResult
+from gps2gtfs.preprocessing.data_cleaner import (
+    MEMORY_BYTES_ATTR,
+    REMOVED_ROWS_ATTR,
+    clean,
+)
+from gps2gtfs.reporting.profiler import StageProfiler
+from gps2gtfs.reporting.progress import ProgressMonitor
+from gps2gtfs.reporting.run_report import RUN_REPORT_FILE_NAME, RunReport
+from gps2gtfs.stop.data_preparator import create_stop_buffers, prepare_trajectory_df
+from gps2gtfs.stop.feature_extractor import extract_stop_features, stop_time_columns
+from gps2gtfs.stop.stop_extractor import extract_stops
+from gps2gtfs.utility.data_io_converter import FileFormat
+from gps2gtfs.utility.executor import Engine, ExecutionBackend, MemoryProfile
+from gps2gtfs.utility.logger import logger
+
+
+def run(
+    raw_gps_data_path: str,
+    processed_gps_data_path: str,
+    trips_data_path: str,
+    stops_data_path: str,
+    stops_buffer_radius: int,
+    stops_extended_buffer_radius: int,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: Optional[str] = ".",
+    profile: bool = False,
+    write_report: bool = False,
+    progress: Optional[ProgressMonitor] = None,
+    profile_dir: Optional[str] = None,
+    running_times_and_headways: bool = False,
+) -> Optional[PipelineResult]:
+    """
+    Run the stop pipeline on the trips extracted by an earlier run.
+
+    The trips and the GPS records matched with the trip terminals are read from the outputs of
+    a trip or trip & stop pipeline run with `write_processed_gps`, so the terminal matching and
+    trip assembly are not run again. The raw GPS data is cleaned and goes straight to the stop
+    buffers, trajectories, stop matching and stop times, which is all that changes with the
+    stop buffer radii.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the raw GPS data of the earlier run.
+        processed_gps_data_path (str): File path to the 'processed_gps' output of the earlier
+                                       run.
+        trips_data_path (str): File path to the 'trips' output of the earlier run.
+        stops_data_path (str): File path to the CSV containing stops data.
+        stops_buffer_radius (int): Buffer radius around the bus stops.
+        stops_extended_buffer_radius (int): Extended buffer radius around the bus stops.
+        num_workers (int, optional): Number of parallel workers. Default is None, which uses
+                                     the number of available CPU cores.
+        backend (Union[str, ExecutionBackend]): One of 'serial', 'threads' or 'processes'.
+                                                Default is 'processes'.
+        engine (Union[str, Engine]): Implementation of the stop matching and aggregation, either
+                                     'reference' or 'fast'. Default is 'reference'.
+        memory_profile (Union[str, MemoryProfile]): Either 'default', or 'compact' to store
+                                                    the cleaned GPS data with compact dtypes.
+                                                    Default is 'default'.
+        presorted (bool): Whether the raw GPS data is known to be sorted by device and time,
+                          which skips sorting it. Default is False.
+        input_format (Union[str, FileFormat]): Format of the raw GPS, processed GPS and trips
+                                               files, either 'csv' or 'parquet'. Default is
+                                               'csv'.
+        output_format (Union[str, FileFormat]): Format of the stops output. Default is 'csv'.
+        output_dir (str, optional): Directory where the stops output is written. Default is
+                                    the current directory. None writes nothing.
+        profile (bool): Whether to log the metrics of every stage. Default is False.
+        write_report (bool): Whether to write the run report as JSON in the output directory.
+                             Default is False.
+        progress (ProgressMonitor, optional): Monitor that logs and exports the live progress
+                                              of the stages. Default is None.
+        profile_dir (str, optional): Directory where the cProfile and collapsed-stack profiles
+                                     of every stage are written. Default is None, which
+                                     disables profiling.
+        running_times_and_headways (bool): Whether to add the running time from the previous
+                                           stop and the headway behind the previous bus to
+                                           the stop times. Default is False.
+
+    Returns:
+        Optional[PipelineResult]: The stop times with the run report. None is returned if
+                                  the input data cannot be loaded.
+
+    Notes:
+        - The trips of a partitioned run are numbered one date at a time. They are numbered
+          again in the order of the GPS records for the trajectories, and the stop times keep
+          the trip IDs of the trips output.
+
+    Example:
+        >>> from gps2gtfs.pipeline import stop, trip
+        >>> trip.run(raw_gps_path, terminals_path, 100, write_processed_gps=True,
+        ...          output_dir="out")
+        >>> stop.run(raw_gps_path, "out/processed_gps.csv", "out/trips.csv", stops_path,
+        ...          40, 80, output_dir="out_40")
+    """
+    report = RunReport(
+        "stop",
+        {
+            "stops_buffer_radius": stops_buffer_radius,
+            "stops_extended_buffer_radius": stops_extended_buffer_radius,
+            "backend": ExecutionBackend(backend).value,
+            "engine": Engine(engine).value,
+            "memory_profile": MemoryProfile(memory_profile).value,
+            "presorted": presorted,
+        },
+        log_stages=profile,
+        progress=progress,
+        profiler=StageProfiler(profile_dir) if profile_dir else None,
+    )
+    logger.info("Pipeline method called !")
+    logger.info("Starting Pipeline for extracting Bus Stop Data from stored trips")
+    with report.stage("load") as stage:
+        loaded_data = load_data_for_stop_calculation(
+            raw_gps_data_path,
+            processed_gps_data_path,
+            trips_data_path,
+            stops_data_path,
+            input_format,
+        )
+        stage.output_rows = len(loaded_data[0]) if loaded_data else None
+    if not loaded_data:
+        return None
+    raw_gps_df, processed_gps_df, trips_df, stops_df = loaded_data
+
+    with report.stage("clean", len(raw_gps_df)) as stage:
+        cleaned_raw_gps_df = clean(
+            raw_gps_df, memory_profile=memory_profile, presorted=presorted
+        )
+        stage.output_rows = len(cleaned_raw_gps_df)
+        stage.counters.update(cleaned_raw_gps_df.attrs[REMOVED_ROWS_ATTR])
+        stage.counters.update(cleaned_raw_gps_df.attrs.get(MEMORY_BYTES_ATTR, {}))
+    del raw_gps_df
+
+    processed_gps_df, trips_df, trip_ids = _number_trips_in_order(
+        cleaned_raw_gps_df, processed_gps_df, trips_df
+    )
+    if len(trips_df) == 0:
+        logger.error("None of the stored trips matches the Raw GPS data")
+        return PipelineResult(report.finish())
+
+    logger.info("Preparing data for calculations regarding bus stops")
+    with report.stage("trajectory prep", len(cleaned_raw_gps_df)) as stage:
+        (
+            raw_gps_geo_df,
+            direction1_stops_buffer,
+            direction2_stops_buffer,
+            direction1_stops_extended_buffer,
+            direction2_stops_extended_buffer,
+        ) = create_stop_buffers(
+            cleaned_raw_gps_df,
+            stops_df,
+            stops_buffer_radius,
+            stops_extended_buffer_radius,
+        )
+        del cleaned_raw_gps_df
+
+        trajectory_df = prepare_trajectory_df(
+            raw_gps_geo_df, processed_gps_df, trips_df
+        )
+        del raw_gps_geo_df, processed_gps_df
+        stage.output_rows = len(trajectory_df)
+
+    with report.stage("stop match", len(trajectory_df)) as stage:
+        stop_gps_df = extract_stops(
+            trajectory_df,
+            direction1_stops_buffer,
+            direction2_stops_buffer,
+            direction1_stops_extended_buffer,
+            direction2_stops_extended_buffer,
+            num_workers,
+            backend,
+            engine,
+        )
+        stage.output_rows = len(stop_gps_df)
+    del trajectory_df
+
+    # The stored trips start and end at the trip terminals, whose records are not stop times
+    terminal_ids = unique(
+        trips_df[[TripField.START_TERMINAL.value, TripField.END_TERMINAL.value]]
+        .to_numpy()
+        .ravel()
+    ).tolist()
+    with report.stage("stop features", len(stop_gps_df)) as stage:
+        if len(stop_gps_df) == 0:
+            stop_times_df = DataFrame(
+                columns=stop_time_columns(running_times_and_headways)
+            )
+        else:
+            stop_times_df = extract_stop_features(
+                stop_gps_df,
+                terminal_ids,
+                engine,
+                running_times_and_headways=running_times_and_headways,
+            )
+            trip_id_column = stop_times_df[StopTimeField.TRIP_ID.value]
+            stop_times_df[StopTimeField.TRIP_ID.value] = trip_id_column.map(
+                trip_ids
+            ).astype(trip_id_column.dtype)
+        stage.output_rows = len(stop_times_df)
+
+    result = PipelineResult(report, stop_times=stop_times_df)
+    if output_dir is not None:
+        with report.stage("write", len(stop_times_df)):
+            result.write(output_dir, output_format)
+    report.finish()
+    if write_report and output_dir is not None:
+        report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return result
+
+
+def _number_trips_in_order(
+    cleaned_raw_gps_df: DataFrame, processed_gps_df: DataFrame, trips_df: DataFrame
+) -> List:
+    # The trajectories are built by walking the GPS records in order, and expect the trip IDs
+    # to count up from 1 along the way, which is how a single run numbers them
+    record_ids = cleaned_raw_gps_df[CleanedRawGPSField.ID.value]
+    positions = Series(np.arange(len(record_ids)), index=record_ids.to_numpy())
+    positions = positions[~positions.index.duplicated()]
+    processed_positions = processed_gps_df[ProcessedGPSField.ID.value].map(positions)
+
+    is_missing = processed_positions.isna()
+    if is_missing.any():
+        logger.warning(
+            f"Ignoring {int(is_missing.sum())} processed GPS records that are not in the "
+            "cleaned Raw GPS data"
+        )
+    processed_gps_df = processed_gps_df[~is_missing].copy()
+    order = processed_positions[~is_missing].to_numpy().argsort(kind="stable")
+    stored_trip_ids = unique(
+        processed_gps_df[ProcessedGPSField.TRIP_ID.value].to_numpy()[order]
+    )
+    new_trip_ids: Dict = {
+        trip_id: new_trip_id
+        for new_trip_id, trip_id in enumerate(stored_trip_ids, start=1)
+    }
+
+    processed_gps_df[ProcessedGPSField.TRIP_ID.value] = processed_gps_df[
+        ProcessedGPSField.TRIP_ID.value
+    ].map(new_trip_ids)
+    trips_df = trips_df[trips_df[TripField.TRIP_ID.value].isin(new_trip_ids)].copy()
+    trips_df[TripField.TRIP_ID.value] = trips_df[TripField.TRIP_ID.value].map(
+        new_trip_ids
+    )
+    stored_trip_ids_by_new_id = {
+        new_trip_id: trip_id for trip_id, new_trip_id in new_trip_ids.items()
+    }
+    return [processed_gps_df, trips_df, stored_trip_ids_by_new_id]
@@ -0,0 +1,368 @@
+import os
+from itertools import product
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from pandas import DataFrame, concat
+from gps2gtfs.data_field.im_field import TerminalGPSField, TrajectoryField
+from gps2gtfs.data_field.input_field import StopField, TerminalField
+from gps2gtfs.data_field.output_field import StopTimeField, SweepField
+from gps2gtfs.load_data.load_from_csv import load_data_for_trip_stop_pipeline
+from gps2gtfs.preprocessing.data_cleaner import (
+    MEMORY_BYTES_ATTR,
+    REMOVED_ROWS_ATTR,
+    clean,
+)
+from gps2gtfs.preprocessing.stationary_compressor import (
+    STATIONARY_ROWS_ATTR,
+    compress_stationary,
+)
+from gps2gtfs.reporting.profiler import StageProfiler
+from gps2gtfs.reporting.progress import ProgressMonitor
+from gps2gtfs.reporting.run_report import RUN_REPORT_FILE_NAME, RunReport
+from gps2gtfs.stop.data_preparator import (
+    prepare_trajectory_df,
+    split_stops_by_direction,
+)
+from gps2gtfs.stop.feature_extractor import extract_stop_features
+from gps2gtfs.stop.stop_extractor import assign_first_stops
+from gps2gtfs.trip.feature_extractor import extract_trip_features
+from gps2gtfs.trip.trip_extractor import assemble_trips
+from gps2gtfs.utility.data_io_converter import (
+    FileFormat,
+    output_file_path,
+    pandas_to_geo_data_frame,
+    write_file,
+)
+from gps2gtfs.utility.distance_table import DistanceTable
+from gps2gtfs.utility.executor import Engine, MemoryProfile
+from gps2gtfs.utility.logger import logger
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+    from numpy import ndarray
+
+SWEEP_FILE_NAME = "sweep"
+# Position of every record in the cleaned GPS data, to look up its distances in the tables
+_RECORD_POSITION = "record_position"
+
+
+def run(
+    raw_gps_data_path: str,
+    trip_terminals_data_path: str,
+    stops_data_path: str,
+    terminals_buffer_radii: Sequence[int],
+    stops_buffer_radii: Sequence[int],
+    stops_extended_buffer_radii: Sequence[int],
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    compress_stationary_records: bool = False,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+    write_outputs: bool = False,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: Optional[str] = ".",
+    profile: bool = False,
+    write_report: bool = False,
+    progress: Optional[ProgressMonitor] = None,
+    profile_dir: Optional[str] = None,
+) -> Optional[DataFrame]:
+    """
+    Run the trip & stop pipeline for every combination of the given buffer radii.
+
+    The raw GPS data is loaded and cleaned once, and the distances of every record to the
+    nearby trip terminals and bus stops are computed once, up to the largest radius. Terminal
+    and stop matching for any radius are then read from these distance tables, so the grid
+    costs one spatial query per set of areas instead of one pipeline run per setting. Trips
+    and trajectories are extracted once per terminals radius, and stop times once per setting.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the CSV or Parquet file containing raw GPS data.
+        trip_terminals_data_path (str): File path to the CSV containing trip terminals data.
+        stops_data_path (str): File path to the CSV containing stops data.
+        terminals_buffer_radii (Sequence[int]): Buffer radii around the trip terminals.
+        stops_buffer_radii (Sequence[int]): Buffer radii around the bus stops.
+        stops_extended_buffer_radii (Sequence[int]): Extended buffer radii around the bus stops.
+        engine (Union[str, Engine]): Implementation of the trip assembly and stop time
+                                     aggregation, either 'reference' or 'fast'. Default is
+                                     'reference'.
+        compress_stationary_records (bool): Whether to collapse the runs of GPS records at the
+                                            same position before matching. Default is False.
+        memory_profile (Union[str, MemoryProfile]): Either 'default', or 'compact' to store
+                                                    the cleaned GPS data with compact dtypes.
+                                                    Default is 'default'.
+        presorted (bool): Whether the raw GPS data is known to be sorted by device and time,
+                          which skips sorting it. Default is False.
+        write_outputs (bool): Whether to also write the trips and stops outputs of every
+                              setting, in one sub-directory of the output directory per
+                              setting. Default is False.
+        input_format (Union[str, FileFormat]): Format of the raw GPS data file, either 'csv'
+                                               or 'parquet'. Default is 'csv'.
+        output_format (Union[str, FileFormat]): Format of the outputs. Default is 'csv'.
+        output_dir (str, optional): Directory where the outputs are written. Default is the
+                                    current directory. None writes nothing.
+        profile (bool): Whether to log the metrics of every stage. Default is False.
+        write_report (bool): Whether to write the run report as JSON in the output directory.
+                             Default is False.
+        progress (ProgressMonitor, optional): Monitor that logs and exports the live progress
+                                              of the stages. Default is None.
+        profile_dir (str, optional): Directory where the cProfile and collapsed-stack profiles
+                                     of every stage are written. Default is None, which
+                                     disables profiling.
+
+    Returns:
+        Optional[DataFrame]: One row per setting with its radii, the number of trips and stop
+                             times, the share of the stops with stop times and the median
+                             dwell time in seconds. The same table is written as 'sweep'.
+                             None is returned if the input data cannot be loaded.
+
+    Notes:
+        - Matching gives the stops and terminals of the `fast` engine of the trip & stop
+          pipeline run with the same radii, hence the same trips and stop times.
+
+    Example:
+        >>> from gps2gtfs.pipeline import sweep
+        >>> sweep_df = sweep.run(raw_gps_path, terminals_path, stops_path,
+        ...                      [75, 100, 150], [30, 50], [80, 100], output_dir="sweep")
+        >>> sweep_df.sort_values("stop_coverage", ascending=False).head(1)
+    """
+    terminals_buffer_radii = sorted(set(terminals_buffer_radii))
+    stops_buffer_radii = sorted(set(stops_buffer_radii))
+    stops_extended_buffer_radii = sorted(set(stops_extended_buffer_radii))
+    report = RunReport(
+        "sweep",
+        {
+            "terminals_buffer_radii": terminals_buffer_radii,
+            "stops_buffer_radii": stops_buffer_radii,
+            "stops_extended_buffer_radii": stops_extended_buffer_radii,
+            "engine": Engine(engine).value,
+            "compress_stationary_records": compress_stationary_records,
+            "memory_profile": MemoryProfile(memory_profile).value,
+            "presorted": presorted,
+        },
+        log_stages=profile,
+        progress=progress,
+        profiler=StageProfiler(profile_dir) if profile_dir else None,
+    )
+    logger.info("Pipeline method called !")
+    logger.info("Starting Pipeline for sweeping the buffer radii")
+    with report.stage("load") as stage:
+        loaded_data = load_data_for_trip_stop_pipeline(
+            raw_gps_data_path, trip_terminals_data_path, stops_data_path, input_format
+        )
+        stage.output_rows = len(loaded_data[0]) if loaded_data else None
+    if not loaded_data:
+        return None
+    raw_gps_df, trip_terminals_df, stops_df = loaded_data
+
+    with report.stage("clean", len(raw_gps_df)) as stage:
+        cleaned_raw_gps_df = clean(
+            raw_gps_df, memory_profile=memory_profile, presorted=presorted
+        )
+        stage.output_rows = len(cleaned_raw_gps_df)
+        stage.counters.update(cleaned_raw_gps_df.attrs[REMOVED_ROWS_ATTR])
+        stage.counters.update(cleaned_raw_gps_df.attrs.get(MEMORY_BYTES_ATTR, {}))
+    del raw_gps_df
+
+    if compress_stationary_records:
+        with report.stage("stationary compression", len(cleaned_raw_gps_df)) as stage:
+            cleaned_raw_gps_df = compress_stationary(cleaned_raw_gps_df)
+            stage.output_rows = len(cleaned_raw_gps_df)
+            stage.counters[STATIONARY_ROWS_ATTR] = cleaned_raw_gps_df.attrs[
+                STATIONARY_ROWS_ATTR
+            ]
+
+    logger.info("Computing the distances of the GPS Data Points to terminals and stops")
+    with report.stage("distance tables", len(cleaned_raw_gps_df)) as stage:
+        raw_gps_geo_df = pandas_to_geo_data_frame(cleaned_raw_gps_df)
+        raw_gps_geo_df.reset_index(drop=True, inplace=True)
+        raw_gps_geo_df[_RECORD_POSITION] = np.arange(len(raw_gps_geo_df))
+        del cleaned_raw_gps_df
+
+        trip_terminals_geo_df = pandas_to_geo_data_frame(trip_terminals_df)
+        terminals_table = DistanceTable(
+            raw_gps_geo_df, trip_terminals_geo_df, max(terminals_buffer_radii)
+        )
+        max_stops_radius = max(stops_buffer_radii + stops_extended_buffer_radii)
+        stops_geo_dfs = split_stops_by_direction(pandas_to_geo_data_frame(stops_df))
+        stops_tables = [
+            DistanceTable(raw_gps_geo_df, direction_stops_geo_df, max_stops_radius)
+            for direction_stops_geo_df in stops_geo_dfs
+        ]
+        stage.output_rows = len(terminals_table) + sum(map(len, stops_tables))
+
+    num_stops = len(concat(stops_geo_dfs)[StopField.STOP_ID.value].drop_duplicates())
+    # Stop matches of every radius, shared by the settings of all the terminals radii
+    first_stops: Dict[int, List["ndarray"]] = {}
+    rows = []
+    for terminals_buffer_radius in terminals_buffer_radii:
+        logger.info(f"Extracting trips with terminals radius {terminals_buffer_radius}")
+        results = _extract_trajectories(
+            raw_gps_geo_df,
+            trip_terminals_geo_df,
+            terminals_table,
+            terminals_buffer_radius,
+            engine,
+            report,
+        )
+        if results is None:
+            rows.extend(
+                [
+                    terminals_buffer_radius,
+                    stops_radius,
+                    extended_radius,
+                    0,
+                    0,
+                    0.0,
+                    np.nan,
+                ]
+                for stops_radius, extended_radius in product(
+                    stops_buffer_radii, stops_extended_buffer_radii
+                )
+            )
+            continue
+        trip_features_df, trajectory_df = results
+
+        for stops_radius, extended_radius in product(
+            stops_buffer_radii, stops_extended_buffer_radii
+        ):
+            for radius in (stops_radius, extended_radius):
+                if radius not in first_stops:
+                    first_stops[radius] = [
+                        table.first_within(radius) for table in stops_tables
+                    ]
+
+            with report.stage("stop match", len(trajectory_df)) as stage:
+                stop_gps_df = _match_stops(
+                    trajectory_df,
+                    stops_geo_dfs,
+                    first_stops[stops_radius],
+                    first_stops[extended_radius],
+                )
+                stage.output_rows = len(stop_gps_df)
+
+            with report.stage("stop features", len(stop_gps_df)) as stage:
+                if len(stop_gps_df) == 0:
+                    stop_times_df = DataFrame(columns=[f.value for f in StopTimeField])
+                else:
+                    stop_times_df = extract_stop_features(
+                        stop_gps_df,
+                        trip_terminals_df[TerminalField.TERMINAL_ID.value].tolist(),
+                        engine,
+                    )
+                stage.output_rows = len(stop_times_df)
+
+            if write_outputs and output_dir is not None:
+                setting_dir = os.path.join(
+                    output_dir,
+                    f"terminals_{terminals_buffer_radius}"
+                    f"_stops_{stops_radius}_{extended_radius}",
+                )
+                with report.stage("write", len(trip_features_df) + len(stop_times_df)):
+                    write_file(
+                        trip_features_df,
+                        output_file_path(setting_dir, "trips", output_format),
+                        output_format,
+                    )
+                    write_file(
+                        stop_times_df,
+                        output_file_path(setting_dir, "stops", output_format),
+                        output_format,
+                    )
+            rows.append(
+                [
+                    terminals_buffer_radius,
+                    stops_radius,
+                    extended_radius,
+                    len(trip_features_df),
+                    len(stop_times_df),
+                    stop_times_df[StopTimeField.BUS_STOP.value].nunique() / num_stops,
+                    stop_times_df[StopTimeField.DWELL_TIME_IN_SECONDS.value]
+                    .astype("float64")
+                    .median(),
+                ]
+            )
+
+    sweep_df = DataFrame(rows, columns=[f.value for f in SweepField])
+    if output_dir is not None:
+        with report.stage("write", len(sweep_df)):
+            write_file(
+                sweep_df,
+                output_file_path(output_dir, SWEEP_FILE_NAME, output_format),
+                output_format,
+            )
+
+    report.finish()
+    if write_report and output_dir is not None:
+        report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return sweep_df
+
+
+def _extract_trajectories(
+    raw_gps_geo_df: "GeoDataFrame",
+    trip_terminals_geo_df: "GeoDataFrame",
+    terminals_table: DistanceTable,
+    terminals_buffer_radius: int,
+    engine: Union[str, Engine],
+    report: RunReport,
+) -> Optional[List[DataFrame]]:
+    with report.stage("terminal match", len(raw_gps_geo_df)) as stage:
+        first_terminal = terminals_table.first_within(terminals_buffer_radius)
+        matched = first_terminal >= 0
+        gps_data_within_terminal_buffer = raw_gps_geo_df[matched].reset_index(drop=True)
+        gps_data_within_terminal_buffer[TerminalGPSField.BUS_STOP.value] = (
+            trip_terminals_geo_df[TerminalField.TERMINAL_ID.value].to_numpy()[
+                first_terminal[matched]
+            ]
+        )
+        stage.output_rows = len(gps_data_within_terminal_buffer)
+
+    with report.stage("trip assembly", len(gps_data_within_terminal_buffer)) as stage:
+        trips_df = assemble_trips(gps_data_within_terminal_buffer, engine)
+        stage.output_rows = len(trips_df)
+    del gps_data_within_terminal_buffer
+    if len(trips_df) == 0:
+        logger.info("No trips found in the data")
+        return None
+
+    with report.stage("trip features", len(trips_df)) as stage:
+        trip_features_df = extract_trip_features(trips_df)
+        stage.output_rows = len(trip_features_df)
+
+    with report.stage("trajectory prep", len(raw_gps_geo_df)) as stage:
+        trajectory_df = prepare_trajectory_df(
+            raw_gps_geo_df, trips_df, trip_features_df
+        )
+        stage.output_rows = len(trajectory_df)
+    return [trip_features_df, trajectory_df]
+
+
+def _match_stops(
+    trajectory_df: DataFrame,
+    stops_geo_dfs: Sequence["GeoDataFrame"],
+    first_stops: Sequence["ndarray"],
+    first_extended_stops: Sequence["ndarray"],
+) -> DataFrame:
+    # Same records as extract_stops: each direction matched with its own stops, in turn
+    direction_trajectories = []
+    for direction, stops_geo_df in enumerate(stops_geo_dfs, start=1):
+        direction_trajectory = trajectory_df[
+            trajectory_df[TrajectoryField.DIRECTION.value] == direction
+        ].reset_index(drop=True)
+        positions = direction_trajectory[_RECORD_POSITION].to_numpy()
+        stop_ids = stops_geo_df[StopField.STOP_ID.value].to_numpy()
+        direction_trajectory[TrajectoryField.BUS_STOP.value] = assign_first_stops(
+            direction_trajectory[TrajectoryField.BUS_STOP.value].to_numpy(
+                dtype="object"
+            ),
+            first_stops[direction - 1][positions],
+            first_extended_stops[direction - 1][positions],
+            stop_ids,
+            stop_ids,
+        )
+        direction_trajectories.append(direction_trajectory)
+
+    trip_all_points = concat(direction_trajectories, ignore_index=True)
+    return trip_all_points.dropna().drop(columns=_RECORD_POSITION)
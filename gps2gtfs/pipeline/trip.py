@@ -1,41 +1,498 @@
-import warnings
-
-from pandas.errors import SettingWithCopyWarning
-from gps2gtfs.load_data.load_from_csv import load_data_for_trip_pipeline
-from gps2gtfs.preprocessing.data_cleaner import clean
-from gps2gtfs.trip.feature_extractor import extract_trip_features
-from gps2gtfs.trip.trip_extractor import extract_trips
-from gps2gtfs.utility.data_io_converter import write_as_csv_file
+import os
+import shutil
+import tempfile
+from typing import List, Optional, Union
+
+from pandas import DataFrame
+from gps2gtfs.data_field.im_field import ProcessedGPSField
+from gps2gtfs.data_field.output_field import TripField
+from gps2gtfs.load_data.load_from_csv import (
+    load_data_for_partitioned_pipeline,
+    load_data_for_trip_pipeline,
+)
+from gps2gtfs.load_data.partitioner import (
+    partition_raw_gps_by_date,
+    split_partition_by_device,
+)
+from gps2gtfs.pipeline.result import PipelineResult
+from gps2gtfs.preprocessing.data_cleaner import (
+    MEMORY_BYTES_ATTR,
+    REMOVED_ROWS_ATTR,
+    clean,
+)
+from gps2gtfs.preprocessing.stationary_compressor import (
+    STATIONARY_ROWS_ATTR,
+    compress_stationary,
+)
+from gps2gtfs.reporting.profiler import StageProfiler
+from gps2gtfs.reporting.progress import ProgressMonitor
+from gps2gtfs.reporting.run_report import RUN_REPORT_FILE_NAME, RunReport
+from gps2gtfs.trip.feature_extractor import (
+    extract_trip_features,
+    update_terminal_order,
+)
+from gps2gtfs.trip.trip_extractor import assemble_trips, match_terminals
+from gps2gtfs.utility.data_io_converter import (
+    PROCESSED_GPS_FILE_NAME,
+    FileFormat,
+    geo_to_pandas_data_frame,
+    output_file_path,
+    read_csv_file,
+    write_partition,
+)
+from gps2gtfs.utility.executor import Engine, ExecutionBackend, MemoryProfile
 from gps2gtfs.utility.logger import logger
+from gps2gtfs.utility.route_index import RouteIndex
 
 
 def run(
     raw_gps_data_path: str,
     trip_terminals_data_path: str,
     terminals_buffer_radius: int,
-) -> None:
-    # Suppress the SettingWithCopyWarning
-    warnings.filterwarnings("ignore", category=SettingWithCopyWarning)
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    compress_stationary_records: bool = False,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+    lean: bool = False,
+    write_processed_gps: bool = False,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: Optional[str] = ".",
+    profile: bool = False,
+    write_report: bool = False,
+    progress: Optional[ProgressMonitor] = None,
+    profile_dir: Optional[str] = None,
+) -> Optional[PipelineResult]:
+    """
+    Run the trip pipeline on the files of a route.
+
+    The input files are loaded and go through `process`, and the outputs are written in
+    `output_dir` unless it is None.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the CSV or Parquet file containing raw GPS data.
+        trip_terminals_data_path (str): File path to the CSV containing trip terminals data.
+        terminals_buffer_radius (int): Buffer radius around the trip terminals.
+        num_workers, backend, engine, compress_stationary_records, memory_profile, presorted,
+        lean, profile, progress, profile_dir: See `process`.
+        write_processed_gps (bool): Whether to also write the GPS records matched with the trip
+                                    terminals. Default is False.
+        input_format (Union[str, FileFormat]): Format of the raw GPS data file, either 'csv'
+                                               or 'parquet'. Default is 'csv'.
+        output_format (Union[str, FileFormat]): Format of the outputs. Default is 'csv'.
+        output_dir (str, optional): Directory where the outputs are written. Default is the
+                                    current directory. None writes nothing.
+        write_report (bool): Whether to write the run report as JSON in the output directory.
+                             Default is False.
 
+    Returns:
+        Optional[PipelineResult]: The trips and processed GPS records with the run report.
+                                  None is returned if the input data cannot be loaded.
+    """
+    report = _new_report(
+        terminals_buffer_radius,
+        backend,
+        engine,
+        compress_stationary_records,
+        memory_profile,
+        presorted,
+        lean,
+        profile,
+        progress,
+        profile_dir,
+    )
     logger.info("Pipeline method called !")
     logger.info("Starting Pipeline for extracting Trip Data")
-    loaded_data = load_data_for_trip_pipeline(
-        raw_gps_data_path, trip_terminals_data_path
+    with report.stage("load") as stage:
+        loaded_data = load_data_for_trip_pipeline(
+            raw_gps_data_path, trip_terminals_data_path, input_format
+        )
+        stage.output_rows = len(loaded_data[0]) if loaded_data else None
+    if not loaded_data:
+        return None
+    logger.info("Successfully read the data")
+    raw_gps_df, trip_terminals_df = loaded_data
+    del loaded_data
+
+    cleaned_raw_gps_df = _clean_raw_gps(
+        raw_gps_df, compress_stationary_records, memory_profile, presorted, report
+    )
+    del raw_gps_df
+    result = _extract_result(
+        cleaned_raw_gps_df,
+        trip_terminals_df,
+        terminals_buffer_radius,
+        num_workers,
+        backend,
+        engine,
+        lean,
+        report,
+    )
+    del cleaned_raw_gps_df
+    if result.trips is None:
+        report.finish()
+        return result
+
+    if output_dir is not None:
+        with report.stage("write", len(result.trips)):
+            result.write(output_dir, output_format, write_processed_gps)
+    report.finish()
+    if write_report and output_dir is not None:
+        report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return result
+
+
+def process(
+    raw_gps_df: DataFrame,
+    trip_terminals_df: DataFrame,
+    terminals_buffer_radius: int,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    compress_stationary_records: bool = False,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+    lean: bool = False,
+    profile: bool = False,
+    progress: Optional[ProgressMonitor] = None,
+    profile_dir: Optional[str] = None,
+    route_index: Optional[RouteIndex] = None,
+) -> PipelineResult:
+    """
+    Extract the trips of a route from data frames, in memory.
+
+    Nothing is read or written, apart from the profiles when `profile_dir` is given, and the
+    input data frames are not changed. See `gps2gtfs.pipeline.trip_stop.process` for running
+    several routes at the same time.
+
+    Parameters:
+        raw_gps_df (DataFrame): Raw GPS data, with the columns of `RawGPSField`.
+        trip_terminals_df (DataFrame): Trip terminals data, with the columns of
+                                       `TerminalField`.
+        terminals_buffer_radius (int): Buffer radius around the trip terminals.
+        num_workers (int, optional): Number of parallel workers. Default is None, which uses
+                                     the number of available CPU cores.
+        backend (Union[str, ExecutionBackend]): One of 'serial', 'threads' or 'processes'.
+                                                Default is 'processes'.
+        engine (Union[str, Engine]): Implementation of the matching and aggregation stages,
+                                     either the 'reference' loops or the vectorized 'fast'
+                                     engine. Default is 'reference'.
+        compress_stationary_records (bool): Whether to collapse the runs of GPS records at the
+                                            same position before matching. Default is False.
+        memory_profile (Union[str, MemoryProfile]): Either 'default', or 'compact' to store
+                                                    the cleaned GPS data with compact dtypes.
+                                                    Default is 'default'.
+        presorted (bool): Whether the raw GPS data is known to be sorted by device and time,
+                          which skips sorting it. Default is False.
+        lean (bool): Whether to match the terminals on the points of the cleaned GPS data
+                     without copying it. Default is False.
+        profile (bool): Whether to log the metrics of every stage. Default is False.
+        progress (ProgressMonitor, optional): Monitor that logs and exports the live progress
+                                              of the stages. Default is None.
+        profile_dir (str, optional): Directory where the cProfile and collapsed-stack profiles
+                                     of every stage are written. Default is None, which
+                                     disables profiling.
+        route_index (RouteIndex, optional): Prebuilt buffers and spatial indexes of the
+                                            terminals and stops of the route, kept between
+                                            runs. Default is None, which makes them for this
+                                            run.
+
+    Returns:
+        PipelineResult: The trips and processed GPS records with the run report. The outputs
+                        are None when no trip can be extracted.
+    """
+    report = _new_report(
+        terminals_buffer_radius,
+        backend,
+        engine,
+        compress_stationary_records,
+        memory_profile,
+        presorted,
+        lean,
+        profile,
+        progress,
+        profile_dir,
+    )
+    logger.info("Starting Pipeline for extracting Trip Data")
+    cleaned_raw_gps_df = _clean_raw_gps(
+        raw_gps_df, compress_stationary_records, memory_profile, presorted, report
+    )
+    result = _extract_result(
+        cleaned_raw_gps_df,
+        trip_terminals_df,
+        terminals_buffer_radius,
+        num_workers,
+        backend,
+        engine,
+        lean,
+        report,
+        route_index,
+    )
+    report.finish()
+    return result
+
+
+def run_partitioned(
+    raw_gps_data_path: str,
+    trip_terminals_data_path: str,
+    terminals_buffer_radius: int,
+    memory_limit_mb: Optional[int] = None,
+    work_dir: Optional[str] = None,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    compress_stationary_records: bool = False,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+    lean: bool = False,
+    write_processed_gps: bool = False,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: str = ".",
+    profile: bool = False,
+    write_report: bool = False,
+    progress: Optional[ProgressMonitor] = None,
+    profile_dir: Optional[str] = None,
+) -> Optional[RunReport]:
+    """
+    Run the trip pipeline one service date at a time with bounded memory.
+
+    This is the trip-only counterpart of `gps2gtfs.pipeline.trip_stop.run_partitioned`, see
+    there for how the input is partitioned and how trips are kept consistent across partitions.
+    """
+    logger.info("Pipeline method called !")
+    logger.info("Starting partitioned Pipeline for extracting Trip Data")
+    loaded_data = load_data_for_partitioned_pipeline(trip_terminals_data_path)
+    if not loaded_data:
+        return None
+    (trip_terminals_df,) = loaded_data
+
+    report = _new_report(
+        terminals_buffer_radius,
+        backend,
+        engine,
+        compress_stationary_records,
+        memory_profile,
+        presorted,
+        lean,
+        profile,
+        progress,
+        profile_dir,
+    )
+    report.parameters["memory_limit_mb"] = memory_limit_mb
+    trips_path = output_file_path(output_dir, "trips", output_format)
+    processed_gps_path = output_file_path(
+        output_dir, PROCESSED_GPS_FILE_NAME, output_format
+    )
+    spill_dir = (
+        work_dir if work_dir is not None else tempfile.mkdtemp(prefix="gps2gtfs_")
+    )
+    try:
+        with report.stage("partition"):
+            partition_paths = partition_raw_gps_by_date(
+                raw_gps_data_path, spill_dir, memory_limit_mb, input_format
+            )
+        if partition_paths is None:
+            return None
+        if progress is not None:
+            progress.set_partitions(len(partition_paths))
+
+        part_index = 0
+        trip_id_offset = 0
+        terminal_order: List[str] = []
+        for date, partition_path in partition_paths.items():
+            logger.info(f"Processing partition of {date}")
+            with report.stage("load") as stage:
+                partition_df = read_csv_file(partition_path, f"partition of {date}")
+                stage.output_rows = None if partition_df is None else len(partition_df)
+            if partition_df is None:
+                continue
+
+            # Parts are taken out of the list, so that each one is freed once cleaned
+            parts = split_partition_by_device(partition_df, memory_limit_mb)
+            del partition_df
+            while parts:
+                cleaned_raw_gps_df = _clean_raw_gps(
+                    parts.pop(0),
+                    compress_stationary_records,
+                    memory_profile,
+                    presorted,
+                    report,
+                )
+                results = _extract_trips_with_features(
+                    cleaned_raw_gps_df,
+                    trip_terminals_df,
+                    terminals_buffer_radius,
+                    num_workers,
+                    backend,
+                    engine,
+                    lean,
+                    report,
+                    terminal_order,
+                )
+                del cleaned_raw_gps_df
+                if results is None:
+                    continue
+
+                trip_features_df, processed_gps_df = results
+                trip_features_df[TripField.TRIP_ID.value] += trip_id_offset
+                processed_gps_df[ProcessedGPSField.TRIP_ID.value] += trip_id_offset
+                trip_id_offset = int(trip_features_df[TripField.TRIP_ID.value].max())
+                with report.stage("write", len(trip_features_df)):
+                    write_partition(
+                        trip_features_df, trips_path, part_index, output_format
+                    )
+                    if write_processed_gps:
+                        write_partition(
+                            geo_to_pandas_data_frame(processed_gps_df),
+                            processed_gps_path,
+                            part_index,
+                            output_format,
+                        )
+                part_index += 1
+
+            if progress is not None:
+                progress.partition_done()
+    finally:
+        if work_dir is None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    report.finish()
+    if write_report:
+        report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return report
+
+
+def _new_report(
+    terminals_buffer_radius: int,
+    backend: Union[str, ExecutionBackend],
+    engine: Union[str, Engine],
+    compress_stationary_records: bool,
+    memory_profile: Union[str, MemoryProfile],
+    presorted: bool,
+    lean: bool,
+    profile: bool,
+    progress: Optional[ProgressMonitor],
+    profile_dir: Optional[str],
+) -> RunReport:
+    return RunReport(
+        "trip",
+        {
+            "terminals_buffer_radius": terminals_buffer_radius,
+            "backend": ExecutionBackend(backend).value,
+            "engine": Engine(engine).value,
+            "compress_stationary_records": compress_stationary_records,
+            "memory_profile": MemoryProfile(memory_profile).value,
+            "presorted": presorted,
+            "lean": lean,
+        },
+        log_stages=profile,
+        progress=progress,
+        profiler=StageProfiler(profile_dir) if profile_dir else None,
+    )
+
+
+def _extract_result(
+    cleaned_raw_gps_df: DataFrame,
+    trip_terminals_df: DataFrame,
+    terminals_buffer_radius: int,
+    num_workers: Optional[int],
+    backend: Union[str, ExecutionBackend],
+    engine: Union[str, Engine],
+    lean: bool,
+    report: RunReport,
+    route_index: Optional[RouteIndex] = None,
+) -> PipelineResult:
+    results = _extract_trips_with_features(
+        cleaned_raw_gps_df,
+        trip_terminals_df,
+        terminals_buffer_radius,
+        num_workers,
+        backend,
+        engine,
+        lean,
+        report,
+        route_index=route_index,
     )
-    if loaded_data:
-        logger.info("Successfully read the data")
-        raw_gps_df, trip_terminals_df = loaded_data
+    if results is None:
+        logger.error("No trips could be extracted from the Raw GPS data")
+        return PipelineResult(report)
+    trip_features_df, processed_gps_df = results
+    logger.info("Finished extracting Trip Data")
+    return PipelineResult(report, trip_features_df, processed_gps=processed_gps_df)
 
-        cleaned_raw_gps_df = clean(raw_gps_df)
 
-        trips_df = extract_trips(
-            cleaned_raw_gps_df, trip_terminals_df, terminals_buffer_radius
+def _clean_raw_gps(
+    raw_gps_df: DataFrame,
+    compress_stationary_records: bool,
+    memory_profile: Union[str, MemoryProfile],
+    presorted: bool,
+    report: RunReport,
+) -> DataFrame:
+    with report.stage("clean", len(raw_gps_df)) as stage:
+        cleaned_raw_gps_df = clean(
+            raw_gps_df, memory_profile=memory_profile, presorted=presorted
         )
+        stage.output_rows = len(cleaned_raw_gps_df)
+        stage.counters.update(cleaned_raw_gps_df.attrs[REMOVED_ROWS_ATTR])
+        stage.counters.update(cleaned_raw_gps_df.attrs.get(MEMORY_BYTES_ATTR, {}))
+    del raw_gps_df
+
+    if compress_stationary_records and len(cleaned_raw_gps_df) > 0:
+        with report.stage("stationary compression", len(cleaned_raw_gps_df)) as stage:
+            cleaned_raw_gps_df = compress_stationary(cleaned_raw_gps_df)
+            stage.output_rows = len(cleaned_raw_gps_df)
+            stage.counters[STATIONARY_ROWS_ATTR] = cleaned_raw_gps_df.attrs[
+                STATIONARY_ROWS_ATTR
+            ]
+    return cleaned_raw_gps_df
 
-        trip_features_df = extract_trip_features(trips_df)
 
-        logger.info("Finished extracting Trip Data")
+def _extract_trips_with_features(
+    cleaned_raw_gps_df: DataFrame,
+    trip_terminals_df: DataFrame,
+    terminals_buffer_radius: int,
+    num_workers: Optional[int],
+    backend: Union[str, ExecutionBackend],
+    engine: Union[str, Engine],
+    lean: bool,
+    report: RunReport,
+    terminal_order: Optional[List[str]] = None,
+    route_index: Optional[RouteIndex] = None,
+) -> Optional[List[DataFrame]]:
+    if len(cleaned_raw_gps_df) == 0:
+        return None
+
+    with report.stage("terminal match", len(cleaned_raw_gps_df)) as stage:
+        # In lean mode, the points for the matching share the columns of the cleaned data
+        gps_data_within_terminal_buffer = match_terminals(
+            cleaned_raw_gps_df,
+            trip_terminals_df,
+            terminals_buffer_radius,
+            num_workers,
+            backend,
+            engine,
+            copy=not lean,
+            route_index=route_index,
+        )
+        stage.output_rows = len(gps_data_within_terminal_buffer)
 
-        write_as_csv_file(trip_features_df, "trips.csv")
+    with report.stage("trip assembly", len(gps_data_within_terminal_buffer)) as stage:
+        trips_df = assemble_trips(gps_data_within_terminal_buffer, engine)
+        stage.output_rows = len(trips_df)
+    if len(trips_df) == 0:
+        logger.info("No trips found in the data")
+        return None
 
-        logger.info("Pipeline finished successfully !")
+    with report.stage("trip features", len(trips_df)) as stage:
+        if terminal_order is not None:
+            terminal_order = update_terminal_order(trips_df, terminal_order)
+        trip_features_df = extract_trip_features(trips_df, terminal_order)
+        stage.output_rows = len(trip_features_df)
+    return [trip_features_df, trips_df]
@@ -1,15 +1,71 @@
-import warnings
+import os
+import shutil
+import tempfile
+from typing import List, Optional, Tuple, Union
 
-from pandas.errors import SettingWithCopyWarning
-from gps2gtfs.load_data.load_from_csv import load_data_for_trip_stop_pipeline
-from gps2gtfs.preprocessing.data_cleaner import clean
+from pandas import DataFrame, concat
+from gps2gtfs.aggregation.schedule_sketches import (
+    SCHEDULE_SKETCHES_FILE_NAME,
+    ScheduleSketches,
+)
+from gps2gtfs.data_field.im_field import ProcessedGPSField
+from gps2gtfs.data_field.input_field import TerminalField
+from gps2gtfs.data_field.output_field import (
+    CompactTrajectoryField,
+    StopTimeField,
+    TripField,
+)
+from gps2gtfs.load_data.load_from_csv import (
+    load_data_for_partitioned_pipeline,
+    load_data_for_trip_stop_pipeline,
+)
+from gps2gtfs.load_data.partitioner import (
+    partition_raw_gps_by_date,
+    split_partition_by_device,
+)
+from gps2gtfs.pipeline.result import PipelineResult
+from gps2gtfs.preprocessing.data_cleaner import (
+    MEMORY_BYTES_ATTR,
+    REMOVED_ROWS_ATTR,
+    clean,
+)
+from gps2gtfs.preprocessing.stationary_compressor import (
+    STATIONARY_ROWS_ATTR,
+    compress_stationary,
+)
+from gps2gtfs.reporting.profiler import StageProfiler
+from gps2gtfs.reporting.progress import ProgressMonitor
+from gps2gtfs.reporting.run_report import RUN_REPORT_FILE_NAME, RunReport
 from gps2gtfs.stop.data_preparator import create_stop_buffers, prepare_trajectory_df
-from gps2gtfs.stop.feature_extractor import extract_stop_features
+from gps2gtfs.stop.feature_extractor import (
+    add_running_times_and_headways,
+    extract_stop_features,
+    stop_time_columns,
+)
 from gps2gtfs.stop.stop_extractor import extract_stops
-from gps2gtfs.trip.feature_extractor import extract_trip_features
-from gps2gtfs.trip.trip_extractor import extract_trips
-from gps2gtfs.utility.data_io_converter import write_as_csv_file
+from gps2gtfs.store.trajectory_export import (
+    DEFAULT_TOLERANCE_M,
+    SimplifyMethod,
+    compress_trajectories,
+)
+from gps2gtfs.store.trajectory_store import TrajectoryStore
+from gps2gtfs.trip.feature_extractor import (
+    extract_trip_features,
+    update_terminal_order,
+)
+from gps2gtfs.trip.trip_extractor import assemble_trips, match_terminals
+from gps2gtfs.utility.data_io_converter import (
+    PROCESSED_GPS_FILE_NAME,
+    FileFormat,
+    geo_to_pandas_data_frame,
+    output_file_path,
+    pandas_to_geo_data_frame,
+    read_csv_file,
+    write_partition,
+)
+from gps2gtfs.utility.executor import Engine, ExecutionBackend, MemoryProfile
 from gps2gtfs.utility.logger import logger
+from gps2gtfs.utility.route_index import RouteIndex
 
 
 def run(
@@ -19,31 +75,782 @@ def run(
     terminals_buffer_radius: int,
     stops_buffer_radius: int,
     stops_extended_buffer_radius: int,
-) -> None:
-    # Suppress the SettingWithCopyWarning
-    warnings.filterwarnings("ignore", category=SettingWithCopyWarning)
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    compress_stationary_records: bool = False,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+    lean: bool = False,
+    write_processed_gps: bool = False,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: Optional[str] = ".",
+    profile: bool = False,
+    write_report: bool = False,
+    progress: Optional[ProgressMonitor] = None,
+    profile_dir: Optional[str] = None,
+    trajectory_store_dir: Optional[str] = None,
+    export_trajectories: bool = False,
+    trajectory_tolerance_m: float = DEFAULT_TOLERANCE_M,
+    trajectory_simplification: Union[
+        str, SimplifyMethod
+    ] = SimplifyMethod.DOUGLAS_PEUCKER,
+    running_times_and_headways: bool = False,
+    schedule_sketches: bool = False,
+) -> Optional[PipelineResult]:
+    """
+    Run the trip & stop pipeline on the files of a route.
+
+    The input files are loaded and go through `process`, and the outputs are written in
+    `output_dir` unless it is None. The run changes no global state and writes nowhere else,
+    so runs of several routes can be executed at the same time in threads or tasks, each with
+    an output directory of its own or none.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the CSV or Parquet file containing raw GPS data.
+        trip_terminals_data_path (str): File path to the CSV containing trip terminals data.
+        stops_data_path (str): File path to the CSV containing stops data.
+        terminals_buffer_radius (int): Buffer radius around the trip terminals.
+        stops_buffer_radius (int): Buffer radius around the bus stops.
+        stops_extended_buffer_radius (int): Extended buffer radius around the bus stops.
+        num_workers, backend, engine, compress_stationary_records, memory_profile, presorted,
+        lean, profile, progress, profile_dir, export_trajectories, trajectory_tolerance_m,
+        trajectory_simplification, running_times_and_headways, schedule_sketches: See
+        `process`.
+        write_processed_gps (bool): Whether to also write the GPS records matched with the trip
+                                    terminals. Default is False.
+        input_format (Union[str, FileFormat]): Format of the raw GPS data file, either 'csv'
+                                               or 'parquet'. Default is 'csv'.
+        output_format (Union[str, FileFormat]): Format of the outputs. Default is 'csv'.
+        output_dir (str, optional): Directory where the outputs are written. Default is the
+                                    current directory. None writes nothing.
+        write_report (bool): Whether to write the run report as JSON in the output directory.
+                             Default is False.
+        trajectory_store_dir (str, optional): Directory of a `TrajectoryStore` where the
+                                              trip-annotated trajectories are also written.
+                                              Default is None.
 
+    Returns:
+        Optional[PipelineResult]: The trips, stop times, processed GPS records and exported
+                                  trajectories with the run report. None is returned if the
+                                  input data cannot be loaded.
+    """
+    report = _new_report(
+        terminals_buffer_radius,
+        stops_buffer_radius,
+        stops_extended_buffer_radius,
+        backend,
+        engine,
+        compress_stationary_records,
+        memory_profile,
+        presorted,
+        lean,
+        profile,
+        progress,
+        profile_dir,
+    )
     logger.info("Pipeline method called !")
     logger.info("Starting Pipeline for extracting Trip Data")
-    loaded_data = load_data_for_trip_stop_pipeline(
-        raw_gps_data_path, trip_terminals_data_path, stops_data_path
+    with report.stage("load") as stage:
+        loaded_data = load_data_for_trip_stop_pipeline(
+            raw_gps_data_path, trip_terminals_data_path, stops_data_path, input_format
+        )
+        stage.output_rows = len(loaded_data[0]) if loaded_data else None
+    if not loaded_data:
+        return None
+    logger.info("Successfully read the data")
+    raw_gps_df, trip_terminals_df, stops_df = loaded_data
+    del loaded_data
+
+    cleaned_raw_gps_df = _clean_raw_gps(
+        raw_gps_df,
+        compress_stationary_records,
+        memory_profile,
+        presorted,
+        lean,
+        report,
+    )
+    del raw_gps_df
+    trajectory_store = (
+        None if trajectory_store_dir is None else TrajectoryStore(trajectory_store_dir)
+    )
+    result = _extract_result(
+        cleaned_raw_gps_df,
+        trip_terminals_df,
+        stops_df,
+        terminals_buffer_radius,
+        stops_buffer_radius,
+        stops_extended_buffer_radius,
+        num_workers,
+        backend,
+        engine,
+        lean,
+        report,
+        trajectory_store=trajectory_store,
+        trajectory_simplification=_trajectory_simplification(
+            export_trajectories, trajectory_tolerance_m, trajectory_simplification
+        ),
+        running_times_and_headways=running_times_and_headways,
+        schedule_sketches=ScheduleSketches() if schedule_sketches else None,
+    )
+    del cleaned_raw_gps_df
+    if result.trips is None:
+        report.finish()
+        return result
+
+    if output_dir is not None:
+        with report.stage("write", len(result.trips) + len(result.stop_times)):
+            result.write(output_dir, output_format, write_processed_gps)
+    report.finish()
+    if write_report and output_dir is not None:
+        report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return result
+
+
+def process(
+    raw_gps_df: DataFrame,
+    trip_terminals_df: DataFrame,
+    stops_df: DataFrame,
+    terminals_buffer_radius: int,
+    stops_buffer_radius: int,
+    stops_extended_buffer_radius: int,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    compress_stationary_records: bool = False,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+    lean: bool = False,
+    profile: bool = False,
+    progress: Optional[ProgressMonitor] = None,
+    profile_dir: Optional[str] = None,
+    route_index: Optional[RouteIndex] = None,
+    export_trajectories: bool = False,
+    trajectory_tolerance_m: float = DEFAULT_TOLERANCE_M,
+    trajectory_simplification: Union[
+        str, SimplifyMethod
+    ] = SimplifyMethod.DOUGLAS_PEUCKER,
+    running_times_and_headways: bool = False,
+    schedule_sketches: bool = False,
+) -> PipelineResult:
+    """
+    Extract the trips and stop times of a route from data frames, in memory.
+
+    Nothing is read or written, apart from the profiles when `profile_dir` is given, and the
+    input data frames are not changed.
+
+    Parameters:
+        raw_gps_df (DataFrame): Raw GPS data, with the columns of `RawGPSField`.
+        trip_terminals_df (DataFrame): Trip terminals data, with the columns of
+                                       `TerminalField`.
+        stops_df (DataFrame): Stops data, with the columns of `StopField`.
+        terminals_buffer_radius (int): Buffer radius around the trip terminals.
+        stops_buffer_radius (int): Buffer radius around the bus stops.
+        stops_extended_buffer_radius (int): Extended buffer radius around the bus stops.
+        num_workers (int, optional): Number of parallel workers. Default is None, which uses
+                                     the number of available CPU cores.
+        backend (Union[str, ExecutionBackend]): One of 'serial', 'threads' or 'processes'.
+                                                Default is 'processes'.
+        engine (Union[str, Engine]): Implementation of the matching and aggregation stages,
+                                     either the 'reference' loops or the vectorized 'fast'
+                                     engine. Default is 'reference'.
+        compress_stationary_records (bool): Whether to collapse the runs of GPS records at the
+                                            same position before matching. Default is False.
+        memory_profile (Union[str, MemoryProfile]): Either 'default', or 'compact' to store
+                                                    the cleaned GPS data with compact dtypes.
+                                                    Default is 'default'.
+        presorted (bool): Whether the raw GPS data is known to be sorted by device and time,
+                          which skips sorting it. Default is False.
+        lean (bool): Whether to make the points of the cleaned GPS data once, sharing its
+                     columns, for both the terminal and the stop matching. Default is False.
+        profile (bool): Whether to log the metrics of every stage. Default is False.
+        progress (ProgressMonitor, optional): Monitor that logs and exports the live progress
+                                              of the stages. Default is None.
+        profile_dir (str, optional): Directory where the cProfile and collapsed-stack profiles
+                                     of every stage are written. Default is None, which
+                                     disables profiling.
+        route_index (RouteIndex, optional): Prebuilt buffers and spatial indexes of the
+                                            terminals and stops of the route, kept between
+                                            runs. Default is None, which makes them for this
+                                            run.
+        export_trajectories (bool): Whether to also output the trajectory of every trip as one
+                                    simplified linestring with delta-encoded times, see
+                                    `compress_trajectories`. Default is False.
+        trajectory_tolerance_m (float): Largest distance in meters of the GPS records dropped
+                                        from the exported trajectories. Default is 10.
+        trajectory_simplification (Union[str, SimplifyMethod]): Either 'douglas-peucker' or
+                                                                'time-aware'. Default is
+                                                                'douglas-peucker'.
+        running_times_and_headways (bool): Whether to add the running time from the previous
+                                           stop and the headway behind the previous bus to
+                                           the stop times, see
+                                           `add_running_times_and_headways`. Default is False.
+        schedule_sketches (bool): Whether to also make the quantile sketches of the trip
+                                  durations and stop times, see `ScheduleSketches`, written
+                                  to 'schedule_sketches.json'. Default is False.
+
+    Returns:
+        PipelineResult: The trips, stop times, processed GPS records and exported trajectories
+                        with the run report. The outputs are None when no trip can be
+                        extracted.
+
+    Notes:
+        - The peak RSS of the stages that overlap a stage of another run is None, and their
+          CPU time includes the other runs, as both are measured for the whole process.
+
+    Example:
+        >>> from concurrent.futures import ThreadPoolExecutor
+        >>> from gps2gtfs.pipeline import trip_stop
+        >>> with ThreadPoolExecutor() as executor:
+        ...     results = list(executor.map(
+        ...         lambda route: trip_stop.process(*route, 100, 50, 100, engine="fast"),
+        ...         routes))
+        >>> results[0].trips.head()
+    """
+    report = _new_report(
+        terminals_buffer_radius,
+        stops_buffer_radius,
+        stops_extended_buffer_radius,
+        backend,
+        engine,
+        compress_stationary_records,
+        memory_profile,
+        presorted,
+        lean,
+        profile,
+        progress,
+        profile_dir,
     )
-    if loaded_data:
-        logger.info("Successfully read the data")
-        raw_gps_df, trip_terminals_df, stops_df = loaded_data
+    logger.info("Starting Pipeline for extracting Trip & Bus Stop Data")
+    cleaned_raw_gps_df = _clean_raw_gps(
+        raw_gps_df,
+        compress_stationary_records,
+        memory_profile,
+        presorted,
+        lean,
+        report,
+    )
+    result = _extract_result(
+        cleaned_raw_gps_df,
+        trip_terminals_df,
+        stops_df,
+        terminals_buffer_radius,
+        stops_buffer_radius,
+        stops_extended_buffer_radius,
+        num_workers,
+        backend,
+        engine,
+        lean,
+        report,
+        route_index,
+        trajectory_simplification=_trajectory_simplification(
+            export_trajectories, trajectory_tolerance_m, trajectory_simplification
+        ),
+        running_times_and_headways=running_times_and_headways,
+        schedule_sketches=ScheduleSketches() if schedule_sketches else None,
+    )
+    report.finish()
+    return result
+
+
+def run_partitioned(
+    raw_gps_data_path: str,
+    trip_terminals_data_path: str,
+    stops_data_path: str,
+    terminals_buffer_radius: int,
+    stops_buffer_radius: int,
+    stops_extended_buffer_radius: int,
+    memory_limit_mb: Optional[int] = None,
+    work_dir: Optional[str] = None,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    compress_stationary_records: bool = False,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+    lean: bool = False,
+    write_processed_gps: bool = False,
+    input_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    output_dir: str = ".",
+    profile: bool = False,
+    write_report: bool = False,
+    progress: Optional[ProgressMonitor] = None,
+    profile_dir: Optional[str] = None,
+    trajectory_store_dir: Optional[str] = None,
+    export_trajectories: bool = False,
+    trajectory_tolerance_m: float = DEFAULT_TOLERANCE_M,
+    trajectory_simplification: Union[
+        str, SimplifyMethod
+    ] = SimplifyMethod.DOUGLAS_PEUCKER,
+    running_times_and_headways: bool = False,
+    schedule_sketches: bool = False,
+) -> Optional[RunReport]:
+    """
+    Run the trip & stop pipeline one service date at a time with bounded memory.
+
+    The raw GPS data is streamed into one file per date, and each date is processed through
+    clean -> trips -> stops on its own. The results of every date are written to the trips and
+    stops outputs as soon as they are ready, so only one partition is held in memory.
 
-        cleaned_raw_gps_df = clean(raw_gps_df)
+    Trips are paired from terminal records of the same date, hence partitioning by date never
+    cuts a trip in two. Across partitions, trip IDs are offset to stay unique and the terminal
+    that defines direction 1 is pinned by the first partition with trips. When a date does not
+    fit under the memory limit, it is further split into groups of whole devices.
+
+    Parameters:
+        raw_gps_data_path (str): File path to the CSV or Parquet file containing raw GPS data.
+        trip_terminals_data_path (str): File path to the CSV containing trip terminals data.
+        stops_data_path (str): File path to the CSV containing stops data.
+        terminals_buffer_radius (int): Buffer radius around the trip terminals.
+        stops_buffer_radius (int): Buffer radius around the bus stops.
+        stops_extended_buffer_radius (int): Extended buffer radius around the bus stops.
+        memory_limit_mb (int, optional): Memory ceiling in megabytes used to size the input
+                                         chunks and the partitions. Default is None.
+        work_dir (str, optional): Directory to spill the partitions into. Default is None,
+                                  which uses a temporary directory removed after the run.
+        num_workers (int, optional): Number of parallel workers. Default is None, which uses
+                                     the number of available CPU cores.
+        backend (Union[str, ExecutionBackend]): One of 'serial', 'threads' or 'processes'.
+                                                Default is 'processes'.
+        engine (Union[str, Engine]): Implementation of the matching and aggregation stages,
+                                     either the 'reference' loops or the vectorized 'fast'
+                                     engine. Default is 'reference'.
+        compress_stationary_records (bool): Whether to collapse the runs of GPS records at the
+                                            same position before matching. Default is False.
+        memory_profile (Union[str, MemoryProfile]): Either 'default', or 'compact' to store
+                                                    the cleaned GPS data with compact dtypes.
+                                                    Default is 'default'.
+        presorted (bool): Whether the raw GPS data is known to be sorted by device and time,
+                          which skips sorting it. Default is False.
+        lean (bool): Whether to make the points of the cleaned GPS data once, sharing its
+                     columns, for both the terminal and the stop matching instead of copying
+                     the data for each. Default is False.
+        write_processed_gps (bool): Whether to also write the GPS records matched with the trip
+                                    terminals, from which `gps2gtfs.pipeline.stop.run` computes
+                                    stop times again without extracting the trips. Default is
+                                    False.
+        input_format (Union[str, FileFormat]): Format of the raw GPS data file, either 'csv'
+                                               or 'parquet'. Default is 'csv'.
+        output_format (Union[str, FileFormat]): Format of the outputs. A Parquet output is a
+                                                directory with one file per partition.
+                                                Default is 'csv'.
+        output_dir (str): Directory where the outputs are written. Default is the current
+                          directory.
+        profile (bool): Whether to log the metrics of every stage. Default is False.
+        write_report (bool): Whether to write the run report as JSON in the output directory.
+                             Default is False.
+        progress (ProgressMonitor, optional): Monitor that logs and exports the live progress
+                                              of the stages and partitions. Default is None.
+        profile_dir (str, optional): Directory where the cProfile and collapsed-stack profiles
+                                     of every stage are written. Default is None, which
+                                     disables profiling.
+        trajectory_store_dir (str, optional): Directory of a `TrajectoryStore` where the
+                                              trip-annotated trajectories of every partition
+                                              are also written. Default is None.
+        export_trajectories, trajectory_tolerance_m, trajectory_simplification: See
+        `process`. The trajectories are written to 'trajectories' partition by partition.
+        running_times_and_headways (bool): See `process`. The headways are computed per date,
+                                           which is a partition. When a date is split by
+                                           device under `memory_limit_mb`, the stop times of
+                                           its parts are kept until the date is done, and
+                                           their headways are computed together.
+        schedule_sketches (bool): See `process`. The sketches are updated partition by
+                                  partition, and written to 'schedule_sketches.json' at the
+                                  end.
+
+    Returns:
+        Optional[RunReport]: The metrics of every stage, accumulated over the partitions. None
+                             is returned if the input data cannot be loaded.
+    """
+    logger.info("Pipeline method called !")
+    logger.info("Starting partitioned Pipeline for extracting Trip & Bus Stop Data")
+    loaded_data = load_data_for_partitioned_pipeline(
+        trip_terminals_data_path, stops_data_path
+    )
+    if not loaded_data:
+        return None
+    trip_terminals_df, stops_df = loaded_data
+
+    report = _new_report(
+        terminals_buffer_radius,
+        stops_buffer_radius,
+        stops_extended_buffer_radius,
+        backend,
+        engine,
+        compress_stationary_records,
+        memory_profile,
+        presorted,
+        lean,
+        profile,
+        progress,
+        profile_dir,
+    )
+    report.parameters["memory_limit_mb"] = memory_limit_mb
+    trips_path = output_file_path(output_dir, "trips", output_format)
+    stops_path = output_file_path(output_dir, "stops", output_format)
+    processed_gps_path = output_file_path(
+        output_dir, PROCESSED_GPS_FILE_NAME, output_format
+    )
+    trajectories_path = output_file_path(output_dir, "trajectories", output_format)
+    simplification = _trajectory_simplification(
+        export_trajectories, trajectory_tolerance_m, trajectory_simplification
+    )
+    trajectory_store = (
+        None if trajectory_store_dir is None else TrajectoryStore(trajectory_store_dir)
+    )
+    sketches = ScheduleSketches() if schedule_sketches else None
+    spill_dir = (
+        work_dir if work_dir is not None else tempfile.mkdtemp(prefix="gps2gtfs_")
+    )
+    try:
+        with report.stage("partition"):
+            partition_paths = partition_raw_gps_by_date(
+                raw_gps_data_path, spill_dir, memory_limit_mb, input_format
+            )
+        if partition_paths is None:
+            return None
+        if progress is not None:
+            progress.set_partitions(len(partition_paths))
 
-        trips_df = extract_trips(
-            cleaned_raw_gps_df, trip_terminals_df, terminals_buffer_radius
+        part_index = 0
+        stops_part_index = 0
+        trip_id_offset = 0
+        terminal_order: List[str] = []
+        for date, partition_path in partition_paths.items():
+            logger.info(f"Processing partition of {date}")
+            with report.stage("load") as stage:
+                partition_df = read_csv_file(partition_path, f"partition of {date}")
+                stage.output_rows = None if partition_df is None else len(partition_df)
+            if partition_df is None:
+                if progress is not None:
+                    progress.partition_done()
+                continue
+
+            # Parts are taken out of the list, so that each one is freed once cleaned
+            parts = split_partition_by_device(partition_df, memory_limit_mb)
+            del partition_df
+            # A bus of one part can be behind a bus of another one at the same stop
+            split_headways = running_times_and_headways and len(parts) > 1
+            date_stop_times: List[DataFrame] = []
+            while parts:
+                cleaned_raw_gps_df = _clean_raw_gps(
+                    parts.pop(0),
+                    compress_stationary_records,
+                    memory_profile,
+                    presorted,
+                    lean,
+                    report,
+                )
+                results = _extract_trips_and_stops(
+                    cleaned_raw_gps_df,
+                    trip_terminals_df,
+                    stops_df,
+                    terminals_buffer_radius,
+                    stops_buffer_radius,
+                    stops_extended_buffer_radius,
+                    num_workers,
+                    backend,
+                    engine,
+                    lean,
+                    report,
+                    terminal_order,
+                    trajectory_store=trajectory_store,
+                    trajectory_simplification=simplification,
+                    trip_id_offset=trip_id_offset,
+                    running_times_and_headways=running_times_and_headways,
+                )
+                del cleaned_raw_gps_df
+                if results is None:
+                    continue
+
+                (
+                    trip_features_df,
+                    stop_times_df,
+                    processed_gps_df,
+                    trajectories_df,
+                ) = results
+                trip_features_df[TripField.TRIP_ID.value] += trip_id_offset
+                stop_times_df[StopTimeField.TRIP_ID.value] += trip_id_offset
+                processed_gps_df[ProcessedGPSField.TRIP_ID.value] += trip_id_offset
+                if trajectories_df is not None:
+                    trajectories_df[
+                        CompactTrajectoryField.TRIP_ID.value
+                    ] += trip_id_offset
+                trip_id_offset = int(trip_features_df[TripField.TRIP_ID.value].max())
+                if split_headways:
+                    date_stop_times.append(stop_times_df)
+                    stop_times_df = stop_times_df.iloc[:0]
+                if sketches is not None:
+                    _update_schedule_sketches(
+                        sketches, trip_features_df, stop_times_df, report
+                    )
+
+                with report.stage("write", len(trip_features_df) + len(stop_times_df)):
+                    write_partition(
+                        trip_features_df, trips_path, part_index, output_format
+                    )
+                    if not split_headways:
+                        write_partition(
+                            stop_times_df, stops_path, stops_part_index, output_format
+                        )
+                        stops_part_index += 1
+                    if write_processed_gps:
+                        write_partition(
+                            geo_to_pandas_data_frame(processed_gps_df),
+                            processed_gps_path,
+                            part_index,
+                            output_format,
+                        )
+                    if trajectories_df is not None:
+                        write_partition(
+                            trajectories_df,
+                            trajectories_path,
+                            part_index,
+                            output_format,
+                        )
+                part_index += 1
+
+            if date_stop_times:
+                stops_part_index = _write_date_stop_times(
+                    date_stop_times,
+                    stops_path,
+                    stops_part_index,
+                    output_format,
+                    sketches,
+                    report,
+                )
+            if progress is not None:
+                progress.partition_done()
+    finally:
+        if work_dir is None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    report.finish()
+    if sketches is not None:
+        sketches.write_json(os.path.join(output_dir, SCHEDULE_SKETCHES_FILE_NAME))
+    if write_report:
+        report.write_json(os.path.join(output_dir, RUN_REPORT_FILE_NAME))
+
+    logger.info("Pipeline finished successfully !")
+    return report
+
+
+def _new_report(
+    terminals_buffer_radius: int,
+    stops_buffer_radius: int,
+    stops_extended_buffer_radius: int,
+    backend: Union[str, ExecutionBackend],
+    engine: Union[str, Engine],
+    compress_stationary_records: bool,
+    memory_profile: Union[str, MemoryProfile],
+    presorted: bool,
+    lean: bool,
+    profile: bool,
+    progress: Optional[ProgressMonitor],
+    profile_dir: Optional[str],
+) -> RunReport:
+    return RunReport(
+        "trip_stop",
+        {
+            "terminals_buffer_radius": terminals_buffer_radius,
+            "stops_buffer_radius": stops_buffer_radius,
+            "stops_extended_buffer_radius": stops_extended_buffer_radius,
+            "backend": ExecutionBackend(backend).value,
+            "engine": Engine(engine).value,
+            "compress_stationary_records": compress_stationary_records,
+            "memory_profile": MemoryProfile(memory_profile).value,
+            "presorted": presorted,
+            "lean": lean,
+        },
+        log_stages=profile,
+        progress=progress,
+        profiler=StageProfiler(profile_dir) if profile_dir else None,
+    )
+
+
+def _extract_result(
+    cleaned_raw_gps_df: DataFrame,
+    trip_terminals_df: DataFrame,
+    stops_df: DataFrame,
+    terminals_buffer_radius: int,
+    stops_buffer_radius: int,
+    stops_extended_buffer_radius: int,
+    num_workers: Optional[int],
+    backend: Union[str, ExecutionBackend],
+    engine: Union[str, Engine],
+    lean: bool,
+    report: RunReport,
+    route_index: Optional[RouteIndex] = None,
+    trajectory_store: Optional[TrajectoryStore] = None,
+    trajectory_simplification: Optional[Tuple[float, SimplifyMethod]] = None,
+    running_times_and_headways: bool = False,
+    schedule_sketches: Optional[ScheduleSketches] = None,
+) -> PipelineResult:
+    results = _extract_trips_and_stops(
+        cleaned_raw_gps_df,
+        trip_terminals_df,
+        stops_df,
+        terminals_buffer_radius,
+        stops_buffer_radius,
+        stops_extended_buffer_radius,
+        num_workers,
+        backend,
+        engine,
+        lean,
+        report,
+        route_index=route_index,
+        trajectory_store=trajectory_store,
+        trajectory_simplification=trajectory_simplification,
+        running_times_and_headways=running_times_and_headways,
+    )
+    if results is None:
+        logger.error("No trips could be extracted from the Raw GPS data")
+        return PipelineResult(report)
+    if schedule_sketches is not None:
+        _update_schedule_sketches(schedule_sketches, results[0], results[1], report)
+    return PipelineResult(report, *results, schedule_sketches=schedule_sketches)
+
+
+def _update_schedule_sketches(
+    schedule_sketches: ScheduleSketches,
+    trip_features_df: DataFrame,
+    stop_times_df: DataFrame,
+    report: RunReport,
+) -> None:
+    with report.stage(
+        "schedule sketches", len(trip_features_df) + len(stop_times_df)
+    ) as stage:
+        stage.counters["sketched_values"] = schedule_sketches.update_trips(
+            trip_features_df
+        ) + schedule_sketches.update_stop_times(stop_times_df)
+
+
+def _write_date_stop_times(
+    date_stop_times: List[DataFrame],
+    stops_path: str,
+    stops_part_index: int,
+    output_format: Union[str, FileFormat],
+    sketches: Optional[ScheduleSketches],
+    report: RunReport,
+) -> int:
+    # The stop times of the parts of a date, with the headways between buses of all the parts
+    with report.stage("headways", sum(len(df) for df in date_stop_times)) as stage:
+        stop_times_df = concat(date_stop_times, ignore_index=True)
+        add_running_times_and_headways(stop_times_df)
+        stage.output_rows = len(stop_times_df)
+    if sketches is not None:
+        with report.stage("schedule sketches", len(stop_times_df)) as stage:
+            stage.counters["sketched_values"] = sketches.update_stop_times(
+                stop_times_df
+            )
+    with report.stage("write", len(stop_times_df)):
+        write_partition(stop_times_df, stops_path, stops_part_index, output_format)
+    return stops_part_index + 1
+
+
+def _trajectory_simplification(
+    export_trajectories: bool,
+    trajectory_tolerance_m: float,
+    trajectory_simplification: Union[str, SimplifyMethod],
+) -> Optional[Tuple[float, SimplifyMethod]]:
+    if not export_trajectories:
+        return None
+    return trajectory_tolerance_m, SimplifyMethod(trajectory_simplification)
+
+
+def _clean_raw_gps(
+    raw_gps_df: DataFrame,
+    compress_stationary_records: bool,
+    memory_profile: Union[str, MemoryProfile],
+    presorted: bool,
+    lean: bool,
+    report: RunReport,
+) -> DataFrame:
+    with report.stage("clean", len(raw_gps_df)) as stage:
+        cleaned_raw_gps_df = clean(
+            raw_gps_df, memory_profile=memory_profile, presorted=presorted
+        )
+        stage.output_rows = len(cleaned_raw_gps_df)
+        stage.counters.update(cleaned_raw_gps_df.attrs[REMOVED_ROWS_ATTR])
+        stage.counters.update(cleaned_raw_gps_df.attrs.get(MEMORY_BYTES_ATTR, {}))
+    del raw_gps_df
+
+    if compress_stationary_records and len(cleaned_raw_gps_df) > 0:
+        with report.stage("stationary compression", len(cleaned_raw_gps_df)) as stage:
+            cleaned_raw_gps_df = compress_stationary(cleaned_raw_gps_df)
+            stage.output_rows = len(cleaned_raw_gps_df)
+            stage.counters[STATIONARY_ROWS_ATTR] = cleaned_raw_gps_df.attrs[
+                STATIONARY_ROWS_ATTR
+            ]
+
+    if lean:
+        # The points are made once, without copying the columns, for the terminal and the
+        # stop matching, which then share this GeoDataFrame
+        with report.stage("geometry", len(cleaned_raw_gps_df)):
+            cleaned_raw_gps_df = pandas_to_geo_data_frame(
+                cleaned_raw_gps_df, copy=False
+            )
+    return cleaned_raw_gps_df
+
+
+def _extract_trips_and_stops(
+    cleaned_raw_gps_df: DataFrame,
+    trip_terminals_df: DataFrame,
+    stops_df: DataFrame,
+    terminals_buffer_radius: int,
+    stops_buffer_radius: int,
+    stops_extended_buffer_radius: int,
+    num_workers: Optional[int],
+    backend: Union[str, ExecutionBackend],
+    engine: Union[str, Engine],
+    lean: bool,
+    report: RunReport,
+    terminal_order: Optional[List[str]] = None,
+    route_index: Optional[RouteIndex] = None,
+    trajectory_store: Optional[TrajectoryStore] = None,
+    trajectory_simplification: Optional[Tuple[float, SimplifyMethod]] = None,
+    trip_id_offset: int = 0,
+    running_times_and_headways: bool = False,
+) -> Optional[List[Optional[DataFrame]]]:
+    if len(cleaned_raw_gps_df) == 0:
+        return None
+
+    with report.stage("terminal match", len(cleaned_raw_gps_df)) as stage:
+        gps_data_within_terminal_buffer = match_terminals(
+            cleaned_raw_gps_df,
+            trip_terminals_df,
+            terminals_buffer_radius,
+            num_workers,
+            backend,
+            engine,
+            copy=not lean,
+            route_index=route_index,
         )
+        stage.output_rows = len(gps_data_within_terminal_buffer)
+
+    with report.stage("trip assembly", len(gps_data_within_terminal_buffer)) as stage:
+        trips_df = assemble_trips(gps_data_within_terminal_buffer, engine)
+        stage.output_rows = len(trips_df)
+    del gps_data_within_terminal_buffer
+    if len(trips_df) == 0:
+        logger.info("No trips found in the data")
+        return None
 
-        trip_features_df = extract_trip_features(trips_df)
+    with report.stage("trip features", len(trips_df)) as stage:
+        if terminal_order is not None:
+            terminal_order = update_terminal_order(trips_df, terminal_order)
+        trip_features_df = extract_trip_features(trips_df, terminal_order)
+        stage.output_rows = len(trip_features_df)
 
-        logger.info("Finished extracting Trip Data")
-        logger.info("Starting Pipeline for extracting Bus Stop Data")
+    logger.info("Finished extracting Trip Data")
+    logger.info("Starting Pipeline for extracting Bus Stop Data")
 
-        logger.info("Preparing data for calculations regarding bus stops")
+    logger.info("Preparing data for calculations regarding bus stops")
+    with report.stage("trajectory prep", len(cleaned_raw_gps_df)) as stage:
         (
             raw_gps_geo_df,
             direction1_stops_buffer,
@@ -55,23 +862,54 @@ def run(
             stops_df,
             stops_buffer_radius,
             stops_extended_buffer_radius,
+            copy=not lean,
+            route_index=route_index,
         )
 
         trajectory_df = prepare_trajectory_df(
             raw_gps_geo_df, trips_df, trip_features_df
         )
+        del raw_gps_geo_df
+        stage.output_rows = len(trajectory_df)
+
+    if trajectory_store is not None:
+        with report.stage("trajectory store", len(trajectory_df)) as stage:
+            stage.output_rows = trajectory_store.write(trajectory_df, trip_id_offset)
 
+    trajectories_df = None
+    if trajectory_simplification is not None:
+        with report.stage("trajectory export", len(trajectory_df)) as stage:
+            trajectories_df = compress_trajectories(
+                trajectory_df, *trajectory_simplification
+            )
+            stage.output_rows = len(trajectories_df)
+
+    with report.stage("stop match", len(trajectory_df)) as stage:
         stop_gps_df = extract_stops(
             trajectory_df,
             direction1_stops_buffer,
             direction2_stops_buffer,
             direction1_stops_extended_buffer,
             direction2_stops_extended_buffer,
+            num_workers,
+            backend,
+            engine,
         )
+        stage.output_rows = len(stop_gps_df)
+    del trajectory_df
 
-        stop_times_df = extract_stop_features(stop_gps_df)
-
-        write_as_csv_file(trip_features_df, "trips.csv")
-        write_as_csv_file(stop_times_df, "stops.csv")
+    with report.stage("stop features", len(stop_gps_df)) as stage:
+        if len(stop_gps_df) == 0:
+            stop_times_df = DataFrame(
+                columns=stop_time_columns(running_times_and_headways)
+            )
+        else:
+            stop_times_df = extract_stop_features(
+                stop_gps_df,
+                trip_terminals_df[TerminalField.TERMINAL_ID.value].tolist(),
+                engine,
+                running_times_and_headways=running_times_and_headways,
+            )
+        stage.output_rows = len(stop_times_df)
 
-        logger.info("Pipeline finished successfully !")
+    return [trip_features_df, stop_times_df, trips_df, trajectories_df]
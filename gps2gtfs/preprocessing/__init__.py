@@ -1,3 +1,9 @@
-from . import (  # noqa F401
-    data_cleaner,
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "data_cleaner",
+        "stationary_compressor",
+    ],
 )
@@ -1,11 +1,50 @@
-from pandas import DataFrame, to_datetime
+import sys
+from datetime import date, time
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+from pandas import (
+    Categorical,
+    CategoricalDtype,
+    DataFrame,
+    Series,
+    Timestamp,
+    factorize,
+    to_datetime,
+)
+from pandas.api.types import is_integer_dtype, is_numeric_dtype, is_object_dtype
 
 from gps2gtfs.data_field.im_field import CleanedRawGPSField
 from gps2gtfs.data_field.input_field import RawGPSField
+from gps2gtfs.utility.data_io_converter import haversine_m
+from gps2gtfs.utility.executor import MemoryProfile
 from gps2gtfs.utility.logger import logger
 
+# Implied speed above which an isolated GPS point is a jump
+DEFAULT_MAX_SPEED_KMH = 150.0
+# Key of DataFrame.attrs with the number of rows removed by every cleaning rule
+REMOVED_ROWS_ATTR = "removed_rows"
+
+ZERO_COORDINATES = "zero_coordinates"
+OUT_OF_BOUNDS = "out_of_bounds"
+DUPLICATES = "duplicates"
+SPEED_JUMPS = "speed_jumps"
+
+# Key of DataFrame.attrs with the memory of the frame before and after the dtypes are compacted
+MEMORY_BYTES_ATTR = "memory_bytes"
+# Average length of the sorted runs of the GPS data above which a merge sort is used
+MIN_SORTED_RUN_LENGTH = 16
+# Largest ratio of unique values to records for which a categorical column saves memory
+MAX_CATEGORY_RATIO = 0.5
+
 
-def clean(raw_gps_df: DataFrame) -> DataFrame:
+def clean(
+    raw_gps_df: DataFrame,
+    max_speed_kmh: Optional[float] = DEFAULT_MAX_SPEED_KMH,
+    bounds: Optional[Tuple[float, float, float, float]] = None,
+    memory_profile: Union[str, MemoryProfile] = MemoryProfile.DEFAULT,
+    presorted: bool = False,
+) -> DataFrame:
     """
     Clean and preprocess a DataFrame containing raw GPS data.
 
@@ -13,16 +52,49 @@ def clean(raw_gps_df: DataFrame) -> DataFrame:
     and preprocessing steps:
 
     1. Removes the rows where latitude and longitude are both zero.
-    2. Converts the 'DEVICE_TIME' column to pandas datetime format.
-    3. Extracts the date and time components from the 'DEVICE_TIME' column and adds them as new
+    2. Removes the rows with coordinates out of the valid range, or out of `bounds`.
+    3. Converts the 'DEVICE_TIME' column to pandas datetime format.
+    4. Removes the duplicate records of a device at the same 'DEVICE_TIME', keeping the first.
+    5. Sorts the DataFrame by 'DEVICE_ID' and 'DEVICE_TIME' in ascending order, which also
+       puts the records received out of order back in place.
+    6. Extracts the date and time components from the 'DEVICE_TIME' column and adds them as new
        columns.
-    4. Sorts the DataFrame by 'DEVICE_ID', 'DATE', and 'TIME' in ascending order.
+    7. Removes the jumps, the records reached from the previous record of the device and left
+       to the next one at an implied speed above `max_speed_kmh`.
+    8. With the 'compact' memory profile, stores the columns with compact dtypes, see
+       `compact_dtypes`, which keep the values of the default profile.
 
     Parameters:
         raw_gps_df (DataFrame): A pandas DataFrame containing raw GPS data.
+        max_speed_kmh (float, optional): Implied speed in km/h above which an isolated record
+                                         is a jump. Default is 150. None keeps the jumps.
+        bounds (Tuple[float, float, float, float], optional): Area of the service as
+                                                              (min_longitude, min_latitude,
+                                                              max_longitude, max_latitude).
+                                                              Default is None, which only
+                                                              removes invalid coordinates.
+        memory_profile (Union[str, MemoryProfile]): Either 'default' or 'compact'. Default is
+                                                    'default'.
+        presorted (bool): Whether the records are known to be sorted by device and time, e.g.
+                          Parquet partitions written in that order, in which case the order is
+                          neither checked nor changed. Default is False.
 
     Returns:
-        DataFrame: A new DataFrame with the cleaned and preprocessed GPS data.
+        DataFrame: A new DataFrame with the cleaned and preprocessed GPS data. The number of
+                   rows removed by every rule is in its `attrs["removed_rows"]`.
+
+    Notes:
+        - The implied speed of a record is computed from the great-circle distance and the
+          time to the previous and the next records of its device, using shifted arrays.
+        - A jump is an isolated record: a device that really moves to a far place, e.g. after a
+          signal gap, has a single fast step and is kept.
+        - The number of rows removed by every rule is logged.
+        - With the 'compact' profile, 'DATE' and 'TIME' are ordered categoricals built from
+          the unique dates and times of day, so that no Python object is created per record.
+          A column with more unique values than half its records keeps one object per record.
+        - With the 'compact' profile, the memory of the cleaned frame with the default dtypes
+          and with the compact ones is logged and kept in `attrs["memory_bytes"]`. The former
+          is computed without creating the 'DATE' and 'TIME' objects of the default profile.
 
     Example:
         >>> import pandas as pd
@@ -39,31 +111,263 @@ def clean(raw_gps_df: DataFrame) -> DataFrame:
            DEVICE_ID  LATITUDE  LONGITUDE        DEVICE_TIME        DATE      TIME
         1         2   40.7486   -73.9857 2023-07-27 10:20:30  2023-07-27  10:20:30
         0         1   37.7749  -122.4194 2023-07-27 12:34:56  2023-07-27  12:34:56
+        >>> cleaned_gps_df.attrs["removed_rows"]
+        {'zero_coordinates': 1, 'out_of_bounds': 0, 'duplicates': 0, 'speed_jumps': 0}
     """
     logger.info("Getting ready to clean the Raw GPS data data")
-    cleaned_raw_gps_df = raw_gps_df[
-        (raw_gps_df[RawGPSField.LATITUDE.value] != 0)
-        & (raw_gps_df[RawGPSField.LONGITUDE.value] != 0)
-    ].copy()
+    memory_profile = MemoryProfile(memory_profile)
+    removed_rows: Dict[str, int] = {}
+
+    is_valid = (raw_gps_df[RawGPSField.LATITUDE.value] != 0) & (
+        raw_gps_df[RawGPSField.LONGITUDE.value] != 0
+    )
+    removed_rows[ZERO_COORDINATES] = int((~is_valid).sum())
+
+    is_in_bounds = _in_bounds(raw_gps_df, bounds)
+    removed_rows[OUT_OF_BOUNDS] = int((is_valid & ~is_in_bounds).sum())
+    cleaned_raw_gps_df = raw_gps_df[is_valid & is_in_bounds].copy()
 
     cleaned_raw_gps_df[RawGPSField.DEVICE_TIME.value] = to_datetime(
         cleaned_raw_gps_df[RawGPSField.DEVICE_TIME.value]
     )
-    cleaned_raw_gps_df[CleanedRawGPSField.DATE.value] = cleaned_raw_gps_df[
-        RawGPSField.DEVICE_TIME.value
-    ].dt.date
-    cleaned_raw_gps_df[CleanedRawGPSField.TIME.value] = cleaned_raw_gps_df[
-        RawGPSField.DEVICE_TIME.value
-    ].dt.time
-
-    cleaned_raw_gps_df.sort_values(
-        by=[
-            RawGPSField.DEVICE_ID.value,
-            CleanedRawGPSField.DATE.value,
-            CleanedRawGPSField.TIME.value,
-        ],
-        inplace=True,
+    is_duplicate = cleaned_raw_gps_df.duplicated(
+        subset=[RawGPSField.DEVICE_ID.value, RawGPSField.DEVICE_TIME.value]
     )
+    removed_rows[DUPLICATES] = int(is_duplicate.sum())
+    if removed_rows[DUPLICATES]:
+        cleaned_raw_gps_df = cleaned_raw_gps_df[~is_duplicate]
+    if not presorted:
+        cleaned_raw_gps_df = _sort_by_device_and_time(cleaned_raw_gps_df)
+
+    if memory_profile == MemoryProfile.DEFAULT:
+        cleaned_raw_gps_df[CleanedRawGPSField.DATE.value] = cleaned_raw_gps_df[
+            RawGPSField.DEVICE_TIME.value
+        ].dt.date
+        cleaned_raw_gps_df[CleanedRawGPSField.TIME.value] = cleaned_raw_gps_df[
+            RawGPSField.DEVICE_TIME.value
+        ].dt.time
+
+    removed_rows[SPEED_JUMPS] = 0
+    if max_speed_kmh is not None:
+        is_jump = _speed_jumps(cleaned_raw_gps_df, max_speed_kmh)
+        removed_rows[SPEED_JUMPS] = int(is_jump.sum())
+        if removed_rows[SPEED_JUMPS]:
+            cleaned_raw_gps_df = cleaned_raw_gps_df[~is_jump]
+
+    if memory_profile == MemoryProfile.COMPACT:
+        memory_before = _default_memory_usage(cleaned_raw_gps_df)
+        cleaned_raw_gps_df = compact_dtypes(cleaned_raw_gps_df)
+        _add_date_and_time_categories(cleaned_raw_gps_df)
+
+    for rule, count in removed_rows.items():
+        logger.info(f"Cleaning rule '{rule}' removed {count} rows")
+    cleaned_raw_gps_df.attrs[REMOVED_ROWS_ATTR] = removed_rows
+    if memory_profile == MemoryProfile.COMPACT:
+        memory_after = int(cleaned_raw_gps_df.memory_usage(deep=True).sum())
+        cleaned_raw_gps_df.attrs[MEMORY_BYTES_ATTR] = {
+            "memory_before_bytes": memory_before,
+            "memory_after_bytes": memory_after,
+        }
+        logger.info(
+            f"Compacted the GPS data from {memory_before / 2**20:.1f} MB to "
+            f"{memory_after / 2**20:.1f} MB"
+        )
 
     logger.info("Successfully cleaned the Raw GPS data data")
     return cleaned_raw_gps_df
+
+
+def compact_dtypes(gps_df: DataFrame) -> DataFrame:
+    """
+    Store the columns of GPS data with memory-efficient dtypes.
+
+    The function converts the following columns, when their values allow it:
+
+    - 'ID' and integer 'DEVICE_ID' to int32, and text 'DEVICE_ID' to a categorical.
+    - 'SPEED' to uint16 when it holds whole numbers from 0 to 65535.
+    - Other text columns to Arrow-backed strings, when pyarrow is installed.
+
+    Parameters:
+        gps_df (DataFrame): A pandas DataFrame containing GPS data.
+
+    Returns:
+        DataFrame: The GPS data with compact dtypes. The input DataFrame is not changed.
+
+    Notes:
+        - Every value is kept as is, so that the trips and the stop times are the same as
+          with the default dtypes. The coordinates stay float64: float32 keeps about 7
+          significant digits, i.e. about a meter at the largest longitudes, which can move a
+          point across the edge of a terminal or stop buffer.
+
+    Example:
+        >>> compact_gps_df = compact_dtypes(cleaned_gps_df)
+        >>> compact_gps_df.dtypes
+        id                     int32
+        deviceid               int32
+        latitude             float64
+        longitude            float64
+        devicetime    datetime64[ns]
+        speed                 uint16
+        dtype: object
+    """
+    compact_gps_df = gps_df.copy()
+    for column in [RawGPSField.ID.value, RawGPSField.DEVICE_ID.value]:
+        if column not in compact_gps_df:
+            continue
+        values = compact_gps_df[column]
+        if is_integer_dtype(values) and _fits(values, np.int32):
+            compact_gps_df[column] = values.astype(np.int32)
+        elif column == RawGPSField.DEVICE_ID.value and is_object_dtype(values):
+            compact_gps_df[column] = values.astype("category")
+
+    if RawGPSField.SPEED.value in compact_gps_df:
+        speeds = compact_gps_df[RawGPSField.SPEED.value]
+        if (
+            is_numeric_dtype(speeds)
+            and speeds.notna().all()
+            and _fits(speeds, np.uint16)
+            and (speeds % 1 == 0).all()
+        ):
+            compact_gps_df[RawGPSField.SPEED.value] = speeds.astype(np.uint16)
+
+    text_columns = [
+        column
+        for column in compact_gps_df.select_dtypes(include="object").columns
+        if column not in (CleanedRawGPSField.DATE.value, CleanedRawGPSField.TIME.value)
+    ]
+    if text_columns:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.info("Text columns are kept as objects, as pyarrow is not installed")
+        else:
+            for column in text_columns:
+                compact_gps_df[column] = compact_gps_df[column].astype(
+                    "string[pyarrow]"
+                )
+    return compact_gps_df
+
+
+def _default_memory_usage(cleaned_raw_gps_df: DataFrame) -> int:
+    # The default profile adds one date and one time object per record, each behind a pointer
+    object_bytes = 2 * 8 + sys.getsizeof(date.min) + sys.getsizeof(time.min)
+    return int(
+        cleaned_raw_gps_df.memory_usage(deep=True).sum()
+        + object_bytes * len(cleaned_raw_gps_df)
+    )
+
+
+def _add_date_and_time_categories(cleaned_raw_gps_df: DataFrame) -> None:
+    # One date and one time object per unique value instead of one per record
+    device_times = cleaned_raw_gps_df[RawGPSField.DEVICE_TIME.value]
+    dates = device_times.dt.normalize()
+    times = (device_times - dates).to_numpy()
+    for column, values, to_objects in [
+        (CleanedRawGPSField.DATE.value, dates.to_numpy(), lambda d: d.dt.date),
+        (
+            CleanedRawGPSField.TIME.value,
+            times,
+            lambda t: (Timestamp(0) + t).dt.time,
+        ),
+    ]:
+        categories, codes = np.unique(values, return_inverse=True)
+        if len(categories) > MAX_CATEGORY_RATIO * len(values):
+            # Mostly unique values take less memory as one object per record
+            cleaned_raw_gps_df[column] = to_objects(Series(values)).to_numpy()
+        else:
+            cleaned_raw_gps_df[column] = Categorical.from_codes(
+                codes,
+                categories=to_objects(Series(categories)).tolist(),
+                ordered=True,
+            )
+
+
+def _sort_by_device_and_time(cleaned_raw_gps_df: DataFrame) -> DataFrame:
+    # Sorting on integer keys avoids comparing Python objects, and the keys tell whether the
+    # records are already in order
+    device_times = cleaned_raw_gps_df[RawGPSField.DEVICE_TIME.value]
+    if len(device_times) == 0:
+        return cleaned_raw_gps_df
+    if device_times.isna().any():
+        return cleaned_raw_gps_df.sort_values(
+            by=[RawGPSField.DEVICE_ID.value, RawGPSField.DEVICE_TIME.value]
+        )
+    device_codes = _device_codes(cleaned_raw_gps_df[RawGPSField.DEVICE_ID.value])
+    times = device_times.to_numpy().astype("int64")
+    min_time = times.min()
+    time_span = int(times.max()) - int(min_time) + 1
+    if (int(device_codes.max()) + 1) * time_span >= 2**63:
+        order = np.lexsort((times, device_codes))
+        return cleaned_raw_gps_df.take(order)
+
+    # One key per record, ordered by device and then by time
+    keys = device_codes * time_span + (times - min_time)
+    descents = int((keys[1:] < keys[:-1]).sum())
+    if descents == 0:
+        logger.info("The GPS data is already sorted by device and time")
+        return cleaned_raw_gps_df
+    # Records are unique per device and time, so any sort gives the same order. A merge sort
+    # is quicker on input made of long sorted runs, such as devices sorted by time.
+    kind = "stable" if descents * MIN_SORTED_RUN_LENGTH <= len(keys) else "quicksort"
+    logger.info(f"Sorting the GPS data with {descents + 1} sorted runs")
+    return cleaned_raw_gps_df.take(np.argsort(keys, kind=kind))
+
+
+def _device_codes(device_ids: Series) -> "np.ndarray":
+    # Codes from 0 in the order of the device IDs, missing device IDs last
+    if isinstance(device_ids.dtype, CategoricalDtype):
+        # Categoricals are sorted in the order of their categories
+        codes = device_ids.cat.codes.to_numpy().astype("int64")
+    else:
+        codes, _ = factorize(device_ids, sort=True)
+        codes = codes.astype("int64")
+    codes[codes < 0] = codes.max(initial=0) + 1
+    return codes
+
+
+def _fits(values: Series, dtype: type) -> bool:
+    limits = np.iinfo(dtype)
+    return len(values) == 0 or (
+        values.min() >= limits.min and values.max() <= limits.max
+    )
+
+
+def _in_bounds(
+    raw_gps_df: DataFrame, bounds: Optional[Tuple[float, float, float, float]]
+) -> Series:
+    min_longitude, min_latitude, max_longitude, max_latitude = (
+        bounds if bounds is not None else (-180, -90, 180, 90)
+    )
+    latitudes = raw_gps_df[RawGPSField.LATITUDE.value]
+    longitudes = raw_gps_df[RawGPSField.LONGITUDE.value]
+    # NaN coordinates are out of bounds as well
+    return latitudes.between(min_latitude, max_latitude) & longitudes.between(
+        min_longitude, max_longitude
+    )
+
+
+def _speed_jumps(cleaned_raw_gps_df: DataFrame, max_speed_kmh: float) -> "np.ndarray":
+    # Records are sorted by device and time, so every step is from a record to the next one
+    device_ids = cleaned_raw_gps_df[RawGPSField.DEVICE_ID.value].to_numpy()
+    times_s = (
+        cleaned_raw_gps_df[RawGPSField.DEVICE_TIME.value].to_numpy().astype("int64")
+        / 1e9
+    )
+    latitudes = cleaned_raw_gps_df[RawGPSField.LATITUDE.value].to_numpy(dtype="float64")
+    longitudes = cleaned_raw_gps_df[RawGPSField.LONGITUDE.value].to_numpy(
+        dtype="float64"
+    )
+
+    step_km = (
+        haversine_m(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+        / 1000
+    )
+    step_h = np.diff(times_s) / 3600
+    is_fast_step = (device_ids[1:] == device_ids[:-1]) & (
+        step_km > max_speed_kmh * step_h
+    )
+
+    # A jump is reached by a fast step and left by another one
+    is_jump = np.zeros(len(cleaned_raw_gps_df), dtype=bool)
+    is_jump[1:-1] = is_fast_step[:-1] & is_fast_step[1:]
+    return is_jump
@@ -0,0 +1,92 @@
+import numpy as np
+from pandas import DataFrame
+
+from gps2gtfs.data_field.im_field import CleanedRawGPSField
+from gps2gtfs.utility.data_io_converter import haversine_m
+from gps2gtfs.utility.logger import logger
+
+# Key of DataFrame.attrs with the number of stationary rows removed
+STATIONARY_ROWS_ATTR = "stationary_rows"
+
+
+def compress_stationary(
+    cleaned_gps_df: DataFrame, max_distance_m: float = 0.0
+) -> DataFrame:
+    """
+    Collapse the runs of stationary GPS records of a device into a few representatives.
+
+    A run is a sequence of consecutive records of one device and one date where every record
+    is within `max_distance_m` of the previous one, e.g. a bus idling at a terminal or a depot.
+    Of every run, the function keeps the first and the last records, and the first and the last
+    records with a zero speed. The time a bus enters and leaves a place, and the first and last
+    times it is stopped there, are thereby kept, which are all the trip and stop time
+    calculations use.
+
+    Parameters:
+        cleaned_gps_df (DataFrame): The GPS data returned by `clean`, sorted by device and time.
+        max_distance_m (float): Largest distance in meters between two consecutive records of a
+                                run. Default is 0, which only collapses records at the same
+                                position.
+
+    Returns:
+        DataFrame: The GPS data without the records inside stationary runs. The number of rows
+                   removed is in its `attrs["stationary_rows"]`.
+
+    Notes:
+        - Runs are found with shifted arrays, without a loop over the records.
+        - With the default distance, trips and stop times are the same as without the
+          compression. With a larger distance, a run can span the edge of a terminal or stop
+          buffer, and the matched records of the run may then be removed.
+
+    Example:
+        >>> cleaned_gps_df = clean(raw_gps_df)
+        >>> compressed_gps_df = compress_stationary(cleaned_gps_df)
+        >>> compressed_gps_df.attrs["stationary_rows"]
+        3120
+    """
+    logger.info("Preparing to compress stationary GPS records")
+    device_ids = cleaned_gps_df[CleanedRawGPSField.DEVICE_ID.value].to_numpy()
+    dates = (
+        cleaned_gps_df[CleanedRawGPSField.DEVICE_TIME.value].dt.normalize().to_numpy()
+    )
+    latitudes = cleaned_gps_df[CleanedRawGPSField.LATITUDE.value].to_numpy(
+        dtype="float64"
+    )
+    longitudes = cleaned_gps_df[CleanedRawGPSField.LONGITUDE.value].to_numpy(
+        dtype="float64"
+    )
+    is_stopped = (cleaned_gps_df[CleanedRawGPSField.SPEED.value] == 0).to_numpy()
+
+    # A record continues the run of the previous record when the device did not move
+    continues_run = np.zeros(len(cleaned_gps_df), dtype=bool)
+    continues_run[1:] = (
+        (device_ids[1:] == device_ids[:-1])
+        & (dates[1:] == dates[:-1])
+        & (
+            haversine_m(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+            <= max_distance_m
+        )
+    )
+    starts_run = ~continues_run
+    ends_run = np.ones(len(cleaned_gps_df), dtype=bool)
+    ends_run[:-1] = starts_run[1:]
+
+    # First and last records with a zero speed in every run
+    run_ids = np.cumsum(starts_run)
+    stopped_positions = np.flatnonzero(is_stopped)
+    stopped_run_ids = run_ids[stopped_positions]
+    starts_stop = np.ones(len(stopped_positions), dtype=bool)
+    starts_stop[1:] = stopped_run_ids[1:] != stopped_run_ids[:-1]
+    ends_stop = np.ones(len(stopped_positions), dtype=bool)
+    ends_stop[:-1] = starts_stop[1:]
+
+    keep = starts_run | ends_run
+    keep[stopped_positions[starts_stop | ends_stop]] = True
+
+    compressed_gps_df = cleaned_gps_df[keep]
+    compressed_gps_df.attrs[STATIONARY_ROWS_ATTR] = int((~keep).sum())
+    logger.info(
+        f"Removed {compressed_gps_df.attrs[STATIONARY_ROWS_ATTR]} stationary GPS records "
+        f"out of {len(cleaned_gps_df)}"
+    )
+    return compressed_gps_df
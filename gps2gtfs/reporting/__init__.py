@@ -0,0 +1,12 @@
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "equivalence",
+        "gps_quality",
+        "profiler",
+        "progress",
+        "run_report",
+    ],
+)
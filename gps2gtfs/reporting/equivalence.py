@@ -0,0 +1,318 @@
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union
+
+from gps2gtfs.utility.executor import Engine, ExecutionBackend
+from gps2gtfs.utility.logger import logger
+
+if TYPE_CHECKING:
+    from pandas import DataFrame, Series
+
+DEFAULT_RTOL = 1e-9
+DEFAULT_ATOL = 1e-6
+MAX_REPORTED_ROWS = 5
+
+
+class EngineComparison:
+    """
+    Outputs and timings of one stage run with the reference and the fast engines.
+
+    The stage is equivalent when the fast engine gives the same rows as the reference engine,
+    numbers being compared with the relative and absolute tolerances of the comparison.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        reference_time_s: float,
+        fast_time_s: float,
+        rows: int,
+        mismatches: List[str],
+    ) -> None:
+        self.name = name
+        self.reference_time_s = reference_time_s
+        self.fast_time_s = fast_time_s
+        self.rows = rows
+        self.mismatches = mismatches
+
+    @property
+    def equivalent(self) -> bool:
+        return not self.mismatches
+
+    @property
+    def speedup(self) -> Optional[float]:
+        if self.fast_time_s <= 0:
+            return None
+        return self.reference_time_s / self.fast_time_s
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "equivalent": self.equivalent,
+            "rows": self.rows,
+            "reference_time_s": round(self.reference_time_s, 6),
+            "fast_time_s": round(self.fast_time_s, 6),
+            "speedup": None if self.speedup is None else round(self.speedup, 3),
+            "mismatches": self.mismatches,
+        }
+
+    def __repr__(self) -> str:
+        return f"EngineComparison({self.to_dict()})"
+
+
+def diff_frames(
+    reference_df: "DataFrame",
+    candidate_df: "DataFrame",
+    rtol: float = DEFAULT_RTOL,
+    atol: float = DEFAULT_ATOL,
+) -> List[str]:
+    """
+    Compare two DataFrames row by row and describe their differences.
+
+    Rows are compared by position, so both DataFrames must be in the same order. The dtypes do
+    not have to match: numbers, including numbers stored as objects, are compared with the
+    given tolerances, durations are compared in seconds with the same tolerances, and other
+    values are compared by their text. Missing values are equal to each other.
+
+    Parameters:
+        reference_df (DataFrame): The expected rows.
+        candidate_df (DataFrame): The rows to check.
+        rtol (float): Relative tolerance of numbers. Default is 1e-9.
+        atol (float): Absolute tolerance of numbers and seconds. Default is 1e-6.
+
+    Returns:
+        List[str]: One message per difference of shape or columns, and per column with
+                   different values, listing the first rows that differ. The list is empty
+                   when the DataFrames are equivalent.
+
+    Example:
+        >>> import pandas as pd
+
+        >>> reference_df = pd.DataFrame({'trip_id': [1, 2], 'speed': [10.0, 12.5]})
+        >>> candidate_df = pd.DataFrame({'trip_id': [1.0, 2.0], 'speed': [10.0, 12.6]})
+        >>> diff_frames(reference_df, candidate_df)
+        ["Column 'speed' differs in 1 rows, e.g. row 1: 12.5 != 12.6"]
+    """
+    import numpy as np
+
+    mismatches = []
+    if len(reference_df) != len(candidate_df):
+        mismatches.append(
+            f"Row count differs: {len(reference_df)} != {len(candidate_df)}"
+        )
+    if list(reference_df.columns) != list(candidate_df.columns):
+        mismatches.append(
+            f"Columns differ: {list(reference_df.columns)} != "
+            f"{list(candidate_df.columns)}"
+        )
+    if mismatches:
+        return mismatches
+
+    for column in reference_df.columns:
+        reference = reference_df[column].reset_index(drop=True)
+        candidate = candidate_df[column].reset_index(drop=True)
+        different = _different_values(reference, candidate, rtol, atol)
+        if different.any():
+            rows = np.flatnonzero(different)
+            examples = ", ".join(
+                f"row {row}: {reference.iat[row]} != {candidate.iat[row]}"
+                for row in rows[:MAX_REPORTED_ROWS]
+            )
+            mismatches.append(
+                f"Column '{column}' differs in {len(rows)} rows, e.g. {examples}"
+            )
+    return mismatches
+
+
+def compare_engines(
+    name: str,
+    func: Callable,
+    make_args: Callable[[], Tuple],
+    rtol: float = DEFAULT_RTOL,
+    atol: float = DEFAULT_ATOL,
+) -> Tuple[EngineComparison, Any]:
+    """
+    Run a stage function with the reference and the fast engines and compare their outputs.
+
+    Parameters:
+        name (str): Name of the stage.
+        func (Callable): Stage function taking an `engine` keyword argument and returning a
+                         DataFrame.
+        make_args (Callable[[], Tuple]): Builds fresh positional arguments for each run, as
+                                         stage functions may change their inputs.
+        rtol (float): Relative tolerance of numbers. Default is 1e-9.
+        atol (float): Absolute tolerance of numbers and seconds. Default is 1e-6.
+
+    Returns:
+        Tuple[EngineComparison, Any]: The comparison and the output of the reference engine.
+    """
+    args = make_args()
+    start_time = perf_counter()
+    reference_output = func(*args, engine=Engine.REFERENCE)
+    reference_time_s = perf_counter() - start_time
+
+    args = make_args()
+    start_time = perf_counter()
+    fast_output = func(*args, engine=Engine.FAST)
+    fast_time_s = perf_counter() - start_time
+
+    comparison = EngineComparison(
+        name,
+        reference_time_s,
+        fast_time_s,
+        len(reference_output),
+        diff_frames(reference_output, fast_output, rtol, atol),
+    )
+    speedup = comparison.speedup
+    logger.info(
+        f"Stage '{name}': {'equivalent' if comparison.equivalent else 'DIFFERENT'} "
+        f"on {comparison.rows} rows, reference {reference_time_s:.3f}s, "
+        f"fast {fast_time_s:.3f}s, speedup "
+        f"{'n/a' if speedup is None else f'{speedup:.1f}x'}"
+    )
+    for mismatch in comparison.mismatches:
+        logger.warning(f"Stage '{name}': {mismatch}")
+    return comparison, reference_output
+
+
+def compare_stage_engines(
+    raw_gps_df: "DataFrame",
+    trip_terminals_df: "DataFrame",
+    stops_df: Optional["DataFrame"] = None,
+    terminals_buffer_radius: int = 100,
+    stops_buffer_radius: int = 50,
+    stops_extended_buffer_radius: int = 100,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    rtol: float = DEFAULT_RTOL,
+    atol: float = DEFAULT_ATOL,
+) -> List[EngineComparison]:
+    """
+    Check that the fast engine gives the outputs of the reference engine at every stage.
+
+    The stages with two engines are run in pipeline order. Each stage gets the output of the
+    reference engine at the previous stage, so that both engines of a stage run on the same
+    inputs and a difference is reported at the stage that causes it.
+
+    Parameters:
+        raw_gps_df (DataFrame): Raw GPS data.
+        trip_terminals_df (DataFrame): Trip terminals data.
+        stops_df (DataFrame, optional): Stops data. Default is None, which only compares the
+                                        trip stages.
+        terminals_buffer_radius (int): Buffer radius around the trip terminals. Default is 100.
+        stops_buffer_radius (int): Buffer radius around the bus stops. Default is 50.
+        stops_extended_buffer_radius (int): Extended buffer radius around the bus stops.
+                                            Default is 100.
+        num_workers (int, optional): Number of parallel workers. Default is None, which uses
+                                     the number of available CPU cores.
+        backend (Union[str, ExecutionBackend]): One of 'serial', 'threads' or 'processes'.
+                                                Default is 'processes'.
+        rtol (float): Relative tolerance of numbers. Default is 1e-9.
+        atol (float): Absolute tolerance of numbers and seconds. Default is 1e-6.
+
+    Returns:
+        List[EngineComparison]: The comparison of every stage. Later stages are skipped when
+                                no trips or stops are found.
+
+    Example:
+        >>> comparisons = compare_stage_engines(raw_gps_df, trip_terminals_df, stops_df)
+        >>> all(comparison.equivalent for comparison in comparisons)
+        True
+    """
+    from gps2gtfs.data_field.input_field import TerminalField
+    from gps2gtfs.preprocessing.data_cleaner import clean
+    from gps2gtfs.stop.data_preparator import create_stop_buffers, prepare_trajectory_df
+    from gps2gtfs.stop.feature_extractor import calculate_stop_times
+    from gps2gtfs.stop.stop_extractor import extract_stops
+    from gps2gtfs.trip.feature_extractor import extract_trip_features
+    from gps2gtfs.trip.trip_extractor import assemble_trips, match_terminals
+
+    comparisons = []
+    cleaned_gps_df = clean(raw_gps_df.copy())
+
+    comparison, terminal_gps_df = compare_engines(
+        "terminal match",
+        match_terminals,
+        lambda: (
+            cleaned_gps_df.copy(),
+            trip_terminals_df.copy(),
+            terminals_buffer_radius,
+            num_workers,
+            backend,
+        ),
+        rtol,
+        atol,
+    )
+    comparisons.append(comparison)
+
+    comparison, trips_df = compare_engines(
+        "trip assembly",
+        assemble_trips,
+        lambda: (terminal_gps_df.copy(),),
+        rtol,
+        atol,
+    )
+    comparisons.append(comparison)
+    if stops_df is None or len(trips_df) == 0:
+        return comparisons
+
+    trip_features_df = extract_trip_features(trips_df.copy())
+    raw_gps_geo_df, *stop_buffers = create_stop_buffers(
+        cleaned_gps_df.copy(),
+        stops_df.copy(),
+        stops_buffer_radius,
+        stops_extended_buffer_radius,
+    )
+    trajectory_df = prepare_trajectory_df(raw_gps_geo_df, trips_df, trip_features_df)
+
+    comparison, stop_gps_df = compare_engines(
+        "stop match",
+        extract_stops,
+        lambda: (trajectory_df.copy(), *stop_buffers, num_workers, backend),
+        rtol,
+        atol,
+    )
+    comparisons.append(comparison)
+    if len(stop_gps_df) == 0:
+        return comparisons
+
+    comparison, _ = compare_engines(
+        "stop features",
+        calculate_stop_times,
+        lambda: (
+            stop_gps_df.copy(),
+            trip_terminals_df[TerminalField.TERMINAL_ID.value].tolist(),
+        ),
+        rtol,
+        atol,
+    )
+    comparisons.append(comparison)
+    return comparisons
+
+
+def _different_values(
+    reference: "Series", candidate: "Series", rtol: float, atol: float
+) -> Any:
+    import numpy as np
+    from pandas import to_numeric, to_timedelta
+    from pandas.api.types import is_timedelta64_dtype
+
+    reference = reference.infer_objects()
+    candidate = candidate.infer_objects()
+    missing = reference.isna().to_numpy() & candidate.isna().to_numpy()
+
+    if is_timedelta64_dtype(reference) or is_timedelta64_dtype(candidate):
+        try:
+            reference = to_timedelta(reference).dt.total_seconds()
+            candidate = to_timedelta(candidate).dt.total_seconds()
+        except (TypeError, ValueError):
+            pass
+    try:
+        reference_numbers = to_numeric(reference).to_numpy(dtype="float64")
+        candidate_numbers = to_numeric(candidate).to_numpy(dtype="float64")
+    except (TypeError, ValueError):
+        different = reference.astype(str).to_numpy() != candidate.astype(str).to_numpy()
+    else:
+        different = ~np.isclose(
+            reference_numbers, candidate_numbers, rtol=rtol, atol=atol, equal_nan=True
+        )
+    return different & ~missing
@@ -0,0 +1,253 @@
+import json
+from typing import Any, Dict
+
+import numpy as np
+from pandas import DataFrame, Series, factorize, to_datetime
+
+from gps2gtfs.data_field.input_field import RawGPSField
+from gps2gtfs.data_field.output_field import GPSQualityField
+from gps2gtfs.utility.data_io_converter import haversine_m
+from gps2gtfs.utility.defaults import (
+    DEFAULT_MAX_FROZEN_RATIO,
+    DEFAULT_MAX_GAP_S,
+    DEFAULT_SPARSE_INTERVAL_S,
+    DEFAULT_STATIONARY_DISTANCE_M,
+)
+from gps2gtfs.utility.logger import logger
+
+INTERVAL_QUANTILES = (0.5, 0.9, 0.99)
+GPS_QUALITY_FILE_NAME = "gps_quality"
+GPS_QUALITY_SUMMARY_FILE_NAME = "gps_quality_summary.json"
+
+
+def profile_gps_quality(
+    gps_df: DataFrame,
+    max_gap_s: float = DEFAULT_MAX_GAP_S,
+    stationary_distance_m: float = DEFAULT_STATIONARY_DISTANCE_M,
+) -> DataFrame:
+    """
+    Profile the quality of GPS data per device and date.
+
+    The records are sorted once by device and time, and every metric is computed from shifted
+    arrays and reduced per device-day with `np.bincount`, so the profile costs about as much as
+    cleaning the data and can be made on every ingest.
+
+    - Records interval percentiles, from the positive intervals between successive records.
+    - Gaps, the intervals longer than `max_gap_s`, and the coverage, the share of the span of
+      the day not lost in a gap.
+    - Duplicates, the records at the same time as the previous record of the device.
+    - Out of order records, received after a record of the device with a later time, a sign of
+      clock skew.
+    - Stationary records, within `stationary_distance_m` of the previous record, and frozen
+      records, at exactly the position of the previous record while reporting a speed.
+
+    Parameters:
+        gps_df (DataFrame): Raw GPS data, in the order it was received. Cleaned GPS data can be
+                            profiled too, but it holds no duplicates, zero coordinates or out
+                            of order records anymore.
+        max_gap_s (float): Interval in seconds above which the signal is lost. Default is 300.
+        stationary_distance_m (float): Distance in meters from the previous record below which
+                                       a record has not moved. Default is 5.
+
+    Returns:
+        DataFrame: One row per device and date with the columns of `GPSQualityField`. The
+                   ratios are shares of the records of the device-day.
+
+    Notes:
+        - Records with zero coordinates are counted and left out of the position metrics,
+          their times still count in the intervals.
+        - 'frozen_ratio' is NaN when the data has no 'speed' column.
+
+    Example:
+        >>> quality_df = profile_gps_quality(read_csv_file("raw_gps.csv"))
+        >>> summary = summarize_gps_quality(quality_df)
+        >>> write_gps_quality_summary(summary, "gps_quality_summary.json")
+    """
+    columns = [f.value for f in GPSQualityField]
+    if len(gps_df) == 0:
+        return DataFrame(columns=columns)
+
+    device_codes, device_ids = factorize(gps_df[RawGPSField.DEVICE_ID.value])
+    times = to_datetime(gps_df[RawGPSField.DEVICE_TIME.value]).to_numpy()
+    latitudes = gps_df[RawGPSField.LATITUDE.value].to_numpy(dtype=np.float64)
+    longitudes = gps_df[RawGPSField.LONGITUDE.value].to_numpy(dtype=np.float64)
+    has_speed = RawGPSField.SPEED.value in gps_df.columns
+
+    # Records received before the previous record of their device, in arrival order
+    arrival = np.argsort(device_codes, kind="stable")
+    is_out_of_order = np.zeros(len(gps_df), dtype=bool)
+    is_out_of_order[arrival[1:]] = (
+        device_codes[arrival[1:]] == device_codes[arrival[:-1]]
+    ) & (times[arrival[1:]] < times[arrival[:-1]])
+
+    order = np.lexsort((times, device_codes))
+    device_codes = device_codes[order]
+    times = times[order]
+    days = times.astype("datetime64[D]")
+    latitudes, longitudes = latitudes[order], longitudes[order]
+
+    is_group_start = np.r_[
+        True, (device_codes[1:] != device_codes[:-1]) | (days[1:] != days[:-1])
+    ]
+    group_starts = np.flatnonzero(is_group_start)
+    group_ends = np.r_[group_starts[1:], len(order)] - 1
+    groups = np.cumsum(is_group_start) - 1
+    n_groups = len(group_starts)
+
+    def count(flags: "np.ndarray") -> "np.ndarray":
+        return np.bincount(groups, weights=flags, minlength=n_groups)
+
+    intervals = np.diff(times).astype("timedelta64[ms]").astype(np.float64) / 1000
+    intervals = np.r_[np.nan, intervals]
+    intervals[is_group_start] = np.nan
+    has_previous = ~is_group_start
+    is_duplicate = intervals == 0
+    is_gap = intervals > max_gap_s
+    covered_s = count(np.where(has_previous & ~is_gap, intervals, 0))
+    longest_gap_s = np.maximum.reduceat(np.nan_to_num(intervals), group_starts)
+
+    is_zero = (latitudes == 0) & (longitudes == 0)
+    has_position = has_previous & ~is_zero & ~np.r_[False, is_zero[:-1]] & ~is_duplicate
+    moved_m = np.full(len(order), np.inf)
+    moved_m[1:] = haversine_m(
+        latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]
+    )
+    is_stationary = has_position & (moved_m <= stationary_distance_m)
+
+    is_moving = intervals > 0
+    quantiles = (
+        Series(intervals[is_moving])
+        .groupby(groups[is_moving])
+        .quantile(list(INTERVAL_QUANTILES))
+        .unstack()
+        .reindex(index=range(n_groups), columns=list(INTERVAL_QUANTILES))
+    )
+
+    records = np.bincount(groups, minlength=n_groups)
+    span_s = (times[group_ends] - times[group_starts]).astype("timedelta64[ms]")
+    span_s = span_s.astype(np.float64) / 1000
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coverage_ratio = np.where(span_s > 0, covered_s / span_s, np.nan)
+    if has_speed:
+        speeds = gps_df[RawGPSField.SPEED.value].to_numpy(dtype=np.float64)[order]
+        is_frozen = (
+            has_position
+            & (latitudes == np.r_[np.nan, latitudes[:-1]])
+            & (longitudes == np.r_[np.nan, longitudes[:-1]])
+            & (speeds > 0)
+        )
+        frozen_ratio = count(is_frozen) / records
+    else:
+        frozen_ratio = np.full(n_groups, np.nan)
+
+    quality_df = DataFrame(
+        {
+            GPSQualityField.DEVICE_ID.value: device_ids[device_codes[group_starts]],
+            GPSQualityField.DATE.value: days[group_starts],
+            GPSQualityField.RECORDS.value: records,
+            GPSQualityField.FIRST_TIME.value: times[group_starts],
+            GPSQualityField.LAST_TIME.value: times[group_ends],
+            GPSQualityField.SPAN_HOURS.value: span_s / 3600,
+            GPSQualityField.COVERAGE_RATIO.value: coverage_ratio,
+            GPSQualityField.INTERVAL_P50_S.value: quantiles[0.5].to_numpy(),
+            GPSQualityField.INTERVAL_P90_S.value: quantiles[0.9].to_numpy(),
+            GPSQualityField.INTERVAL_P99_S.value: quantiles[0.99].to_numpy(),
+            GPSQualityField.GAPS.value: count(is_gap).astype(np.int64),
+            GPSQualityField.LONGEST_GAP_S.value: longest_gap_s,
+            GPSQualityField.DUPLICATE_RATIO.value: count(is_duplicate) / records,
+            GPSQualityField.OUT_OF_ORDER.value: count(is_out_of_order[order]).astype(
+                np.int64
+            ),
+            GPSQualityField.ZERO_COORDINATES.value: count(is_zero).astype(np.int64),
+            GPSQualityField.STATIONARY_RATIO.value: count(is_stationary) / records,
+            GPSQualityField.FROZEN_RATIO.value: frozen_ratio,
+        }
+    )
+    quality_df[GPSQualityField.DATE.value] = quality_df[
+        GPSQualityField.DATE.value
+    ].dt.date
+    logger.info(
+        f"Profiled {len(order)} GPS records of {len(device_ids)} devices over "
+        f"{n_groups} device-days"
+    )
+    return quality_df
+
+
+def summarize_gps_quality(
+    quality_df: DataFrame,
+    sparse_interval_s: float = DEFAULT_SPARSE_INTERVAL_S,
+    max_frozen_ratio: float = DEFAULT_MAX_FROZEN_RATIO,
+) -> Dict[str, Any]:
+    """
+    Summarize a GPS quality profile and flag the device-days with poor data.
+
+    Parameters:
+        quality_df (DataFrame): A profile made by `profile_gps_quality`, possibly the
+                                concatenation of the profiles of several dates.
+        sparse_interval_s (float): Median interval in seconds above which a device-day is
+                                   sparse. Default is 60.
+        max_frozen_ratio (float): Share of frozen records above which a device-day is frozen.
+                                  Default is 0.05.
+
+    Returns:
+        Dict[str, Any]: The totals of the profile, the medians of its interval and coverage
+                        metrics, and the number and devices of the device-days flagged as
+                        'sparse', 'gaps', 'clock_skew' and 'frozen'.
+    """
+    records = quality_df[GPSQualityField.RECORDS.value]
+    flags = {
+        "sparse": quality_df[GPSQualityField.INTERVAL_P50_S.value] > sparse_interval_s,
+        "gaps": quality_df[GPSQualityField.GAPS.value] > 0,
+        "clock_skew": quality_df[GPSQualityField.OUT_OF_ORDER.value] > 0,
+        "frozen": quality_df[GPSQualityField.FROZEN_RATIO.value] > max_frozen_ratio,
+    }
+
+    def median(field: GPSQualityField) -> Any:
+        value = quality_df[field.value].median()
+        return None if np.isnan(value) else round(float(value), 3)
+
+    return {
+        "devices": int(quality_df[GPSQualityField.DEVICE_ID.value].nunique()),
+        "device_days": len(quality_df),
+        "records": int(records.sum()),
+        "duplicates": int(
+            round((quality_df[GPSQualityField.DUPLICATE_RATIO.value] * records).sum())
+        ),
+        "out_of_order": int(quality_df[GPSQualityField.OUT_OF_ORDER.value].sum()),
+        "zero_coordinates": int(
+            quality_df[GPSQualityField.ZERO_COORDINATES.value].sum()
+        ),
+        "gaps": int(quality_df[GPSQualityField.GAPS.value].sum()),
+        "median_interval_p50_s": median(GPSQualityField.INTERVAL_P50_S),
+        "median_interval_p90_s": median(GPSQualityField.INTERVAL_P90_S),
+        "median_coverage_ratio": median(GPSQualityField.COVERAGE_RATIO),
+        "median_stationary_ratio": median(GPSQualityField.STATIONARY_RATIO),
+        "flagged_device_days": {
+            name: {
+                "count": int(is_flagged.sum()),
+                "devices": sorted(
+                    str(device_id)
+                    for device_id in quality_df.loc[
+                        is_flagged, GPSQualityField.DEVICE_ID.value
+                    ].unique()
+                ),
+            }
+            for name, is_flagged in flags.items()
+        },
+    }
+
+
+def write_gps_quality_summary(summary: Dict[str, Any], path: str) -> None:
+    """
+    Write the summary of a GPS quality profile as a JSON file.
+
+    Parameters:
+        summary (Dict[str, Any]): A summary made by `summarize_gps_quality`.
+        path (str): The file path where the JSON summary will be saved.
+
+    Returns:
+        None
+    """
+    with open(path, "w", encoding="utf-8") as summary_file:
+        json.dump(summary, summary_file, indent=2, default=str)
+    logger.info(f"Successfully wrote the GPS quality summary into JSON in {path}")
@@ -0,0 +1,242 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+
+from gps2gtfs.utility.logger import logger
+
+PSTATS_EXTENSION = ".pstats"
+COLLAPSED_EXTENSION = ".collapsed"
+DEFAULT_SAMPLE_INTERVAL_S = 0.005
+
+# The profiler of the running stage in this context
+_active_profiler: ContextVar[Optional["StageProfiler"]] = ContextVar(
+    "active_profiler", default=None
+)
+
+
+class StageProfiler:
+    """
+    Profile every pipeline stage and every worker task run during the stage.
+
+    Each stage is profiled with cProfile, and sampled by a thread that records the call stack of
+    the profiled threads at a fixed interval. Worker tasks run by `parallel_map` are profiled in
+    the worker, whichever the backend, and their profiles are merged into the profile of the
+    stage. For every stage, two files are written in `output_dir`:
+
+    - `<stage>.pstats`, which can be read with `pstats`, snakeviz or gprof2dot.
+    - `<stage>.collapsed`, with one line per sampled call stack and its number of samples, which
+      can be turned into a flame graph with flamegraph.pl, speedscope or inferno.
+
+    When a stage runs several times, e.g. once per partition, its profiles are accumulated.
+
+    Parameters:
+        output_dir (str): Directory where the profiles are written.
+        sample_interval_s (float): Seconds between two stack samples. Default is 0.005.
+
+    Example:
+        >>> from gps2gtfs.pipeline.trip import run
+        >>> run(raw_gps_path, terminals_path, 100, profile_dir="profiles/")
+        >>> import pstats
+        >>> pstats.Stats("profiles/terminal_match.pstats").sort_stats("tottime").print_stats(10)
+    """
+
+    def __init__(
+        self, output_dir: str, sample_interval_s: float = DEFAULT_SAMPLE_INTERVAL_S
+    ) -> None:
+        self.output_dir = output_dir
+        self.sample_interval_s = sample_interval_s
+        self.stage: Optional[str] = None
+        self._worker_dir: Optional[str] = None
+        self._stats: Dict[str, Any] = {}
+        self._stacks: Dict[str, Counter] = {}
+
+    @contextmanager
+    def profile_stage(self, name: str) -> Iterator[None]:
+        import cProfile
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._worker_dir = tempfile.mkdtemp(prefix="gps2gtfs_profile_")
+        self.stage = name
+        profile = cProfile.Profile()
+        sampler = StackSampler(self.sample_interval_s)
+        sampler.add_thread(threading.get_ident())
+        token = _active_profiler.set(self)
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+            _active_profiler.reset(token)
+            self._collect(name, profile, sampler.stacks)
+            shutil.rmtree(self._worker_dir, ignore_errors=True)
+            self._worker_dir = None
+            self.stage = None
+
+    def wrap_task(self, func: Callable) -> Callable:
+        """
+        Wrap a worker function so that every task it runs is profiled.
+        """
+        return ProfiledTask(
+            func,
+            self._worker_dir,
+            self.sample_interval_s,
+            (os.getpid(), threading.get_ident()),
+        )
+
+    def _collect(self, name: str, profile: Any, stacks: Counter) -> None:
+        import pstats
+
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = pstats.Stats(profile)
+        else:
+            stats.add(profile)
+        stage_stacks = self._stacks.setdefault(name, Counter())
+        stage_stacks.update(stacks)
+
+        for file_name in sorted(os.listdir(self._worker_dir)):
+            path = os.path.join(self._worker_dir, file_name)
+            if file_name.endswith(PSTATS_EXTENSION):
+                stats.add(path)
+            elif file_name.endswith(COLLAPSED_EXTENSION):
+                stage_stacks.update(read_collapsed_stacks(path))
+
+        file_stem = os.path.join(self.output_dir, name.replace(" ", "_"))
+        stats.dump_stats(file_stem + PSTATS_EXTENSION)
+        write_collapsed_stacks(stage_stacks, file_stem + COLLAPSED_EXTENSION)
+        logger.info(f"Wrote the profiles of stage '{name}' in {self.output_dir}")
+
+
+class StackSampler:
+    """
+    Record the call stacks of selected threads at a fixed interval in a background thread.
+    """
+
+    def __init__(self, interval_s: float = DEFAULT_SAMPLE_INTERVAL_S) -> None:
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self._thread_ids: Set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_thread(self, thread_id: int) -> None:
+        with self._lock:
+            self._thread_ids.add(thread_id)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="gps2gtfs-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            with self._lock:
+                thread_ids = set(self._thread_ids)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[_collapse(frame)] += 1
+
+
+class ProfiledTask:
+    """
+    Profile every call of a worker function and save the profiles for the stage to merge.
+
+    The wrapper can be pickled when the wrapped function is defined at module level, so it can
+    be used with the 'processes' backend. Tasks run in the thread profiling the stage, with the
+    'serial' backend or a single worker, are left to the profile of the stage: a second cProfile
+    in that thread would switch the profile of the stage off.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        worker_dir: str,
+        sample_interval_s: float,
+        stage_thread: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        self.func = func
+        self.worker_dir = worker_dir
+        self.sample_interval_s = sample_interval_s
+        self.stage_thread = stage_thread
+
+    def __call__(self, task: Any) -> Any:
+        import cProfile
+        import uuid
+
+        if self.stage_thread == (os.getpid(), threading.get_ident()):
+            return self.func(task)
+
+        profile = cProfile.Profile()
+        sampler = StackSampler(self.sample_interval_s)
+        sampler.add_thread(threading.get_ident())
+        sampler.start()
+        try:
+            # Only one profiler can be active at a time on some Python versions
+            profile.enable()
+            profiled = True
+        except ValueError:
+            profiled = False
+        try:
+            return self.func(task)
+        finally:
+            if profiled:
+                profile.disable()
+            sampler.stop()
+            file_stem = os.path.join(
+                self.worker_dir, f"worker-{os.getpid()}-{uuid.uuid4().hex}"
+            )
+            if profiled:
+                profile.dump_stats(file_stem + PSTATS_EXTENSION)
+            write_collapsed_stacks(sampler.stacks, file_stem + COLLAPSED_EXTENSION)
+
+
+def active_profiler() -> Optional[StageProfiler]:
+    return _active_profiler.get()
+
+
+def write_collapsed_stacks(stacks: Counter, path: str) -> None:
+    """
+    Write call stacks in the collapsed format, one 'frame;frame;frame count' line per stack.
+    """
+    with open(path, "w", encoding="utf-8") as collapsed_file:
+        for stack, count in sorted(stacks.items()):
+            collapsed_file.write(f"{stack} {count}\n")
+
+
+def read_collapsed_stacks(path: str) -> Counter:
+    stacks: Counter = Counter()
+    with open(path, encoding="utf-8") as collapsed_file:
+        for line in collapsed_file:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+def _collapse(frame: Any) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        file_name = os.path.basename(code.co_filename)
+        frames.append(f"{code.co_name} ({file_name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
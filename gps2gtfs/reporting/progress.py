@@ -0,0 +1,478 @@
+import os
+import threading
+from contextvars import ContextVar
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional
+
+from gps2gtfs.utility.logger import logger
+
+# Hot loops report their progress once every this many rows
+REPORT_EVERY_ROWS = 100
+METRIC_PREFIX = "gps2gtfs"
+
+_DRAIN_INTERVAL_S = 0.5
+_TASK_STARTED = "start"
+_TASK_ROWS = "rows"
+_TASK_FINISHED = "end"
+
+# The monitor of the running stage in this context, so that concurrent runs in threads or
+# tasks report to their own monitor, and in worker processes the queue that carries their
+# progress back to it
+_active_monitor: ContextVar[Optional["ProgressMonitor"]] = ContextVar(
+    "active_monitor", default=None
+)
+_worker_queue: Any = None
+
+
+class ProgressMonitor:
+    """
+    Live progress of a pipeline run: rows processed, tasks and partitions done, throughput and
+    estimated time left of the running stage.
+
+    The progress is logged periodically and can be exported in the Prometheus text format, to a
+    file read by the node exporter's textfile collector and over HTTP on localhost. Workers that
+    started a task but have not reported any progress for `stall_after_s` seconds are logged as
+    stalled.
+
+    Parameters:
+        log_interval_s (float): Seconds between two progress log lines and textfile updates.
+                                Default is 30.
+        textfile_path (str, optional): Path of the Prometheus textfile to keep up to date.
+                                       Default is None.
+        http_port (int, optional): Port to serve the metrics on at
+                                   http://127.0.0.1:<port>/metrics. Default is None.
+        stall_after_s (float): Seconds without progress after which a busy worker is reported
+                               as stalled. Default is 300.
+
+    Example:
+        >>> from gps2gtfs.pipeline.trip_stop import run
+        >>> with ProgressMonitor(log_interval_s=10, http_port=9464) as progress:
+        ...     run(raw_gps_path, terminals_path, stops_path, 100, 50, 100, progress=progress)
+    """
+
+    def __init__(
+        self,
+        log_interval_s: float = 30.0,
+        textfile_path: Optional[str] = None,
+        http_port: Optional[int] = None,
+        stall_after_s: float = 300.0,
+    ) -> None:
+        self.log_interval_s = log_interval_s
+        self.textfile_path = textfile_path
+        self.http_port = http_port
+        self.stall_after_s = stall_after_s
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._server: Any = None
+        self._queue: Any = None
+
+        self.stage: Optional[str] = None
+        self.stage_started_at: Optional[float] = None
+        self.total_rows: Optional[int] = None
+        self.rows_done = 0
+        self.tasks_total = 0
+        self.tasks_done = 0
+        self.partitions_total: Optional[int] = None
+        self.partitions_done = 0
+        self.stages_done = 0
+        self._workers: Dict[str, Dict[str, Any]] = {}
+
+    def __enter__(self) -> "ProgressMonitor":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def start(self) -> "ProgressMonitor":
+        if self.http_port is not None and self._server is None:
+            self._server = _start_http_server(self, self.http_port)
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="gps2gtfs-progress", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._drain_worker_queue()
+        self._write_textfile()
+
+    def start_stage(self, name: str, total_rows: Optional[int] = None) -> None:
+        with self._lock:
+            self.stage = name
+            self.stage_started_at = monotonic()
+            self.total_rows = total_rows
+            self.rows_done = 0
+            self.tasks_total = 0
+            self.tasks_done = 0
+            self._workers = {}
+        _active_monitor.set(self)
+
+    def finish_stage(self) -> None:
+        _active_monitor.set(None)
+        self._drain_worker_queue()
+        with self._lock:
+            self.stages_done += 1
+            self.stage = None
+
+    def set_partitions(self, total: int) -> None:
+        with self._lock:
+            self.partitions_total = total
+            self.partitions_done = 0
+
+    def partition_done(self) -> None:
+        with self._lock:
+            self.partitions_done += 1
+        self.log_progress()
+
+    def add_tasks(self, num_tasks: int) -> None:
+        with self._lock:
+            self.tasks_total += num_tasks
+
+    def task_done(self) -> None:
+        with self._lock:
+            self.tasks_done += 1
+
+    def update(self, worker: str, event: str, rows: int = 0) -> None:
+        now = monotonic()
+        with self._lock:
+            state = self._workers.setdefault(
+                worker, {"rows": 0, "busy": False, "last_update": now, "stalled": False}
+            )
+            state["rows"] += rows
+            state["last_update"] = now
+            state["stalled"] = False
+            if event == _TASK_STARTED:
+                state["busy"] = True
+            elif event == _TASK_FINISHED:
+                state["busy"] = False
+            self.rows_done += rows
+
+    def worker_queue(self) -> Any:
+        """
+        Queue used by worker processes to send their progress, see `init_worker`.
+        """
+        if self._queue is None:
+            from multiprocessing import Queue
+
+            self._queue = Queue()
+        return self._queue
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.stage_started_at is None:
+            return None
+        elapsed_s = monotonic() - self.stage_started_at
+        return self.rows_done / elapsed_s if elapsed_s > 0 else None
+
+    @property
+    def eta_s(self) -> Optional[float]:
+        rows_per_second = self.rows_per_second
+        if self.total_rows is None or not rows_per_second:
+            return None
+        return max(0.0, (self.total_rows - self.rows_done) / rows_per_second)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = monotonic()
+        with self._lock:
+            return {
+                "stage": self.stage,
+                "elapsed_s": (
+                    None
+                    if self.stage_started_at is None
+                    else now - self.stage_started_at
+                ),
+                "rows_done": self.rows_done,
+                "total_rows": self.total_rows,
+                "tasks_done": self.tasks_done,
+                "tasks_total": self.tasks_total,
+                "partitions_done": self.partitions_done,
+                "partitions_total": self.partitions_total,
+                "stages_done": self.stages_done,
+                "rows_per_second": self.rows_per_second,
+                "eta_s": self.eta_s,
+                "workers": {
+                    worker: {
+                        "rows": state["rows"],
+                        "busy": state["busy"],
+                        "idle_s": now - state["last_update"],
+                    }
+                    for worker, state in self._workers.items()
+                },
+            }
+
+    def log_progress(self) -> None:
+        snapshot = self.snapshot()
+        if snapshot["stage"] is None:
+            return
+        message = f"Stage '{snapshot['stage']}': {snapshot['rows_done']}"
+        if snapshot["total_rows"]:
+            percent = 100 * snapshot["rows_done"] / snapshot["total_rows"]
+            message += f"/{snapshot['total_rows']} rows ({percent:.1f}%)"
+        else:
+            message += " rows"
+        if snapshot["tasks_total"]:
+            message += f", {snapshot['tasks_done']}/{snapshot['tasks_total']} tasks"
+        if snapshot["partitions_total"]:
+            message += (
+                f", {snapshot['partitions_done']}/{snapshot['partitions_total']} "
+                "partitions"
+            )
+        if snapshot["rows_per_second"] is not None:
+            message += f", {snapshot['rows_per_second']:.0f} rows/s"
+        if snapshot["eta_s"] is not None:
+            message += f", ETA {_format_duration(snapshot['eta_s'])}"
+        logger.info(message)
+
+    def to_prometheus(self) -> str:
+        """
+        Render the progress in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines: List[str] = []
+        _add_metric(
+            lines,
+            "partitions_done",
+            "Partitions processed.",
+            [({}, snapshot["partitions_done"])],
+        )
+        _add_metric(
+            lines,
+            "partitions_total",
+            "Partitions of the input.",
+            [({}, snapshot["partitions_total"])],
+        )
+        _add_metric(
+            lines, "stages_done", "Stages finished.", [({}, snapshot["stages_done"])]
+        )
+        if snapshot["stage"] is None:
+            return "\n".join(lines) + "\n"
+
+        stage_label = {"stage": snapshot["stage"]}
+        _add_metric(
+            lines,
+            "rows_processed",
+            "Rows processed in the running stage.",
+            [(stage_label, snapshot["rows_done"])],
+        )
+        _add_metric(
+            lines,
+            "rows_total",
+            "Input rows of the running stage.",
+            [(stage_label, snapshot["total_rows"])],
+        )
+        _add_metric(
+            lines,
+            "rows_per_second",
+            "Throughput of the running stage.",
+            [(stage_label, snapshot["rows_per_second"])],
+        )
+        _add_metric(
+            lines,
+            "eta_seconds",
+            "Estimated seconds left in the running stage.",
+            [(stage_label, snapshot["eta_s"])],
+        )
+        _add_metric(
+            lines,
+            "tasks_done",
+            "Worker tasks finished in the running stage.",
+            [(stage_label, snapshot["tasks_done"])],
+        )
+        _add_metric(
+            lines,
+            "tasks_total",
+            "Worker tasks submitted in the running stage.",
+            [(stage_label, snapshot["tasks_total"])],
+        )
+        _add_metric(
+            lines,
+            "worker_rows_processed",
+            "Rows processed by a worker in the running stage.",
+            [
+                ({**stage_label, "worker": worker}, state["rows"])
+                for worker, state in snapshot["workers"].items()
+            ],
+        )
+        _add_metric(
+            lines,
+            "worker_idle_seconds",
+            "Seconds since a worker last reported progress.",
+            [
+                ({**stage_label, "worker": worker}, state["idle_s"])
+                for worker, state in snapshot["workers"].items()
+            ],
+        )
+        return "\n".join(lines) + "\n"
+
+    def _run(self) -> None:
+        last_log = monotonic()
+        while not self._stop.wait(_DRAIN_INTERVAL_S):
+            self._drain_worker_queue()
+            if monotonic() - last_log >= self.log_interval_s:
+                last_log = monotonic()
+                self.log_progress()
+                self._check_stalled_workers()
+                self._write_textfile()
+
+    def _drain_worker_queue(self) -> None:
+        if self._queue is None:
+            return
+        from queue import Empty
+
+        while True:
+            try:
+                worker, event, rows = self._queue.get_nowait()
+            except (Empty, OSError, ValueError):
+                return
+            self.update(worker, event, rows)
+
+    def _check_stalled_workers(self) -> None:
+        now = monotonic()
+        stalled = []
+        with self._lock:
+            for worker, state in self._workers.items():
+                idle_s = now - state["last_update"]
+                if (
+                    state["busy"]
+                    and not state["stalled"]
+                    and idle_s > self.stall_after_s
+                ):
+                    state["stalled"] = True
+                    stalled.append((worker, idle_s))
+        for worker, idle_s in stalled:
+            logger.warning(
+                f"Worker {worker} of stage '{self.stage}' has not reported progress "
+                f"for {idle_s:.0f}s"
+            )
+
+    def _write_textfile(self) -> None:
+        if self.textfile_path is None:
+            return
+        # Write and rename, so that the collector never reads a partial file
+        temporary_path = f"{self.textfile_path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as textfile:
+                textfile.write(self.to_prometheus())
+            os.replace(temporary_path, self.textfile_path)
+        except OSError as e:
+            logger.warning(
+                f"Failed to write the progress metrics in {self.textfile_path}. {e}"
+            )
+
+
+def active_monitor() -> Optional[ProgressMonitor]:
+    return _active_monitor.get()
+
+
+def init_worker(queue: Any) -> None:
+    """
+    Pool initializer that sends the progress of a worker process to the monitor.
+    """
+    global _worker_queue
+    _worker_queue = queue
+
+
+def report_rows(rows: int) -> None:
+    """
+    Report rows processed by the current task, if a stage is being monitored.
+
+    Hot loops call this every REPORT_EVERY_ROWS rows and once with the remainder, so that the
+    overhead stays negligible when no monitor is active.
+    """
+    _report(_TASK_ROWS, rows)
+
+
+class TrackedTask:
+    """
+    Wrap a worker function to report when a task starts and finishes.
+
+    The wrapper can be pickled when the wrapped function is defined at module level, so it can
+    be used with the 'processes' backend.
+    """
+
+    def __init__(self, func: Callable) -> None:
+        self.func = func
+
+    def __call__(self, task: Any) -> Any:
+        _report(_TASK_STARTED, 0)
+        try:
+            return self.func(task)
+        finally:
+            _report(_TASK_FINISHED, 0)
+
+
+def _report(event: str, rows: int) -> None:
+    if _worker_queue is not None:
+        _worker_queue.put((f"pid-{os.getpid()}", event, rows))
+    else:
+        monitor = _active_monitor.get()
+        if monitor is not None:
+            monitor.update(threading.current_thread().name, event, rows)
+
+
+def _add_metric(
+    lines: List[str], name: str, help_text: str, samples: List[tuple]
+) -> None:
+    metric = f"{METRIC_PREFIX}_{name}"
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} gauge")
+    for labels, value in samples:
+        if value is None:
+            continue
+        label_text = ",".join(
+            f'{key}="{_escape_label(str(label))}"' for key, label in labels.items()
+        )
+        label_text = f"{{{label_text}}}" if label_text else ""
+        lines.append(f"{metric}{label_text} {float(value):g}")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+def _start_http_server(monitor: ProgressMonitor, port: int) -> Any:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa N802
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = monitor.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa A002
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="gps2gtfs-metrics", daemon=True
+    ).start()
+    logger.info(f"Serving progress metrics on http://127.0.0.1:{port}/metrics")
+    return server
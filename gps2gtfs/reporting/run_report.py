@@ -0,0 +1,291 @@
+import json
+import os
+import platform
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter, process_time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional
+
+from gps2gtfs.utility.logger import logger
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+if TYPE_CHECKING:
+    from gps2gtfs.reporting.profiler import StageProfiler
+    from gps2gtfs.reporting.progress import ProgressMonitor
+
+RUN_REPORT_FILE_NAME = "run_report.json"
+_PROC_STATUS_PATH = "/proc/self/status"
+_PROC_CLEAR_REFS_PATH = "/proc/self/clear_refs"
+
+# Stages running in the process, of any run, and whether each one overlapped another stage
+_running_stages: Dict[int, bool] = {}
+_running_stages_lock = threading.Lock()
+
+
+class StageMetrics:
+    """
+    Resource usage and throughput of one pipeline stage.
+
+    When a stage runs several times, e.g. once per partition, its metrics are accumulated: times,
+    row counts and counters are summed and the peak memory is the maximum of all runs.
+
+    Counters are named counts specific to a stage, e.g. the rows removed by every cleaning rule.
+    """
+
+    def __init__(self, name: str, input_rows: Optional[int] = None) -> None:
+        self.name = name
+        self.runs = 0
+        self.wall_time_s = 0.0
+        self.cpu_time_s = 0.0
+        self.peak_rss_mb: Optional[float] = None
+        self.input_rows = input_rows
+        self.output_rows: Optional[int] = None
+        self.counters: Dict[str, int] = {}
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.input_rows is None or self.wall_time_s <= 0:
+            return None
+        return self.input_rows / self.wall_time_s
+
+    def merge(self, other: "StageMetrics") -> None:
+        self.runs += other.runs
+        self.wall_time_s += other.wall_time_s
+        self.cpu_time_s += other.cpu_time_s
+        self.peak_rss_mb = _max_optional(self.peak_rss_mb, other.peak_rss_mb)
+        self.input_rows = _sum_optional(self.input_rows, other.input_rows)
+        self.output_rows = _sum_optional(self.output_rows, other.output_rows)
+        for counter, count in other.counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + count
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "runs": self.runs,
+            "wall_time_s": round(self.wall_time_s, 6),
+            "cpu_time_s": round(self.cpu_time_s, 6),
+            "peak_rss_mb": _round_optional(self.peak_rss_mb),
+            "input_rows": self.input_rows,
+            "output_rows": self.output_rows,
+            "rows_per_second": _round_optional(self.rows_per_second),
+            "counters": self.counters,
+        }
+
+    def __repr__(self) -> str:
+        return f"StageMetrics({self.to_dict()})"
+
+
+class RunReport:
+    """
+    Structured report of a pipeline run with the metrics of every stage.
+
+    When a `ProgressMonitor` is given, it follows the live progress of every stage, and when a
+    `StageProfiler` is given, every stage is profiled.
+
+    The CPU time of a stage is the one of the whole process, including the worker processes
+    that finished during the stage and the threads of other runs. The peak RSS is the
+    high-water mark of the main process during the stage where Linux allows it to be reset,
+    and the high-water mark since the process started otherwise. The high-water mark is shared
+    by the process, so the peak RSS of a stage that overlapped a stage of another run, e.g. of
+    a concurrent service job, is None rather than the memory of both.
+
+    Example:
+        >>> report = RunReport("trip", {"terminals_buffer_radius": 100})
+        >>> with report.stage("clean", input_rows=len(raw_gps_df)) as stage:
+        ...     cleaned_raw_gps_df = clean(raw_gps_df)
+        ...     stage.output_rows = len(cleaned_raw_gps_df)
+        >>> report.finish()
+        >>> report.write_json("out/run_report.json")
+    """
+
+    def __init__(
+        self,
+        pipeline: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        log_stages: bool = False,
+        progress: Optional["ProgressMonitor"] = None,
+        profiler: Optional["StageProfiler"] = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.parameters = parameters or {}
+        self.log_stages = log_stages
+        self.progress = progress
+        self.profiler = profiler
+        self.stages: Dict[str, StageMetrics] = {}
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self._start_wall_time = perf_counter()
+        self.wall_time_s: Optional[float] = None
+
+    @contextmanager
+    def stage(
+        self, name: str, input_rows: Optional[int] = None
+    ) -> Iterator[StageMetrics]:
+        metrics = StageMetrics(name, input_rows)
+        if self.progress is not None:
+            self.progress.start_stage(name, input_rows)
+        _start_peak_rss(id(metrics))
+        start_wall_time = perf_counter()
+        start_cpu_time = _cpu_time()
+        try:
+            if self.profiler is None:
+                yield metrics
+            else:
+                with self.profiler.profile_stage(name):
+                    yield metrics
+        finally:
+            if self.progress is not None:
+                self.progress.finish_stage()
+            metrics.runs = 1
+            metrics.wall_time_s = perf_counter() - start_wall_time
+            metrics.cpu_time_s = _cpu_time() - start_cpu_time
+            metrics.peak_rss_mb = _stop_peak_rss(id(metrics))
+            if self.log_stages:
+                logger.info(
+                    f"Stage '{name}' finished in {metrics.wall_time_s:.3f}s wall time, "
+                    f"{metrics.cpu_time_s:.3f}s CPU time, "
+                    f"peak RSS {_format_optional(metrics.peak_rss_mb)} MB, "
+                    f"rows {_format_optional(input_rows)} -> "
+                    f"{_format_optional(metrics.output_rows)}"
+                )
+            if name in self.stages:
+                self.stages[name].merge(metrics)
+            else:
+                self.stages[name] = metrics
+
+    def finish(self) -> "RunReport":
+        self.finished_at = datetime.now()
+        self.wall_time_s = perf_counter() - self._start_wall_time
+        return self
+
+    @property
+    def peak_rss_mb(self) -> Optional[float]:
+        peak_rss_mb = None
+        for stage in self.stages.values():
+            peak_rss_mb = _max_optional(peak_rss_mb, stage.peak_rss_mb)
+        return peak_rss_mb
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pipeline": self.pipeline,
+            "package_version": _package_version(),
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": (
+                self.finished_at.isoformat(timespec="seconds")
+                if self.finished_at
+                else None
+            ),
+            "wall_time_s": _round_optional(self.wall_time_s),
+            "peak_rss_mb": _round_optional(self.peak_rss_mb),
+            "parameters": self.parameters,
+            "stages": [stage.to_dict() for stage in self.stages.values()],
+        }
+
+    def write_json(self, path: str) -> None:
+        """
+        Write the report as a JSON file.
+
+        Parameters:
+            path (str): The file path where the JSON report will be saved.
+
+        Returns:
+            None
+        """
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2, default=str)
+        logger.info(f"Successfully wrote the run report into JSON in {path}")
+
+    def __repr__(self) -> str:
+        return f"RunReport(pipeline={self.pipeline!r}, stages={list(self.stages)})"
+
+
+def _cpu_time() -> float:
+    cpu_time = process_time()
+    if resource is not None:
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_time += children_usage.ru_utime + children_usage.ru_stime
+    return cpu_time
+
+
+def _start_peak_rss(stage_id: int) -> None:
+    # The high-water mark is only reset by a stage that starts alone, as it would wipe the
+    # peak of the stages running in other threads
+    with _running_stages_lock:
+        if _running_stages:
+            _running_stages.update(dict.fromkeys(_running_stages, True))
+            _running_stages[stage_id] = True
+        else:
+            _running_stages[stage_id] = False
+            _reset_peak_rss()
+
+
+def _stop_peak_rss(stage_id: int) -> Optional[float]:
+    with _running_stages_lock:
+        overlapped = _running_stages.pop(stage_id)
+        return None if overlapped else _peak_rss_mb()
+
+
+def _reset_peak_rss() -> None:
+    # Writing 5 to clear_refs resets the peak RSS (VmHWM) of the process on Linux
+    try:
+        with open(_PROC_CLEAR_REFS_PATH, "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        with open(_PROC_STATUS_PATH) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return max_rss / 1024**2 if sys.platform == "darwin" else max_rss / 1024
+
+
+def _package_version() -> Optional[str]:
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        return None
+    try:
+        return version("gps2gtfs")
+    except PackageNotFoundError:
+        return None
+
+
+def _sum_optional(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None or b is None:
+        return a if b is None else b
+    return a + b
+
+
+def _max_optional(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None or b is None:
+        return a if b is None else b
+    return max(a, b)
+
+
+def _round_optional(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
+
+
+def _format_optional(value: Optional[float]) -> str:
+    if value is None:
+        return "n/a"
+    return f"{value:.1f}" if isinstance(value, float) else str(value)
@@ -1,5 +1,10 @@
-from . import (  # noqa F401
-    data_preparator,
-    feature_extractor,
-    stop_extractor,
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "data_preparator",
+        "feature_extractor",
+        "stop_extractor",
+    ],
 )
@@ -1,6 +1,5 @@
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
-from geopandas import GeoDataFrame
 from pandas import DataFrame, merge
 from gps2gtfs.data_field.im_field import (
     CleanedRawGPSField,
@@ -9,34 +8,38 @@ from gps2gtfs.data_field.im_field import (
 )
 from gps2gtfs.data_field.output_field import TripField
 from gps2gtfs.data_field.input_field import StopField
+from gps2gtfs.reporting.progress import REPORT_EVERY_ROWS, report_rows
 from gps2gtfs.utility.data_io_converter import (
     extend_geo_buffer,
     pandas_to_geo_data_frame,
 )
 from gps2gtfs.utility.logger import logger
 
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+
+    from gps2gtfs.utility.route_index import RouteIndex
+
 
 def create_stop_buffers(
     raw_gps_df: DataFrame,
     stops_df: DataFrame,
     buffer_radius: int,
     extended_buffer_radius: int,
+    copy: bool = True,
+    route_index: Optional["RouteIndex"] = None,
 ) -> Tuple:
-    logger.info("Splitting stops dataframe into two based on route direction")
-    raw_gps_geo_df = pandas_to_geo_data_frame(raw_gps_df)
-    stops_geo_df = pandas_to_geo_data_frame(stops_df)
-
-    logger.info("Splitting stops dataframe into two based on route direction")
-    directions: List[str] = stops_geo_df[StopField.DIRECTION.value].unique().tolist()
-    directions = list(filter(lambda d: not d.isdigit(), directions))
-    direction1_stops_geo_df = stops_geo_df[
-        stops_geo_df[StopField.DIRECTION.value] == directions[0]
-    ]
-    direction2_stops_geo_df = stops_geo_df[
-        stops_geo_df[StopField.DIRECTION.value] == directions[1]
-    ]
+    raw_gps_geo_df = pandas_to_geo_data_frame(raw_gps_df, copy)
+    if route_index is not None:
+        return (
+            raw_gps_geo_df,
+            *route_index.stop_buffers(buffer_radius, extended_buffer_radius),
+        )
 
-    direction2_stops_geo_df.reset_index(drop=True, inplace=True)
+    stops_geo_df = pandas_to_geo_data_frame(stops_df)
+    direction1_stops_geo_df, direction2_stops_geo_df = split_stops_by_direction(
+        stops_geo_df
+    )
 
     # proximity analysis
     # creating a buffer
@@ -61,8 +64,23 @@ def create_stop_buffers(
     )
 
 
+def split_stops_by_direction(stops_geo_df: "GeoDataFrame") -> Tuple:
+    logger.info("Splitting stops dataframe into two based on route direction")
+    directions: List[str] = stops_geo_df[StopField.DIRECTION.value].unique().tolist()
+    directions = list(filter(lambda d: not d.isdigit(), directions))
+    direction1_stops_geo_df = stops_geo_df[
+        stops_geo_df[StopField.DIRECTION.value] == directions[0]
+    ]
+    direction2_stops_geo_df = stops_geo_df[
+        stops_geo_df[StopField.DIRECTION.value] == directions[1]
+    ]
+
+    direction2_stops_geo_df.reset_index(drop=True, inplace=True)
+    return direction1_stops_geo_df, direction2_stops_geo_df
+
+
 def prepare_trajectory_df(
-    raw_gps_geo_df: GeoDataFrame,
+    raw_gps_geo_df: "GeoDataFrame",
     processed_gps_df: DataFrame,
     trips_df: DataFrame,
 ) -> DataFrame:
@@ -96,6 +114,9 @@ def prepare_trajectory_df(
                 trajectory_df.at[i + 1, TrajectoryField.TRIP_ID.value] = trip
             elif trajectory_df.at[i + 1, TrajectoryField.TRIP_ID.value] == trip:
                 trip = trip + 1
+        if (i + 1) % REPORT_EVERY_ROWS == 0:
+            report_rows(REPORT_EVERY_ROWS)
+    report_rows(max(0, len(trajectory_df) - 1) % REPORT_EVERY_ROWS)
 
     trajectory_df.drop(
         trajectory_df[trajectory_df[TrajectoryField.TRIP_ID.value] == 0].index,
@@ -1,28 +1,79 @@
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional, Union
 
 import numpy as np
-from pandas import DataFrame, concat, to_datetime
+from pandas import (
+    DataFrame,
+    Series,
+    Timedelta,
+    Timestamp,
+    concat,
+    to_datetime,
+    to_timedelta,
+)
 from gps2gtfs.data_field.im_field import ExtractedStopField
 from gps2gtfs.data_field.output_field import StopTimeField
+from gps2gtfs.reporting.progress import report_rows
+from gps2gtfs.utility.executor import Engine
 from gps2gtfs.utility.logger import logger
 
+# A bus that stays stopped longer than this after its last zero speed record left the stop
+DEPARTURE_MARGIN = Timedelta(seconds=15)
 
-def extract_stop_features(stops: DataFrame) -> DataFrame:
-    stop_times_df = calculate_stop_times(stops)
-    add_features_from_datetimes(stop_times_df)
+
+# Stop time columns that are derived from the date and arrival time
+DATETIME_STOP_TIME_COLUMNS = [
+    StopTimeField.DAY_OF_WEEK.value,
+    StopTimeField.HOUR_OF_DAY.value,
+    StopTimeField.IS_WEEKDAY.value,
+]
+# Stop time columns that compare a stop visit with the previous ones, added on request
+INTERVAL_STOP_TIME_COLUMNS = [
+    StopTimeField.RUNNING_TIME_IN_SECONDS.value,
+    StopTimeField.HEADWAY_IN_SECONDS.value,
+]
+
+
+def stop_time_columns(running_times_and_headways: bool = False) -> List[str]:
+    # Columns of the stop times, which hold the intervals only when they are added
+    return [
+        f.value
+        for f in StopTimeField
+        if running_times_and_headways or f.value not in INTERVAL_STOP_TIME_COLUMNS
+    ]
+
+
+def extract_stop_features(
+    stops: DataFrame,
+    terminal_ids: List[str],
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    columns: Optional[List[str]] = None,
+    running_times_and_headways: bool = False,
+) -> DataFrame:
+    # Only the columns in `columns` are returned, the date features only if one is in them,
+    # and the intervals if asked for or in them
+    stop_times_df = calculate_stop_times(stops, terminal_ids, engine)
+    if columns is None or set(DATETIME_STOP_TIME_COLUMNS) & set(columns):
+        add_features_from_datetimes(stop_times_df)
+    if running_times_and_headways or (
+        columns is not None and set(INTERVAL_STOP_TIME_COLUMNS) & set(columns)
+    ):
+        add_running_times_and_headways(stop_times_df)
+    if columns is not None:
+        stop_times_df = stop_times_df[
+            [column for column in stop_times_df.columns if column in columns]
+        ]
     return stop_times_df
 
 
-def calculate_stop_times(stops_df: DataFrame) -> DataFrame:
-    # Drop records with End terminals
-    terminals: List[str] = stops_df[ExtractedStopField.BUS_STOP.value].unique().tolist()
+def calculate_stop_times(
+    stops_df: DataFrame,
+    terminal_ids: List[str],
+    engine: Union[str, Engine] = Engine.REFERENCE,
+) -> DataFrame:
+    # Drop records with End terminals, the trip terminals of the route
     stops_df.drop(
-        stops_df[stops_df[ExtractedStopField.BUS_STOP.value] == terminals[0]].index,
-        inplace=True,
-    )
-    stops_df.drop(
-        stops_df[stops_df[ExtractedStopField.BUS_STOP.value] == terminals[1]].index,
+        stops_df[stops_df[ExtractedStopField.BUS_STOP.value].isin(terminal_ids)].index,
         inplace=True,
     )
 
@@ -36,6 +87,9 @@ def calculate_stop_times(stops_df: DataFrame) -> DataFrame:
         )
     ).cumsum()
 
+    if Engine(engine) == Engine.FAST:
+        return aggregate_stop_times(stops_df)
+
     # creating a new dataframe for stop times
     columns = [
         StopTimeField.TRIP_ID.value,
@@ -88,6 +142,7 @@ def calculate_stop_times(stops_df: DataFrame) -> DataFrame:
         )
         new_row = DataFrame([values], columns=columns)
         stop_times_df = concat([stop_times_df, new_row], ignore_index=True)
+        report_rows(len(group))
         # stop_times_df = stop_times_df.append(dict(zip(columns, values)), ignore_index=True)
 
     for i in range(len(stop_times_df)):
@@ -105,6 +160,65 @@ def calculate_stop_times(stops_df: DataFrame) -> DataFrame:
     return stop_times_df
 
 
+def aggregate_stop_times(stops_df: DataFrame) -> DataFrame:
+    # Same stop times as the loop of calculate_stop_times, computed for all groups at once
+    groups = stops_df.groupby(ExtractedStopField.GROUPED_ENDS.value, sort=True)
+    stop_times_df = groups[
+        [
+            ExtractedStopField.TRIP_ID.value,
+            ExtractedStopField.DEVICE_ID.value,
+            ExtractedStopField.DATE.value,
+            ExtractedStopField.DIRECTION.value,
+            ExtractedStopField.BUS_STOP.value,
+        ]
+    ].min()
+    stop_times_df.columns = [
+        StopTimeField.TRIP_ID.value,
+        StopTimeField.DEVICE_ID.value,
+        StopTimeField.DATE.value,
+        StopTimeField.DIRECTION.value,
+        StopTimeField.BUS_STOP.value,
+    ]
+
+    # Time of day of every record, and of the records where the bus is stopped
+    device_times = to_datetime(stops_df[ExtractedStopField.DEVICE_TIME.value])
+    times = device_times - device_times.dt.normalize()
+    stopped_times = times.where(stops_df[ExtractedStopField.SPEED.value] == 0)
+    group_ids = stops_df[ExtractedStopField.GROUPED_ENDS.value]
+    first_time = times.groupby(group_ids).min()
+    buffer_leaving_time = times.groupby(group_ids).max()
+    first_stopped_time = stopped_times.groupby(group_ids).min()
+    rough_departure_time = stopped_times.groupby(group_ids).max()
+
+    has_stopped = first_stopped_time.notna()
+    arrival_time = first_stopped_time.where(has_stopped, first_time)
+    departure_time = (rough_departure_time + DEPARTURE_MARGIN) % Timedelta(days=1)
+    departure_time = departure_time.where(
+        buffer_leaving_time - rough_departure_time > DEPARTURE_MARGIN,
+        buffer_leaving_time,
+    ).where(has_stopped, arrival_time)
+
+    stop_times_df[StopTimeField.ARRIVAL_TIME.value] = (
+        Timestamp(0) + arrival_time
+    ).dt.time
+    stop_times_df[StopTimeField.DEPARTURE_TIME.value] = (
+        Timestamp(0) + departure_time
+    ).dt.time
+    dwell_time = departure_time - arrival_time
+    # Python timedeltas, as written by the loop
+    stop_times_df[StopTimeField.DWELL_TIME.value] = Series(
+        dwell_time.dt.to_pytimedelta(), index=dwell_time.index, dtype="object"
+    )
+    stop_times_df[StopTimeField.DWELL_TIME_IN_SECONDS.value] = (
+        dwell_time / np.timedelta64(1, "s")
+    )
+    stop_times_df.reset_index(drop=True, inplace=True)
+    report_rows(len(stops_df))
+
+    logger.info("Successfully extracted stop related features")
+    return stop_times_df
+
+
 def add_features_from_datetimes(stop_times_df: DataFrame) -> None:
     # bus_stop_times = bus_stop_times.drop(bus_stop_times[bus_stop_times['dwell_time_in_seconds']>threshold].index)
 
@@ -122,6 +236,63 @@ def add_features_from_datetimes(stop_times_df: DataFrame) -> None:
     )
 
 
+def add_running_times_and_headways(stop_times_df: DataFrame) -> None:
+    """
+    Add the running time from the previous stop and the headway behind the previous bus.
+
+    Both are computed for all the stop visits at once: the visits are sorted once, and the
+    previous visit is found with a groupby shift instead of a loop over trips or stops.
+
+    - 'running_time_in_seconds': From the departure of the trip at its previous stop to its
+      arrival at this stop. NaN at the first stop of a trip.
+    - 'headway_in_seconds': From the arrival of the previous trip at the same stop, in the same
+      direction and on the same date, to the arrival of this trip. NaN for the first trip of
+      the day at a stop.
+
+    Parameters:
+        stop_times_df (DataFrame): Stop times, as made by `calculate_stop_times`. The columns
+                                   are added in place.
+
+    Returns:
+        None
+    """
+    trip_ids = stop_times_df[StopTimeField.TRIP_ID.value]
+    dates = to_datetime(stop_times_df[StopTimeField.DATE.value])
+    arrivals = dates + _time_of_day(stop_times_df[StopTimeField.ARRIVAL_TIME.value])
+    departures = dates + _time_of_day(stop_times_df[StopTimeField.DEPARTURE_TIME.value])
+
+    visits = DataFrame({"trip_id": trip_ids, "arrival": arrivals}).sort_values(
+        ["trip_id", "arrival"], kind="stable"
+    )
+    previous_departures = departures.loc[visits.index].groupby(trip_ids).shift()
+    stop_times_df[StopTimeField.RUNNING_TIME_IN_SECONDS.value] = (
+        arrivals - previous_departures
+    ) / np.timedelta64(1, "s")
+
+    visits = visits.sort_values("arrival", kind="stable")
+    headways = (
+        arrivals.loc[visits.index]
+        .groupby(
+            [
+                dates,
+                stop_times_df[StopTimeField.DIRECTION.value],
+                stop_times_df[StopTimeField.BUS_STOP.value],
+            ],
+            observed=True,
+            sort=False,
+        )
+        .diff()
+    )
+    stop_times_df[StopTimeField.HEADWAY_IN_SECONDS.value] = headways / np.timedelta64(
+        1, "s"
+    )
+
+
+def _time_of_day(times: Series) -> Series:
+    # datetime.time values to timedeltas since midnight, parsed in one pass
+    return to_timedelta(times.astype(str))
+
+
 def calculate_departure_time(rough_departure_time, buffer_leaving_time, date):
     if (
         datetime.combine(date, buffer_leaving_time)
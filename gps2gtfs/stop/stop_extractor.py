@@ -1,23 +1,38 @@
-from typing import Tuple
-from multiprocessing import Pool, cpu_count
+from typing import TYPE_CHECKING, Optional, Tuple, Union
 
-from geopandas import GeoDataFrame
-from pandas import DataFrame, concat
+from pandas import DataFrame, Series, concat
 from gps2gtfs.data_field.im_field import TrajectoryField
 from gps2gtfs.data_field.input_field import StopField
+from gps2gtfs.reporting.progress import REPORT_EVERY_ROWS, report_rows
+from gps2gtfs.utility.data_io_converter import GEO_CRS, first_containing_area
+from gps2gtfs.utility.executor import (
+    Engine,
+    ExecutionBackend,
+    parallel_map,
+    resolve_num_workers,
+    split_into_chunks,
+)
 from gps2gtfs.utility.logger import logger
 
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+    from numpy import ndarray
+
 
 def extract_stops(
     trajectory_df: DataFrame,
-    direction1_stops_buffer: GeoDataFrame,
-    direction2_stops_buffer: GeoDataFrame,
-    direction1_stops_extended_buffer: GeoDataFrame,
-    direction2_stops_extended_buffer: GeoDataFrame,
+    direction1_stops_buffer: "GeoDataFrame",
+    direction2_stops_buffer: "GeoDataFrame",
+    direction1_stops_extended_buffer: "GeoDataFrame",
+    direction2_stops_extended_buffer: "GeoDataFrame",
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
 ) -> DataFrame:
     logger.info("Preparing to extract stops from GPS Data")
-    # project to local coordinate system before buffer filtering
-    trajectory_df = trajectory_df.to_crs("EPSG:5234")
+    # project to local coordinate system before buffer filtering, unless it already is
+    if trajectory_df.crs != GEO_CRS:
+        trajectory_df = trajectory_df.to_crs(GEO_CRS)
 
     # split trajectories by direction
     direction1_trajectory = trajectory_df[
@@ -33,14 +48,26 @@ def extract_stops(
 
     # filter records within stops buffer of both directions
     direction1_trajectory = match_gps_data_with_stops(
-        direction1_trajectory, direction1_stops_buffer, direction1_stops_extended_buffer
+        direction1_trajectory,
+        direction1_stops_buffer,
+        direction1_stops_extended_buffer,
+        num_workers,
+        backend,
+        engine,
     )
     direction2_trajectory = match_gps_data_with_stops(
-        direction2_trajectory, direction2_stops_buffer, direction2_stops_extended_buffer
+        direction2_trajectory,
+        direction2_stops_buffer,
+        direction2_stops_extended_buffer,
+        num_workers,
+        backend,
+        engine,
     )
 
     # concatenate dataframes of both directions and keep only records filtered within stops
-    trip_all_points = concat([direction1_trajectory, direction2_trajectory])
+    trip_all_points = concat(
+        [direction1_trajectory, direction2_trajectory], ignore_index=True
+    )
     stops = trip_all_points.dropna()
 
     logger.info("Successfully Extracted Stops")
@@ -49,47 +76,120 @@ def extract_stops(
 
 def match_gps_data_with_stops(
     trajectory_df: DataFrame,
-    stops_buffer_geo_df: GeoDataFrame,
-    stops_extended_buffer_geo_df: GeoDataFrame,
+    stops_buffer_geo_df: "GeoDataFrame",
+    stops_extended_buffer_geo_df: "GeoDataFrame",
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
 ) -> DataFrame:
     logger.info("Preparing to match stops coordinates with GPS Data Points")
-    num_processes = cpu_count()  # Number of available CPU cores
-    chunk_size = len(trajectory_df) // num_processes
+    if len(trajectory_df) == 0:
+        # No chunk to match, e.g. a partition whose trips all run in the other direction
+        trajectory_df = trajectory_df.copy()
+        trajectory_df[TrajectoryField.BUS_STOP.value] = Series(dtype="object")
+        return trajectory_df
+
+    num_workers = resolve_num_workers(num_workers)
+    # Stop IDs are taken by position, as the tasks may run in threads sharing the buffers
+    stop_ids = stops_buffer_geo_df[StopField.STOP_ID.value].to_numpy()
+    extended_stop_ids = stops_extended_buffer_geo_df[StopField.STOP_ID.value].to_numpy()
     chunks = [
         (
-            trajectory_df[i : i + chunk_size],
+            chunk,
             stops_buffer_geo_df,
             stops_extended_buffer_geo_df,
+            stop_ids,
+            extended_stop_ids,
         )
-        for i in range(0, len(trajectory_df), chunk_size)
+        for chunk in split_into_chunks(trajectory_df, num_workers)
     ]
 
     logger.info("Starting to match stops coordinates with GPS Data Points")
-    with Pool(processes=num_processes) as pool:
-        updated_chunks = pool.map(match_gps_points, chunks)
+    match_chunk = (
+        match_gps_points_fast if Engine(engine) == Engine.FAST else match_gps_points
+    )
+    updated_chunks = parallel_map(match_chunk, chunks, num_workers, backend)
 
     logger.info("Successfully matched stops coordinates with GPS Data Points")
     return concat(updated_chunks, ignore_index=True)
 
 
 def match_gps_points(args: Tuple) -> DataFrame:
-    trajectory_df, stops_buffer_geo_df, stops_extended_buffer_geo_df = args
+    (
+        trajectory_df,
+        stops_buffer_geo_df,
+        stops_extended_buffer_geo_df,
+        stop_ids,
+        extended_stop_ids,
+    ) = args
+    # Chunks keep the index of the whole trajectory, the loop below assigns by position
+    trajectory_df = trajectory_df.reset_index(drop=True)
 
     for i in range(len(trajectory_df)):
         for stop in range(len(stops_buffer_geo_df)):
             if stops_buffer_geo_df.iloc[stop].geometry.contains(
                 trajectory_df.iloc[i].geometry
             ):
-                trajectory_df.at[
-                    i, TrajectoryField.BUS_STOP.value
-                ] = stops_buffer_geo_df.at[stop, StopField.STOP_ID.value]
+                trajectory_df.at[i, TrajectoryField.BUS_STOP.value] = stop_ids[stop]
                 break
             elif stops_extended_buffer_geo_df.iloc[stop].geometry.contains(
                 trajectory_df.iloc[i].geometry
             ):
-                trajectory_df.at[
-                    i, TrajectoryField.BUS_STOP.value
-                ] = stops_extended_buffer_geo_df.at[stop, StopField.STOP_ID.value]
+                trajectory_df.at[i, TrajectoryField.BUS_STOP.value] = extended_stop_ids[
+                    stop
+                ]
                 break
+        if (i + 1) % REPORT_EVERY_ROWS == 0:
+            report_rows(REPORT_EVERY_ROWS)
+    report_rows(len(trajectory_df) % REPORT_EVERY_ROWS)
+
+    return trajectory_df
+
+
+def match_gps_points_fast(args: Tuple) -> DataFrame:
+    (
+        trajectory_df,
+        stops_buffer_geo_df,
+        stops_extended_buffer_geo_df,
+        stop_ids,
+        extended_stop_ids,
+    ) = args
+    trajectory_df = trajectory_df.reset_index(drop=True)
+
+    # Same stop as the loop: the first stop, in the stops order, whose buffer or extended
+    # buffer contains the point, preferring the buffer when both contain it
+    first_stop = first_containing_area(trajectory_df, stops_buffer_geo_df)
+    first_extended_stop = first_containing_area(
+        trajectory_df, stops_extended_buffer_geo_df
+    )
+    trajectory_df[TrajectoryField.BUS_STOP.value] = assign_first_stops(
+        trajectory_df[TrajectoryField.BUS_STOP.value].to_numpy(dtype="object"),
+        first_stop,
+        first_extended_stop,
+        stop_ids,
+        extended_stop_ids,
+    )
 
+    report_rows(len(trajectory_df))
     return trajectory_df
+
+
+def assign_first_stops(
+    bus_stops: "ndarray",
+    first_stop: "ndarray",
+    first_extended_stop: "ndarray",
+    stop_ids: "ndarray",
+    extended_stop_ids: "ndarray",
+) -> "ndarray":
+    # The buffer wins over the extended buffer when its stop comes first in the stops order
+    in_buffer = (first_stop >= 0) & (
+        (first_extended_stop < 0) | (first_stop <= first_extended_stop)
+    )
+    in_extended_buffer = (first_extended_stop >= 0) & ~in_buffer
+
+    bus_stops = bus_stops.copy()
+    bus_stops[in_buffer] = stop_ids[first_stop[in_buffer]]
+    bus_stops[in_extended_buffer] = extended_stop_ids[
+        first_extended_stop[in_extended_buffer]
+    ]
+    return bus_stops
@@ -0,0 +1,276 @@
+from typing import TYPE_CHECKING, Union
+
+import numpy as np
+from pandas import DataFrame, Series, to_datetime, to_timedelta
+from gps2gtfs.data_field.im_field import TrajectoryField
+from gps2gtfs.data_field.output_field import CompactTrajectoryField
+from gps2gtfs.utility.data_io_converter import GEO_CRS, pandas_to_geo_data_frame
+from gps2gtfs.utility.defaults import DEFAULT_TOLERANCE_M, SimplifyMethod
+from gps2gtfs.utility.logger import logger
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+    from numpy import ndarray
+
+# Decimals of the exported coordinates, about 0.1 m
+COORDINATE_DECIMALS = 6
+
+
+def compress_trajectories(
+    trajectory_df: DataFrame,
+    tolerance_m: float = DEFAULT_TOLERANCE_M,
+    method: Union[str, SimplifyMethod] = SimplifyMethod.DOUGLAS_PEUCKER,
+) -> "GeoDataFrame":
+    """
+    Turn the pings of every trip into one simplified linestring with delta-encoded times.
+
+    The pings of every trip are simplified top-down: the first and last pings are kept, and the
+    farthest ping from what the kept pings describe is kept while it is farther than
+    `tolerance_m`, splitting the trip until no ping is. All the trips are split together,
+    with vectorized operations on the pings of all the segments at once.
+
+    - With 'douglas-peucker', a ping is measured against the segment between the kept pings
+      around it, which keeps the shape of the path.
+    - With 'time-aware', a ping is measured against the position interpolated between the kept
+      pings around it at the time of the ping, i.e. dead reckoning at constant speed.
+      Interpolating the exported trip in time then places every original ping within
+      `tolerance_m`, including where the bus stood still.
+
+    Parameters:
+        trajectory_df (DataFrame): Trajectory records, as made by `prepare_trajectory_df`.
+        tolerance_m (float): Largest distance in meters of a dropped ping. Default is 10.
+        method (Union[str, SimplifyMethod]): Either 'douglas-peucker' or 'time-aware'. Default
+                                             is 'douglas-peucker'.
+
+    Returns:
+        GeoDataFrame: One row per trip with the columns of `CompactTrajectoryField`. The
+                      linestring holds the kept pings in longitude and latitude (EPSG:4326),
+                      and 'time_deltas_s' the seconds from each kept ping to the next,
+                      separated by spaces.
+
+    Notes:
+        - Trips with a single ping cannot be made into a linestring and are left out.
+
+    Example:
+        >>> trajectories = compress_trajectories(trajectory_df, 10, "time-aware")
+        >>> trajectories.to_parquet("trajectories.parquet")  # GeoParquet
+        >>> pings = expand_trajectories(trajectories)
+    """
+    import shapely
+    from geopandas import GeoDataFrame
+
+    method = SimplifyMethod(method)
+    columns = [f.value for f in CompactTrajectoryField]
+    if getattr(trajectory_df, "crs", None) != GEO_CRS:
+        trajectory_df = pandas_to_geo_data_frame(trajectory_df)
+    device_times = to_datetime(trajectory_df[TrajectoryField.DEVICE_TIME.value])
+    trip_ids = trajectory_df[TrajectoryField.TRIP_ID.value].to_numpy()
+    order = np.lexsort((device_times.to_numpy(), trip_ids))
+
+    trip_ids = trip_ids[order]
+    is_trip_start = np.r_[True, trip_ids[1:] != trip_ids[:-1]] if len(order) else []
+    trip_starts = np.flatnonzero(is_trip_start)
+    trip_sizes = np.diff(np.r_[trip_starts, len(order)])
+    single_ping_trips = int((trip_sizes == 1).sum())
+    if single_ping_trips:
+        logger.warning(
+            f"Leaving out {single_ping_trips} trips with a single GPS record"
+        )
+
+    seconds = device_times.to_numpy()[order].astype("datetime64[s]").astype(np.int64)
+    keep = simplify_mask(
+        trajectory_df.geometry.x.to_numpy()[order],
+        trajectory_df.geometry.y.to_numpy()[order],
+        seconds,
+        trip_starts,
+        tolerance_m,
+        method,
+    )
+    keep &= np.repeat(trip_sizes > 1, trip_sizes)
+    if not keep.any():
+        return GeoDataFrame(columns=columns, geometry=[], crs="EPSG:4326")
+
+    kept = order[keep]
+    kept_trip_ids = trip_ids[keep]
+    kept_seconds = seconds[keep]
+    first = np.r_[True, kept_trip_ids[1:] != kept_trip_ids[:-1]]
+    trip_codes = np.cumsum(first) - 1
+    deltas = np.diff(kept_seconds, prepend=kept_seconds[0]).astype(str)
+    time_deltas = (
+        Series(deltas[~first]).groupby(trip_codes[~first]).agg(" ".join).to_numpy()
+    )
+    coordinates = np.column_stack(
+        [
+            trajectory_df[TrajectoryField.LONGITUDE.value].to_numpy()[kept],
+            trajectory_df[TrajectoryField.LATITUDE.value].to_numpy()[kept],
+        ]
+    ).round(COORDINATE_DECIMALS)
+    first_rows = kept[first]
+
+    trajectories = GeoDataFrame(
+        {
+            CompactTrajectoryField.TRIP_ID.value: kept_trip_ids[first].astype(np.int64),
+            CompactTrajectoryField.DEVICE_ID.value: trajectory_df[
+                TrajectoryField.DEVICE_ID.value
+            ].to_numpy()[first_rows],
+            CompactTrajectoryField.DIRECTION.value: trajectory_df[
+                TrajectoryField.DIRECTION.value
+            ].to_numpy()[first_rows],
+            CompactTrajectoryField.START_TIME.value: device_times.to_numpy()[
+                first_rows
+            ],
+            CompactTrajectoryField.RAW_POINTS.value: trip_sizes[trip_sizes > 1],
+            CompactTrajectoryField.POINTS.value: np.bincount(trip_codes),
+            CompactTrajectoryField.TIME_DELTAS_S.value: time_deltas,
+        },
+        geometry=shapely.linestrings(coordinates, indices=trip_codes),
+        crs="EPSG:4326",
+    )
+    logger.info(
+        f"Simplified {keep.size} GPS records into {keep.sum()} points of "
+        f"{len(trajectories)} trips"
+    )
+    return trajectories
+
+
+def expand_trajectories(trajectories_df: DataFrame) -> DataFrame:
+    """
+    Decode compact trajectories back to one row per kept ping.
+
+    Parameters:
+        trajectories_df (DataFrame): Trajectories made by `compress_trajectories`, or read
+                                     back from their CSV file (WKT geometries) or GeoParquet
+                                     file.
+
+    Returns:
+        DataFrame: The trip ID, device time, latitude and longitude of every kept ping.
+    """
+    import shapely
+
+    geometries = trajectories_df[CompactTrajectoryField.GEOMETRY.value]
+    if len(geometries) and isinstance(geometries.iloc[0], str):
+        # Read back from CSV, as WKT
+        geometries = shapely.from_wkt(geometries.to_numpy())
+    coordinates, trip_codes = shapely.get_coordinates(
+        np.asarray(geometries), return_index=True
+    )
+
+    time_deltas = (
+        trajectories_df[CompactTrajectoryField.TIME_DELTAS_S.value]
+        .fillna("")
+        .astype(str)
+        .str.split()
+    )
+    offsets = np.concatenate(
+        [np.cumsum([0] + [int(delta) for delta in deltas]) for deltas in time_deltas]
+    )
+    start_times = to_datetime(
+        trajectories_df[CompactTrajectoryField.START_TIME.value]
+    ).to_numpy()
+    return DataFrame(
+        {
+            TrajectoryField.TRIP_ID.value: trajectories_df[
+                CompactTrajectoryField.TRIP_ID.value
+            ].to_numpy()[trip_codes],
+            TrajectoryField.DEVICE_TIME.value: start_times[trip_codes]
+            + to_timedelta(offsets, unit="s").to_numpy(),
+            TrajectoryField.LATITUDE.value: coordinates[:, 1],
+            TrajectoryField.LONGITUDE.value: coordinates[:, 0],
+        }
+    )
+
+
+def simplify_mask(
+    x: "ndarray",
+    y: "ndarray",
+    seconds: "ndarray",
+    trip_starts: "ndarray",
+    tolerance_m: float,
+    method: Union[str, SimplifyMethod] = SimplifyMethod.DOUGLAS_PEUCKER,
+) -> "ndarray":
+    """
+    Find the pings to keep when simplifying every trip, all trips at once.
+
+    Parameters:
+        x (ndarray): Projected x coordinates of the pings, ordered by trip and time.
+        y (ndarray): Projected y coordinates of the pings.
+        seconds (ndarray): Times of the pings in seconds.
+        trip_starts (ndarray): Position of the first ping of every trip.
+        tolerance_m (float): Largest distance of a dropped ping.
+        method (Union[str, SimplifyMethod]): Either 'douglas-peucker' or 'time-aware'.
+
+    Returns:
+        ndarray: Whether each ping is kept.
+    """
+    method = SimplifyMethod(method)
+    keep = np.zeros(len(x), dtype=bool)
+    if len(x) == 0:
+        return keep
+    starts = np.asarray(trip_starts, dtype=np.int64)
+    ends = np.r_[starts[1:], len(x)] - 1
+    keep[starts] = True
+    keep[ends] = True
+
+    # Every round measures the inner pings of all the open segments, and splits the segments
+    # at their farthest ping when it is out of tolerance
+    while True:
+        is_open = ends - starts >= 2
+        starts, ends = starts[is_open], ends[is_open]
+        if len(starts) == 0:
+            return keep
+        inner_counts = ends - starts - 1
+        offsets = np.cumsum(inner_counts) - inner_counts
+        segment = np.repeat(np.arange(len(starts)), inner_counts)
+        pings = np.arange(inner_counts.sum()) - offsets[segment] + starts[segment] + 1
+        first, last = starts[segment], ends[segment]
+
+        if method == SimplifyMethod.TIME_AWARE:
+            distances = _synchronized_distance(x, y, seconds, pings, first, last)
+        else:
+            distances = _segment_distance(x, y, pings, first, last)
+
+        max_distances = np.maximum.reduceat(distances, offsets)
+        farthest = np.flatnonzero(distances == max_distances[segment])
+        segments_found, first_found = np.unique(segment[farthest], return_index=True)
+        split_at = np.empty(len(starts), dtype=np.int64)
+        split_at[segments_found] = pings[farthest[first_found]]
+
+        is_split = max_distances > tolerance_m
+        keep[split_at[is_split]] = True
+        starts = np.concatenate([starts[is_split], split_at[is_split]])
+        ends = np.concatenate([split_at[is_split], ends[is_split]])
+
+
+def _segment_distance(
+    x: "ndarray", y: "ndarray", pings: "ndarray", first: "ndarray", last: "ndarray"
+) -> "ndarray":
+    segment_x = x[last] - x[first]
+    segment_y = y[last] - y[first]
+    squared_length = segment_x**2 + segment_y**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = (
+            (x[pings] - x[first]) * segment_x + (y[pings] - y[first]) * segment_y
+        ) / squared_length
+    ratio = np.clip(np.nan_to_num(ratio), 0, 1)
+    return np.hypot(
+        x[pings] - (x[first] + ratio * segment_x),
+        y[pings] - (y[first] + ratio * segment_y),
+    )
+
+
+def _synchronized_distance(
+    x: "ndarray",
+    y: "ndarray",
+    seconds: "ndarray",
+    pings: "ndarray",
+    first: "ndarray",
+    last: "ndarray",
+) -> "ndarray":
+    duration = seconds[last] - seconds[first]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = (seconds[pings] - seconds[first]) / duration
+    ratio = np.nan_to_num(ratio)
+    return np.hypot(
+        x[pings] - (x[first] + ratio * (x[last] - x[first])),
+        y[pings] - (y[first] + ratio * (y[last] - y[first])),
+    )
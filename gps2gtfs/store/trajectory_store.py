@@ -0,0 +1,424 @@
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, time
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+from pandas import DataFrame, Timestamp, concat, to_datetime, to_timedelta
+from gps2gtfs.data_field.im_field import TrajectoryField
+from gps2gtfs.data_field.input_field import RawGPSField, StopField
+from gps2gtfs.utility.data_io_converter import (
+    GEO_CRS,
+    FileFormat,
+    geo_to_pandas_data_frame,
+    pandas_to_geo_data_frame,
+    read_file,
+    write_file,
+)
+from gps2gtfs.utility.logger import logger
+
+STORE_INDEX_FILE_NAME = "_index.json"
+DEFAULT_CELL_SIZE_M = 1000
+SECONDS_PER_DAY = 86_400
+
+_X = "x"
+_Y = "y"
+_DAY = "day"
+_CELL_X = "cell_x"
+_CELL_Y = "cell_y"
+_TIME_OF_DAY_S = "time_of_day_s"
+
+
+class TrajectoryStore:
+    """
+    On-disk store of trip-annotated trajectories, partitioned by date and spatial grid cell.
+
+    Every record is written in the partition of its service date and of the square cell of
+    `cell_size_m` meters that holds it, in the projected coordinate system of the pipeline.
+    The store keeps an index of its partitions with their number of rows and the min/max of
+    their projected coordinates, device times, times of day and trip IDs. A query reads only
+    the partitions whose statistics can hold matching records.
+
+    The trip & stop pipeline writes its trajectories in a store with `trajectory_store_dir`.
+    The first time a store object writes a date, the partitions already stored for that date
+    are replaced, so running the pipeline on the same dates again does not duplicate records.
+
+    Parameters:
+        store_dir (str): Directory of the store. It is created on the first write.
+        cell_size_m (float): Side of the grid cells in meters. Default is 1000. An existing
+                             store keeps the cell size it was created with.
+        file_format (Union[str, FileFormat]): Format of the partition files, either 'csv' or
+                                              'parquet'. Default is 'csv'. An existing store
+                                              keeps the format it was created with.
+
+    Example:
+        >>> store = TrajectoryStore("store/route_654")
+        >>> pings = store.query_stop(stops_df, "ST-1203", 50, start="2024-01-01",
+        ...                          end="2024-02-01", start_time="07:00", end_time="09:00")
+    """
+
+    def __init__(
+        self,
+        store_dir: str,
+        cell_size_m: float = DEFAULT_CELL_SIZE_M,
+        file_format: Union[str, FileFormat] = FileFormat.CSV,
+    ) -> None:
+        self.store_dir = store_dir
+        self.cell_size_m = cell_size_m
+        self.file_format = FileFormat(file_format)
+        self.partitions: List[Dict[str, Any]] = []
+        self._written_dates: set = set()
+        self._lock = threading.Lock()
+
+        index_path = os.path.join(store_dir, STORE_INDEX_FILE_NAME)
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as index_file:
+                index = json.load(index_file)
+            self.cell_size_m = index["cell_size_m"]
+            self.file_format = FileFormat(index["file_format"])
+            self.partitions = index["partitions"]
+
+    def __len__(self) -> int:
+        return sum(partition["rows"] for partition in self.partitions)
+
+    @property
+    def dates(self) -> List[str]:
+        return sorted({partition["date"] for partition in self.partitions})
+
+    def write(self, trajectory_df: DataFrame, trip_id_offset: int = 0) -> int:
+        """
+        Write trajectory records in the partitions of their date and grid cell.
+
+        Parameters:
+            trajectory_df (DataFrame): Trajectory records, as made by `prepare_trajectory_df`.
+            trip_id_offset (int): Offset added to the trip IDs, so that they match the trips
+                                  output of a partitioned run. Default is 0.
+
+        Returns:
+            int: The number of records written.
+        """
+        if len(trajectory_df) == 0:
+            return 0
+        records_df = _with_projected_coordinates(trajectory_df)
+        if trip_id_offset:
+            records_df[TrajectoryField.TRIP_ID.value] += trip_id_offset
+        device_times = to_datetime(records_df[TrajectoryField.DEVICE_TIME.value])
+        days = device_times.dt.normalize()
+        records_df[_DAY] = days.dt.strftime("%Y-%m-%d")
+        records_df[_TIME_OF_DAY_S] = (device_times - days).dt.total_seconds()
+        records_df[_CELL_X] = np.floor(records_df[_X] / self.cell_size_m).astype(
+            "int64"
+        )
+        records_df[_CELL_Y] = np.floor(records_df[_Y] / self.cell_size_m).astype(
+            "int64"
+        )
+
+        with self._lock:
+            for date in records_df[_DAY].unique():
+                if date not in self._written_dates:
+                    self._remove_date(date)
+                    self._written_dates.add(date)
+
+            for (date, cell_x, cell_y), partition_df in records_df.groupby(
+                [_DAY, _CELL_X, _CELL_Y], sort=False
+            ):
+                self._write_partition(date, cell_x, cell_y, partition_df)
+            self._write_index()
+
+        logger.info(f"Stored {len(records_df)} trajectory records in {self.store_dir}")
+        return len(records_df)
+
+    def query(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_m: float,
+        start: Optional[Union[str, datetime]] = None,
+        end: Optional[Union[str, datetime]] = None,
+        start_time: Optional[Union[str, time]] = None,
+        end_time: Optional[Union[str, time]] = None,
+    ) -> DataFrame:
+        """
+        Find the stored records within a distance of a point and a time window.
+
+        Parameters:
+            latitude (float): Latitude of the center of the area.
+            longitude (float): Longitude of the center of the area.
+            radius_m (float): Radius of the area in meters.
+            start (Union[str, datetime], optional): Earliest device time, included. Default is
+                                                    None, for no lower bound.
+            end (Union[str, datetime], optional): Latest device time, excluded. Default is
+                                                  None, for no upper bound.
+            start_time (Union[str, time], optional): Earliest time of day, e.g. '07:00',
+                                                     included. Default is None.
+            end_time (Union[str, time], optional): Latest time of day, excluded. Default is
+                                                   None. A window ending before it starts
+                                                   wraps around midnight.
+
+        Returns:
+            DataFrame: The matching records, with their distance to the center in meters,
+                       sorted by device and device time.
+        """
+        from geopandas import points_from_xy
+
+        center = points_from_xy([longitude], [latitude], crs="EPSG:4326").to_crs(
+            GEO_CRS
+        )[0]
+        start = None if start is None else Timestamp(start)
+        end = None if end is None else Timestamp(end)
+        start_s = None if start_time is None else _seconds_of_day(start_time)
+        end_s = None if end_time is None else _seconds_of_day(end_time)
+
+        partitions = self.select_partitions(
+            center.x - radius_m,
+            center.x + radius_m,
+            center.y - radius_m,
+            center.y + radius_m,
+            start,
+            end,
+            start_s,
+            end_s,
+        )
+        columns = [f.value for f in TrajectoryField] + ["distance_m"]
+        partition_dfs = [
+            partition_df
+            for partition_df in (
+                read_file(
+                    os.path.join(self.store_dir, partition["path"]),
+                    "Trajectory partition",
+                    self.file_format,
+                )
+                for partition in partitions
+            )
+            if partition_df is not None
+        ]
+        if not partition_dfs:
+            return DataFrame(columns=columns)
+
+        records_df = concat(partition_dfs, ignore_index=True)
+        device_times = to_datetime(records_df[TrajectoryField.DEVICE_TIME.value])
+        records_df[TrajectoryField.DEVICE_TIME.value] = device_times
+        distances = pandas_to_geo_data_frame(records_df).distance(center)
+        records_df["distance_m"] = distances.to_numpy()
+
+        keep = records_df["distance_m"].to_numpy() <= radius_m
+        if start is not None:
+            keep &= (device_times >= start).to_numpy()
+        if end is not None:
+            keep &= (device_times < end).to_numpy()
+        if start_s is not None or end_s is not None:
+            keep &= _in_time_window(
+                (device_times - device_times.dt.normalize()).dt.total_seconds(),
+                start_s,
+                end_s,
+            )
+        logger.info(
+            f"Read {len(partition_dfs)} of {len(self.partitions)} trajectory partitions"
+        )
+        return (
+            records_df[keep]
+            .sort_values(
+                [TrajectoryField.DEVICE_ID.value, TrajectoryField.DEVICE_TIME.value],
+                kind="stable",
+            )
+            .reset_index(drop=True)
+        )
+
+    def query_stop(
+        self,
+        stops_df: DataFrame,
+        stop_id: Any,
+        radius_m: float,
+        start: Optional[Union[str, datetime]] = None,
+        end: Optional[Union[str, datetime]] = None,
+        start_time: Optional[Union[str, time]] = None,
+        end_time: Optional[Union[str, time]] = None,
+    ) -> DataFrame:
+        """
+        Find the stored records near a stop in a time window, as `query` does for a point.
+
+        Parameters:
+            stops_df (DataFrame): Stops data, with the 'stop_id', 'latitude' and 'longitude'
+                                  columns.
+            stop_id (Any): ID of the stop. The records near every stop with this ID, e.g. on
+                           both sides of the road, are returned.
+            radius_m, start, end, start_time, end_time: See `query`.
+
+        Returns:
+            DataFrame: The matching records with the ID of the stop and their distance to it.
+        """
+        stops = stops_df[stops_df[StopField.STOP_ID.value].astype(str) == str(stop_id)]
+        if len(stops) == 0:
+            logger.error(f"Stop {stop_id} is not in the stops data")
+        records_dfs = []
+        for _, stop in stops.iterrows():
+            records_df = self.query(
+                stop[RawGPSField.LATITUDE.value],
+                stop[RawGPSField.LONGITUDE.value],
+                radius_m,
+                start,
+                end,
+                start_time,
+                end_time,
+            )
+            records_df.insert(0, StopField.STOP_ID.value, stop_id)
+            records_dfs.append(records_df)
+        if not records_dfs:
+            return DataFrame(
+                columns=[StopField.STOP_ID.value]
+                + [f.value for f in TrajectoryField]
+                + ["distance_m"]
+            )
+        return concat(records_dfs, ignore_index=True).drop_duplicates(
+            subset=[TrajectoryField.ID.value, TrajectoryField.DEVICE_TIME.value]
+        )
+
+    def select_partitions(
+        self,
+        min_x: float,
+        max_x: float,
+        min_y: float,
+        max_y: float,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+        start_s: Optional[float] = None,
+        end_s: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Select the partitions whose statistics overlap a box of projected coordinates and a
+        time window.
+        """
+        selected = []
+        for partition in self.partitions:
+            if (
+                partition["max_x"] < min_x
+                or partition["min_x"] > max_x
+                or partition["max_y"] < min_y
+                or partition["min_y"] > max_y
+            ):
+                continue
+            if start is not None and Timestamp(partition["max_time"]) < start:
+                continue
+            if end is not None and Timestamp(partition["min_time"]) >= end:
+                continue
+            if (start_s is not None or end_s is not None) and not _overlaps_time_window(
+                partition["min_time_of_day_s"],
+                partition["max_time_of_day_s"],
+                start_s,
+                end_s,
+            ):
+                continue
+            selected.append(partition)
+        return selected
+
+    def _write_partition(
+        self, date: str, cell_x: int, cell_y: int, partition_df: DataFrame
+    ) -> None:
+        cell_dir = os.path.join(f"date={date}", f"cell={cell_x}_{cell_y}")
+        os.makedirs(os.path.join(self.store_dir, cell_dir), exist_ok=True)
+        part_index = sum(
+            1
+            for partition in self.partitions
+            if partition["date"] == date
+            and partition["cell"] == [int(cell_x), int(cell_y)]
+        )
+        path = os.path.join(cell_dir, f"part-{part_index:05d}.{self.file_format.value}")
+        write_file(
+            partition_df.drop(columns=[_X, _Y, _DAY, _CELL_X, _CELL_Y, _TIME_OF_DAY_S]),
+            os.path.join(self.store_dir, path),
+            self.file_format,
+        )
+
+        device_times = to_datetime(partition_df[TrajectoryField.DEVICE_TIME.value])
+        trip_ids = partition_df[TrajectoryField.TRIP_ID.value]
+        self.partitions.append(
+            {
+                "path": path,
+                "date": date,
+                "cell": [int(cell_x), int(cell_y)],
+                "rows": len(partition_df),
+                "min_x": float(partition_df[_X].min()),
+                "max_x": float(partition_df[_X].max()),
+                "min_y": float(partition_df[_Y].min()),
+                "max_y": float(partition_df[_Y].max()),
+                "min_time": device_times.min().isoformat(),
+                "max_time": device_times.max().isoformat(),
+                "min_time_of_day_s": float(partition_df[_TIME_OF_DAY_S].min()),
+                "max_time_of_day_s": float(partition_df[_TIME_OF_DAY_S].max()),
+                "min_trip_id": int(trip_ids.min()),
+                "max_trip_id": int(trip_ids.max()),
+            }
+        )
+
+    def _remove_date(self, date: str) -> None:
+        date_dir = os.path.join(self.store_dir, f"date={date}")
+        if os.path.isdir(date_dir):
+            shutil.rmtree(date_dir)
+        self.partitions = [
+            partition for partition in self.partitions if partition["date"] != date
+        ]
+
+    def _write_index(self) -> None:
+        os.makedirs(self.store_dir, exist_ok=True)
+        index_path = os.path.join(self.store_dir, STORE_INDEX_FILE_NAME)
+        # Write and rename, so that queries never read a partial index
+        temporary_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as index_file:
+            json.dump(
+                {
+                    "cell_size_m": self.cell_size_m,
+                    "file_format": self.file_format.value,
+                    "crs": GEO_CRS,
+                    "partitions": self.partitions,
+                },
+                index_file,
+                indent=1,
+            )
+        os.replace(temporary_path, index_path)
+
+    def __repr__(self) -> str:
+        return (
+            f"TrajectoryStore({self.store_dir!r}, dates={len(self.dates)}, "
+            f"partitions={len(self.partitions)}, rows={len(self)})"
+        )
+
+
+def _with_projected_coordinates(trajectory_df: DataFrame) -> DataFrame:
+    # The trajectories of the pipeline already hold their projected points
+    if getattr(trajectory_df, "crs", None) != GEO_CRS:
+        trajectory_df = pandas_to_geo_data_frame(trajectory_df)
+    records_df = geo_to_pandas_data_frame(trajectory_df)
+    records_df[_X] = trajectory_df.geometry.x.to_numpy()
+    records_df[_Y] = trajectory_df.geometry.y.to_numpy()
+    return records_df
+
+
+def _seconds_of_day(time_of_day: Union[str, time]) -> float:
+    if isinstance(time_of_day, time):
+        time_of_day = time_of_day.isoformat()
+    if time_of_day.count(":") == 1:
+        time_of_day += ":00"
+    return to_timedelta(time_of_day).total_seconds()
+
+
+def _in_time_window(
+    seconds: Any, start_s: Optional[float], end_s: Optional[float]
+) -> np.ndarray:
+    seconds = np.asarray(seconds)
+    start_s = 0.0 if start_s is None else start_s
+    end_s = float(SECONDS_PER_DAY) if end_s is None else end_s
+    if start_s <= end_s:
+        return (seconds >= start_s) & (seconds < end_s)
+    return (seconds >= start_s) | (seconds < end_s)
+
+
+def _overlaps_time_window(
+    min_s: float, max_s: float, start_s: Optional[float], end_s: Optional[float]
+) -> bool:
+    start_s = 0.0 if start_s is None else start_s
+    end_s = float(SECONDS_PER_DAY) if end_s is None else end_s
+    if start_s <= end_s:
+        return max_s >= start_s and min_s < end_s
+    return max_s >= start_s or min_s < end_s
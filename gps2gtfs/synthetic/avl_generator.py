@@ -0,0 +1,511 @@
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from gps2gtfs.data_field.input_field import RawGPSField, StopField, TerminalField
+from gps2gtfs.data_field.output_field import StopTimeField, TripField
+from gps2gtfs.load_data.load_from_csv import load
+from gps2gtfs.utility.data_io_converter import (
+    METERS_PER_DEGREE,
+    FileFormat,
+    haversine_m,
+    output_file_path,
+    write_partition,
+)
+from gps2gtfs.utility.logger import logger
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+RAW_GPS_FILE_NAME = "raw_gps"
+TRIPS_GROUND_TRUTH_FILE_NAME = "trips_ground_truth"
+STOPS_GROUND_TRUTH_FILE_NAME = "stops_ground_truth"
+
+SECONDS_PER_DAY = 86_400
+
+
+def generate_avl_data(
+    trip_terminals_data_path: str,
+    stops_data_path: str,
+    output_dir: str,
+    num_buses: int = 10,
+    num_days: int = 7,
+    start_date: str = "2022-07-01",
+    trips_per_day: int = 8,
+    ping_interval_s: float = 15,
+    gps_noise_m: float = 5.0,
+    speed_range_kmh: Tuple[float, float] = (20, 40),
+    dwell_time_range_s: Tuple[float, float] = (10, 60),
+    layover_time_range_s: Tuple[float, float] = (300, 900),
+    signal_gaps_per_day: float = 2.0,
+    signal_gap_range_s: Tuple[float, float] = (60, 600),
+    output_format: Union[str, FileFormat] = FileFormat.CSV,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    seed: int = 0,
+) -> Optional[Dict[str, str]]:
+    """
+    Generate synthetic AVL (raw GPS) data of buses running trips along a route.
+
+    Every bus runs `trips_per_day` trips a day between the two terminals, alternating the
+    direction. It waits for a layover at the terminals, drives every segment between consecutive
+    stops at a random speed and dwells at every stop. The position is reported every
+    `ping_interval_s` seconds with GPS noise, except during random signal gaps.
+
+    The data is generated one day at a time and written in chunks of at most `chunk_rows` rows,
+    so the whole dataset is never held in memory. The exact trips and stop times of the
+    simulation are written next to it as ground truth, in the same format as the outputs of the
+    trip & stop pipeline, to measure the accuracy of the pipeline.
+
+    Parameters:
+        trip_terminals_data_path (str): File path to the CSV file containing the two trip
+                                        terminals.
+        stops_data_path (str): File path to the CSV file containing the stops of both
+                               directions, listed in travel order.
+        output_dir (str): Directory where the raw GPS data and the ground truth are written.
+        num_buses (int): Number of buses. Default is 10.
+        num_days (int): Number of consecutive service days. Default is 7.
+        start_date (str): First service date (YYYY-MM-DD). Default is '2022-07-01'.
+        trips_per_day (int): Number of trips each bus runs a day. Default is 8.
+        ping_interval_s (float): Seconds between two GPS pings. Default is 15.
+        gps_noise_m (float): Standard deviation of the GPS noise in meters. Default is 5.
+        speed_range_kmh (Tuple[float, float]): Range of the speed between two stops in km/h.
+                                               Default is (20, 40).
+        dwell_time_range_s (Tuple[float, float]): Range of the dwell time at a stop in seconds.
+                                                  Default is (10, 60).
+        layover_time_range_s (Tuple[float, float]): Range of the layover at a terminal in
+                                                    seconds. Default is (300, 900).
+        signal_gaps_per_day (float): Average number of signal gaps per bus and day. Default
+                                     is 2.
+        signal_gap_range_s (Tuple[float, float]): Range of the length of a signal gap in
+                                                  seconds. Default is (60, 600).
+        output_format (Union[str, FileFormat]): Either 'csv' or 'parquet'. Default is 'csv'.
+        chunk_rows (int): Maximum number of raw GPS rows written at once. Default is 1,000,000.
+        seed (int): Seed of the random generator. The same seed gives the same data. Default
+                    is 0.
+
+    Returns:
+        Optional[Dict[str, str]]: The paths of the 'raw_gps', 'trips' and 'stops' outputs. None
+                                  is returned if the terminals or stops cannot be loaded.
+
+    Notes:
+        - The ground truth times are the moments the bus leaves or reaches the terminal or stop
+          itself. The pipeline detects them from the pings inside the buffers, so its times
+          differ by up to the buffer radius divided by the speed, plus the ping interval.
+        - The raw GPS rows of a day are ordered by device and device time. The 'id' values
+          increase with the device, the date and the time, like in an export sorted by device,
+          but they are not consecutive. The trajectory preparation of the stop pipeline relies
+          on this order to assign the points between the terminals to a trip.
+        - Buses start at 05:00, the trips of a day should end before midnight.
+
+    Example:
+        >>> paths = generate_avl_data(
+        ...     "bus_terminals_654.csv", "bus_stops_654.csv", "synthetic/", num_buses=100
+        ... )
+        >>> paths["raw_gps"]
+        'synthetic/raw_gps.csv'
+    """
+    trip_terminals_df, stops_df = load(
+        {"Trip Terminals data": trip_terminals_data_path, "Stops data": stops_data_path}
+    )
+    if trip_terminals_df is None or stops_df is None:
+        logger.error("Failed to load data for the synthetic AVL generator")
+        return None
+
+    routes = build_routes(trip_terminals_df, stops_df)
+    if len(routes) != 2:
+        logger.error(
+            "The stops data should contain the stops of exactly two directions"
+        )
+        return None
+
+    paths = {
+        "raw_gps": output_file_path(output_dir, RAW_GPS_FILE_NAME, output_format),
+        "trips": output_file_path(
+            output_dir, TRIPS_GROUND_TRUTH_FILE_NAME, output_format
+        ),
+        "stops": output_file_path(
+            output_dir, STOPS_GROUND_TRUTH_FILE_NAME, output_format
+        ),
+    }
+
+    logger.info(
+        f"Generating synthetic AVL data of {num_buses} buses over {num_days} days"
+    )
+    raw_gps_part = 0
+    num_rows = 0
+    for day_index, (raw_gps_df, trips_df, stop_times_df) in enumerate(
+        iter_simulated_days(
+            routes,
+            num_buses,
+            num_days,
+            start_date,
+            trips_per_day,
+            ping_interval_s,
+            gps_noise_m,
+            speed_range_kmh,
+            dwell_time_range_s,
+            layover_time_range_s,
+            signal_gaps_per_day,
+            signal_gap_range_s,
+            seed,
+        )
+    ):
+        num_rows += len(raw_gps_df)
+        for start in range(0, len(raw_gps_df), chunk_rows):
+            write_partition(
+                raw_gps_df.iloc[start : start + chunk_rows],
+                paths["raw_gps"],
+                raw_gps_part,
+                output_format,
+            )
+            raw_gps_part += 1
+        write_partition(trips_df, paths["trips"], day_index, output_format)
+        write_partition(stop_times_df, paths["stops"], day_index, output_format)
+
+    logger.info(f"Successfully generated {num_rows} rows of synthetic AVL data")
+    return paths
+
+
+def iter_simulated_days(
+    routes: List[Dict],
+    num_buses: int = 10,
+    num_days: int = 7,
+    start_date: str = "2022-07-01",
+    trips_per_day: int = 8,
+    ping_interval_s: float = 15,
+    gps_noise_m: float = 5.0,
+    speed_range_kmh: Tuple[float, float] = (20, 40),
+    dwell_time_range_s: Tuple[float, float] = (10, 60),
+    layover_time_range_s: Tuple[float, float] = (300, 900),
+    signal_gaps_per_day: float = 2.0,
+    signal_gap_range_s: Tuple[float, float] = (60, 600),
+    seed: int = 0,
+) -> Iterator[Tuple["DataFrame", "DataFrame", "DataFrame"]]:
+    """
+    Simulate the buses day by day, see `generate_avl_data` for the parameters.
+
+    Parameters:
+        routes (List[Dict]): The two directions of the route, as built by `build_routes`.
+
+    Yields:
+        Tuple[DataFrame, DataFrame, DataFrame]: The raw GPS data, the ground truth trips and the
+                                                ground truth stop times of a day.
+    """
+    from pandas import DataFrame, concat
+
+    rng = np.random.default_rng(seed)
+    first_date = datetime.strptime(start_date, "%Y-%m-%d").date()
+
+    # Spread the first departures of the buses over one round trip
+    round_trip_s = sum(
+        route["distances_m"].sum() / (np.mean(speed_range_kmh) / 3.6)
+        + (len(route["stop_ids"]) * np.mean(dwell_time_range_s))
+        + np.mean(layover_time_range_s)
+        for route in routes
+    )
+    # Ids are spaced so that they increase with the device first, then the date and the time
+    ids_per_day = 2 * int(np.ceil(SECONDS_PER_DAY / ping_interval_s))
+    trip_id = 0
+    for day in range(num_days):
+        service_date = first_date + timedelta(days=day)
+        day_start = datetime.combine(service_date, datetime.min.time()) + timedelta(
+            hours=5
+        )
+        raw_gps_dfs: List[DataFrame] = []
+        trip_rows: List[List] = []
+        stop_time_rows: List[List] = []
+        for bus in range(num_buses):
+            first_departure_s = bus * round_trip_s / max(1, num_buses)
+            pings, trips = simulate_bus_day(
+                routes,
+                first_direction=bus % 2,
+                first_departure_s=first_departure_s,
+                trips_per_day=trips_per_day,
+                ping_interval_s=ping_interval_s,
+                gps_noise_m=gps_noise_m,
+                speed_range_kmh=speed_range_kmh,
+                dwell_time_range_s=dwell_time_range_s,
+                layover_time_range_s=layover_time_range_s,
+                signal_gaps_per_day=signal_gaps_per_day,
+                signal_gap_range_s=signal_gap_range_s,
+                rng=rng,
+            )
+            device_id = bus + 1
+            first_id = (bus * num_days + day) * ids_per_day + 1
+            device_times = np.datetime64(day_start, "s") + pings["time_s"].astype(
+                "timedelta64[s]"
+            )
+            raw_gps_dfs.append(
+                DataFrame(
+                    {
+                        RawGPSField.ID.value: first_id + np.arange(len(device_times)),
+                        RawGPSField.DEVICE_ID.value: device_id,
+                        RawGPSField.LATITUDE.value: pings["latitude"],
+                        RawGPSField.LONGITUDE.value: pings["longitude"],
+                        RawGPSField.DEVICE_TIME.value: device_times,
+                        RawGPSField.SPEED.value: pings["speed"],
+                    }
+                )
+            )
+            for direction, start_s, end_s, visits in trips:
+                trip_id += 1
+                route = routes[direction]
+                trip_rows.append(
+                    [
+                        trip_id,
+                        device_id,
+                        service_date,
+                        route["start_terminal"],
+                        route["end_terminal"],
+                        direction + 1,
+                        _time_of_day(day_start, start_s),
+                        _time_of_day(day_start, end_s),
+                    ]
+                )
+                for stop_id, arrival_s, departure_s in visits:
+                    stop_time_rows.append(
+                        [
+                            trip_id,
+                            device_id,
+                            service_date,
+                            direction + 1,
+                            stop_id,
+                            _time_of_day(day_start, arrival_s),
+                            _time_of_day(day_start, departure_s),
+                        ]
+                    )
+
+        yield (
+            concat(raw_gps_dfs, ignore_index=True),
+            _trips_ground_truth(trip_rows),
+            _stops_ground_truth(stop_time_rows),
+        )
+
+
+def build_routes(trip_terminals_df: "DataFrame", stops_df: "DataFrame") -> List[Dict]:
+    """
+    Build the two directions of the route from the terminals and the stops.
+
+    The stops of a direction are taken in the order they are listed. A direction starts at the
+    terminal nearest to its first stop and ends at the terminal nearest to its last stop.
+
+    Parameters:
+        trip_terminals_df (DataFrame): The trip terminals with 'terminal_id', 'latitude' and
+                                       'longitude'.
+        stops_df (DataFrame): The stops with 'stop_id', 'direction', 'latitude' and
+                              'longitude'.
+
+    Returns:
+        List[Dict]: One route per direction, in the order of the directions in the stops data,
+                    with its terminals, stop ids, waypoints and segment lengths in meters.
+    """
+    terminal_points = trip_terminals_df[["latitude", "longitude"]].to_numpy(dtype=float)
+    terminal_ids = trip_terminals_df[TerminalField.TERMINAL_ID.value].tolist()
+
+    directions = [
+        d
+        for d in stops_df[StopField.DIRECTION.value].unique().tolist()
+        if not str(d).isdigit()
+    ]
+    routes = []
+    for direction in directions[:2]:
+        direction_stops = stops_df[stops_df[StopField.DIRECTION.value] == direction]
+        stop_points = direction_stops[["latitude", "longitude"]].to_numpy(dtype=float)
+        start = _nearest(terminal_points, stop_points[0])
+        end = _nearest(terminal_points, stop_points[-1])
+        waypoints = np.vstack(
+            [terminal_points[start], stop_points, terminal_points[end]]
+        )
+        routes.append(
+            {
+                "start_terminal": terminal_ids[start],
+                "end_terminal": terminal_ids[end],
+                "stop_ids": direction_stops[StopField.STOP_ID.value].tolist(),
+                "waypoints": waypoints,
+                "distances_m": haversine_m(
+                    waypoints[:-1, 0],
+                    waypoints[:-1, 1],
+                    waypoints[1:, 0],
+                    waypoints[1:, 1],
+                ),
+            }
+        )
+    return routes
+
+
+def simulate_bus_day(
+    routes: List[Dict],
+    first_direction: int,
+    first_departure_s: float,
+    trips_per_day: int,
+    ping_interval_s: float,
+    gps_noise_m: float,
+    speed_range_kmh: Tuple[float, float],
+    dwell_time_range_s: Tuple[float, float],
+    layover_time_range_s: Tuple[float, float],
+    signal_gaps_per_day: float,
+    signal_gap_range_s: Tuple[float, float],
+    rng: np.random.Generator,
+) -> Tuple[Dict[str, np.ndarray], List[Tuple]]:
+    """
+    Simulate one bus for one day.
+
+    The movement is described by knots: the bus is at the position of a knot at its time, and
+    moves in a straight line at constant speed to the next knot. Waiting is a pair of knots at
+    the same position. The pings are sampled from the knots in one vectorized pass.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], List[Tuple]]: The pings ('time_s', 'latitude',
+        'longitude' and 'speed', with times in seconds since the start of the day), and the
+        trips as (direction index, departure, arrival, [(stop id, arrival, departure), ...]).
+    """
+    knot_times: List[float] = [first_departure_s]
+    knot_points: List[np.ndarray] = [routes[first_direction]["waypoints"][0]]
+    knot_speeds: List[float] = []
+    trips = []
+
+    def move_to(point: np.ndarray, duration_s: float, speed_kmh: float) -> None:
+        knot_speeds.append(speed_kmh)
+        knot_times.append(knot_times[-1] + duration_s)
+        knot_points.append(point)
+
+    for trip in range(trips_per_day):
+        direction = (first_direction + trip) % len(routes)
+        route = routes[direction]
+        waypoints = route["waypoints"]
+
+        move_to(waypoints[0], rng.uniform(*layover_time_range_s), 0)
+        departure_s = knot_times[-1]
+        speeds_kmh = rng.uniform(*speed_range_kmh, len(route["distances_m"]))
+        dwell_times_s = rng.uniform(*dwell_time_range_s, len(route["stop_ids"]))
+        visits = []
+        for segment, distance_m in enumerate(route["distances_m"]):
+            move_to(
+                waypoints[segment + 1],
+                distance_m / (speeds_kmh[segment] / 3.6),
+                speeds_kmh[segment],
+            )
+            if segment < len(route["stop_ids"]):
+                arrival_s = knot_times[-1]
+                move_to(waypoints[segment + 1], dwell_times_s[segment], 0)
+                visits.append((route["stop_ids"][segment], arrival_s, knot_times[-1]))
+        trips.append((direction, departure_s, knot_times[-1], visits))
+    move_to(knot_points[-1], rng.uniform(*layover_time_range_s), 0)
+
+    times = np.array(knot_times)
+    points = np.vstack(knot_points)
+    speeds = np.array(knot_speeds)
+
+    ping_times = np.arange(
+        times[0] + rng.uniform(0, ping_interval_s), times[-1], ping_interval_s
+    )
+    for _ in range(rng.poisson(signal_gaps_per_day)):
+        gap_start = rng.uniform(times[0], times[-1])
+        gap_end = gap_start + rng.uniform(*signal_gap_range_s)
+        ping_times = ping_times[(ping_times < gap_start) | (ping_times >= gap_end)]
+
+    segment = np.clip(
+        np.searchsorted(times, ping_times, side="right") - 1, 0, len(speeds) - 1
+    )
+    speed = speeds[segment]
+    moving = speed > 0
+    latitude = np.interp(ping_times, times, points[:, 0])
+    longitude = np.interp(ping_times, times, points[:, 1])
+    noise_deg = rng.normal(0, gps_noise_m, (2, len(ping_times))) / METERS_PER_DEGREE
+    latitude += noise_deg[0]
+    longitude += noise_deg[1] / np.cos(np.radians(latitude))
+    reported_speed = np.where(
+        moving, np.maximum(1, np.rint(speed + rng.normal(0, 2, len(speed)))), 0
+    ).astype(int)
+
+    pings = {
+        "time_s": np.floor(ping_times).astype("int64"),
+        "latitude": latitude,
+        "longitude": longitude,
+        "speed": reported_speed,
+    }
+    return pings, trips
+
+
+def _nearest(points: np.ndarray, point: np.ndarray) -> int:
+    return int(np.argmin(haversine_m(points[:, 0], points[:, 1], point[0], point[1])))
+
+
+def _time_of_day(day_start: datetime, seconds: float):  # noqa ANN202
+    return (day_start + timedelta(seconds=int(seconds))).time()
+
+
+def _duration(start_time, end_time) -> timedelta:  # noqa ANN001
+    return datetime.combine(date.min, end_time) - datetime.combine(date.min, start_time)
+
+
+def _trips_ground_truth(trip_rows: List[List]) -> "DataFrame":
+    from pandas import DataFrame, to_datetime
+
+    trips_df = DataFrame(
+        trip_rows,
+        columns=[
+            TripField.TRIP_ID.value,
+            TripField.DEVICE_ID.value,
+            TripField.DATE.value,
+            TripField.START_TERMINAL.value,
+            TripField.END_TERMINAL.value,
+            TripField.DIRECTION.value,
+            TripField.START_TIME.value,
+            TripField.END_TIME.value,
+        ],
+    )
+    trips_df[TripField.DURATION.value] = [
+        _duration(start, end)
+        for start, end in zip(
+            trips_df[TripField.START_TIME.value], trips_df[TripField.END_TIME.value]
+        )
+    ]
+    trips_df[TripField.DURATION_IN_MINS.value] = trips_df[
+        TripField.DURATION.value
+    ] / np.timedelta64(1, "m")
+    trips_df[TripField.DAY_OF_WEEK.value] = to_datetime(
+        trips_df[TripField.DATE.value]
+    ).dt.weekday
+    trips_df[TripField.HOUR_OF_DAY.value] = [
+        t.hour for t in trips_df[TripField.START_TIME.value]
+    ]
+    return trips_df
+
+
+def _stops_ground_truth(stop_time_rows: List[List]) -> "DataFrame":
+    from pandas import DataFrame, to_datetime
+
+    stop_times_df = DataFrame(
+        stop_time_rows,
+        columns=[
+            StopTimeField.TRIP_ID.value,
+            StopTimeField.DEVICE_ID.value,
+            StopTimeField.DATE.value,
+            StopTimeField.DIRECTION.value,
+            StopTimeField.BUS_STOP.value,
+            StopTimeField.ARRIVAL_TIME.value,
+            StopTimeField.DEPARTURE_TIME.value,
+        ],
+    )
+    stop_times_df[StopTimeField.DWELL_TIME.value] = [
+        _duration(arrival, departure)
+        for arrival, departure in zip(
+            stop_times_df[StopTimeField.ARRIVAL_TIME.value],
+            stop_times_df[StopTimeField.DEPARTURE_TIME.value],
+        )
+    ]
+    stop_times_df[StopTimeField.DWELL_TIME_IN_SECONDS.value] = stop_times_df[
+        StopTimeField.DWELL_TIME.value
+    ] / np.timedelta64(1, "s")
+    stop_times_df[StopTimeField.DAY_OF_WEEK.value] = to_datetime(
+        stop_times_df[StopTimeField.DATE.value]
+    ).dt.weekday
+    stop_times_df[StopTimeField.HOUR_OF_DAY.value] = [
+        t.hour for t in stop_times_df[StopTimeField.ARRIVAL_TIME.value]
+    ]
+    stop_times_df[StopTimeField.IS_WEEKDAY.value] = (
+        stop_times_df[StopTimeField.DAY_OF_WEEK.value] < 5
+    ).astype(int)
+    return stop_times_df
@@ -1,4 +1,9 @@
-from . import (  # noqa F401
-    feature_extractor,
-    trip_extractor,
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "feature_extractor",
+        "trip_extractor",
+    ],
 )
@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from typing import List
+from typing import List, Optional
 
 from numpy import ndarray, select, timedelta64
 from pandas import DataFrame, Series, to_datetime
@@ -7,14 +7,25 @@ from gps2gtfs.data_field.im_field import TerminalGPSField
 from gps2gtfs.data_field.output_field import TripField
 from gps2gtfs.utility.logger import logger
 
-
-def extract_trip_features(trips: DataFrame) -> DataFrame:
+# Trip columns that are computed, rather than taken from the terminal records
+DERIVED_TRIP_COLUMNS = [
+    TripField.DURATION.value,
+    TripField.DURATION_IN_MINS.value,
+    TripField.DAY_OF_WEEK.value,
+    TripField.HOUR_OF_DAY.value,
+]
+
+
+def extract_trip_features(
+    trips: DataFrame,
+    terminals: Optional[List[str]] = None,
+    columns: Optional[List[str]] = None,
+) -> DataFrame:
+    # Only the derived columns in `columns` are computed, and only `columns` are returned
     logger.info("Starting to extracting features for the trips")
-    trips = trips.copy()
-    add_end_time_and_end_terminal(trips)
-    trips = trips.iloc[::2]
-
-    trips = trips.drop(
+    # Every trip is a start record followed by an end record, only the start records are kept
+    terminal_records = trips
+    trips = trips.iloc[::2].drop(
         [
             TerminalGPSField.ID.value,
             TerminalGPSField.DEVICE_TIME.value,
@@ -27,6 +38,7 @@ def extract_trip_features(trips: DataFrame) -> DataFrame:
         ],
         axis=1,
     )
+    add_end_time_and_end_terminal(trips, terminal_records)
 
     trips.insert(0, TripField.TRIP_ID.value, trips.pop(TripField.TRIP_ID.value))
     trips.rename(
@@ -37,7 +49,7 @@ def extract_trip_features(trips: DataFrame) -> DataFrame:
         inplace=True,
     )
 
-    trips[TripField.DIRECTION.value] = find_direction(trips)
+    trips[TripField.DIRECTION.value] = find_direction(trips, terminals)
 
     trips = trips[
         [
@@ -53,34 +65,57 @@ def extract_trip_features(trips: DataFrame) -> DataFrame:
     ].reset_index(drop=True)
 
     # Calculating trip duration and adding it into the trips dataset
-    add_trip_duration(trips)
+    if columns is None or {
+        TripField.DURATION.value,
+        TripField.DURATION_IN_MINS.value,
+    } & set(columns):
+        add_trip_duration(trips)
+
+    if columns is None or TripField.DAY_OF_WEEK.value in columns:
+        trips[TripField.DAY_OF_WEEK.value] = find_day_of_week(trips)
+    if columns is None or TripField.HOUR_OF_DAY.value in columns:
+        trips[TripField.HOUR_OF_DAY.value] = find_hour_of_day(trips)
 
-    trips[TripField.DAY_OF_WEEK.value] = find_day_of_week(trips)
-    trips[TripField.HOUR_OF_DAY.value] = find_hour_of_day(trips)
+    if columns is not None:
+        trips = trips[[column for column in trips.columns if column in columns]]
 
     logger.info("Successfully extracted features for the trips")
     return trips
 
 
-def add_end_time_and_end_terminal(trips: DataFrame) -> None:
-    trips[[TripField.END_TIME.value, TripField.END_TERMINAL.value]] = trips[
+def add_end_time_and_end_terminal(
+    trips: DataFrame, terminal_records: DataFrame
+) -> None:
+    # The end of a trip is the record after its start, in the terminal records of all trips
+    trips[[TripField.END_TIME.value, TripField.END_TERMINAL.value]] = terminal_records[
         [TerminalGPSField.TIME.value, TerminalGPSField.BUS_STOP.value]
     ].shift(-1)
     logger.info("Added End Time & End Terminal Details")
 
 
-def find_direction(trips: DataFrame) -> ndarray:
+def find_direction(trips: DataFrame, terminals: Optional[List[str]] = None) -> ndarray:
     logger.info("Finding Direction data for the trips")
-    terminals: List[str] = trips[TripField.START_TERMINAL.value].unique().tolist()
+    # Direction 1 starts at the first terminal, unless the order is pinned by the caller
+    if terminals is None:
+        terminals = trips[TripField.START_TERMINAL.value].unique().tolist()
     conditions = [
-        (trips[TripField.START_TERMINAL.value] == terminals[0]),
-        (trips[TripField.START_TERMINAL.value] == terminals[1]),
+        (trips[TripField.START_TERMINAL.value] == terminal)
+        for terminal in terminals[:2]
     ]
-    values = [1, 2]
+    values = [1, 2][: len(conditions)]
 
     return select(conditions, values)
 
 
+def update_terminal_order(trips: DataFrame, terminals: List[str]) -> List[str]:
+    # Appends the start terminals of new trips, so that the direction of a terminal never
+    # changes when trips are extracted in several parts
+    for terminal in trips[TerminalGPSField.BUS_STOP.value].iloc[::2].unique():
+        if terminal not in terminals:
+            terminals.append(terminal)
+    return terminals
+
+
 def add_trip_duration(trips: DataFrame) -> None:
     trips[TripField.DURATION.value] = Series(dtype="object")
     for i in range(len(trips)):
@@ -1,16 +1,29 @@
-from multiprocessing import Pool, cpu_count
-from typing import Tuple
+from typing import TYPE_CHECKING, Optional, Tuple, Union
 
-from geopandas import GeoDataFrame
+import numpy as np
 from pandas import DataFrame, Series, concat
 from gps2gtfs.data_field.im_field import TerminalGPSField
 from gps2gtfs.data_field.input_field import TerminalField
+from gps2gtfs.reporting.progress import REPORT_EVERY_ROWS, report_rows
 from gps2gtfs.utility.data_io_converter import (
     extend_geo_buffer,
+    first_containing_area,
     pandas_to_geo_data_frame,
 )
+from gps2gtfs.utility.executor import (
+    Engine,
+    ExecutionBackend,
+    parallel_map,
+    resolve_num_workers,
+    split_into_chunks,
+)
 from gps2gtfs.utility.logger import logger
 
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+
+    from gps2gtfs.utility.route_index import RouteIndex
+
 TERMINAL_ENTRY = "1"
 TERMINAL_EXIT = "0"
 
@@ -19,67 +32,120 @@ def extract_trips(
     raw_gps_df: DataFrame,
     trip_terminals_df: DataFrame,
     buffer_radius: int,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
 ) -> DataFrame:
     logger.info("Getting ready to extract the Trip Details")
-    # Converting to GeoDataframe
-    raw_gps_geo_df = pandas_to_geo_data_frame(raw_gps_df)
-    trip_terminals_geo_df = pandas_to_geo_data_frame(trip_terminals_df)
+    gps_data_within_terminal_buffer = match_terminals(
+        raw_gps_df, trip_terminals_df, buffer_radius, num_workers, backend, engine
+    )
+    return assemble_trips(gps_data_within_terminal_buffer, engine)
+
+
+def match_terminals(
+    raw_gps_df: DataFrame,
+    trip_terminals_df: DataFrame,
+    buffer_radius: int,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+    copy: bool = True,
+    route_index: Optional["RouteIndex"] = None,
+) -> DataFrame:
+    # Converting to GeoDataframe, sharing the columns of the GPS data unless copy is True
+    raw_gps_geo_df = pandas_to_geo_data_frame(raw_gps_df, copy)
+    # Creating buffer area to extract records around trip terminals, or taking the prebuilt one
+    if route_index is None:
+        trip_terminals_geo_df = pandas_to_geo_data_frame(trip_terminals_df)
+        trip_terminals_buffer = extend_geo_buffer(trip_terminals_geo_df, buffer_radius)
+    else:
+        trip_terminals_geo_df = route_index.trip_terminals_geo_df
+        trip_terminals_buffer = route_index.terminals_buffer(buffer_radius)
 
     logger.info("Preparing to match GPS Data Points to Bus Terminal Coordinates")
     # Splitting the GPS data into chunks to be processed in parallel
-    num_processes = cpu_count()  # Number of available CPU cores
-    chunk_size = len(raw_gps_geo_df) // num_processes
+    num_workers = resolve_num_workers(num_workers)
+    # Terminal IDs are taken by position, as the tasks may run in threads sharing the frames
+    terminal_ids = trip_terminals_geo_df[TerminalField.TERMINAL_ID.value].to_numpy()
     chunks = [
-        (raw_gps_geo_df[i : (i + chunk_size)], trip_terminals_geo_df, buffer_radius)
-        for i in range(0, len(raw_gps_geo_df), chunk_size)
+        (chunk, terminal_ids, trip_terminals_buffer)
+        for chunk in split_into_chunks(raw_gps_geo_df, num_workers)
     ]
 
     logger.info("Starting to match GPS Data Points to Bus Terminal Coordinates")
-    with Pool(processes=num_processes) as pool:
-        updated_chunks = pool.map(match_raw_gps_data_with_terminals, chunks)
+    match_chunk = (
+        match_raw_gps_data_with_terminals_fast
+        if Engine(engine) == Engine.FAST
+        else match_raw_gps_data_with_terminals
+    )
+    updated_chunks = parallel_map(match_chunk, chunks, num_workers, backend)
 
     raw_gps_data_with_terminals: DataFrame = concat(updated_chunks, ignore_index=True)
     logger.info("Successfully matched GPS Data Points to Bus Terminal Coordinates")
 
-    gps_data_within_terminal_buffer = (
-        raw_gps_data_with_terminals.dropna()
-    )  # Filtering records within terminal buffer
+    # Filtering records within terminal buffer
+    return raw_gps_data_with_terminals.dropna()
 
+
+def assemble_trips(
+    gps_data_within_terminal_buffer: DataFrame,
+    engine: Union[str, Engine] = Engine.REFERENCE,
+) -> DataFrame:
     # EXTRACTING TRIP ENDS
     trip_terminals_gps_data = extract_trip_terminals(gps_data_within_terminal_buffer)
 
     # Providing unique trip id for trips which have entry / exit values within the 2 end terminals
+    if Engine(engine) == Engine.FAST:
+        return terminals_gps_data_to_trips_fast(trip_terminals_gps_data)
     return terminals_gps_data_to_trips(trip_terminals_gps_data)
 
 
-def match_raw_gps_data_with_terminals(args: Tuple) -> GeoDataFrame:
-    raw_gps_geo_df, trip_terminals_geo_df, buffer_radius = args
+def match_raw_gps_data_with_terminals(args: Tuple) -> "GeoDataFrame":
+    raw_gps_geo_df, terminal_ids, trip_terminals_buffer = args
 
-    # Creating buffer area to extract records around trip terminals
-    trip_terminals_buffer = extend_geo_buffer(trip_terminals_geo_df, buffer_radius)
+    # Chunks are slices of the whole GPS data, the loop below works on a frame of its own
+    raw_gps_geo_df = raw_gps_geo_df.reset_index(
+        drop=True
+    )  # Resetting indices to run a for loop
 
     # Filtering coordinates within trip terminals end buffer
     raw_gps_geo_df[TerminalGPSField.BUS_STOP.value] = Series(
         dtype="object"
     )  # Creating a new column in raw gps data set
-    raw_gps_geo_df.reset_index(
-        drop=True, inplace=True
-    )  # Resetting indices to run a for loop
 
     for i in range(len(raw_gps_geo_df)):
-        for stop in range(len(trip_terminals_geo_df)):
+        for stop in range(len(terminal_ids)):
             if trip_terminals_buffer.iloc[stop].geometry.contains(
                 raw_gps_geo_df.iloc[i].geometry
             ):
-                raw_gps_geo_df.at[
-                    i, TerminalGPSField.BUS_STOP.value
-                ] = trip_terminals_geo_df.at[stop, TerminalField.TERMINAL_ID.value]
+                raw_gps_geo_df.at[i, TerminalGPSField.BUS_STOP.value] = terminal_ids[
+                    stop
+                ]
                 break
+        if (i + 1) % REPORT_EVERY_ROWS == 0:
+            report_rows(REPORT_EVERY_ROWS)
+    report_rows(len(raw_gps_geo_df) % REPORT_EVERY_ROWS)
+    return raw_gps_geo_df
+
+
+def match_raw_gps_data_with_terminals_fast(args: Tuple) -> "GeoDataFrame":
+    raw_gps_geo_df, terminal_ids, trip_terminals_buffer = args
+    raw_gps_geo_df = raw_gps_geo_df.reset_index(drop=True)
+
+    # Same terminal as the loop: the first one, in the terminals order, containing the point
+    first_terminal = first_containing_area(raw_gps_geo_df, trip_terminals_buffer)
+    matched = first_terminal >= 0
+    bus_stops = np.full(len(raw_gps_geo_df), np.nan, dtype="object")
+    bus_stops[matched] = terminal_ids[first_terminal[matched]]
+    raw_gps_geo_df[TerminalGPSField.BUS_STOP.value] = bus_stops
+
+    report_rows(len(raw_gps_geo_df))
     return raw_gps_geo_df
 
 
 def extract_trip_terminals(gps_data_within_terminal_buffer: DataFrame) -> DataFrame:
-    # Grouping the filtered records of one trip terminal and one date
+    # Grouping the filtered records of one trip terminal, one device and one date
     logger.info("Preparing to extract trip terminals")
     gps_data_within_terminal_buffer[TerminalGPSField.GROUPED_TERMINALS.value] = (
         (
@@ -90,6 +156,10 @@ def extract_trip_terminals(gps_data_within_terminal_buffer: DataFrame) -> DataFr
             gps_data_within_terminal_buffer[TerminalGPSField.DATE.value].shift()
             != gps_data_within_terminal_buffer[TerminalGPSField.DATE.value]
         )
+        | (
+            gps_data_within_terminal_buffer[TerminalGPSField.DEVICE_ID.value].shift()
+            != gps_data_within_terminal_buffer[TerminalGPSField.DEVICE_ID.value]
+        )
     ).cumsum()
 
     logger.info("Successfully extracted Trip Ends")
@@ -130,14 +200,23 @@ def extract_trip_terminals(gps_data_within_terminal_buffer: DataFrame) -> DataFr
 
 def terminals_gps_data_to_trips(trip_terminals_gps_data: DataFrame) -> DataFrame:
     logger.info("Started extracting Trips and assigning Trip ID")
+    # Created up front, so that a partition without any trip still has the column
+    trip_terminals_gps_data[TerminalGPSField.TRIP_ID.value] = np.nan
     trip = 0
     for i in range(len(trip_terminals_gps_data) - 1):
         if (
-            trip_terminals_gps_data.at[i, TerminalGPSField.BUS_STOP.value]
-            != trip_terminals_gps_data.at[i + 1, TerminalGPSField.BUS_STOP.value]
-        ) & (
-            trip_terminals_gps_data.at[i, TerminalGPSField.DATE.value]
-            == trip_terminals_gps_data.at[i + 1, TerminalGPSField.DATE.value]
+            (
+                trip_terminals_gps_data.at[i, TerminalGPSField.BUS_STOP.value]
+                != trip_terminals_gps_data.at[i + 1, TerminalGPSField.BUS_STOP.value]
+            )
+            & (
+                trip_terminals_gps_data.at[i, TerminalGPSField.DATE.value]
+                == trip_terminals_gps_data.at[i + 1, TerminalGPSField.DATE.value]
+            )
+            & (
+                trip_terminals_gps_data.at[i, TerminalGPSField.DEVICE_ID.value]
+                == trip_terminals_gps_data.at[i + 1, TerminalGPSField.DEVICE_ID.value]
+            )
         ):
             trip += 1
             trip_terminals_gps_data.at[i, TerminalGPSField.TRIP_ID.value] = trip
@@ -151,3 +230,38 @@ def terminals_gps_data_to_trips(trip_terminals_gps_data: DataFrame) -> DataFrame
 
     logger.info("Successfully extracted trips & finished assigning Trip ID")
     return trips
+
+
+def terminals_gps_data_to_trips_fast(trip_terminals_gps_data: DataFrame) -> DataFrame:
+    logger.info("Started extracting Trips and assigning Trip ID")
+    bus_stops = trip_terminals_gps_data[TerminalGPSField.BUS_STOP.value]
+    dates = trip_terminals_gps_data[TerminalGPSField.DATE.value]
+    device_ids = trip_terminals_gps_data[TerminalGPSField.DEVICE_ID.value]
+
+    # A pair of consecutive records at different terminals of one device and one date is a trip
+    is_trip_start = (
+        (bus_stops != bus_stops.shift(-1))
+        & (dates == dates.shift(-1))
+        & (device_ids == device_ids.shift(-1))
+    ).to_numpy()
+    is_trip_start[-1:] = False
+    trip_numbers = np.cumsum(is_trip_start).astype("float64")
+
+    # As in the loop, a record ending one trip and starting the next one keeps the next trip
+    ends_trip = np.zeros_like(is_trip_start)
+    ends_trip[1:] = is_trip_start[:-1]
+    trip_ids = np.full(len(trip_terminals_gps_data), np.nan)
+    trip_ids[ends_trip] = trip_numbers[np.flatnonzero(ends_trip) - 1]
+    trip_ids[is_trip_start] = trip_numbers[is_trip_start]
+    trip_terminals_gps_data[TerminalGPSField.TRIP_ID.value] = trip_ids
+
+    trips = trip_terminals_gps_data.dropna()
+    trip_sizes = trips.groupby(TerminalGPSField.TRIP_ID.value)[
+        TerminalGPSField.TRIP_ID.value
+    ].transform("size")
+    # Removing outliers where no defined 2 trip terminals for a trip
+    trips = trips[trip_sizes > 1]
+    trips.reset_index(drop=True, inplace=True)
+
+    logger.info("Successfully extracted trips & finished assigning Trip ID")
+    return trips
@@ -1,4 +1,13 @@
-from . import (  # noqa F401
-    data_io_converter,
-    logger,
+from gps2gtfs._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    [
+        "data_io_converter",
+        "defaults",
+        "distance_table",
+        "executor",
+        "logger",
+        "route_index",
+    ],
 )
@@ -1,12 +1,37 @@
-from typing import Optional
+import os
+import shutil
+from enum import Enum
+from typing import TYPE_CHECKING, Iterator, Optional, Union
 
-from geopandas import GeoDataFrame, points_from_xy
-from pandas import DataFrame, errors, read_csv
+from gps2gtfs.data_field.im_field import ProcessedGPSField
 from gps2gtfs.data_field.input_field import RawGPSField
 from gps2gtfs.utility.logger import logger
 
+# pandas and geopandas are imported where they are used, which keeps the package and the
+# command line interface quick to import
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+    from numpy import ndarray
+    from pandas import DataFrame
 
-def read_csv_file(path: str, file_name: str = None) -> Optional[DataFrame]:
+
+# Name of the output with the GPS records matched with the trip terminals, from which the
+# stop pipeline continues
+PROCESSED_GPS_FILE_NAME = "processed_gps"
+
+EARTH_RADIUS_M = 6_371_000
+# Length of a degree of latitude, an upper bound of the length of a degree of longitude
+METERS_PER_DEGREE = 111_320
+# Projected coordinate system of the GeoDataFrames, in meters
+GEO_CRS = "EPSG:5234"
+
+
+class FileFormat(Enum):
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+def read_csv_file(path: str, file_name: str = None) -> Optional["DataFrame"]:
     """
     Reads a CSV file and returns its content as a pandas DataFrame.
 
@@ -35,6 +60,8 @@ def read_csv_file(path: str, file_name: str = None) -> Optional[DataFrame]:
         ... else:
         ...     print("Error occurred while reading the CSV file.")
     """
+    from pandas import errors, read_csv
+
     try:
         read_csv_df = read_csv(path)
         logger.info(f"Successfully read the {file_name} file in the path {path}")
@@ -51,7 +78,7 @@ def read_csv_file(path: str, file_name: str = None) -> Optional[DataFrame]:
         )
 
 
-def write_as_csv_file(pd_df: DataFrame, path: str) -> None:
+def write_as_csv_file(pd_df: "DataFrame", path: str) -> None:
     """
     Write a pandas DataFrame to a CSV file.
 
@@ -82,7 +109,205 @@ def write_as_csv_file(pd_df: DataFrame, path: str) -> None:
     logger.info(f"Successfully wrote the dataframe into CSV in {path}")
 
 
-def pandas_to_geo_data_frame(raw_gps_pd_df: DataFrame) -> GeoDataFrame:
+def read_parquet_file(path: str, file_name: str = None) -> Optional["DataFrame"]:
+    """
+    Reads a Parquet file, or a directory of Parquet files, and returns it as a pandas DataFrame.
+
+    Parameters:
+        path (str): The path of the Parquet file or dataset directory to read.
+        file_name (str, optional): The name of the file. It is used for error reporting.
+                                   Default is None.
+
+    Returns:
+        Optional[DataFrame]: A pandas DataFrame containing the content of the file. If the file
+                             is not found, pyarrow is not installed or the file cannot be read,
+                             None is returned.
+    """
+    from pandas import read_parquet
+
+    try:
+        read_parquet_df = read_parquet(path)
+        logger.info(f"Successfully read the {file_name} file in the path {path}")
+        return read_parquet_df
+    except FileNotFoundError:
+        logger.error(
+            f"File is not found. Please check the file path. Provided path is {path}."
+        )
+    except ImportError:
+        logger.error("Reading Parquet files requires pyarrow. Please install pyarrow.")
+    except Exception as e:
+        logger.error(
+            f"An unexpected error occurred when reading the file {file_name}. Error is {str(e)}"
+        )
+
+
+def read_file(
+    path: str,
+    file_name: str = None,
+    file_format: Union[str, FileFormat] = FileFormat.CSV,
+) -> Optional["DataFrame"]:
+    """
+    Reads a CSV or Parquet file and returns its content as a pandas DataFrame.
+
+    Parameters:
+        path (str): The path of the file to read.
+        file_name (str, optional): The name of the file. It is used for error reporting.
+                                   Default is None.
+        file_format (Union[str, FileFormat]): Either 'csv' or 'parquet'. Default is 'csv'.
+
+    Returns:
+        Optional[DataFrame]: A pandas DataFrame containing the content of the file, or None if
+                             the file cannot be read.
+    """
+    if FileFormat(file_format) == FileFormat.PARQUET:
+        return read_parquet_file(path, file_name)
+    return read_csv_file(path, file_name)
+
+
+def iter_file_chunks(
+    path: str,
+    chunk_rows: int,
+    file_format: Union[str, FileFormat] = FileFormat.CSV,
+) -> Iterator["DataFrame"]:
+    """
+    Iterate over a CSV or Parquet file in chunks of rows without loading the whole file.
+
+    Parameters:
+        path (str): The path of the file to read.
+        chunk_rows (int): The maximum number of rows in a chunk.
+        file_format (Union[str, FileFormat]): Either 'csv' or 'parquet'. Default is 'csv'.
+
+    Returns:
+        Iterator[DataFrame]: An iterator over the chunks of the file.
+
+    Notes:
+        - Reading Parquet files in chunks requires pyarrow.
+        - Errors are not handled, they are raised to the caller.
+    """
+    if FileFormat(file_format) == FileFormat.PARQUET:
+        from pyarrow.parquet import ParquetFile
+
+        for batch in ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        from pandas import read_csv
+
+        yield from read_csv(path, chunksize=chunk_rows)
+
+
+def write_as_parquet_file(pd_df: "DataFrame", path: str) -> None:
+    """
+    Write a pandas DataFrame to a Parquet file, without the DataFrame index.
+
+    Parquet columns hold a single type, so object columns mixing types (e.g. numeric stop IDs
+    next to terminal IDs) are written as strings.
+
+    Parameters:
+        pd_df (DataFrame): The pandas DataFrame to be written to the Parquet file.
+        path (str): The file path where the Parquet file will be saved.
+
+    Returns:
+        None
+    """
+    mixed_columns = [
+        column
+        for column in pd_df.select_dtypes(include="object").columns
+        if pd_df[column].dropna().map(type).nunique() > 1
+    ]
+    if mixed_columns:
+        pd_df = pd_df.astype({column: str for column in mixed_columns})
+    pd_df.to_parquet(path, index=False)
+    logger.info(f"Successfully wrote the dataframe into Parquet in {path}")
+
+
+def write_file(
+    pd_df: "DataFrame",
+    path: str,
+    file_format: Union[str, FileFormat] = FileFormat.CSV,
+) -> None:
+    """
+    Write a pandas DataFrame to a CSV or Parquet file, without the DataFrame index.
+
+    Parameters:
+        pd_df (DataFrame): The pandas DataFrame to be written.
+        path (str): The file path where the file will be saved.
+        file_format (Union[str, FileFormat]): Either 'csv' or 'parquet'. Default is 'csv'.
+
+    Returns:
+        None
+    """
+    if FileFormat(file_format) == FileFormat.PARQUET:
+        write_as_parquet_file(pd_df, path)
+    else:
+        write_as_csv_file(pd_df, path)
+
+
+def write_partition(
+    pd_df: "DataFrame",
+    path: str,
+    part_index: int,
+    file_format: Union[str, FileFormat] = FileFormat.CSV,
+) -> None:
+    """
+    Write one partition of a result that is produced partition by partition.
+
+    A CSV result is a single file: the first partition overwrites it and later partitions are
+    appended without header. A Parquet result is a dataset directory holding one file per
+    partition, which pandas reads back as a single DataFrame.
+
+    Parameters:
+        pd_df (DataFrame): The partition to be written.
+        path (str): The path of the result file or dataset directory.
+        part_index (int): The index of the partition, starting at 0.
+        file_format (Union[str, FileFormat]): Either 'csv' or 'parquet'. Default is 'csv'.
+
+    Returns:
+        None
+    """
+    if FileFormat(file_format) == FileFormat.PARQUET:
+        if part_index == 0:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+            os.makedirs(path)
+        write_as_parquet_file(
+            pd_df, os.path.join(path, f"part-{part_index:05d}.parquet")
+        )
+    elif part_index == 0:
+        write_as_csv_file(pd_df, path)
+    else:
+        pd_df.to_csv(path, mode="a", header=False, index=False)
+        logger.info(f"Successfully appended the dataframe into CSV in {path}")
+
+
+def output_file_path(
+    output_dir: str,
+    name: str,
+    file_format: Union[str, FileFormat] = FileFormat.CSV,
+) -> str:
+    """
+    Build the path of an output file in the output directory, creating the directory if needed.
+
+    Parameters:
+        output_dir (str): The directory where outputs are written.
+        name (str): The name of the output without extension, e.g. 'trips'.
+        file_format (Union[str, FileFormat]): Either 'csv' or 'parquet'. Default is 'csv'.
+
+    Returns:
+        str: The path of the output file, e.g. 'output_dir/trips.csv'.
+
+    Example:
+        >>> output_file_path("out", "trips", "parquet")
+        'out/trips.parquet'
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, f"{name}.{FileFormat(file_format).value}")
+
+
+def pandas_to_geo_data_frame(
+    raw_gps_pd_df: "DataFrame", copy: bool = True
+) -> "GeoDataFrame":
     """
     Convert a pandas DataFrame with raw GPS coordinates to a GeoDataFrame with points.
 
@@ -93,6 +318,9 @@ def pandas_to_geo_data_frame(raw_gps_pd_df: DataFrame) -> GeoDataFrame:
 
     Parameters:
         raw_gps_pd_df (DataFrame): A pandas DataFrame containing raw GPS coordinates.
+        copy (bool): Whether to copy the columns of `raw_gps_pd_df`. When False, the
+                     GeoDataFrame shares them, and a GeoDataFrame already made by this function
+                     is returned as it is. Default is True.
 
     Returns:
         GeoDataFrame: A geopandas GeoDataFrame containing points created from the provided
@@ -104,7 +332,10 @@ def pandas_to_geo_data_frame(raw_gps_pd_df: DataFrame) -> GeoDataFrame:
         - The function sets the coordinate reference system (CRS) of the GeoDataFrame to EPSG:4326,
           which is the standard WGS 84 geographic coordinate system (latitude and longitude).
         - The resulting GeoDataFrame is then reprojected to EPSG:5234, which represents a different
-          coordinate system (you can customize this according to your specific needs).
+          coordinate system (you can customize this according to your specific needs). Only the
+          points are reprojected, so the other columns are not copied again.
+        - With `copy=False`, adding or replacing columns of the GeoDataFrame leaves the input
+          unchanged, but changing values in place changes both.
 
     Example:
         >>> import pandas as pd
@@ -123,19 +354,52 @@ def pandas_to_geo_data_frame(raw_gps_pd_df: DataFrame) -> GeoDataFrame:
         1  POINT (37.7749 -122.4194)
         2  POINT (34.0522 -118.2437)
     """
-    geo_df = GeoDataFrame(
-        data=raw_gps_pd_df,
-        geometry=points_from_xy(
-            raw_gps_pd_df[RawGPSField.LONGITUDE.value],
-            raw_gps_pd_df[RawGPSField.LATITUDE.value],
-        ),
+    from geopandas import GeoDataFrame, points_from_xy
+
+    if (
+        not copy
+        and isinstance(raw_gps_pd_df, GeoDataFrame)
+        and raw_gps_pd_df.crs == GEO_CRS
+    ):
+        return raw_gps_pd_df
+
+    points = points_from_xy(
+        raw_gps_pd_df[RawGPSField.LONGITUDE.value],
+        raw_gps_pd_df[RawGPSField.LATITUDE.value],
         crs="EPSG:4326",
     )
+    return GeoDataFrame(
+        data=raw_gps_pd_df.copy(deep=copy), geometry=points.to_crs(GEO_CRS)
+    )
+
+
+def geo_to_pandas_data_frame(geo_df: "GeoDataFrame") -> "DataFrame":
+    """
+    Convert a GeoDataFrame of GPS points back to a pandas DataFrame without the geometry.
+
+    The points are rebuilt from the 'longitude' and 'latitude' columns by
+    `pandas_to_geo_data_frame`, so the geometry column can be dropped when the data is written
+    to a CSV or Parquet file.
+
+    Parameters:
+        geo_df (GeoDataFrame): A GeoDataFrame, or a DataFrame with a 'geometry' column.
+
+    Returns:
+        DataFrame: A pandas DataFrame with the other columns of `geo_df`.
+
+    Example:
+        >>> geo_df = pandas_to_geo_data_frame(raw_gps_pd_df)
+        >>> geo_to_pandas_data_frame(geo_df).columns.tolist()
+        ['longitude', 'latitude']
+    """
+    from pandas import DataFrame
 
-    return geo_df.to_crs("EPSG:5234")
+    return DataFrame(
+        geo_df.drop(columns=ProcessedGPSField.GEOMETRY.value, errors="ignore")
+    )
 
 
-def extend_geo_buffer(geo_df: GeoDataFrame, distance: int) -> GeoDataFrame:
+def extend_geo_buffer(geo_df: "GeoDataFrame", distance: int) -> "GeoDataFrame":
     """
     Extend the buffer of geometries in a GeoDataFrame.
 
@@ -172,7 +436,89 @@ def extend_geo_buffer(geo_df: GeoDataFrame, distance: int) -> GeoDataFrame:
         0      POLYGON ((-1 -1, -1 1, 1 1, 1 -1, -1 -1))
         1  LINESTRING (0 0, -0.7071067811865476 0.7071067811865476, -1 1, -1.707106781186547 1.707106781186547, -2 2)
     """
+    from geopandas import GeoDataFrame
+
     return GeoDataFrame(
         data=geo_df,
         geometry=geo_df.geometry.buffer(distance),
     )
+
+
+def first_containing_area(
+    points_geo_df: "GeoDataFrame", areas_geo_df: "GeoDataFrame"
+) -> "ndarray":
+    """
+    Find, for every point, the first area that contains it.
+
+    The function gives the same result as testing `area.contains(point)` for every area in
+    order and stopping at the first match, but queries the spatial index of the areas once for
+    all the points.
+
+    Parameters:
+        points_geo_df (GeoDataFrame): A geopandas GeoDataFrame with point geometries.
+        areas_geo_df (GeoDataFrame): A geopandas GeoDataFrame with polygon geometries, in the
+                                     coordinate system of the points.
+
+    Returns:
+        ndarray: For every point, the position of the first area that contains it, or -1 when
+                 no area contains it.
+
+    Notes:
+        - A point on the boundary of an area is not contained in it, as with `contains`.
+
+    Example:
+        >>> from geopandas import GeoDataFrame
+        >>> from shapely.geometry import Point
+
+        >>> points = GeoDataFrame(geometry=[Point(0, 0), Point(5, 5), Point(1.5, 0)])
+        >>> areas = GeoDataFrame(geometry=[Point(1, 0).buffer(1), Point(0, 0).buffer(1)])
+        >>> first_containing_area(points, areas)
+        array([ 1, -1,  0])
+    """
+    import numpy as np
+
+    first_area = np.full(len(points_geo_df), len(areas_geo_df), dtype=np.int64)
+    if len(points_geo_df) > 0 and len(areas_geo_df) > 0:
+        point_positions, area_positions = areas_geo_df.sindex.query(
+            points_geo_df.geometry.values, predicate="within"
+        )
+        np.minimum.at(first_area, point_positions, area_positions)
+    first_area[first_area == len(areas_geo_df)] = -1
+    return first_area
+
+
+def haversine_m(
+    latitude1: "ndarray",
+    longitude1: "ndarray",
+    latitude2: "ndarray",
+    longitude2: "ndarray",
+) -> "ndarray":
+    """
+    Compute the great-circle distance in meters between arrays of coordinates.
+
+    Parameters:
+        latitude1 (ndarray): Latitudes of the first points, in degrees.
+        longitude1 (ndarray): Longitudes of the first points, in degrees.
+        latitude2 (ndarray): Latitudes of the second points, in degrees.
+        longitude2 (ndarray): Longitudes of the second points, in degrees.
+
+    Returns:
+        ndarray: The distance between the first and the second point of every pair. The
+                 arrays are broadcast against each other, as in numpy.
+
+    Example:
+        >>> round(float(haversine_m(6.9271, 79.8612, 7.2906, 80.6337)))
+        94335
+    """
+    import numpy as np
+
+    latitude1, longitude1, latitude2, longitude2 = map(
+        np.radians, (latitude1, longitude1, latitude2, longitude2)
+    )
+    a = (
+        np.sin((latitude2 - latitude1) / 2) ** 2
+        + np.cos(latitude1)
+        * np.cos(latitude2)
+        * np.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
@@ -0,0 +1,35 @@
+from enum import Enum
+
+# Defaults of the stage parameters that are also options of the command line interface.
+# This module imports neither numpy nor pandas, so that building the parser stays cheap.
+
+# Largest distance in meters of the GPS records dropped from the exported trajectories
+DEFAULT_TOLERANCE_M = 10.0
+
+
+class SimplifyMethod(Enum):
+    # Distance of a ping to the segment between the kept pings around it
+    DOUGLAS_PEUCKER = "douglas-peucker"
+    # Distance of a ping to where the kept pings around it place the vehicle at its time
+    TIME_AWARE = "time-aware"
+
+
+# Dwell clustering of the terminal and stop discovery
+DEFAULT_CLUSTER_RADIUS_M = 30.0
+DEFAULT_MIN_VISITS = 5
+DEFAULT_MIN_LAYOVER_S = 180.0
+DEFAULT_MIN_TERMINAL_DISTANCE_M = 1000.0
+
+# Interval between two records of a device above which the signal is lost
+DEFAULT_MAX_GAP_S = 300.0
+# Distance from the previous record below which a record has not moved
+DEFAULT_STATIONARY_DISTANCE_M = 5.0
+# Median interval above which a device-day is too sparse to time stops
+DEFAULT_SPARSE_INTERVAL_S = 60.0
+# Share of frozen records above which the GPS of a device-day is stuck
+DEFAULT_MAX_FROZEN_RATIO = 0.05
+
+# Number of items kept at the top level of a quantile sketch, which sets its accuracy
+DEFAULT_K = 200
+# Quantiles of the schedule statistics tables
+DEFAULT_QUANTILES = (0.5, 0.85)
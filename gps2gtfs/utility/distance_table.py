@@ -0,0 +1,102 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+    from numpy import ndarray
+
+# Segments per quarter circle of the buffers made by `extend_geo_buffer`, the Shapely default
+BUFFER_QUADRANT_SEGMENTS = 16
+# Points closer to the center than this share of the radius are inside the buffer polygon
+INSCRIBED_RADIUS_RATIO = np.cos(np.pi / (4 * BUFFER_QUADRANT_SEGMENTS)) * (1 - 1e-9)
+# Points farther from the center than this share of the radius are outside the buffer polygon
+CIRCUMSCRIBED_RADIUS_RATIO = 1 + 1e-9
+
+
+class DistanceTable:
+    """
+    Distances between points and the centers of areas, for matching with any buffer radius.
+
+    The table holds every pair of a point and a center closer than `max_distance`, found with
+    one query of the spatial index of the centers. The first area containing each point is then
+    derived for any radius up to `max_distance` without buffering and querying again, which is
+    what a sweep over buffer radii repeats.
+
+    The buffers of `extend_geo_buffer` are polygons inscribed in the circle of the radius. A
+    pair is in the buffer when its distance is below the inner radius of the polygon, and out
+    of it when its distance is at least the radius. The few pairs in between are tested with
+    the buffer polygons, so that the result is the one of `first_containing_area`.
+
+    Parameters:
+        points_geo_df (GeoDataFrame): A geopandas GeoDataFrame with point geometries.
+        centers_geo_df (GeoDataFrame): A geopandas GeoDataFrame with the point geometries the
+                                       buffers are made around, in the coordinate system of
+                                       the points.
+        max_distance (float): Largest buffer radius the table is used with.
+
+    Example:
+        >>> table = DistanceTable(raw_gps_geo_df, trip_terminals_geo_df, 200)
+        >>> first_terminal = table.first_within(100)
+        >>> all(first_terminal == first_containing_area(
+        ...     raw_gps_geo_df, extend_geo_buffer(trip_terminals_geo_df, 100)))
+        True
+    """
+
+    def __init__(
+        self,
+        points_geo_df: "GeoDataFrame",
+        centers_geo_df: "GeoDataFrame",
+        max_distance: float,
+    ) -> None:
+        self.points = points_geo_df.geometry.values
+        self.centers = centers_geo_df.geometry.values
+        self.max_distance = max_distance
+
+        if len(self.points) > 0 and len(self.centers) > 0:
+            point_positions, center_positions = centers_geo_df.sindex.query(
+                self.points,
+                predicate="dwithin",
+                distance=max_distance * CIRCUMSCRIBED_RADIUS_RATIO,
+            )
+        else:
+            point_positions = center_positions = np.empty(0, dtype=np.int64)
+        self.point_positions = point_positions
+        self.center_positions = center_positions
+        self.distances = self.points[point_positions].distance(
+            self.centers[center_positions]
+        )
+
+    def __len__(self) -> int:
+        return len(self.distances)
+
+    def first_within(self, radius: float) -> "ndarray":
+        """
+        Find, for every point, the first center whose buffer of `radius` contains it.
+
+        Parameters:
+            radius (float): Buffer radius, at most the `max_distance` of the table.
+
+        Returns:
+            ndarray: For every point, the position of the first center whose buffer contains
+                     it, or -1 when no buffer contains it.
+        """
+        if radius > self.max_distance:
+            raise ValueError(
+                f"Radius {radius} is larger than the {self.max_distance} of the table"
+            )
+
+        inside = self.distances < radius * INSCRIBED_RADIUS_RATIO
+        on_edge = ~inside & (self.distances < radius * CIRCUMSCRIBED_RADIUS_RATIO)
+        if on_edge.any():
+            buffers = self.centers.buffer(radius)
+            inside[on_edge] = buffers[self.center_positions[on_edge]].contains(
+                self.points[self.point_positions[on_edge]]
+            )
+
+        first_center = np.full(len(self.points), len(self.centers), dtype=np.int64)
+        np.minimum.at(
+            first_center, self.point_positions[inside], self.center_positions[inside]
+        )
+        first_center[first_center == len(self.centers)] = -1
+        return first_center
@@ -0,0 +1,255 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+# Pools are imported when they are used, so that importing this module stays cheap
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+    from gps2gtfs.reporting.progress import ProgressMonitor
+
+
+class ExecutionBackend(Enum):
+    SERIAL = "serial"
+    THREADS = "threads"
+    PROCESSES = "processes"
+
+
+# The original loops of the matching and aggregation stages are kept as the reference engine,
+# and the fast engine gives the same outputs with vectorized operations
+class Engine(Enum):
+    REFERENCE = "reference"
+    FAST = "fast"
+
+
+# The compact memory profile stores the cleaned GPS data with smaller dtypes
+class MemoryProfile(Enum):
+    DEFAULT = "default"
+    COMPACT = "compact"
+
+
+# The pool that `parallel_map` runs the tasks of this context on, instead of starting one
+_active_pool: ContextVar[Optional["WorkerPool"]] = ContextVar(
+    "active_pool", default=None
+)
+
+
+class WorkerPool:
+    """
+    Workers kept running between the calls of `parallel_map`.
+
+    `parallel_map` starts a pool of workers for every stage, which costs more than the work of
+    small runs with the 'processes' backend. While a pool is activated, the calls of
+    `parallel_map` with its backend run their tasks on its workers instead.
+
+    Parameters:
+        num_workers (int, optional): Number of workers. Default is None, which uses the number
+                                     of available CPU cores.
+        backend (Union[str, ExecutionBackend]): Either 'threads' or 'processes'. Default is
+                                                'processes'.
+
+    Notes:
+        - The progress that worker processes report is not forwarded to the monitor, since the
+          workers start before the runs. The tasks done are still counted.
+
+    Example:
+        >>> with WorkerPool(4) as pool, pool.activate():
+        ...     result = trip_stop.process(raw_gps_df, terminals_df, stops_df, 100, 50, 100,
+        ...                                num_workers=pool.num_workers)
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+    ) -> None:
+        self.num_workers = resolve_num_workers(num_workers)
+        self.backend = ExecutionBackend(backend)
+        if self.backend == ExecutionBackend.SERIAL:
+            raise ValueError("A worker pool needs the 'threads' or 'processes' backend")
+        self._pool: Any = None
+
+    def __enter__(self) -> "WorkerPool":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def start(self) -> "WorkerPool":
+        if self._pool is None:
+            if self.backend == ExecutionBackend.THREADS:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self._pool = ThreadPoolExecutor(max_workers=self.num_workers)
+            else:
+                from multiprocessing import Pool
+
+                self._pool = Pool(processes=self.num_workers)
+        return self
+
+    def close(self) -> None:
+        if self._pool is None:
+            return
+        if self.backend == ExecutionBackend.THREADS:
+            self._pool.shutdown()
+        else:
+            self._pool.close()
+            self._pool.join()
+        self._pool = None
+
+    @contextmanager
+    def activate(self) -> Iterator["WorkerPool"]:
+        """
+        Run the tasks of `parallel_map` on this pool within the block, in this context only.
+        """
+        token = _active_pool.set(self.start())
+        try:
+            yield self
+        finally:
+            _active_pool.reset(token)
+
+    def map(self, func: Callable, tasks: List) -> Iterable:
+        if self.backend == ExecutionBackend.THREADS:
+            return _map_in_context(self._pool, func, tasks)
+        return self._pool.imap(func, tasks)
+
+    def __repr__(self) -> str:
+        return f"WorkerPool(num_workers={self.num_workers}, backend={self.backend.value!r})"
+
+
+def resolve_num_workers(num_workers: Optional[int] = None) -> int:
+    """
+    Resolve the number of workers to use for parallel execution.
+
+    Parameters:
+        num_workers (int, optional): Requested number of workers. Default is None, which uses
+                                     the number of available CPU cores.
+
+    Returns:
+        int: The number of workers, at least 1.
+    """
+    if num_workers is None or num_workers < 1:
+        return os.cpu_count() or 1
+    return num_workers
+
+
+def split_into_chunks(df: "DataFrame", num_chunks: int) -> List["DataFrame"]:
+    """
+    Split a DataFrame into consecutive row chunks of equal size.
+
+    Parameters:
+        df (DataFrame): The DataFrame to split.
+        num_chunks (int): The number of chunks wanted. The last chunk holds the remainder, so
+                          one extra chunk may be returned.
+
+    Returns:
+        List[DataFrame]: Consecutive slices of the DataFrame, keeping their original index.
+    """
+    chunk_size = max(1, len(df) // max(1, num_chunks))
+    return [df[i : (i + chunk_size)] for i in range(0, len(df), chunk_size)]
+
+
+def parallel_map(
+    func: Callable,
+    tasks: Iterable,
+    num_workers: Optional[int] = None,
+    backend: Union[str, ExecutionBackend] = ExecutionBackend.PROCESSES,
+) -> List:
+    """
+    Apply a function to every task with the selected execution backend.
+
+    Parameters:
+        func (Callable): A function taking a single task. It must be defined at module level
+                         when the 'processes' backend is used.
+        tasks (Iterable): The tasks to process.
+        num_workers (int, optional): Number of workers. Default is None, which uses the number
+                                     of available CPU cores.
+        backend (Union[str, ExecutionBackend]): One of 'serial', 'threads' or 'processes'.
+                                                Default is 'processes'.
+
+    Returns:
+        List: The results in the order of the tasks.
+
+    Notes:
+        - While a stage is monitored by a `ProgressMonitor`, the tasks are counted and the
+          progress that the workers report with `report_rows` is forwarded to the monitor.
+        - While a stage is profiled by a `StageProfiler`, every task is profiled in its worker.
+        - While a `WorkerPool` of the backend is activated, the tasks run on its workers.
+
+    Example:
+        >>> parallel_map(abs, [-1, -2, 3], num_workers=2, backend="threads")
+        [1, 2, 3]
+    """
+    from gps2gtfs.reporting.profiler import active_profiler
+    from gps2gtfs.reporting.progress import TrackedTask, active_monitor, init_worker
+
+    backend = ExecutionBackend(backend)
+    tasks = list(tasks)
+    num_workers = min(resolve_num_workers(num_workers), max(1, len(tasks)))
+
+    # Report the tasks to the progress monitor of the running stage, if any
+    monitor = active_monitor()
+    if monitor is not None:
+        monitor.add_tasks(len(tasks))
+        func = TrackedTask(func)
+    # Profile every task when the running stage is profiled
+    profiler = active_profiler()
+    if profiler is not None:
+        func = profiler.wrap_task(func)
+
+    if backend == ExecutionBackend.SERIAL or num_workers == 1:
+        return _collect(map(func, tasks), monitor)
+    pool = _active_pool.get()
+    if pool is not None and pool.backend == backend:
+        return _collect(pool.map(func, tasks), monitor)
+    if backend == ExecutionBackend.THREADS:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return _collect(_map_in_context(executor, func, tasks), monitor)
+
+    from multiprocessing import Pool
+
+    if monitor is None:
+        with Pool(processes=num_workers) as pool:
+            return pool.map(func, tasks)
+
+    with Pool(
+        processes=num_workers,
+        initializer=init_worker,
+        initargs=(monitor.worker_queue(),),
+    ) as pool:
+        results = _collect(pool.imap(func, tasks), monitor)
+        # Let the workers exit on their own, so that their last progress is delivered
+        pool.close()
+        pool.join()
+    return results
+
+
+def _map_in_context(executor: Any, func: Callable, tasks: List) -> Iterable:
+    from contextvars import copy_context
+
+    # Tasks run in a copy of the caller's context, so that they report to its monitor
+    context = copy_context()
+    return executor.map(lambda task: context.copy().run(func, task), tasks)
+
+
+def _collect(results: Iterable, monitor: Optional["ProgressMonitor"]) -> List:
+    if monitor is None:
+        return list(results)
+    collected = []
+    for result in results:
+        collected.append(result)
+        monitor.task_done()
+    return collected
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from pandas import DataFrame
+from gps2gtfs.stop.data_preparator import split_stops_by_direction
+from gps2gtfs.utility.data_io_converter import (
+    extend_geo_buffer,
+    pandas_to_geo_data_frame,
+)
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+
+# Buffers kept by a route index, the least recently used ones being dropped beyond it
+MAX_CACHED_BUFFERS = 16
+
+
+class RouteIndex:
+    """
+    Terminals and stops of a route, projected once, with their buffers and spatial indexes.
+
+    The buffers of every radius are made on first use and kept, with their spatial index built,
+    so that the runs of a route after the first one go straight to matching. Only the
+    `MAX_CACHED_BUFFERS` most recently used buffers are kept, so that the radii of a
+    long-running service do not pile up. The index can be shared by runs executed at the same
+    time in threads.
+
+    Parameters:
+        trip_terminals_df (DataFrame): Trip terminals data, with the columns of `TerminalField`.
+        stops_df (DataFrame, optional): Stops data, with the columns of `StopField`. Default is
+                                        None, for routes only used by the trip pipeline.
+
+    Example:
+        >>> route = RouteIndex(trip_terminals_df, stops_df)
+        >>> result = trip_stop.process(raw_gps_df, trip_terminals_df, stops_df, 100, 50, 100,
+        ...                            route_index=route)
+    """
+
+    def __init__(
+        self, trip_terminals_df: DataFrame, stops_df: Optional[DataFrame] = None
+    ) -> None:
+        self.trip_terminals_df = trip_terminals_df
+        self.stops_df = stops_df
+        self.trip_terminals_geo_df = pandas_to_geo_data_frame(trip_terminals_df)
+        self.stops_geo_dfs: Tuple = ()
+        if stops_df is not None:
+            self.stops_geo_dfs = split_stops_by_direction(
+                pandas_to_geo_data_frame(stops_df)
+            )
+        self._buffers: "OrderedDict[Tuple[str, int, float], GeoDataFrame]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def terminals_buffer(self, buffer_radius: float) -> "GeoDataFrame":
+        """
+        Buffers of `buffer_radius` around the trip terminals, in the order of the terminals.
+        """
+        return self._buffer("terminals", 0, self.trip_terminals_geo_df, buffer_radius)
+
+    def stop_buffers(
+        self, buffer_radius: float, extended_buffer_radius: float
+    ) -> Tuple:
+        """
+        Buffers around the stops of both directions, as made by `create_stop_buffers`.
+
+        Returns:
+            Tuple: The buffers of direction 1 and 2, then the extended buffers of direction 1
+                   and 2.
+        """
+        if not self.stops_geo_dfs:
+            raise ValueError("The route index was made without stops")
+        return tuple(
+            self._buffer("stops", direction, stops_geo_df, radius)
+            for radius in (buffer_radius, extended_buffer_radius)
+            for direction, stops_geo_df in enumerate(self.stops_geo_dfs, start=1)
+        )
+
+    def _buffer(
+        self, kind: str, direction: int, geo_df: "GeoDataFrame", radius: float
+    ) -> "GeoDataFrame":
+        key = (kind, direction, radius)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = extend_geo_buffer(geo_df, radius)
+                # Build the spatial index now, rather than in the first run that queries it
+                buffer.sindex
+                self._buffers[key] = buffer
+                if len(self._buffers) > MAX_CACHED_BUFFERS:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(key)
+        return buffer
+
+    def __repr__(self) -> str:
+        return (
+            f"RouteIndex(terminals={len(self.trip_terminals_geo_df)}, "
+            f"stops={sum(len(stops) for stops in self.stops_geo_dfs)}, "
+            f"buffers={len(self._buffers)})"
+        )
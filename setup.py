@@ -8,7 +8,6 @@ classifiers = [
     "Intended Audience :: Developers",
     "Intended Audience :: Science/Research",
     "Programming Language :: Python :: 3 :: Only",  # Specify Python 3 only
-    "Programming Language :: Python :: 3.6",
     "Programming Language :: Python :: 3.7",
     "Programming Language :: Python :: 3.8",
     "Programming Language :: Python :: 3.9",
@@ -33,8 +32,16 @@ setup(
     author_email='helloaaivu@gmail.com',
     license='MIT',
     classifiers=classifiers,
-    python_requires=">=3.6",
-    install_requires=['pandas', 'geopandas', 'numpy'],
+    python_requires=">=3.7",
+    install_requires=['pandas', 'geopandas', 'numpy', 'shapely>=2'],
+    extras_require={
+        "parquet": ['pyarrow'],
+    },
+    entry_points={
+        "console_scripts": [
+            "gps2gtfs=gps2gtfs.cli:main",
+        ],
+    },
     project_urls={
         "Homepage": "https://github.com/aaivu/gps2gtfs",
         "Source": "https://github.com/aaivu/gps2gtfs",